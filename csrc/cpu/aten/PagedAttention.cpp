@@ -22,7 +22,9 @@ void single_query_cached_kv_attention_forward_cpu(
     at::Tensor& context_lens, // [num_seqs]
     int64_t block_size,
     int64_t max_context_len,
-    const c10::optional<at::Tensor>& alibi_slopes) {
+    const c10::optional<at::Tensor>& alibi_slopes,
+    const c10::optional<at::Tensor>& k_scale,
+    const c10::optional<at::Tensor>& v_scale) {
   return single_query_cached_kv_attention_kernel_stub(
       kCPU,
       out,
@@ -35,7 +37,9 @@ void single_query_cached_kv_attention_forward_cpu(
       context_lens,
       block_size,
       max_context_len,
-      alibi_slopes);
+      alibi_slopes,
+      k_scale,
+      v_scale);
 }
 
 void reshape_and_cache_cpu(
@@ -57,7 +61,7 @@ TORCH_LIBRARY_FRAGMENT(torch_ipex, m) {
   m.def(
       "single_query_cached_kv_attention(Tensor (a!)out, Tensor (a!)query, Tensor (a!)key_cache, Tensor (a!)value_cache,\
        Tensor(a!) head_mapping, float scale, Tensor(a!) block_tables, Tensor(a!) context_lens, int block_size, int max_context_len,\
-       Tensor? alibi_slopes)-> ()");
+       Tensor? alibi_slopes, Tensor? k_scale=None, Tensor? v_scale=None)-> ()");
   m.impl(
       "single_query_cached_kv_attention",
       c10::DispatchKey::CPU,
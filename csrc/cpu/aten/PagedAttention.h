@@ -19,7 +19,9 @@ void single_query_cached_kv_attention(
     at::Tensor& context_lens, // [num_seqs]
     int64_t block_size,
     int64_t max_context_len,
-    const c10::optional<at::Tensor>& alibi_slopes);
+    const c10::optional<at::Tensor>& alibi_slopes,
+    const c10::optional<at::Tensor>& k_scale,
+    const c10::optional<at::Tensor>& v_scale);
 }
 
 void reshape_and_cache(
@@ -40,7 +42,9 @@ using single_query_cached_kv_attention_fn = void (*)(
     at::Tensor& context_lens, // [num_seqs]
     int64_t block_size,
     int64_t max_context_len,
-    const c10::optional<at::Tensor>& alibi_slopes);
+    const c10::optional<at::Tensor>& alibi_slopes,
+    const c10::optional<at::Tensor>& k_scale,
+    const c10::optional<at::Tensor>& v_scale);
 
 using reshape_and_cache_fn = void (*)(
     at::Tensor& key,
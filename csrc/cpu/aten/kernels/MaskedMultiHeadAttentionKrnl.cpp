@@ -3,6 +3,7 @@
 #include <aten/MaskedMultiHeadAttention.h>
 #include <torch/all.h>
 #include <torch/csrc/autograd/function.h>
+#include <cstring>
 #include <limits>
 #include "../../utils/isa_utils.h"
 #include "vec/vec.h"
@@ -491,6 +492,122 @@ void copy_key_value(
   }
 }
 
+// The int8/fp8 kv cache stores the quantized head_size values of every token
+// and head followed by their fp32 scale, i.e. [max_len, beam_size*batch,
+// head_num, head_size + 4], so that the scale is read with the values.
+inline bool is_quantized_kv_cache(const at::Tensor& cache) {
+  return cache.scalar_type() == at::kChar ||
+      cache.scalar_type() == at::kFloat8_e4m3fn;
+}
+
+template <typename CT>
+inline float kv_cache_qmax();
+
+template <>
+inline float kv_cache_qmax<int8_t>() {
+  return 127.0f;
+}
+
+template <>
+inline float kv_cache_qmax<at::Float8_e4m3fn>() {
+  return 448.0f;
+}
+
+template <typename CT>
+inline float load_kv_cache_scale(
+    const CT* cache_head_start,
+    int64_t head_size) {
+  float scale;
+  std::memcpy(&scale, cache_head_start + head_size, sizeof(float));
+  return scale;
+}
+
+// symmetric quantization of one head with one fp32 scale
+template <typename T, typename CT>
+void quantize_head(const T* src, CT* cache_head_start, int64_t head_size) {
+  float amax = 0.0f;
+  for (auto hsi = 0; hsi < head_size; hsi++) {
+    amax = std::max(amax, std::abs((float)src[hsi]));
+  }
+  float scale = std::max(amax, 1e-12f) / kv_cache_qmax<CT>();
+  for (auto hsi = 0; hsi < head_size; hsi++) {
+    auto q = (float)src[hsi] / scale;
+    if constexpr (std::is_same<CT, int8_t>::value) {
+      q = std::nearbyint(std::min(std::max(q, -127.0f), 127.0f));
+    }
+    cache_head_start[hsi] = static_cast<CT>(q);
+  }
+  std::memcpy(cache_head_start + head_size, &scale, sizeof(float));
+}
+
+template <typename QT, typename CT>
+void reduce_quantized_head(
+    const QT* q_ptr_start,
+    const CT* k_cache_start,
+    float* attn_w_pos,
+    int64_t head_size) {
+  float sum = 0.0f;
+  for (auto hsi = 0; hsi < head_size; hsi++) {
+    sum += (float)q_ptr_start[hsi] * (float)k_cache_start[hsi];
+  }
+  attn_w_pos[0] += sum * load_kv_cache_scale(k_cache_start, head_size);
+}
+
+template <typename CT>
+void mul_attenion_weights_and_quantized_value_of_head(
+    float& attn_w,
+    const CT* v_cache_start,
+    float* attn_out_start,
+    int64_t head_size,
+    bool accumulate) {
+  auto w = attn_w * load_kv_cache_scale(v_cache_start, head_size);
+  for (auto hsi = 0; hsi < head_size; hsi++) {
+    if (accumulate) {
+      attn_out_start[hsi] += w * (float)v_cache_start[hsi];
+    } else {
+      attn_out_start[hsi] = w * (float)v_cache_start[hsi];
+    }
+  }
+}
+
+template <typename T, typename CT>
+void copy_quantized_key_value(
+    at::Tensor key_cache,
+    const at::Tensor key,
+    at::Tensor value_cache,
+    const at::Tensor value,
+    int beam_batch) {
+  RECORD_FUNCTION(
+      "ipex::copy_quantized_key_value", c10::ArrayRef<c10::IValue>({}));
+  auto bs = key.size(0);
+  auto seq_len = key.size(1);
+  auto head_num = key.size(2);
+  auto head_size = key.size(3);
+  auto cache_head_size = key_cache.size(3);
+  auto key_cache_ptr = key_cache.data_ptr<CT>();
+  auto key_ptr = key.data_ptr<T>();
+  auto value_cache_ptr = value_cache.data_ptr<CT>();
+  auto value_ptr = value.data_ptr<T>();
+  auto token_stride = beam_batch * head_num * cache_head_size;
+  auto beam_size = beam_batch / bs;
+#pragma omp parallel for collapse(3)
+  for (auto si = 0; si < seq_len; si++) {
+    for (auto bi = 0; bi < bs; bi++) {
+      for (auto hi = 0; hi < head_num; hi++) {
+        auto cache_offset = si * token_stride +
+            (bi * beam_size * head_num + hi) * cache_head_size;
+        auto state_offset = ((bi * seq_len + si) * head_num + hi) * head_size;
+        quantize_head<T, CT>(
+            key_ptr + state_offset, key_cache_ptr + cache_offset, head_size);
+        quantize_head<T, CT>(
+            value_ptr + state_offset,
+            value_cache_ptr + cache_offset,
+            head_size);
+      }
+    }
+  }
+}
+
 /*
  *The scale-dot product for indirect access kv chache and fuse
  *matmul+div+add+softmax to improve data reuse
@@ -512,7 +629,7 @@ void copy_key_value(
  *mask.
  *@return attn_outs, None, key_cache, value_cache, beam_idx
  */
-template <typename QT, typename VT>
+template <typename QT, typename VT, typename CT = void>
 std::tuple<at::Tensor, at::Tensor, at::Tensor, at::Tensor, at::Tensor>
 scale_dot_product_for_indirect_access_kv_cache(
     at::Tensor query,
@@ -535,13 +652,18 @@ scale_dot_product_for_indirect_access_kv_cache(
   auto group_size = head_num / kv_head;
   auto head_size = query.size(3);
   auto seq_len = offset + cur_len;
-  auto kc_token_stride = beam_batch * kv_head * head_size;
+  // the int8/fp8 caches are dequantized per head in the loops
+  constexpr bool is_quantized = !std::is_void<CT>::value;
+  using KCT = std::conditional_t<is_quantized, CT, QT>;
+  using VCT = std::conditional_t<is_quantized, CT, VT>;
+  auto cache_head_size = key_cache.size(3);
+  auto kc_token_stride = beam_batch * kv_head * cache_head_size;
   auto attn_weights = at::empty({bs, head_num, cur_len, seq_len}, at::kFloat);
   query = query.contiguous();
   key = key.contiguous();
   auto q_ptr = query.data_ptr<QT>();
   auto k_ptr = key.data_ptr<QT>();
-  auto k_cache_ptr = key_cache.data_ptr<QT>();
+  auto k_cache_ptr = key_cache.data_ptr<KCT>();
   auto mask_ptr = attention_mask.data_ptr<QT>();
   auto mask_head_num = attention_mask.size(1);
   auto mask_dim2 = attention_mask.size(2);
@@ -551,7 +673,7 @@ scale_dot_product_for_indirect_access_kv_cache(
   auto attn_outs =
       at::empty({bs, head_num, cur_len, head_size}, value.options());
   auto v_ptr = value.data_ptr<VT>();
-  auto v_cache_ptr = value_cache.data_ptr<VT>();
+  auto v_cache_ptr = value_cache.data_ptr<VCT>();
   auto attn_out_ptr = attn_outs.data_ptr<VT>();
   // torch_ipex::cpu::kernel::zero_ker(attn_out_ptr, attn_outs.numel());
   auto attn_w_ptr = attn_weights.data_ptr<float>();
@@ -620,23 +742,35 @@ scale_dot_product_for_indirect_access_kv_cache(
               if (cur_len > 1) { // this may occur for processing the promt
                 auto beam_size = beam_batch / bs;
                 // need to store key accross beam
-                kc_t_beam_start =
-                    kc_t_beam_start + bi * beam_size * kv_head * head_size;
+                kc_t_beam_start = kc_t_beam_start +
+                    bi * beam_size * kv_head * cache_head_size;
               } else {
-                kc_t_beam_start = kc_t_beam_start + bi * kv_head * head_size;
+                kc_t_beam_start =
+                    kc_t_beam_start + bi * kv_head * cache_head_size;
               }
               auto kc_head_start =
-                  k_cache_ptr + kc_t_beam_start + kv_hi * head_size;
+                  k_cache_ptr + kc_t_beam_start + kv_hi * cache_head_size;
               auto k_ptr_start = k_ptr +
                   (bi * cur_len + ti - offset) * kv_head * head_size +
                   kv_hi * head_size;
-              reduce_head<QT>(
-                  q_ptr_start,
-                  k_ptr_start,
-                  attn_w_pos,
-                  head_size,
-                  true,
-                  kc_head_start);
+              if constexpr (is_quantized) {
+                reduce_head<QT>(
+                    q_ptr_start,
+                    k_ptr_start,
+                    attn_w_pos,
+                    head_size,
+                    false,
+                    nullptr);
+                quantize_head<QT, CT>(k_ptr_start, kc_head_start, head_size);
+              } else {
+                reduce_head<QT>(
+                    q_ptr_start,
+                    k_ptr_start,
+                    attn_w_pos,
+                    head_size,
+                    true,
+                    kc_head_start);
+              }
             } else { // caculate the innerproduct for the past token
               if (ti >= offset) {
                 auto k_ptr_start = k_ptr +
@@ -650,23 +784,30 @@ scale_dot_product_for_indirect_access_kv_cache(
                     false,
                     nullptr);
               } else {
-                kc_t_beam_start = kc_t_beam_start + beam * kv_head * head_size;
+                kc_t_beam_start =
+                    kc_t_beam_start + beam * kv_head * cache_head_size;
                 if (cur_len > 1) {
                   auto beam_size = beam_batch / bs;
-                  kc_t_beam_start =
-                      kc_t_beam_start + bi * beam_size * kv_head * head_size;
+                  kc_t_beam_start = kc_t_beam_start +
+                      bi * beam_size * kv_head * cache_head_size;
                 } else if (beam_size == 1) {
-                  kc_t_beam_start = kc_t_beam_start + bi * kv_head * head_size;
+                  kc_t_beam_start =
+                      kc_t_beam_start + bi * kv_head * cache_head_size;
                 }
                 auto kc_head_start =
-                    k_cache_ptr + kc_t_beam_start + kv_hi * head_size;
-                reduce_head<QT>(
-                    q_ptr_start,
-                    kc_head_start,
-                    attn_w_pos,
-                    head_size,
-                    false,
-                    nullptr);
+                    k_cache_ptr + kc_t_beam_start + kv_hi * cache_head_size;
+                if constexpr (is_quantized) {
+                  reduce_quantized_head<QT, CT>(
+                      q_ptr_start, kc_head_start, attn_w_pos, head_size);
+                } else {
+                  reduce_head<QT>(
+                      q_ptr_start,
+                      kc_head_start,
+                      attn_w_pos,
+                      head_size,
+                      false,
+                      nullptr);
+                }
               }
             }
           }
@@ -776,24 +917,38 @@ scale_dot_product_for_indirect_access_kv_cache(
                 auto beam_size = beam_batch / bs;
                 // removed the redundant computation, need to store key
                 // accross beam
-                vc_t_beam_start =
-                    vc_t_beam_start + bi * beam_size * kv_head * head_size;
+                vc_t_beam_start = vc_t_beam_start +
+                    bi * beam_size * kv_head * cache_head_size;
               } else {
-                vc_t_beam_start = vc_t_beam_start + bi * kv_head * head_size;
+                vc_t_beam_start =
+                    vc_t_beam_start + bi * kv_head * cache_head_size;
               }
               auto v_cache_head_start =
-                  v_cache_ptr + vc_t_beam_start + kv_hi * head_size;
+                  v_cache_ptr + vc_t_beam_start + kv_hi * cache_head_size;
               auto v_ptr_start = v_ptr +
                   (bi * cur_len + vi - offset) * kv_head * head_size +
                   kv_hi * head_size;
-              mul_attenion_weights_and_value_of_head<VT, float>(
-                  attn_w_query_start[vi],
-                  v_ptr_start,
-                  attn_out_start,
-                  head_size,
-                  true,
-                  v_cache_head_start,
-                  flag_access[thread_id][bi][hi]);
+              if constexpr (is_quantized) {
+                mul_attenion_weights_and_value_of_head<VT, float>(
+                    attn_w_query_start[vi],
+                    v_ptr_start,
+                    attn_out_start,
+                    head_size,
+                    false,
+                    nullptr,
+                    flag_access[thread_id][bi][hi]);
+                quantize_head<VT, CT>(
+                    v_ptr_start, v_cache_head_start, head_size);
+              } else {
+                mul_attenion_weights_and_value_of_head<VT, float>(
+                    attn_w_query_start[vi],
+                    v_ptr_start,
+                    attn_out_start,
+                    head_size,
+                    true,
+                    v_cache_head_start,
+                    flag_access[thread_id][bi][hi]);
+              }
             } else if (vi < query_ti + offset) { // caculate attention
                                                  // values for the past
                                                  // token
@@ -811,24 +966,34 @@ scale_dot_product_for_indirect_access_kv_cache(
                     flag_access[thread_id][bi][hi]);
               } else {
                 auto vc_t_beam_start =
-                    vc_token_start + beam * kv_head * head_size;
+                    vc_token_start + beam * kv_head * cache_head_size;
                 if (cur_len > 1) {
                   auto beam_size = beam_batch / bs;
-                  vc_t_beam_start =
-                      vc_t_beam_start + bi * beam_size * kv_head * head_size;
+                  vc_t_beam_start = vc_t_beam_start +
+                      bi * beam_size * kv_head * cache_head_size;
                 } else if (beam_size == 1) {
-                  vc_t_beam_start = vc_t_beam_start + bi * kv_head * head_size;
+                  vc_t_beam_start =
+                      vc_t_beam_start + bi * kv_head * cache_head_size;
                 }
                 auto v_cache_head_start =
-                    v_cache_ptr + vc_t_beam_start + kv_hi * head_size;
-                mul_attenion_weights_and_value_of_head<VT, float>(
-                    attn_w_query_start[vi],
-                    v_cache_head_start,
-                    attn_out_start,
-                    head_size,
-                    false,
-                    nullptr,
-                    flag_access[thread_id][bi][hi]);
+                    v_cache_ptr + vc_t_beam_start + kv_hi * cache_head_size;
+                if constexpr (is_quantized) {
+                  mul_attenion_weights_and_quantized_value_of_head<CT>(
+                      attn_w_query_start[vi],
+                      v_cache_head_start,
+                      attn_out_start,
+                      head_size,
+                      flag_access[thread_id][bi][hi]);
+                } else {
+                  mul_attenion_weights_and_value_of_head<VT, float>(
+                      attn_w_query_start[vi],
+                      v_cache_head_start,
+                      attn_out_start,
+                      head_size,
+                      false,
+                      nullptr,
+                      flag_access[thread_id][bi][hi]);
+                }
               }
             }
             if (flag_access[thread_id][bi][hi] == 0)
@@ -1185,6 +1350,100 @@ scale_dot_product_for_indirect_access_kv_cache_half(
 }
 #endif
 
+template <typename CT>
+std::tuple<at::Tensor, at::Tensor, at::Tensor, at::Tensor, at::Tensor>
+quantized_kv_cache_scale_dot_product(
+    at::Tensor query,
+    at::Tensor key,
+    at::Tensor value,
+    at::Tensor& key_cache,
+    at::Tensor& value_cache,
+    at::Tensor& beam_idx,
+    const int64_t offset,
+    const double scale_attn,
+    at::Tensor& attention_mask) {
+  if (query.scalar_type() == at::kFloat) {
+    return scale_dot_product_for_indirect_access_kv_cache<float, float, CT>(
+        query,
+        key,
+        value,
+        key_cache,
+        value_cache,
+        beam_idx,
+        offset,
+        scale_attn,
+        attention_mask);
+  } else if (query.scalar_type() == at::kHalf) {
+    return scale_dot_product_for_indirect_access_kv_cache<
+        at::Half,
+        at::Half,
+        CT>(
+        query,
+        key,
+        value,
+        key_cache,
+        value_cache,
+        beam_idx,
+        offset,
+        scale_attn,
+        attention_mask);
+  }
+  return scale_dot_product_for_indirect_access_kv_cache<
+      at::BFloat16,
+      at::BFloat16,
+      CT>(
+      query,
+      key,
+      value,
+      key_cache,
+      value_cache,
+      beam_idx,
+      offset,
+      scale_attn,
+      attention_mask);
+}
+
+std::tuple<at::Tensor, at::Tensor, at::Tensor, at::Tensor, at::Tensor>
+quantized_kv_cache_masked_multihead_self_attention_kernel_impl(
+    at::Tensor query,
+    at::Tensor key,
+    at::Tensor value,
+    at::Tensor& key_cache,
+    at::Tensor& value_cache,
+    at::Tensor& beam_idx,
+    const int64_t offset,
+    const double scale_attn,
+    at::Tensor& attention_mask) {
+  TORCH_CHECK(
+      value.scalar_type() == query.scalar_type(),
+      "query and value must have the same data type to use the int8/fp8 kv cache");
+  TORCH_CHECK(
+      value_cache.scalar_type() == key_cache.scalar_type(),
+      "key_cache and value_cache must have the same data type");
+  if (key_cache.scalar_type() == at::kChar) {
+    return quantized_kv_cache_scale_dot_product<int8_t>(
+        query,
+        key,
+        value,
+        key_cache,
+        value_cache,
+        beam_idx,
+        offset,
+        scale_attn,
+        attention_mask);
+  }
+  return quantized_kv_cache_scale_dot_product<at::Float8_e4m3fn>(
+      query,
+      key,
+      value,
+      key_cache,
+      value_cache,
+      beam_idx,
+      offset,
+      scale_attn,
+      attention_mask);
+}
+
 std::tuple<at::Tensor, at::Tensor, at::Tensor, at::Tensor, at::Tensor>
 zero_copy_kv_cache_masked_multihead_self_attention_kernel_impl(
     at::Tensor query,
@@ -1199,6 +1458,18 @@ zero_copy_kv_cache_masked_multihead_self_attention_kernel_impl(
   assert(
       key.scalar_type() == at::kBFloat16 || key.scalar_type() == at::kFloat ||
       key.scalar_type() == at::kHalf);
+  if (is_quantized_kv_cache(key_cache)) {
+    return quantized_kv_cache_masked_multihead_self_attention_kernel_impl(
+        query,
+        key,
+        value,
+        key_cache,
+        value_cache,
+        beam_idx,
+        offset,
+        scale_attn,
+        attention_mask);
+  }
   if (query.scalar_type() == at::kFloat && value.scalar_type() == at::kFloat) {
     return scale_dot_product_for_indirect_access_kv_cache<float, float>(
         query,
@@ -1323,7 +1594,25 @@ first_token_masked_mha(
         false,
         "key and value must be float, float16 or bfloat16 to use ipex::masked_multihead_self_attention_kernel_impl");
   }
-  if (key.scalar_type() == at::kFloat) {
+  if (is_quantized_kv_cache(key_cache)) {
+    TORCH_CHECK(
+        value.scalar_type() == key.scalar_type(),
+        "key and value must have the same data type to use the int8/fp8 kv cache");
+    AT_DISPATCH_FLOATING_TYPES_AND2(
+        at::kBFloat16,
+        at::kHalf,
+        key.scalar_type(),
+        "copy_quantized_key_value",
+        [&] {
+          if (key_cache.scalar_type() == at::kChar) {
+            copy_quantized_key_value<scalar_t, int8_t>(
+                key_cache, key, value_cache, value, beam_batch);
+          } else {
+            copy_quantized_key_value<scalar_t, at::Float8_e4m3fn>(
+                key_cache, key, value_cache, value, beam_batch);
+          }
+        });
+  } else if (key.scalar_type() == at::kFloat) {
     copy_key_value<float>(key_cache, key, value_cache, value, beam_batch);
   } else if (key.scalar_type() == at::kBFloat16) {
     copy_key_value<at::BFloat16>(
@@ -1392,7 +1681,8 @@ masked_multihead_self_attention_kernel_impl(
     int64_t max_positions,
     const c10::optional<at::Tensor>& head_mask /* optional */,
     const c10::optional<at::Tensor>& attention_mask /* optional */,
-    c10::optional<bool> add_casual_mask /* optional */) {
+    c10::optional<bool> add_casual_mask /* optional */,
+    c10::optional<at::ScalarType> kv_cache_dtype /* optional */) {
   TORCH_CHECK(
       attention_mask.has_value(),
       "Attention mask is necessary for ipex::masked_multihead_self_attention_kernel_impl");
@@ -1418,13 +1708,36 @@ masked_multihead_self_attention_kernel_impl(
   auto cache_size = key_cache.size(0);
   auto cur_len = query.size(1);
   if (offset == 0) {
+    // the cross attention stores the encoder states whose length may differ
+    // from the query length
+    auto kv_len = key.size(1);
     max_positions =
-        max_positions > cur_len ? max_positions : max_positions + cur_len;
-    key_cache = at::empty(
-        {max_positions, beam_batch, key.size(2), key.size(3)}, key.options());
-    value_cache = at::empty(
-        {max_positions, beam_batch, value.size(2), value.size(3)},
-        value.options());
+        max_positions > kv_len ? max_positions : max_positions + kv_len;
+    if (kv_cache_dtype.has_value()) {
+      // the quantized values of every head are followed by their fp32 scale
+      TORCH_CHECK(
+          kv_cache_dtype.value() == at::kChar ||
+              kv_cache_dtype.value() == at::kFloat8_e4m3fn,
+          "kv_cache_dtype must be int8 or float8_e4m3fn");
+      key_cache = at::empty(
+          {max_positions,
+           beam_batch,
+           key.size(2),
+           key.size(3) + (int64_t)sizeof(float)},
+          key.options().dtype(kv_cache_dtype.value()));
+      value_cache = at::empty(
+          {max_positions,
+           beam_batch,
+           value.size(2),
+           value.size(3) + (int64_t)sizeof(float)},
+          value.options().dtype(kv_cache_dtype.value()));
+    } else {
+      key_cache = at::empty(
+          {max_positions, beam_batch, key.size(2), key.size(3)}, key.options());
+      value_cache = at::empty(
+          {max_positions, beam_batch, value.size(2), value.size(3)},
+          value.options());
+    }
     beam_idx = at::zeros({max_positions + 2, beam_batch}, beam_idx.options());
     auto beam_idx_access = beam_idx.accessor<long, 2>();
 #pragma omp parallel for collapse(2)
@@ -1444,16 +1757,21 @@ masked_multihead_self_attention_kernel_impl(
 
   } else if (offset > 0 && offset + cur_len > cache_size) {
     auto new_cache_size = cache_size * 2;
+    while (new_cache_size < offset + cur_len) {
+      new_cache_size *= 2;
+    }
     auto new_key_cache = at::empty(
-        {new_cache_size, beam_batch, key.size(2), key.size(3)}, key.options());
+        {new_cache_size, beam_batch, key_cache.size(2), key_cache.size(3)},
+        key_cache.options());
     auto new_value_cache = at::empty(
-        {new_cache_size, beam_batch, value.size(2), value.size(3)},
-        value.options());
+        {new_cache_size, beam_batch, value_cache.size(2), value_cache.size(3)},
+        value_cache.options());
     auto new_beam_idx =
         at::zeros({new_cache_size + 2, beam_batch}, beam_idx.options());
     new_key_cache.slice(0, 0, cache_size).copy_(key_cache);
     new_value_cache.slice(0, 0, cache_size).copy_(value_cache);
-    new_beam_idx.slice(0, 0, cache_size + 2).copy_(beam_idx);
+    new_beam_idx.slice(0, 0, cache_size)
+        .copy_(beam_idx.slice(0, 0, cache_size));
     auto new_beam_idx_access = new_beam_idx.accessor<long, 2>();
     auto beam_idx_access = beam_idx.accessor<long, 2>();
     for (auto i = offset; i < new_cache_size; i++) {
@@ -1461,9 +1779,10 @@ masked_multihead_self_attention_kernel_impl(
         new_beam_idx_access[i][j] = beam_idx_access[0][j];
       }
     }
-    new_beam_idx_access[new_cache_size][0] = beam_idx_access[cache_size - 2][0];
+    // the prompt len and bs are recorded after the last position
+    new_beam_idx_access[new_cache_size][0] = beam_idx_access[cache_size][0];
     new_beam_idx_access[new_cache_size + 1][0] =
-        beam_idx_access[cache_size - 1][0];
+        beam_idx_access[cache_size + 1][0];
     key_cache = new_key_cache;
     value_cache = new_value_cache;
     beam_idx = new_beam_idx;
@@ -1490,6 +1809,12 @@ masked_multihead_self_attention_kernel_impl(
       ;
       auto value_i = value.select(1, i).unsqueeze(1);
       ;
+      // the mask row of the i-th token, cut to the tokens it attends to
+      auto attention_mask_i = attention_mask_v.size(2) > 1
+          ? attention_mask_v.narrow(2, i, 1)
+          : attention_mask_v;
+      attention_mask_i =
+          attention_mask_i.narrow(3, 0, offset + i + 1).contiguous();
       auto next_outs =
           zero_copy_kv_cache_masked_multihead_self_attention_kernel_impl(
               query_i,
@@ -1500,7 +1825,7 @@ masked_multihead_self_attention_kernel_impl(
               beam_idx,
               offset + i,
               scale_attn,
-              attention_mask_v);
+              attention_mask_i);
       tokens_outs[i] = std::get<0>(next_outs);
     }
     auto attn_outs = at::cat(tokens_outs, 2);
@@ -101,6 +101,48 @@ inline void mul_attenion_weights_and_value_of_head(
 #endif
 }
 
+// The int8/fp8 caches hold one fp32 scale per token and head, the key is
+// dequantized by scaling the dot product and the value by scaling the weight.
+template <typename QT, typename CT>
+void reduce_quantized_head(
+    const QT* q_ptr_start,
+    int64_t kv_head_group_size,
+    const CT* k_cache_start,
+    float k_scale,
+    float* attn_w_pos,
+    int attn_w_stride,
+    int64_t head_size) {
+  for (auto i = 0; i < kv_head_group_size; i++) {
+    float sum = 0;
+    for (auto hsi = 0; hsi < head_size; hsi++) {
+      sum +=
+          (float)q_ptr_start[i * head_size + hsi] * (float)k_cache_start[hsi];
+    }
+    attn_w_pos[i * attn_w_stride] = sum * k_scale;
+  }
+}
+
+template <typename CT>
+inline void mul_attenion_weights_and_quantized_value_of_head(
+    const float* attn_w,
+    int attn_w_stride,
+    const CT* v_cache_start,
+    float v_scale,
+    float* attn_out_start,
+    int attn_out_strideH,
+    int kv_head_group_size,
+    int64_t head_size,
+    bool accumulated) {
+  for (auto i = 0; i < kv_head_group_size; i++) {
+    auto w = attn_w[i * attn_w_stride] * v_scale;
+    auto attn_out = attn_out_start + i * attn_out_strideH;
+    for (auto hsi = 0; hsi < head_size; hsi++) {
+      auto v = w * (float)v_cache_start[hsi];
+      attn_out[hsi] = accumulated ? attn_out[hsi] + v : v;
+    }
+  }
+}
+
 // 1) out = exp(a - val)
 // 2) val = sum(out)
 template <typename T1, typename T2>
@@ -215,8 +257,15 @@ inline void _mul_reduce_max_fusion_kernel(
  * @param max_context_len Maximum context length.
  * @param alibi_slopes  Optional tensor of alibi slopes with the shape of
  * (num_heads).
+ * @param k_scale       The fp32 scales of the int8/fp8 key cache with the
+ * shape of [num_blocks, num_heads, block_size], only for the quantized caches.
+ * @param v_scale       The fp32 scales of the int8/fp8 value cache.
+ *
+ * @tparam scalar_t The data type of the query and output.
+ * @tparam cache_t  The data type of the key/value cache, int8_t and
+ * at::Float8_e4m3fn caches are dequantized per token and head in the loops.
  */
-template <typename scalar_t>
+template <typename scalar_t, typename cache_t = scalar_t>
 void single_query_cached_kv_attention_kernel(
     at::Tensor& out,
     at::Tensor& query,
@@ -227,11 +276,22 @@ void single_query_cached_kv_attention_kernel(
     at::Tensor& context_lens,
     int64_t block_size,
     int64_t max_context_len,
-    const c10::optional<at::Tensor>& alibi_slopes) {
+    const c10::optional<at::Tensor>& alibi_slopes,
+    const c10::optional<at::Tensor>& k_scale = c10::nullopt,
+    const c10::optional<at::Tensor>& v_scale = c10::nullopt) {
+  constexpr bool is_quantized = !std::is_same<cache_t, scalar_t>::value;
   auto out_ptr = out.data_ptr<scalar_t>();
   auto query_ptr = query.data_ptr<scalar_t>();
-  auto key_cache_ptr = key_cache.data_ptr<scalar_t>();
-  auto value_cache_ptr = value_cache.data_ptr<scalar_t>();
+  auto key_cache_ptr = key_cache.data_ptr<cache_t>();
+  auto value_cache_ptr = value_cache.data_ptr<cache_t>();
+  auto k_scale_ptr = is_quantized ? k_scale.value().data_ptr<float>() : nullptr;
+  auto v_scale_ptr = is_quantized ? v_scale.value().data_ptr<float>() : nullptr;
+  auto k_scale_strideN = is_quantized ? k_scale.value().stride(0) : 0;
+  auto k_scale_strideH = is_quantized ? k_scale.value().stride(1) : 0;
+  auto k_scale_strideP = is_quantized ? k_scale.value().stride(2) : 0;
+  auto v_scale_strideN = is_quantized ? v_scale.value().stride(0) : 0;
+  auto v_scale_strideH = is_quantized ? v_scale.value().stride(1) : 0;
+  auto v_scale_strideP = is_quantized ? v_scale.value().stride(2) : 0;
   auto block_tables_ptr = block_tables.data_ptr<int>();
   auto context_lens_ptr = context_lens.data_ptr<int>();
   auto alibi_slopes_ptr = alibi_slopes.has_value()
@@ -334,13 +394,27 @@ void single_query_cached_kv_attention_kernel(
             auto k_cache_start = key_cache_ptr +
                 physical_block_id * kv_block_strideN +
                 block_offset * kv_block_strideP + kv_head_id * kv_block_strideH;
-            reduce_head(
-                q_ptr_start,
-                kv_head_group_size,
-                k_cache_start,
-                &(logits[logits_position]),
-                PARTITION_SIZE,
-                head_size);
+            if constexpr (is_quantized) {
+              reduce_quantized_head(
+                  q_ptr_start,
+                  kv_head_group_size,
+                  k_cache_start,
+                  k_scale_ptr
+                      [physical_block_id * k_scale_strideN +
+                       kv_head_id * k_scale_strideH +
+                       block_offset * k_scale_strideP],
+                  &(logits[logits_position]),
+                  PARTITION_SIZE,
+                  head_size);
+            } else {
+              reduce_head(
+                  q_ptr_start,
+                  kv_head_group_size,
+                  k_cache_start,
+                  &(logits[logits_position]),
+                  PARTITION_SIZE,
+                  head_size);
+            }
             logits_position++;
           }
         }
@@ -393,15 +467,31 @@ void single_query_cached_kv_attention_kernel(
                 physical_block_id * kv_block_strideN +
                 block_offset * kv_block_strideP + kv_head_id * kv_block_strideH;
             auto accumulated = logits_position > 0;
-            mul_attenion_weights_and_value_of_head(
-                &(logits[logits_position]),
-                PARTITION_SIZE,
-                v_cache_start,
-                tmp_out_start,
-                tmp_out_strideH,
-                kv_head_group_size,
-                head_size,
-                accumulated);
+            if constexpr (is_quantized) {
+              mul_attenion_weights_and_quantized_value_of_head(
+                  &(logits[logits_position]),
+                  PARTITION_SIZE,
+                  v_cache_start,
+                  v_scale_ptr
+                      [physical_block_id * v_scale_strideN +
+                       kv_head_id * v_scale_strideH +
+                       block_offset * v_scale_strideP],
+                  tmp_out_start,
+                  tmp_out_strideH,
+                  kv_head_group_size,
+                  head_size,
+                  accumulated);
+            } else {
+              mul_attenion_weights_and_value_of_head(
+                  &(logits[logits_position]),
+                  PARTITION_SIZE,
+                  v_cache_start,
+                  tmp_out_start,
+                  tmp_out_strideH,
+                  kv_head_group_size,
+                  head_size,
+                  accumulated);
+            }
             logits_position++;
           }
         }
@@ -556,6 +646,68 @@ void reshape_and_cache_kernel(
   }
 }
 
+template <typename cache_t>
+void quantized_single_query_cached_kv_attention_kernel(
+    at::Tensor& out,
+    at::Tensor& query,
+    at::Tensor& key_cache,
+    at::Tensor& value_cache,
+    const double scale,
+    at::Tensor& block_tables,
+    at::Tensor& context_lens,
+    int64_t block_size,
+    int64_t max_context_len,
+    const c10::optional<at::Tensor>& alibi_slopes,
+    const c10::optional<at::Tensor>& k_scale,
+    const c10::optional<at::Tensor>& v_scale) {
+  if (out.scalar_type() == at::ScalarType::Float) {
+    single_query_cached_kv_attention_kernel<float, cache_t>(
+        out,
+        query,
+        key_cache,
+        value_cache,
+        scale,
+        block_tables,
+        context_lens,
+        block_size,
+        max_context_len,
+        alibi_slopes,
+        k_scale,
+        v_scale);
+  } else if (out.scalar_type() == at::ScalarType::BFloat16) {
+    single_query_cached_kv_attention_kernel<at::BFloat16, cache_t>(
+        out,
+        query,
+        key_cache,
+        value_cache,
+        scale,
+        block_tables,
+        context_lens,
+        block_size,
+        max_context_len,
+        alibi_slopes,
+        k_scale,
+        v_scale);
+  } else if (out.scalar_type() == at::ScalarType::Half) {
+    single_query_cached_kv_attention_kernel<at::Half, cache_t>(
+        out,
+        query,
+        key_cache,
+        value_cache,
+        scale,
+        block_tables,
+        context_lens,
+        block_size,
+        max_context_len,
+        alibi_slopes,
+        k_scale,
+        v_scale);
+  } else {
+    TORCH_CHECK(
+        false, "Unsupported data type for single_query_cached_kv_attention");
+  }
+}
+
 void single_query_cached_kv_attention_kernel_impl(
     at::Tensor& out, // [num_seqs, num_heads, head_size]
     at::Tensor& query, // [num_seqs, num_heads, head_size]
@@ -567,10 +719,52 @@ void single_query_cached_kv_attention_kernel_impl(
     at::Tensor& context_lens, // [num_seqs]
     int64_t block_size,
     int64_t max_context_len,
-    const c10::optional<at::Tensor>& alibi_slopes) {
+    const c10::optional<at::Tensor>& alibi_slopes,
+    const c10::optional<at::Tensor>& k_scale,
+    const c10::optional<at::Tensor>& v_scale) {
   RECORD_FUNCTION(
       "ipex::single_query_cached_kv_attention_kernel_impl",
       c10::ArrayRef<c10::IValue>({}));
+  auto cache_type = key_cache.scalar_type();
+  if (cache_type == at::ScalarType::Char ||
+      cache_type == at::ScalarType::Float8_e4m3fn) {
+    TORCH_CHECK(
+        k_scale.has_value() && v_scale.has_value(),
+        "k_scale and v_scale are needed by the quantized key/value cache");
+    TORCH_CHECK(
+        value_cache.scalar_type() == cache_type,
+        "key_cache and value_cache should have the same data type");
+    if (cache_type == at::ScalarType::Char) {
+      quantized_single_query_cached_kv_attention_kernel<int8_t>(
+          out,
+          query,
+          key_cache,
+          value_cache,
+          scale,
+          block_tables,
+          context_lens,
+          block_size,
+          max_context_len,
+          alibi_slopes,
+          k_scale,
+          v_scale);
+    } else {
+      quantized_single_query_cached_kv_attention_kernel<at::Float8_e4m3fn>(
+          out,
+          query,
+          key_cache,
+          value_cache,
+          scale,
+          block_tables,
+          context_lens,
+          block_size,
+          max_context_len,
+          alibi_slopes,
+          k_scale,
+          v_scale);
+    }
+    return;
+  }
   // dispatch kernel according to the data type of input tensor
   if (out.scalar_type() == at::ScalarType::Float) {
     single_query_cached_kv_attention_kernel<float>(
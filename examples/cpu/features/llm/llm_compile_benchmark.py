@@ -0,0 +1,113 @@
+import torch
+
+#################### code changes ####################  # noqa F401
+import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.cpu._auto_kernel_selection import _enable_tpp
+
+######################################################  # noqa F401
+import argparse
+import time
+from transformers import (
+    AutoConfig,
+    AutoModelForCausalLM,
+    AutoTokenizer,
+)
+
+# args
+parser = argparse.ArgumentParser(
+    "Compare torch.compile(backend='ipex') with ipex.llm.optimize", add_help=False
+)
+parser.add_argument(
+    "-m", "--model-id", default="meta-llama/Llama-2-7b-hf", type=str, help="model"
+)
+parser.add_argument(
+    "--mode",
+    type=str,
+    choices=["llm-optimize", "compile"],
+    default="compile",
+    help="optimize the model with ipex.llm.optimize or with torch.compile(backend='ipex')",
+)
+parser.add_argument(
+    "--dtype",
+    type=str,
+    choices=["float32", "bfloat16"],
+    default="bfloat16",
+    help="choose the weight dtype and whether to enable auto mixed precision or not",
+)
+parser.add_argument(
+    "--max-new-tokens", default=32, type=int, help="output max new tokens"
+)
+parser.add_argument(
+    "--prompt", default="What are we having for dinner?", type=str, help="input prompt"
+)
+parser.add_argument("--batch-size", default=1, type=int, help="batch size")
+parser.add_argument("--num-iter", default=10, type=int, help="num iter")
+parser.add_argument("--num-warmup", default=3, type=int, help="num warmup")
+args = parser.parse_args()
+print(args)
+
+# dtype
+amp_enabled = True if args.dtype != "float32" else False
+amp_dtype = getattr(torch, args.dtype)
+
+# load model
+config = AutoConfig.from_pretrained(args.model_id, trust_remote_code=True)
+model = AutoModelForCausalLM.from_pretrained(
+    args.model_id,
+    torch_dtype=amp_dtype,
+    config=config,
+    low_cpu_mem_usage=True,
+    trust_remote_code=True,
+)
+tokenizer = AutoTokenizer.from_pretrained(args.model_id, trust_remote_code=True)
+model = model.eval()
+
+# Intel(R) Extension for PyTorch*
+#################### code changes ####################  # noqa F401
+if args.mode == "llm-optimize":
+    model = ipex.llm.optimize(
+        model,
+        dtype=amp_dtype,
+        inplace=True,
+        deployment_mode=True,
+    )
+else:
+    # prepack the linear weights with the TPP blocked layout as ipex.llm.optimize
+    # does, the IPEX inductor backend fuses the linear epilogues, RMSNorm, rotary
+    # embedding and attention of the original model into the IPEX kernels
+    if amp_dtype == torch.bfloat16:
+        _enable_tpp()
+    model = ipex.optimize(model, dtype=amp_dtype, inplace=True)
+    model.forward = torch.compile(model.forward, dynamic=True, backend="ipex")
+######################################################  # noqa F401
+
+# generate args
+generate_kwargs = dict(do_sample=False, num_beams=1)
+prompt = [args.prompt] * args.batch_size
+
+# inference
+total_time = 0.0
+with torch.no_grad(), torch.inference_mode(), torch.cpu.amp.autocast(
+    enabled=amp_enabled
+):
+    input_ids = tokenizer(prompt, return_tensors="pt").input_ids
+    for i in range(args.num_iter + args.num_warmup):
+        tic = time.time()
+        gen_ids = model.generate(
+            input_ids,
+            max_new_tokens=args.max_new_tokens,
+            min_new_tokens=args.max_new_tokens,
+            **generate_kwargs,
+        )
+        toc = time.time()
+        print("Iteration: %d, Time: %.6f sec" % (i, toc - tic), flush=True)
+        if i >= args.num_warmup:
+            total_time += toc - tic
+
+gen_text = tokenizer.batch_decode(gen_ids, skip_special_tokens=True)
+print(gen_text, flush=True)
+latency = total_time / args.num_iter
+print("\n", "-" * 10, "Summary:", "-" * 10)
+print("Mode: %s" % args.mode)
+print("Inference latency: %.3f sec." % latency)
+print("Per-token latency: %.3f ms." % (latency / args.max_new_tokens * 1000))
@@ -59,9 +59,9 @@ parser.add_argument(
     "--low-precision-checkpoint",
     default="",
     type=str,
-    help="Low precision checkpoint file generated by calibration, such as GPTQ. It contains"
-    " modified weights, scales, zero points, etc. For better accuracy of weight only"
-    " quantization with INT4 weight.",
+    help="Low precision checkpoint file (or directory of sharded files) generated by calibration,"
+    " such as GPTQ. It contains modified weights, scales, zero points, etc. For better accuracy"
+    " of weight only quantization with INT4 weight.",
 )
 ######################################################  # noqa F401
 args = parser.parse_args()
@@ -111,7 +111,8 @@ qconfig = ipex.quantization.get_weight_only_quant_qconfig_mapping(
     weight_dtype=weight_dtype, lowp_mode=lowp_mode
 )
 if args.low_precision_checkpoint != "":
-    low_precision_checkpoint = torch.load(args.low_precision_checkpoint)
+    # the checkpoint file is memory-mapped and read layer by layer
+    low_precision_checkpoint = args.low_precision_checkpoint
 else:
     low_precision_checkpoint = None
 model = ipex.llm.optimize(
@@ -150,6 +150,7 @@ from .cpu._auto_kernel_selection import _enable_dnnl, _disable_dnnl, _using_dnnl
 from .cpu.utils.verbose import verbose
 from .cpu.tpp.fused_bert import fast_bert
 from ._inductor.compiler import _set_compiler_backend, _get_compiler_backend, compile
+from ._dynamo.compile_cache import enable_compile_cache, disable_compile_cache
 from .cpu.onednn_fusion import enable_onednn_fusion
 
 from . import _C
@@ -33,7 +33,11 @@ def ipex(
     options = kwargs["options"] if "options" in kwargs else None
     if _get_device_from_graph_module(graph_module) == "cpu":
         from .._inductor.compiler import compile
+        from .compile_cache import _get_compile_cache
 
+        compile_cache = _get_compile_cache()
+        if compile_cache is not None:
+            return compile_cache.compile(graph_module, example_inputs, options, compile)
         return compile(graph_module, example_inputs, options=options)
     else:
         from ..utils.utils import _is_syngraph_available
@@ -0,0 +1,229 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+from unittest.mock import patch
+import torch
+from ..utils._logger import logger, WarningType
+
+# set to enable the cache in every process, e.g., all the instances of ipexrun
+_CACHE_DIR_ENV = "IPEX_COMPILE_CACHE_DIR"
+_MAX_SIZE_ENV = "IPEX_COMPILE_CACHE_MAX_SIZE"
+_DEFAULT_MAX_SIZE = 4 * 1024**3
+_LOCK_FILE = ".lock"
+
+
+def _get_environment_tag():
+    # the artifacts of other IPEX/PyTorch versions or ISA levels are not loadable,
+    # they are cached in different directories
+    import intel_extension_for_pytorch as ipex
+    import intel_extension_for_pytorch._C as core
+
+    tag = f"ipex-{ipex.__version__}-torch-{torch.__version__}-{core._get_current_isa_level()}"
+    return re.sub(r"[^\w.+-]", "_", tag)
+
+
+def _get_input_spec(example_input):
+    if isinstance(example_input, torch.Tensor):
+        return [
+            [str(s) for s in example_input.size()],
+            [str(s) for s in example_input.stride()],
+            str(example_input.dtype),
+            example_input.device.type,
+            example_input.requires_grad,
+        ]
+    # SymInt and the other scalars
+    return str(example_input)
+
+
+class CompileCache(object):
+    r"""
+    On-disk cache of the graphs compiled by the ``ipex`` backend of
+    ``torch.compile``, shared by the processes using the same ``cache_dir``. It is
+    organized as ``<cache_dir>/<IPEX version>-<PyTorch version>-<ISA level>/``:
+
+    * ``inductor/``: the FX graph cache and the compiled kernels of Inductor, keyed
+      by the graph, the input specs and the ``options``.
+    * ``torchscript/<key>.pt``: the frozen TorchScript graphs, keyed by the graph,
+      the fingerprint of its weights, the input specs and the ``options``.
+
+    The files are written to temporary files and renamed, so that the concurrent
+    processes never read a partial artifact. When the cache grows over ``max_size``
+    bytes, the least recently used files are removed, the ones of the other
+    environments first.
+    """
+
+    def __init__(self, cache_dir, max_size=_DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self.env_dir = os.path.join(self.cache_dir, _get_environment_tag())
+
+    def get_key(self, graph_module, example_inputs, options):
+        from ..transformers.artifact_cache import _update_tensor_fingerprint
+
+        sha = hashlib.sha256()
+        sha.update(graph_module.code.encode())
+        # the TorchScript graphs are frozen with the weights held by the module
+        for name, tensor in list(graph_module.named_parameters()) + list(
+            graph_module.named_buffers()
+        ):
+            _update_tensor_fingerprint(sha, name, tensor)
+        sha.update(json.dumps([_get_input_spec(x) for x in example_inputs]).encode())
+        sha.update(json.dumps(options, sort_keys=True, default=str).encode())
+        return sha.hexdigest()
+
+    def _get_torchscript_path(self, key):
+        return os.path.join(self.env_dir, "torchscript", f"{key}.pt")
+
+    def _load_torchscript(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            traced_model = torch.jit.freeze(torch.jit.load(path).eval())
+        except Exception as e:
+            logger.warning(
+                f"ipex backend fails to load the cached graph {path} due to: {e}, recompile",
+                _type=WarningType.NotSupported,
+            )
+            return None
+        traced_model.training = False
+        # the modification time orders the files for eviction
+        os.utime(path)
+        return traced_model
+
+    def _save_torchscript(self, traced_model, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            torch.jit.save(traced_model, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(
+                f"ipex backend fails to save the compiled graph to {path} due to: {e}",
+                _type=WarningType.NotSupported,
+            )
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def compile(self, graph_module, example_inputs, options, compile_fn):
+        r"""
+        Compiles the graph with ``compile_fn`` (``ipex.compile``) unless the compiled
+        graph is found in the cache.
+        """
+        from .._inductor.compiler import _get_compiler_backend
+
+        backend = _get_compiler_backend()
+        if backend == "inductor":
+            inductor_dir = os.path.join(self.env_dir, "inductor")
+            with patch.dict(
+                os.environ, {"TORCHINDUCTOR_CACHE_DIR": inductor_dir}
+            ), torch._inductor.config.patch(fx_graph_cache=True):
+                compiled = compile_fn(graph_module, example_inputs, options=options)
+            self.evict()
+            return compiled
+        if backend != "torchscript":
+            return compile_fn(graph_module, example_inputs, options=options)
+
+        path = self._get_torchscript_path(
+            self.get_key(graph_module, example_inputs, options)
+        )
+        compiled = self._load_torchscript(path)
+        if compiled is not None:
+            return compiled
+        compiled = compile_fn(graph_module, example_inputs, options=options)
+        # the graph module itself is returned if the tracing fails
+        if isinstance(compiled, torch.jit.ScriptModule):
+            self._save_torchscript(compiled, path)
+            self.evict()
+        return compiled
+
+    def evict(self):
+        r"""
+        Removes the least recently used files until the cache fits in ``max_size``.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, _LOCK_FILE), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # another process is evicting
+                return
+            files = []
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    # the lock files of Inductor are kept, they may be held
+                    if name.endswith(".lock"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    in_env = os.path.commonpath([path, self.env_dir]) == self.env_dir
+                    files.append((in_env, stat.st_mtime, stat.st_size, path))
+            total_size = sum(size for _, _, size, _ in files)
+            for _, _, size, path in sorted(files):
+                if total_size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except OSError:
+                    pass
+
+
+_compile_cache = None
+# the environment variables are read on the first compilation, unless the cache is
+# enabled or disabled before
+_compile_cache_configured = False
+
+
+def _get_compile_cache():
+    global _compile_cache, _compile_cache_configured
+    if not _compile_cache_configured:
+        _compile_cache_configured = True
+        if os.environ.get(_CACHE_DIR_ENV, ""):
+            _compile_cache = CompileCache(
+                os.environ[_CACHE_DIR_ENV],
+                int(os.environ.get(_MAX_SIZE_ENV, _DEFAULT_MAX_SIZE)),
+            )
+    return _compile_cache
+
+
+def enable_compile_cache(cache_dir, max_size=_DEFAULT_MAX_SIZE):
+    r"""
+    Enables the on-disk cache of the graphs compiled by the ``ipex`` backend of
+    ``torch.compile``. The processes using the same ``cache_dir``, e.g., the
+    instances launched by ``ipexrun``, reuse the graphs compiled by each other
+    instead of compiling them again. The compiled graphs are keyed by the graph,
+    the specs of the inputs, the ``options`` of ``torch.compile``, the ISA level
+    and the IPEX/PyTorch versions.
+
+    It can also be enabled in every process by setting the environment variables
+    ``IPEX_COMPILE_CACHE_DIR`` and ``IPEX_COMPILE_CACHE_MAX_SIZE``.
+
+    Args:
+        cache_dir (str): The directory of the cache.
+        max_size (int): The max size of the cache in bytes, the least recently used
+            files are removed beyond it. Default value is 4 GB.
+
+    Examples:
+
+        >>> ipex.enable_compile_cache("/tmp/ipex_compile_cache")
+        >>> model = torch.compile(model, backend="ipex")
+    """
+    global _compile_cache, _compile_cache_configured
+    _compile_cache = CompileCache(cache_dir, max_size)
+    _compile_cache_configured = True
+
+
+def disable_compile_cache():
+    r"""
+    Disables the on-disk cache of the graphs compiled by the ``ipex`` backend.
+    """
+    global _compile_cache, _compile_cache_configured
+    _compile_cache = None
+    _compile_cache_configured = True
@@ -1,8 +1,28 @@
+import inspect
+import sys
 import torch
-from torch._inductor.pattern_matcher import PatternMatcherPass
+import torch.nn.functional as F
+from torch._inductor.pattern_matcher import (
+    PatternMatcherPass,
+    fwd_only,
+    init_once_fakemode,
+    register_replacement,
+)
+
+aten = torch.ops.aten
+ipex_ops = torch.ops.torch_ipex
 
 patterns = PatternMatcherPass()
 
+# Values the scalar arguments of the patterns are traced with, they are matched
+# against any value in the graph.
+_scalar_workaround = {
+    "out_features": 97,
+    "eps": 1e-6,
+    "scale": 0.125,
+    "inv_scale": 8.0,
+}
+
 
 # disable bmm_add fusion since oneDNN matmul still has performance issue.
 # @register_lowering_pattern(
@@ -14,7 +34,390 @@ patterns = PatternMatcherPass()
 #     return L[torch.ops.torch_ipex.bmm_add](mat3, mat1, mat2, 1.0)
 
 
+def _val(match, name):
+    return match.kwargs[name].meta["val"]
+
+
+def _no_escape(match):
+    # the intermediate results are not used outside of the matched subgraph,
+    # otherwise they are computed twice after the replacement
+    output = match.output_node()
+    return all(
+        user in match.nodes
+        for node in match.nodes
+        if node is not output
+        for user in node.users
+    )
+
+
+# linear + eltwise: the linear layers prepacked with the TPP blocked layout
+# (ipex.optimize with TPP enabled, as done by ipex.llm.optimize for bf16) are
+# traced to tpp_linear(_bias), whose epilogues are fused into the kernel.
+def _unary_linear_patterns(activation, fused_op):
+    def pattern_bias(x, weight, bias, out_features):
+        return activation(ipex_ops.tpp_linear_bias(x, weight, bias, out_features))
+
+    def replacement_bias(x, weight, bias, out_features):
+        return fused_op(x, weight, bias, out_features)
+
+    def pattern(x, weight, out_features):
+        return activation(ipex_ops.tpp_linear(x, weight, out_features))
+
+    def replacement(x, weight, out_features):
+        return fused_op(x, weight, x.new_empty(0), out_features)
+
+    return [(pattern_bias, replacement_bias), (pattern, replacement)]
+
+
+def _binary_linear_patterns(epilogue, fused_op):
+    def pattern_bias(x, other, weight, bias, out_features):
+        return epilogue(ipex_ops.tpp_linear_bias(x, weight, bias, out_features), other)
+
+    def replacement_bias(x, other, weight, bias, out_features):
+        return fused_op(x, other.contiguous(), weight, bias, out_features)
+
+    def pattern(x, other, weight, out_features):
+        return epilogue(ipex_ops.tpp_linear(x, weight, out_features), other)
+
+    def replacement(x, other, weight, out_features):
+        return fused_op(x, other.contiguous(), weight, x.new_empty(0), out_features)
+
+    return [(pattern_bias, replacement_bias), (pattern, replacement)]
+
+
+def _binary_linear_check(match):
+    other = _val(match, "other")
+    output = match.output_node().meta["val"]
+    return (
+        _no_escape(match)
+        and other.shape == output.shape
+        and other.dtype == output.dtype
+    )
+
+
+def _tpp_linear_add(x, other, weight, bias, out_features):
+    return ipex_ops.tpp_linear_add(x, other, weight, bias, 1.0, out_features)
+
+
+# RMSNorm as implemented by LlamaRMSNorm and the similar modules of HF models
+def _rmsnorm_pattern(hidden_states, weight, eps):
+    input_dtype = hidden_states.dtype
+    hidden_states = hidden_states.to(torch.float32)
+    variance = hidden_states.pow(2).mean(-1, keepdim=True)
+    hidden_states = hidden_states * torch.rsqrt(variance + eps)
+    return weight * hidden_states.to(input_dtype)
+
+
+def _rmsnorm_replacement(hidden_states, weight, eps):
+    return ipex_ops.rmsnorm(hidden_states, weight, eps)
+
+
+def _add_rmsnorm_pattern(hidden_states, residual, weight, eps):
+    return _rmsnorm_pattern(hidden_states + residual, weight, eps)
+
+
+def _add_rmsnorm_replacement(hidden_states, residual, weight, eps):
+    # the sum is not stored back (add_back=False) to keep the graph functional,
+    # so the add is fused only when the sum has no other users
+    return ipex_ops.add_rmsnorm(hidden_states, residual, weight, eps, False)
+
+
+def _rmsnorm_check(match):
+    hidden_states = _val(match, "hidden_states")
+    weight = _val(match, "weight")
+    if "residual" in match.kwargs:
+        residual = _val(match, "residual")
+        if (
+            residual.shape != hidden_states.shape
+            or residual.dtype != hidden_states.dtype
+        ):
+            return False
+    return (
+        _no_escape(match)
+        and weight.dim() == 1
+        and weight.size(0) == hidden_states.size(-1)
+        and weight.dtype == hidden_states.dtype
+    )
+
+
+# rotary embedding with rotate_half, i.e., apply_rotary_pos_emb of HF models,
+# whose cos/sin of [batch, 1, seq_len, head_dim] repeat the two halves of the head.
+# The kernel only reads the first half of cos/sin, so they must be computed in the
+# graph from torch.cat((freqs, freqs), dim=-1).
+def _rotary_pattern(x, cos, sin):
+    x1 = x[..., : x.shape[-1] // 2]
+    x2 = x[..., x.shape[-1] // 2 :]
+    return (x * cos) + (torch.cat((-x2, x1), dim=-1) * sin)
+
+
+def _rotary_replacement(x, cos, sin):
+    _, num_head, seq_len, head_dim = x.shape
+    half = head_dim // 2
+    # the kernel reads the sin and cos of the positions from rows of [sin, cos]
+    # halves, one row per (batch, token) of cos/sin
+    sin_cos = (
+        torch.cat((sin[..., :half], cos[..., :half]), dim=-1)
+        .reshape(-1, head_dim)
+        .to(torch.float32)
+    )
+    position_ids = torch.arange(sin_cos.size(0), device=x.device).view(-1, seq_len)
+    out, _, _ = ipex_ops.rotary_position_embedding(
+        x.transpose(1, 2).contiguous(),
+        sin_cos,
+        position_ids,
+        num_head,
+        head_dim,
+        half,
+        head_dim,
+    )
+    return out.transpose(1, 2)
+
+
+# the ops keeping the two halves of the last dim equal, the elementwise ones with
+# the other inputs broadcast along the last dim and the others not acting on it
+_REPEATED_HALVES_ELEMENTWISE_OPS = [
+    aten.cos.default,
+    aten.sin.default,
+    aten.mul.Tensor,
+    aten.mul.Scalar,
+    aten.div.Tensor,
+    aten.div.Scalar,
+    aten._to_copy.default,
+    aten.clone.default,
+    torch.ops.prims.convert_element_type.default,
+]
+_REPEATED_HALVES_INDEXING_OPS = [
+    aten.unsqueeze.default,
+    aten.squeeze.dim,
+    aten.select.int,
+    aten.slice.Tensor,
+    aten.index.Tensor,
+    aten.embedding.default,
+    aten.expand.default,
+    aten.view.default,
+    aten._unsafe_view.default,
+]
+
+
+def _has_repeated_halves(node, head_dim):
+    while isinstance(node, torch.fx.Node) and node.op == "call_function":
+        val = node.meta.get("val", None)
+        if val is None or val.dim() == 0 or val.size(-1) != head_dim:
+            return False
+        last_dim = [-1, val.dim() - 1]
+        if node.target is aten.cat.default:
+            dim = node.args[1] if len(node.args) > 1 else 0
+            tensors = node.args[0]
+            return len(tensors) == 2 and tensors[0] is tensors[1] and dim in last_dim
+        if node.target in _REPEATED_HALVES_ELEMENTWISE_OPS:
+            inputs = [arg for arg in node.args if isinstance(arg, torch.fx.Node)]
+            sizes = [arg.meta["val"].shape[-1:] for arg in inputs]
+            if sizes.count(torch.Size([head_dim])) != 1 or any(
+                size not in [torch.Size([]), torch.Size([1]), torch.Size([head_dim])]
+                for size in sizes
+            ):
+                return False
+            node = inputs[sizes.index(torch.Size([head_dim]))]
+        elif node.target in _REPEATED_HALVES_INDEXING_OPS:
+            src = node.args[0]
+            src_val = src.meta.get("val", None)
+            if src_val is None or src_val.dim() == 0 or src_val.size(-1) != head_dim:
+                return False
+            if node.target in [aten.slice.Tensor, aten.select.int]:
+                dim = node.args[1] if len(node.args) > 1 else 0
+                if dim in [-1, src_val.dim() - 1]:
+                    return False
+            if node.target is aten.index.Tensor and (
+                len(node.args[1]) == src_val.dim() and node.args[1][-1] is not None
+            ):
+                return False
+            node = src
+        else:
+            return False
+    return False
+
+
+def _rotary_check(match):
+    x = _val(match, "x")
+    cos = _val(match, "cos")
+    sin = _val(match, "sin")
+    if x.dim() != 4 or x.size(-1) % 2 != 0 or cos.shape != sin.shape:
+        return False
+    batch, _, seq_len, head_dim = x.shape
+    if cos.dim() != 4 or list(cos.shape[1:]) != [1, seq_len, head_dim]:
+        return False
+    if cos.size(0) != 1 and cos.size(0) != batch:
+        return False
+    if not all(
+        _has_repeated_halves(match.kwargs[name], head_dim) for name in ["cos", "sin"]
+    ):
+        return False
+    # the head is split in the middle
+    half = head_dim // 2
+    for node in match.nodes:
+        if node.target is aten.slice.Tensor:
+            start = node.args[2] if len(node.args) > 2 else 0
+            end = node.args[3] if len(node.args) > 3 else sys.maxsize
+            if not (
+                (start == 0 and end == half) or (start == half and end >= head_dim)
+            ):
+                return False
+    return _no_escape(match)
+
+
+# scaled dot product attention written with matmul and softmax.
+# F.scaled_dot_product_attention already reaches the IPEX flash attention kernel,
+# which overrides aten::_scaled_dot_product_flash_attention_for_cpu.
+def _sdpa_pattern_1(query, key, value, attn_mask, scale):
+    attn_weights = torch.matmul(query, key.transpose(-2, -1)) * scale
+    attn_weights = torch.softmax(attn_weights + attn_mask, dim=-1)
+    return torch.matmul(attn_weights, value)
+
+
+def _sdpa_replacement_1(query, key, value, attn_mask, scale):
+    return ipex_ops.flash_attention(
+        query, key, value, attention_mask=attn_mask, scale=scale
+    )[0]
+
+
+def _sdpa_pattern_2(query, key, value, attn_mask, inv_scale):
+    attn_weights = torch.matmul(query, key.transpose(-2, -1)) / inv_scale
+    attn_weights = torch.softmax(attn_weights + attn_mask, dim=-1)
+    return torch.matmul(attn_weights, value)
+
+
+def _sdpa_replacement_2(query, key, value, attn_mask, inv_scale):
+    return ipex_ops.flash_attention(
+        query, key, value, attention_mask=attn_mask, scale=1.0 / inv_scale
+    )[0]
+
+
+def _sdpa_pattern_3(query, key, value, attn_mask, scale):
+    # softmax in float32 for the low precision inputs
+    attn_weights = torch.matmul(query, key.transpose(-2, -1)) * scale
+    attn_weights = attn_weights + attn_mask
+    attn_weights = torch.softmax(attn_weights, dim=-1, dtype=torch.float32)
+    return torch.matmul(attn_weights.to(query.dtype), value)
+
+
+def _sdpa_pattern_4(query, key, value, attn_mask, inv_scale):
+    attn_weights = torch.matmul(query, key.transpose(-2, -1)) / inv_scale
+    attn_weights = attn_weights + attn_mask
+    attn_weights = torch.softmax(attn_weights, dim=-1, dtype=torch.float32)
+    return torch.matmul(attn_weights.to(query.dtype), value)
+
+
+def _sdpa_check(match):
+    query = _val(match, "query")
+    key = _val(match, "key")
+    value = _val(match, "value")
+    attn_mask = _val(match, "attn_mask")
+    if any(t.dim() != 4 or t.stride(-1) != 1 for t in [query, key, value]):
+        return False
+    batch, num_head, q_len, head_size = query.shape
+    kv_len = key.size(2)
+    if list(key.shape) != [batch, num_head, kv_len, head_size]:
+        return False
+    if key.shape != value.shape or not (query.dtype == key.dtype == value.dtype):
+        return False
+    if (
+        attn_mask.dim() != 4
+        or attn_mask.dtype != query.dtype
+        or attn_mask.size(0) not in [1, batch]
+        or attn_mask.size(1) not in [1, num_head]
+        or attn_mask.size(2) not in [1, q_len]
+        or attn_mask.size(3) != kv_len
+        or attn_mask.stride(-1) != 1
+    ):
+        return False
+    return _no_escape(match)
+
+
+def _register(search_fn, replace_fn, inputs, extra_check=_no_escape):
+    argnames = inspect.signature(search_fn).parameters.keys()
+    register_replacement(
+        search_fn,
+        replace_fn,
+        [inputs[name] for name in argnames if name not in _scalar_workaround],
+        fwd_only,
+        patterns,
+        extra_check=extra_check,
+        scalar_workaround={
+            name: value
+            for name, value in _scalar_workaround.items()
+            if name in argnames
+        },
+    )
+
+
+@init_once_fakemode
+def _register_ipex_fusion_patterns():
+    # the patterns are traced with fake tensors, the shapes are not matched
+    for dtype in [torch.float32, torch.bfloat16]:
+
+        def empty(*size):
+            return torch.empty(size, dtype=dtype)
+
+        inputs = {
+            # linear
+            "x": empty(2, 4, 32),
+            "weight": empty(1, 1, 32, 32),
+            "bias": empty(32),
+            "other": empty(2, 4, 32),
+            # rmsnorm
+            "hidden_states": empty(2, 4, 32),
+            "residual": empty(2, 4, 32),
+            # attention
+            "query": empty(2, 4, 8, 16),
+            "key": empty(2, 4, 8, 16),
+            "value": empty(2, 4, 8, 16),
+            "attn_mask": empty(2, 1, 8, 8),
+        }
+        # the linear epilogues first, the mul of silu is not an epilogue of mul
+        for activation, fused_op in [
+            (F.silu, ipex_ops.tpp_linear_silu),
+            (F.relu, ipex_ops.tpp_linear_relu),
+            (F.gelu, ipex_ops.tpp_linear_gelu),
+            (
+                lambda t: F.gelu(t, approximate="tanh"),
+                ipex_ops.tpp_linear_gelu_tanh,
+            ),
+        ]:
+            for search_fn, replace_fn in _unary_linear_patterns(activation, fused_op):
+                _register(search_fn, replace_fn, inputs)
+        for epilogue, fused_op in [
+            (torch.mul, ipex_ops.tpp_linear_mul),
+            (lambda t, other: torch.mul(other, t), ipex_ops.tpp_linear_mul),
+            (torch.add, _tpp_linear_add),
+            (lambda t, other: torch.add(other, t), _tpp_linear_add),
+        ]:
+            for search_fn, replace_fn in _binary_linear_patterns(epilogue, fused_op):
+                _register(search_fn, replace_fn, inputs, _binary_linear_check)
+
+        # add + rmsnorm before rmsnorm, which is a part of it
+        _register(
+            _add_rmsnorm_pattern, _add_rmsnorm_replacement, inputs, _rmsnorm_check
+        )
+        _register(_rmsnorm_pattern, _rmsnorm_replacement, inputs, _rmsnorm_check)
+
+        rotary_inputs = {
+            "x": empty(2, 4, 8, 16),
+            "cos": empty(2, 1, 8, 16),
+            "sin": empty(2, 1, 8, 16),
+        }
+        _register(_rotary_pattern, _rotary_replacement, rotary_inputs, _rotary_check)
+
+        for search_fn, replace_fn in [
+            (_sdpa_pattern_1, _sdpa_replacement_1),
+            (_sdpa_pattern_2, _sdpa_replacement_2),
+            (_sdpa_pattern_3, _sdpa_replacement_1),
+            (_sdpa_pattern_4, _sdpa_replacement_2),
+        ]:
+            _register(search_fn, replace_fn, inputs, _sdpa_check)
+
+
 def _ipex_fusion_passes(gm: torch.fx.GraphModule):
+    _register_ipex_fusion_patterns()
     patterns.apply(gm.graph)
     gm.graph.lint()
     gm.recompile()
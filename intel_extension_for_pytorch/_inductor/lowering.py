@@ -58,6 +58,7 @@ make_fallback(torch.ops.torch_ipex.cumsum)
 make_fallback(torch.ops.torch_ipex.tpp_linear)
 make_fallback(torch.ops.torch_ipex.tpp_linear_bias)
 make_fallback(torch.ops.torch_ipex.tpp_linear_gelu)
+make_fallback(torch.ops.torch_ipex.tpp_linear_gelu_tanh)
 make_fallback(torch.ops.torch_ipex.tpp_linear_add_add)
 make_fallback(torch.ops.torch_ipex.tpp_linear_relu)
 make_fallback(torch.ops.torch_ipex.tpp_linear_silu)
@@ -65,6 +66,9 @@ make_fallback(torch.ops.torch_ipex.tpp_linear_add)
 make_fallback(torch.ops.torch_ipex.tpp_linear_mul)
 make_fallback(torch.ops.torch_ipex.masked_multihead_self_attention)
 make_fallback(torch.ops.torch_ipex.rotary_position_embedding)
+make_fallback(torch.ops.torch_ipex.rmsnorm)
+make_fallback(torch.ops.torch_ipex.add_rmsnorm)
+make_fallback(torch.ops.torch_ipex.flash_attention)
 
 make_fallback(torch.ops.torch_ipex.add_softmax_)
 make_fallback(torch.ops.torch_ipex.bmm_add)
@@ -522,11 +522,13 @@ def meta_tpp_linear_bias(
 
 
 @register_meta("choose_tpp_linear_weight")
-def meta_choose_tpp_linear_weight(x, weight, weight_for_large_batch):
+def meta_choose_tpp_linear_weight(
+    x, weight, weight_for_large_batch, large_batch_min_m=256
+):
     M = x.numel() // x.size(-1)
     return (
         weight_for_large_batch
-        if weight_for_large_batch is not None and M >= 256
+        if weight_for_large_batch is not None and M >= large_batch_min_m
         else weight
     )
 
@@ -541,6 +543,16 @@ def meta_tpp_linear_gelu(
     return input.new_empty((*input.shape[:-1], out_features))
 
 
+@register_meta("tpp_linear_gelu_tanh")
+def meta_tpp_linear_gelu_tanh(
+    input,
+    weight,
+    bias,
+    out_features,
+):
+    return input.new_empty((*input.shape[:-1], out_features))
+
+
 @register_meta("tpp_linear_add_add")
 def meta_tpp_linear_add_add(
     input,
@@ -611,6 +623,7 @@ def meta_masked_multihead_self_attention(
     head_mask,
     attention_mask,
     add_casual_mask=None,
+    kv_cache_dtype=None,
 ):
     attn_output = query.new_empty(
         (query.shape[0], query.shape[2], query.shape[1], query.shape[3])
@@ -626,12 +639,28 @@ def meta_masked_multihead_self_attention(
             ),
         )
     attn_weights = None
-    key_cache_out = query.new_empty(
-        (key_cache.shape[0], key_cache.shape[1], key.shape[2], key.shape[3])
-    )
-    value_cache_out = query.new_empty(
-        (value_cache.shape[0], value_cache.shape[1], value.shape[2], value.shape[3])
-    )
+    if kv_cache_dtype is not None:
+        # the quantized values of every head are followed by their fp32 scale
+        key_cache_out = query.new_empty(
+            (key_cache.shape[0], key_cache.shape[1], key.shape[2], key.shape[3] + 4),
+            dtype=kv_cache_dtype,
+        )
+        value_cache_out = query.new_empty(
+            (
+                value_cache.shape[0],
+                value_cache.shape[1],
+                value.shape[2],
+                value.shape[3] + 4,
+            ),
+            dtype=kv_cache_dtype,
+        )
+    else:
+        key_cache_out = query.new_empty(
+            (key_cache.shape[0], key_cache.shape[1], key.shape[2], key.shape[3])
+        )
+        value_cache_out = query.new_empty(
+            (value_cache.shape[0], value_cache.shape[1], value.shape[2], value.shape[3])
+        )
     beam_idx_out = query.new_empty(beam_idx.shape)
     return (attn_output, attn_weights, key_cache_out, value_cache_out, beam_idx_out)
 
@@ -679,3 +708,34 @@ def meta_rmsnorm(
     eps,
 ):
     return input.new_empty(input.shape)
+
+
+@register_meta("add_rmsnorm")
+def meta_add_rmsnorm(
+    input,
+    input1,
+    weight,
+    eps,
+    add_back,
+):
+    return input.new_empty(input.shape)
+
+
+@register_meta("flash_attention")
+def meta_flash_attention(
+    query,
+    key,
+    value,
+    dropout_p=0.0,
+    is_causal=False,
+    *,
+    attention_mask=None,
+    scale=None,
+):
+    batch_size, num_head, q_len, head_size = query.shape
+    output = query.new_empty((batch_size, q_len, num_head, head_size))
+    logsumexp = query.new_empty(
+        (batch_size, q_len, num_head),
+        dtype=torch.double if query.dtype == torch.double else torch.float,
+    )
+    return output.transpose(1, 2), logsumexp.transpose(1, 2)
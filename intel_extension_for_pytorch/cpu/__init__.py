@@ -2,3 +2,5 @@ from . import runtime
 from . import autocast
 from . import auto_ipex
 from . import comm
+from ._linear_autotune import enable_linear_autotune, disable_linear_autotune
+from .shared_tensor_weights import share_tensor_weights
@@ -0,0 +1,218 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import torch
+import intel_extension_for_pytorch._C as core
+from ..utils._logger import logger, WarningType
+
+# M (the collapsed batch size of the input) buckets benchmarked for every GEMM shape
+_DEFAULT_M_BUCKETS = [1, 4, 16, 64, 256, 1024, 4096]
+
+
+def _get_m_bucket(m, m_buckets):
+    # the largest bucket not greater than m
+    bucket = m_buckets[0]
+    for b in m_buckets:
+        if b > m:
+            break
+        bucket = b
+    return bucket
+
+
+def _benchmark(fn, x, warmup, iters):
+    with torch.no_grad():
+        for _ in range(warmup):
+            fn(x)
+        elapsed = []
+        for _ in range(iters):
+            start = time.perf_counter()
+            fn(x)
+            elapsed.append(time.perf_counter() - start)
+    elapsed.sort()
+    return elapsed[len(elapsed) // 2]
+
+
+class _LinearAutotuner(object):
+    r"""
+    Micro-benchmarks the GEMM kernels of a linear for each M bucket and keeps the
+    fastest one in a decision table. The table is keyed by the kind of decision,
+    N, K, dtype, the number of OpenMP threads and the ISA level, and persisted in
+    ``cache_file`` (JSON) so that later processes on the same machine reuse it.
+    """
+
+    def __init__(self, cache_file=None, m_buckets=None, warmup=3, iters=10):
+        self.cache_file = cache_file
+        self.m_buckets = sorted(m_buckets) if m_buckets else _DEFAULT_M_BUCKETS
+        assert all(
+            isinstance(m, int) and m > 0 for m in self.m_buckets
+        ), "M buckets of linear autotune should be positive integers"
+        self.warmup = warmup
+        self.iters = iters
+        self.lock = threading.Lock()
+        self.table = {}
+        if cache_file is not None and os.path.exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    self.table = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(
+                    f"fail to load the linear autotune cache {cache_file} due to: {e}, retune",
+                    _type=WarningType.NotSupported,
+                )
+
+    def _key(self, kind, n, k, dtype):
+        return (
+            f"{kind}:N={n}:K={k}:{dtype}:threads={torch.get_num_threads()}"
+            + f":{core._get_current_isa_level()}"
+        )
+
+    def _save(self):
+        if self.cache_file is None:
+            return
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.table, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.cache_file)
+
+    def select(self, kind, n, k, dtype, candidates, make_input):
+        r"""
+        Returns the decision table ``{M bucket: candidate name}`` of the GEMM shape.
+        ``candidates`` maps the names to the functions running the GEMM on an input
+        created by ``make_input(M)``. They are only benchmarked if the shape is not in
+        the table yet.
+        """
+        key = self._key(kind, n, k, dtype)
+        with self.lock:
+            decisions = self.table.get(key, None)
+            if decisions is not None and all(
+                str(m) in decisions and decisions[str(m)] in candidates
+                for m in self.m_buckets
+            ):
+                return {int(m): name for m, name in decisions.items()}
+            decisions = {}
+            for m in self.m_buckets:
+                x = make_input(m)
+                timings = {
+                    name: _benchmark(fn, x, self.warmup, self.iters)
+                    for name, fn in candidates.items()
+                }
+                decisions[str(m)] = min(timings, key=timings.get)
+            self.table[key] = decisions
+            self._save()
+            return {int(m): name for m, name in decisions.items()}
+
+
+_linear_autotuner = None
+
+
+def enable_linear_autotune(cache_file=None, m_buckets=None):
+    r"""
+    Enables the autotuning of the linear kernels. Instead of the fixed heuristics,
+    the kernels of every linear are chosen by micro-benchmarking them for a set of
+    M (the input size collapsed except the last dim) buckets when the weights are
+    prepacked:
+
+    * fp32 inference with ``ipex.optimize``: oneDNN (``ipex_linear``) or MKL
+      (``ipex_MKLSGEMM``) for the M of the ``sample_input`` if given, otherwise for
+      most of the M buckets. Only the fp32 inference in the ``FP32`` math mode with
+      the default linear backend is tuned, the other cases (bf16, fp16, training,
+      the other fp32 math modes, or oneDNN forced by ``ipex._enable_dnnl()``) have
+      no MKL kernel and always use oneDNN.
+    * TPP with the extra large-batch weights of ``ipex.llm.optimize``
+      (``cache_weight_for_large_batch=True``): the M from which the large-batch
+      blocking is used at runtime, replacing the fixed ``M >= 256``.
+
+    Args:
+        cache_file (str): JSON file to persist the decision table, keyed by the GEMM
+            shape, dtype, number of threads and ISA level. Default value is ``None``,
+            meaning the decisions are not persisted.
+        m_buckets (list of int): The M buckets to benchmark. Default value is ``None``,
+            meaning ``[1, 4, 16, 64, 256, 1024, 4096]``.
+    """
+    global _linear_autotuner
+    _linear_autotuner = _LinearAutotuner(cache_file, m_buckets)
+
+
+def disable_linear_autotune():
+    r"""
+    Disables the autotuning of the linear kernels enabled by ``enable_linear_autotune``.
+    """
+    global _linear_autotuner
+    _linear_autotuner = None
+
+
+def _get_linear_autotuner():
+    return _linear_autotuner
+
+
+def _autotune_dnnl_or_mkl(weight, bias, batch_size_collapsed):
+    r"""
+    Returns whether oneDNN is faster than MKL for the fp32 inference of the linear.
+    """
+    n, k = weight.shape
+    dnnl_ctx = torch.ops.ipex_prepack.linear_prepack(weight, bias, batch_size_collapsed)
+    mkl_ctx = torch.ops.ipex_prepack.mkl_sgemm_prepack(
+        weight, bias, batch_size_collapsed
+    )
+    empty_weight = torch.Tensor().to(weight.dtype)
+    empty_bias = None if bias is None else torch.Tensor().to(bias.dtype)
+    candidates = {
+        "dnnl": lambda x: torch.ops.torch_ipex.ipex_linear(
+            x, empty_weight, empty_bias, dnnl_ctx.get_data_handle(), n
+        ),
+        "mkl": lambda x: torch.ops.torch_ipex.ipex_MKLSGEMM(
+            x, empty_weight, empty_bias, mkl_ctx.get_data_handle(), n
+        ),
+    }
+    decisions = _linear_autotuner.select(
+        "dnnl_or_mkl",
+        n,
+        k,
+        weight.dtype,
+        candidates,
+        lambda m: torch.randn(m, k, dtype=weight.dtype),
+    )
+    if batch_size_collapsed is not None:
+        return (
+            decisions[_get_m_bucket(batch_size_collapsed, _linear_autotuner.m_buckets)]
+            == "dnnl"
+        )
+    votes = list(decisions.values())
+    return votes.count("dnnl") > votes.count("mkl")
+
+
+def _autotune_tpp_large_batch_min_m(
+    weight, weight_for_large_batch, in_features, out_features
+):
+    r"""
+    Returns the smallest M from which the TPP linear with ``weight_for_large_batch``
+    is faster than with the blocked ``weight`` for all the larger M buckets.
+    """
+    k = in_features
+    candidates = {
+        "weight": lambda x: torch.ops.torch_ipex.tpp_linear(
+            x, weight.detach(), out_features
+        ),
+        "weight_for_large_batch": lambda x: torch.ops.torch_ipex.tpp_linear(
+            x, weight_for_large_batch, out_features
+        ),
+    }
+    decisions = _linear_autotuner.select(
+        "tpp_large_batch",
+        out_features,
+        k,
+        weight.dtype,
+        candidates,
+        lambda m: torch.randn(m, k).to(weight.dtype),
+    )
+    min_m = None
+    for m in reversed(sorted(decisions)):
+        if decisions[m] != "weight_for_large_batch":
+            break
+        min_m = m
+    # a M larger than all buckets never uses the large-batch weight
+    return min_m if min_m is not None else torch.iinfo(torch.int64).max
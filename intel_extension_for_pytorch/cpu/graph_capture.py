@@ -1,11 +1,13 @@
-import copy
 import torch
 from torch._dynamo.backends.common import fake_tensor_unsupported
 from torch.jit._trace import TracerWarning
+from torch.utils._pytree import tree_flatten, tree_unflatten
 
+from collections import namedtuple, OrderedDict
 from enum import IntEnum
 from typing import List
 
+import bisect
 import functools
 import threading
 import warnings
@@ -19,14 +21,184 @@ class RunMethods(IntEnum):
     EagerTrain = 4
 
 
+GraphCacheInfo = namedtuple(
+    "GraphCacheInfo", ["hits", "misses", "evictions", "currsize", "maxsize"]
+)
+
+
+def _next_power_of_2(size):
+    return 1 if size <= 1 else 1 << (size - 1).bit_length()
+
+
 class GraphCapture(object):
-    def __init__(self, model, train, dtype, weights_prepack):
-        self.model = copy.deepcopy(model)
+    r"""
+    Captures the graph of the forward of ``model`` at the first inference call, by JIT
+    trace or by TorchDynamo with the JIT trace backend if the trace fails.
+
+    By default, the graph captured at the first call runs all the later inputs. A JIT
+    traced graph is specialized on the shapes of its inputs, so with ``cache_size`` > 1
+    the traced and frozen graphs are kept in a LRU cache keyed by the shapes and dtypes
+    of the tensor inputs. With ``bucket_dims``, the tensor inputs are padded with zeros in these
+    dims to the size of a bucket before running the graph, so that the inputs with
+    different sizes share the graph of their bucket, and the tensor outputs are
+    narrowed back in these dims. Padding is only valid for the dims in which the
+    samples are computed independently, e.g., the batch dim.
+
+    The captured model shares the parameters and buffers of ``model``, so capturing
+    does not copy the weights. However, every frozen graph in the cache embeds the
+    weights as its own constants, and the constants folded or prepacked by the graph
+    optimizations are not shared among the graphs, so the memory of the weights can
+    grow up to ``cache_size`` times. Use ``bucket_dims`` to bound the number of the
+    graphs for large models.
+
+    Args:
+        model (torch.nn.Module): The model to capture.
+        train (bool): Whether the model is used for training, which is not captured.
+        dtype (torch.dtype): The autocast dtype of the model.
+        weights_prepack (bool): Whether the weights of the model are prepacked.
+        cache_size (int): The max number of the cached graphs, the least recently
+            used one is evicted when it is exceeded. The default value is 1, meaning
+            the graph of the first call runs all the inputs, unless ``bucket_dims`` is
+            set.
+        bucket_dims (list of int): The dims of the tensor inputs padded to the bucket
+            sizes. The default value is ``None``, meaning the graphs are keyed by the
+            exact input shapes.
+        buckets (str or list of int): ``"pow2"`` to pad the sizes to the next power of 2,
+            or a list of bucket sizes to pad the sizes to the smallest bucket not less
+            than them. The sizes larger than all buckets are not padded. The default
+            value is ``"pow2"``. Only valid with ``bucket_dims``.
+
+    The decorated forward has a ``cache_info()`` method returning the hits, misses and
+    evictions of the graph cache, and its current and max size.
+    """
+
+    def __init__(
+        self,
+        model,
+        train,
+        dtype,
+        weights_prepack,
+        cache_size=1,
+        bucket_dims=None,
+        buckets="pow2",
+    ):
+        assert cache_size >= 1, "cache_size of graph capture should be positive"
+        assert buckets == "pow2" or (
+            isinstance(buckets, (list, tuple))
+            and len(buckets) > 0
+            and all(isinstance(b, int) and b > 0 for b in buckets)
+        ), "buckets of graph capture should be 'pow2' or a list of positive sizes"
+        # the graphs are captured on a copy of the module tree, so that the forward of
+        # model can be replaced by the captured one, the weights are not copied
+        from ..frontend import _copy_model_sharing_weights
+
+        self.model = _copy_model_sharing_weights(model)
         self.train = train
         self.dtype = dtype
         self.weights_prepack = weights_prepack
         self.method = None
         self.lock = threading.Lock()
+        self.cache_size = cache_size
+        self.bucket_dims = list(bucket_dims) if bucket_dims is not None else []
+        self.buckets = buckets if buckets == "pow2" else sorted(buckets)
+        # a single graph for all the input shapes, as the memory of the weights grows
+        # with the number of the graphs
+        self.keyed_by_shape = cache_size > 1 or len(self.bucket_dims) > 0
+        self.graphs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cache_info(self):
+        with self.lock:
+            return GraphCacheInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                len(self.graphs),
+                self.cache_size,
+            )
+
+    def _get_bucket(self, size):
+        if self.buckets == "pow2":
+            return _next_power_of_2(size)
+        idx = bisect.bisect_left(self.buckets, size)
+        return self.buckets[idx] if idx < len(self.buckets) else size
+
+    def _pad_inputs(self, input):
+        # returns the padded inputs, their cache key and the original size of every
+        # padded size in each bucket dim
+        flat_input, spec = tree_flatten(input)
+        key = []
+        sizes = {d: {} for d in self.bucket_dims}
+        for i, x in enumerate(flat_input):
+            if not isinstance(x, torch.Tensor):
+                key.append(type(x))
+                continue
+            for d in self.bucket_dims:
+                if d >= x.dim():
+                    continue
+                size = x.size(d)
+                bucket = self._get_bucket(size)
+                sizes[d][bucket] = size
+                if bucket > size:
+                    pad_shape = list(x.shape)
+                    pad_shape[d] = bucket - size
+                    x = torch.cat([x, x.new_zeros(pad_shape)], dim=d)
+            flat_input[i] = x
+            key.append((tuple(x.shape), x.dtype))
+        key = tuple(key) if self.keyed_by_shape else ()
+        return tree_unflatten(flat_input, spec), key, sizes
+
+    def _unpad_outputs(self, output, sizes):
+        def unpad(x):
+            if not isinstance(x, torch.Tensor):
+                return x
+            for d in self.bucket_dims:
+                if d < x.dim() and sizes[d].get(x.size(d), x.size(d)) < x.size(d):
+                    x = x.narrow(d, 0, sizes[d][x.size(d)])
+            return x
+
+        flat_output, spec = tree_flatten(output)
+        return tree_unflatten([unpad(x) for x in flat_output], spec)
+
+    def _trace(self, input):
+        # Tracing only records operations done when the given function is run on the given
+        # tensors. Therefore, the returned ScriptModule will always run the same traced graph
+        # on any input. This has some important implications when your module is expected
+        # to run different sets of operations, depending on the input and/or the module state.
+        # In cases like these, tracing would not be appropriate, and the tracer will try to
+        # emit warnings when doing something that may cause an incorrect trace to be produced.
+        # Therefore, we catch these warnings and treat them as errors, and let TorchDynamo
+        # handle such models appropriately.
+        with warnings.catch_warnings():
+            warnings.filterwarnings("error", category=TracerWarning)
+            traced_model = torch.jit.trace(self.model.eval(), input).eval()
+            return torch.jit.freeze(traced_model)
+
+    def _run_cached_graph(self, input, kwargs):
+        input, key, sizes = self._pad_inputs(input)
+        with self.lock:
+            graph = self.graphs.get(key, None)
+            if graph is not None:
+                self.graphs.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                try:
+                    graph = self._trace(input)
+                    logger.debug("generate graph by JIT trace.")
+                except BaseException:
+                    logger.warning(
+                        "JIT trace failed for the new input shapes, fallback to original model for them.",
+                        _type=WarningType.NotSupported,
+                    )
+                    graph = self.model
+                self.graphs[key] = graph
+                if len(self.graphs) > self.cache_size:
+                    self.graphs.popitem(last=False)
+                    self.evictions += 1
+        return self._unpad_outputs(graph(*input, **kwargs), sizes)
 
     def __call__(self, func):
         @fake_tensor_unsupported
@@ -54,6 +226,8 @@ class GraphCapture(object):
                 if self.method:
                     if self.train:
                         return func(*input, **kwargs)
+                    elif self.method == RunMethods.JIT:
+                        return self._run_cached_graph(input, kwargs)
                     else:
                         return self.model(*input, **kwargs)
                 else:
@@ -62,9 +236,9 @@ class GraphCapture(object):
                         if self.method:
                             if self.train:
                                 return func(*input, **kwargs)
-                            else:
+                            elif self.method != RunMethods.JIT:
                                 return self.model(*input, **kwargs)
-                        if self.train:
+                        elif self.train:
                             logger.warning(
                                 "graph capture does not support training yet.",
                                 _type=WarningType.NotSupported,
@@ -74,27 +248,14 @@ class GraphCapture(object):
                         else:
                             try:
                                 # Try JIT trace.
-                                # Tracing only records operations done when the given function is run on the given
-                                # tensors. Therefore, the returned ScriptModule will always run the same traced graph
-                                # on any input. This has some important implications when your module is expected
-                                # to run different sets of operations, depending on the input and/or the module state.
-                                # In cases like these, tracing would not be appropriate, and the tracer will try to
-                                # emit warnings when doing something that may cause an incorrect trace to be produced.
-                                # Therefore, we catch these warnings and treat them as errors, and let TorchDynamo
-                                # handle such models appropriately.
-                                with warnings.catch_warnings():
-                                    warnings.filterwarnings(
-                                        "error", category=TracerWarning
-                                    )
-                                    traced_model = torch.jit.trace(
-                                        self.model.eval(), input
-                                    ).eval()
-                                    traced_model = torch.jit.freeze(traced_model)
-                                    output = traced_model(*input, **kwargs)
-                                    self.model = traced_model
-                                    self.method = RunMethods.JIT
-                                    logger.debug("generate graph by JIT trace.")
-                                    return output
+                                padded_input, key, sizes = self._pad_inputs(input)
+                                traced_model = self._trace(padded_input)
+                                output = traced_model(*padded_input, **kwargs)
+                                self.graphs[key] = traced_model
+                                self.misses += 1
+                                self.method = RunMethods.JIT
+                                logger.debug("generate graph by JIT trace.")
+                                return self._unpad_outputs(output, sizes)
                             except BaseException:
                                 try:
                                     # JIT trace failed, try torchdynamo with JIT trace backend.
@@ -115,5 +276,8 @@ class GraphCapture(object):
                                     self.method = RunMethods.EagerInfer
                                     torch._dynamo.reset()
                                     return self.model(*input, **kwargs)
+                    # another thread has captured the first graph by JIT trace
+                    return self._run_cached_graph(input, kwargs)
 
+        forward.cache_info = self.cache_info
         return forward
@@ -10,7 +10,14 @@ from ..strategy import STRATEGIES
 from intel_extension_for_pytorch.cpu.launch import CPUPoolList
 
 # ### tuning ####
-tuning_default = {"strategy": "grid", "max_trials": 100}
+tuning_default = {
+    "strategy": "grid",
+    "max_trials": 100,
+    "n_startup_trials": 10,
+    "early_stop_ratio": 0,
+    "resume": True,
+    "parallel_trials": 1,
+}
 
 
 def _valid_strategy(data):
@@ -23,6 +30,16 @@ tuning_schema = Schema(
     {
         Optional("strategy", default="grid"): And(str, Use(_valid_strategy)),
         Optional("max_trials", default=100): int,
+        # number of random trials before the tpe strategy builds its model
+        Optional("n_startup_trials", default=10): And(int, lambda s: s > 0),
+        # 0 disables the early stopping
+        Optional("early_stop_ratio", default=0): And(
+            Or(int, float), lambda s: s == 0 or s > 1
+        ),
+        # resume from the trials in output_dir/trials.db
+        Optional("resume", default=True): bool,
+        # number of trials running concurrently on disjoint NUMA nodes
+        Optional("parallel_trials", default=1): And(int, lambda s: s > 0),
     }
 )
 
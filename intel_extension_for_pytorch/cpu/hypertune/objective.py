@@ -1,32 +1,67 @@
 # reference: https://github.com/intel/neural-compressor/blob/\
 #            15477100cef756e430c8ef8ef79729f0c80c8ce6/neural_compressor/objective.py
+import os
+import signal
 import subprocess
 from ...utils._logger import logger, WarningType
 
 
 class MultiObjective(object):
-    def __init__(self, program, program_args, tune_launcher):
+    def __init__(self, program, program_args, tune_launcher, num_objectives):
         self.program = program
         self.program_args = program_args
         self.tune_launcher = tune_launcher
-
-    def evaluate(self, cfg):
+        self.num_objectives = num_objectives
+
+    def evaluate(self, cfg, timeout=None, nodes_list=None):
+        r"""
+        Runs the program with the configuration, on the NUMA nodes of ``nodes_list``
+        if given, and returns ``(status, objective values)``. The status is
+        ``"finished"``, ``"stopped"`` if the run is stopped after ``timeout`` seconds,
+        or ``"failed"`` if the program fails or does not print all the objectives.
+        """
         cmd = ["ipexrun"]
 
         if self.tune_launcher:
-            launcher_args = self.decode_launcer_cfg(cfg)
+            launcher_args = self.decode_launcer_cfg(cfg, nodes_list)
             cmd += launcher_args
+        elif nodes_list is not None:
+            cmd += ["--nodes-list", ",".join(str(n) for n in nodes_list)]
 
         cmd += [self.program]
         cmd += self.program_args
 
-        r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-        # todo: r.returncode != 0
-
-        output = str(r.stdout, "utf-8")
+        r = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            stdout, _ = r.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # ipexrun launches the instances as child processes, stop the whole group
+            os.killpg(r.pid, signal.SIGKILL)
+            r.communicate()
+            return "stopped", None
+
+        output = str(stdout, "utf-8")
+        if r.returncode != 0:
+            logger.warning(
+                f"{self.program} failed with return code {r.returncode} for {cfg}: "
+                + "\n".join(output.strip().splitlines()[-10:]),
+                _type=WarningType.NotSupported,
+            )
+            return "failed", None
         usr_objective_vals = self.extract_usr_objectives(output)
-        return usr_objective_vals
+        if len(usr_objective_vals) != self.num_objectives:
+            logger.warning(
+                f"{self.program} printed {len(usr_objective_vals)} of the "
+                + f"{self.num_objectives} objectives for {cfg}",
+                _type=WarningType.NotSupported,
+            )
+            return "failed", None
+        return "finished", usr_objective_vals
 
     def deprecate_config(self, cfg, deprecated, new, default):
         v_deprecated = default
@@ -49,7 +84,7 @@ class MultiObjective(object):
             ret = v_new
         return ret
 
-    def decode_launcer_cfg(self, cfg):
+    def decode_launcer_cfg(self, cfg, nodes_list=None):
         ncores_per_instance = self.deprecate_config(
             cfg, "ncore_per_instance", "ncores_per_instance", -1
         )
@@ -72,7 +107,15 @@ class MultiObjective(object):
             launcher_args.append("--ninstances")
             launcher_args.append(str(ninstances))
 
-        if use_all_nodes is False:
+        if nodes_list is not None:
+            # the trial is restricted to the NUMA nodes assigned to it
+            launcher_args.append("--nodes-list")
+            launcher_args.append(
+                ",".join(
+                    str(n) for n in (nodes_list if use_all_nodes else nodes_list[:1])
+                )
+            )
+        elif use_all_nodes is False:
             launcher_args.append("--nodes-list")
             launcher_args.append("0")
 
@@ -1,11 +1,16 @@
 # reference: https://github.com/intel/neural-compressor/blob/\
 # 15477100cef756e430c8ef8ef79729f0c80c8ce6/neural_compressor/strategy/strategy.py
 import os
+import time
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import csv
 from collections import OrderedDict
 import click
+import numpy as np
 from ..objective import MultiObjective
+from ..trial_db import TrialDatabase
+from intel_extension_for_pytorch.cpu.launch import CPUPoolList
 
 STRATEGIES = {}
 
@@ -28,6 +33,21 @@ class TuneStrategy(object):
         self.usr_objectives = conf.usr_objectives
 
         self.max_trials = conf.execution_conf.tuning.max_trials
+        self.early_stop_ratio = conf.execution_conf.tuning.early_stop_ratio
+        self.resume = conf.execution_conf.tuning.resume
+        # the concurrent trials run on disjoint NUMA nodes
+        parallel_trials = conf.execution_conf.tuning.parallel_trials
+        if parallel_trials > 1:
+            nodes = sorted(set(c.node for c in CPUPoolList().pool_all))
+            assert parallel_trials <= len(
+                nodes
+            ), f"parallel_trials {parallel_trials} should not be larger than the number of NUMA nodes {len(nodes)}"
+            self.nodes_lists = [
+                [int(n) for n in nodes_list]
+                for nodes_list in np.array_split(nodes, parallel_trials)
+            ]
+        else:
+            self.nodes_lists = [None]
 
         # hyperparams #
         self.hyperparam2searchspace = OrderedDict()
@@ -39,51 +59,148 @@ class TuneStrategy(object):
 
         # objective #
         self.multiobjective = MultiObjective(
-            self.program, self.program_args, tune_launcher
+            self.program, self.program_args, tune_launcher, len(self.usr_objectives)
         )
 
         # output #
         output_name = "record.csv"
         log_name = os.path.join(self.conf.output_dir, output_name)
-        csvfile = open(log_name, "w", newline="")
-        self.tune_result_record = csv.writer(csvfile, delimiter=",")
-        self.tune_result_record.writerow(
-            list(self.hyperparam2searchspace.keys())
-            + [objective["name"] for objective in self.usr_objectives]
-        )
+        self.csvfile = open(log_name, "w", newline="")
+        self.tune_result_record = csv.writer(self.csvfile, delimiter=",")
+        self.tune_result_record.writerow(self._get_record_header())
+        self.pareto_front_name = os.path.join(self.conf.output_dir, "pareto_front.csv")
 
         self.best_tune_result = None
         self.best_tune_cfg = None
+        # (tune_cfg, tune_result) of the non-dominated configurations
+        self.pareto_front = []
+        # (tune_cfg, tune_result) of all the trials, tune_result is None if early stopped or failed
+        self.tune_history = []
+        # the running time of the finished trials
+        self.trial_times = []
+        # the values of the hyperparameters of the finished trials
+        self.done = set()
+        self.trial_db = TrialDatabase(
+            self.conf.output_dir, self.program, self.program_args, self.usr_objectives
+        )
 
     @abstractmethod
     def next_tune_cfg(self):
         raise NotImplementedError
 
-    def traverse(self):
-        click.secho("Starting hypertuning...", fg="green")
-        trials_count = 0
+    def _cfg_key(self, tune_cfg):
+        return tuple(tune_cfg[hp] for hp in self.hyperparams)
 
-        for tune_cfg in self.next_tune_cfg():
+    def _on_resume(self, tune_cfg):
+        # called for each trial resumed from the trial database
+        pass
+
+    def _resume(self):
+        trials_count = 0
+        if not self.resume:
+            return trials_count
+        for tune_cfg, status, tune_result, elapsed in self.trial_db.trials():
+            # the trials out of the current search space
+            if set(tune_cfg.keys()) != set(self.hyperparams) or any(
+                tune_cfg[hp] not in self.hyperparam2searchspace[hp]
+                for hp in self.hyperparams
+            ):
+                continue
+            tune_cfg = {hp: tune_cfg[hp] for hp in self.hyperparams}
             trials_count += 1
+            click.secho("\nResumed tune ", fg="green", nl=False)
+            click.secho(f"{trials_count}", fg="blue", nl=False)
+            click.secho(" from the trial database: ", fg="green", nl=False)
+            click.secho(f"{tune_cfg}", fg="blue")
+            self._add_trial(tune_cfg, status, tune_result, elapsed)
+            self._on_resume(tune_cfg)
+        return trials_count
+
+    def _run_trial(self, tune_cfg, timeout, nodes_list):
+        start = time.perf_counter()
+        status, tune_result = self.multiobjective.evaluate(
+            tune_cfg, timeout, nodes_list
+        )
+        return status, tune_result, time.perf_counter() - start
+
+    def _add_trial(self, tune_cfg, status, tune_result, elapsed):
+        self.done.add(self._cfg_key(tune_cfg))
+        self.tune_history.append((tune_cfg, tune_result))
+        if status == "finished":
+            self.trial_times.append(elapsed)
+            self._update_best_tune_result(tune_result, tune_cfg)
+        elif status == "stopped":
+            click.secho(
+                f"\nTrial {tune_cfg} is early stopped as it runs much longer than the fastest one.",
+                fg="red",
+            )
+        else:
+            click.secho(f"\nTrial {tune_cfg} failed.", fg="red")
+        self._record_tune_result(tune_result, tune_cfg)
 
-            click.secho("\nTune ", fg="green", nl=False)
-            click.secho("{trials_count}", fg="blue", nl=False)
+    def traverse(self):
+        click.secho("Starting hypertuning...", fg="green")
+        trials_count = self._resume()
+        need_stop = trials_count > 0 and self._stop(trials_count)
 
-            click.secho("\nCurrent configuration is: ", fg="green", nl=False)
-            click.secho("{tune_cfg}", fg="blue")
+        tune_cfgs = self.next_tune_cfg()
+        exhausted = False
+        # trial future -> (tune_cfg, nodes_list)
+        pending = {}
+        free_nodes_lists = list(self.nodes_lists)
+        with ThreadPoolExecutor(max_workers=len(self.nodes_lists)) as executor:
+            while True:
+                while (
+                    not need_stop
+                    and not exhausted
+                    and len(free_nodes_lists) > 0
+                    and trials_count + len(pending) < self.max_trials
+                ):
+                    tune_cfg = next(tune_cfgs, None)
+                    if tune_cfg is None:
+                        exhausted = True
+                        break
+                    if self._cfg_key(tune_cfg) in self.done:
+                        continue
+                    nodes_list = free_nodes_lists.pop(0)
 
-            curr_tune_result = self.multiobjective.evaluate(tune_cfg)
+                    click.secho("\nTune ", fg="green", nl=False)
+                    click.secho(
+                        f"{trials_count + len(pending) + 1}", fg="blue", nl=False
+                    )
+                    if nodes_list is not None:
+                        click.secho(" on NUMA nodes ", fg="green", nl=False)
+                        click.secho(f"{nodes_list}", fg="blue", nl=False)
 
-            self._update_best_tune_result(curr_tune_result, tune_cfg)
-            self._record_tune_result(curr_tune_result, tune_cfg)
+                    click.secho("\nCurrent configuration is: ", fg="green", nl=False)
+                    click.secho(f"{tune_cfg}", fg="blue")
 
-            need_stop = self._stop(trials_count)
+                    future = executor.submit(
+                        self._run_trial,
+                        tune_cfg,
+                        self._get_trial_timeout(),
+                        nodes_list,
+                    )
+                    pending[future] = (tune_cfg, nodes_list)
+
+                if len(pending) == 0:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    tune_cfg, nodes_list = pending.pop(future)
+                    free_nodes_lists.append(nodes_list)
+                    status, tune_result, elapsed = future.result()
+                    trials_count += 1
+                    self.trial_db.put(tune_cfg, status, tune_result, elapsed)
+                    self._add_trial(tune_cfg, status, tune_result, elapsed)
+                    # case 1: accuracy goal is met
+                    # case 2: timeout reached (objective goal not met)
+                    # the running trials are still waited for and recorded
+                    need_stop = need_stop or self._stop(trials_count)
 
-            if need_stop:
-                # case 1: accuracy goal is met
-                # case 2: timeout reached (objective goal not met)
-                self._print_best_result()
-                return
+        if need_stop:
+            self._print_best_result()
+            return
 
         # finished traversal
         # case 3: finished traversal (objective goal not met)
@@ -100,58 +217,108 @@ class TuneStrategy(object):
         else:
             return src < dst
 
+    def _dominates(self, src, dst):
+        # src is not worse than dst for all objectives and better for at least one
+        higher_is_better = [
+            objective["higher_is_better"] for objective in self.usr_objectives
+        ]
+        return all(
+            not self._compare(h, dst_val, src_val)
+            for h, src_val, dst_val in zip(higher_is_better, src, dst)
+        ) and any(
+            self._compare(h, src_val, dst_val)
+            for h, src_val, dst_val in zip(higher_is_better, src, dst)
+        )
+
+    def _meets_target(self, tune_result):
+        return all(
+            [
+                self._compare(higher_is_better, val, target_val)
+                for higher_is_better, val, target_val in zip(
+                    [
+                        objective["higher_is_better"]
+                        for objective in self.usr_objectives
+                    ],
+                    tune_result,
+                    [objective["target_val"] for objective in self.usr_objectives],
+                )
+            ]
+        )
+
+    def _get_trial_timeout(self):
+        # a trial running early_stop_ratio times longer than the fastest one is clearly worse
+        if self.early_stop_ratio <= 0 or len(self.trial_times) == 0:
+            return None
+        return self.early_stop_ratio * min(self.trial_times)
+
     def _update_best_tune_result(self, curr_tune_result, curr_tune_cfg):
-        if self.best_tune_result is None and self.best_tune_cfg is None:
-            # initial baseline
-            self.best_tune_result = curr_tune_result
-            self.best_tune_cfg = curr_tune_cfg
-        else:
-            # multi objective
-            if all(
-                [
-                    self._compare(higher_is_better, curr_val, best_val)
-                    for higher_is_better, curr_val, best_val in zip(
-                        [
-                            objective["higher_is_better"]
-                            for objective in self.usr_objectives
-                        ],
-                        curr_tune_result,
-                        self.best_tune_result,
-                    )
-                ]
+        if any(
+            self._dominates(tune_result, curr_tune_result)
+            for _, tune_result in self.pareto_front
+        ):
+            return
+        self.pareto_front = [
+            (tune_cfg, tune_result)
+            for tune_cfg, tune_result in self.pareto_front
+            if not self._dominates(curr_tune_result, tune_result)
+        ]
+        self.pareto_front.append((curr_tune_cfg, curr_tune_result))
+
+        # the best configuration is the one with the best first objective among the
+        # configurations of the Pareto front meeting the target values, if any
+        candidates = [
+            (tune_cfg, tune_result)
+            for tune_cfg, tune_result in self.pareto_front
+            if self._meets_target(tune_result)
+        ]
+        if len(candidates) == 0:
+            candidates = self.pareto_front
+        higher_is_better = self.usr_objectives[0]["higher_is_better"]
+        self.best_tune_cfg, self.best_tune_result = candidates[0]
+        for tune_cfg, tune_result in candidates[1:]:
+            if self._compare(
+                higher_is_better, tune_result[0], self.best_tune_result[0]
             ):
-                self.best_tune_result = curr_tune_result
-                self.best_tune_cfg = curr_tune_cfg
+                self.best_tune_cfg, self.best_tune_result = tune_cfg, tune_result
+        self._save_pareto_front()
+
+    def _get_record_header(self):
+        return list(self.hyperparam2searchspace.keys()) + [
+            objective["name"] for objective in self.usr_objectives
+        ]
+
+    def _save_pareto_front(self):
+        with open(self.pareto_front_name, "w", newline="") as csvfile:
+            pareto_front_record = csv.writer(csvfile, delimiter=",")
+            pareto_front_record.writerow(self._get_record_header())
+            for tune_cfg, tune_result in self.pareto_front:
+                pareto_front_record.writerow(list(tune_cfg.values()) + tune_result)
 
     def _record_tune_result(self, curr_tune_result, curr_tune_cfg):
-        for objective, val in zip(self.usr_objectives, curr_tune_result):
-            click.secho("{objective['name']}: {val}", fg="blue")
+        if curr_tune_result is not None:
+            for objective, val in zip(self.usr_objectives, curr_tune_result):
+                click.secho(f"{objective['name']}: {val}", fg="blue")
 
-        click.secho("Best configuration is: ", fg="green", nl=False)
-        click.secho("{self.best_tune_cfg}", fg="blue")
-        for objective, val in zip(self.usr_objectives, self.best_tune_result):
-            click.secho("{objective['name']}: {val}", fg="blue")
+        if self.best_tune_result is not None:
+            click.secho("Best configuration is: ", fg="green", nl=False)
+            click.secho(f"{self.best_tune_cfg}", fg="blue")
+            for objective, val in zip(self.usr_objectives, self.best_tune_result):
+                click.secho(f"{objective['name']}: {val}", fg="blue")
 
         curr_tune_cfg_val = list(_ for _ in curr_tune_cfg.values())
+        if curr_tune_result is None:
+            # early stopped or failed
+            curr_tune_result = ["" for _ in self.usr_objectives]
         self.tune_result_record.writerow(curr_tune_cfg_val + curr_tune_result)
+        self.csvfile.flush()
 
     def _stop(self, trials_count):
-        if all(
-            [
-                self._compare(higher_is_better, best_val, target_val)
-                for higher_is_better, best_val, target_val in zip(
-                    [
-                        objective["higher_is_better"]
-                        for objective in self.usr_objectives
-                    ],
-                    self.best_tune_result,
-                    [objective["target_val"] for objective in self.usr_objectives],
-                )
-            ]
+        if self.best_tune_result is not None and self._meets_target(
+            self.best_tune_result
         ):
             click.secho("\nFound configuration meeting the target values.", fg="red")
             return True
-        elif trials_count == self.max_trials:
+        elif trials_count >= self.max_trials:
             click.secho(
                 "\nMax trials is reached, but didn't find configuration meeting the objective goal.",
                 fg="red",
@@ -160,7 +327,17 @@ class TuneStrategy(object):
         return False
 
     def _print_best_result(self):
+        if self.best_tune_result is None:
+            click.secho("No trial finished.", fg="red")
+            return
         click.secho("Best configuration found is: ", fg="green", nl=False)
-        click.secho("{self.best_tune_cfg}", fg="blue")
+        click.secho(f"{self.best_tune_cfg}", fg="blue")
         for objective, val in zip(self.usr_objectives, self.best_tune_result):
-            click.secho("{objective['name']}: {val}", fg="blue")
+            click.secho(f"{objective['name']}: {val}", fg="blue")
+        if len(self.usr_objectives) > 1:
+            click.secho(
+                f"Pareto front of the non-dominated configurations (saved in {self.pareto_front_name}):",
+                fg="green",
+            )
+            for tune_cfg, tune_result in self.pareto_front:
+                click.secho(f"{tune_cfg}: {tune_result}", fg="blue")
@@ -0,0 +1,154 @@
+import itertools
+import math
+import numpy as np
+from .strategy import strategy_registry, TuneStrategy
+
+
+@strategy_registry
+class TpeTuneStrategy(TuneStrategy):
+    r"""
+    Tree-structured Parzen Estimator. After ``n_startup_trials`` random trials, the
+    finished trials are split into the good ones (the first non-dominated fronts,
+    about ``gamma`` of the trials) and the bad ones. The next configuration is the
+    candidate sampled from the density of the good ones l(x) maximizing
+    l(x) / g(x), where g(x) is the density of the bad ones.
+    """
+
+    def __init__(self, conf):
+        super().__init__(conf)
+        self.n_startup_trials = conf.execution_conf.tuning.n_startup_trials
+        self.gamma = 0.25
+        self.n_candidates = 24
+
+        self.searchspaces = [self.hyperparam2searchspace[hp] for hp in self.hyperparams]
+        self.num_combinations = math.prod(len(space) for space in self.searchspaces)
+        # the numeric hyperparameters are ordinal, the kernels use the rank of the values
+        self.positions = []
+        for space in self.searchspaces:
+            if all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) for v in space
+            ):
+                self.positions.append(np.argsort(np.argsort(space)).astype(float))
+            else:
+                self.positions.append(None)
+        # the indices of the values of the yielded or resumed configurations
+        self.visited = set()
+
+    def _cfg_to_idx(self, tune_cfg):
+        return tuple(
+            space.index(tune_cfg[hp])
+            for hp, space in zip(self.hyperparams, self.searchspaces)
+        )
+
+    def _on_resume(self, tune_cfg):
+        self.visited.add(self._cfg_to_idx(tune_cfg))
+
+    def _random_unvisited(self):
+        for _ in range(100):
+            idx = tuple(np.random.randint(len(space)) for space in self.searchspaces)
+            if idx not in self.visited:
+                return idx
+        # the search space is almost exhausted
+        for idx in itertools.product(*(range(len(s)) for s in self.searchspaces)):
+            if idx not in self.visited:
+                return idx
+
+    def _nondominated_ranks(self, results):
+        ranks = [None] * len(results)
+        remaining = set(range(len(results)))
+        rank = 0
+        while len(remaining) > 0:
+            front = [
+                i
+                for i in remaining
+                if not any(self._dominates(results[j], results[i]) for j in remaining)
+            ]
+            for i in front:
+                ranks[i] = rank
+            remaining -= set(front)
+            rank += 1
+        return ranks
+
+    def _split_trials(self):
+        finished = [
+            (self._cfg_to_idx(tune_cfg), result)
+            for tune_cfg, result in self.tune_history
+            if result is not None
+        ]
+        # the early stopped and failed trials are always bad
+        stopped = [
+            self._cfg_to_idx(tune_cfg)
+            for tune_cfg, result in self.tune_history
+            if result is None
+        ]
+        ranks = self._nondominated_ranks([result for _, result in finished])
+        sign = -1 if self.usr_objectives[0]["higher_is_better"] else 1
+        order = sorted(
+            range(len(finished)), key=lambda i: (ranks[i], sign * finished[i][1][0])
+        )
+        n_good = max(1, math.ceil(self.gamma * len(self.tune_history)))
+        good = [finished[i][0] for i in order[:n_good]]
+        bad = [finished[i][0] for i in order[n_good:]] + stopped
+        return good, bad
+
+    def _parzen(self, hp_id, observations):
+        space = self.searchspaces[hp_id]
+        # the uniform prior keeps every value reachable
+        density = np.full(len(space), 1.0 / len(space))
+        if len(observations) == 0:
+            return density
+        observations = np.array(observations)
+        positions = self.positions[hp_id]
+        if positions is None:
+            density += np.bincount(observations, minlength=len(space))
+        else:
+            bandwidth = max(1.0, len(space) / (1.0 + len(observations)))
+            kernels = np.exp(
+                -0.5
+                * ((positions[:, None] - positions[observations][None, :]) / bandwidth)
+                ** 2
+            )
+            density += (kernels / kernels.sum(axis=0)).sum(axis=1)
+        return density / density.sum()
+
+    def _suggest(self):
+        good, bad = self._split_trials()
+        log_ratio = []
+        good_densities = []
+        for hp_id in range(len(self.searchspaces)):
+            l_x = self._parzen(hp_id, [idx[hp_id] for idx in good])
+            g_x = self._parzen(hp_id, [idx[hp_id] for idx in bad])
+            good_densities.append(l_x)
+            log_ratio.append(np.log(l_x) - np.log(g_x))
+
+        best_idx = None
+        best_score = -float("inf")
+        for _ in range(self.n_candidates):
+            idx = tuple(np.random.choice(len(l_x), p=l_x) for l_x in good_densities)
+            if idx in self.visited:
+                continue
+            score = sum(log_ratio[hp_id][i] for hp_id, i in enumerate(idx))
+            if score > best_score:
+                best_idx = idx
+                best_score = score
+        if best_idx is None:
+            best_idx = self._random_unvisited()
+        return best_idx
+
+    def next_tune_cfg(self):
+        while len(self.visited) < self.num_combinations:
+            # the running trials are visited but not in the history yet
+            if len(self.tune_history) < self.n_startup_trials:
+                idx = self._random_unvisited()
+            else:
+                idx = self._suggest()
+            self.visited.add(idx)
+
+            tune_cfg = dict(
+                zip(
+                    self.hyperparams,
+                    (space[i] for space, i in zip(self.searchspaces, idx)),
+                )
+            )
+            yield tune_cfg
+        return
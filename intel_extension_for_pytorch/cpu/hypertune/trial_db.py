@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class TrialDatabase(object):
+    r"""
+    SQLite database of the trials in ``output_dir/trials.db``. A trial is keyed by
+    the hash of its configuration, the program (path, content and arguments) and
+    the user objectives, so that an interrupted tuning resumes from the finished
+    trials instead of rerunning them.
+    """
+
+    def __init__(self, output_dir, program, program_args, usr_objectives):
+        self.db_name = os.path.join(output_dir, "trials.db")
+        self.lock = threading.Lock()
+        sha = hashlib.sha256()
+        sha.update(str(Path(program).resolve()).encode())
+        sha.update(Path(program).read_bytes())
+        sha.update(json.dumps(program_args).encode())
+        sha.update(json.dumps(usr_objectives, sort_keys=True).encode())
+        self.program_hash = sha.hexdigest()
+        # the connection is shared by the threads running the trials
+        self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS trials ("
+                + "key TEXT PRIMARY KEY, program_hash TEXT, cfg TEXT, status TEXT, "
+                + "result TEXT, elapsed REAL, created REAL)"
+            )
+
+    def _key(self, tune_cfg):
+        sha = hashlib.sha256()
+        sha.update(self.program_hash.encode())
+        sha.update(json.dumps(tune_cfg, sort_keys=True).encode())
+        return sha.hexdigest()
+
+    def get(self, tune_cfg):
+        r"""
+        Returns ``(status, result, elapsed)`` of the trial, or None if not run yet.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, result, elapsed FROM trials WHERE key = ?",
+                (self._key(tune_cfg),),
+            ).fetchone()
+        if row is None:
+            return None
+        status, result, elapsed = row
+        return status, json.loads(result), elapsed
+
+    def put(self, tune_cfg, status, result, elapsed):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(tune_cfg),
+                    self.program_hash,
+                    json.dumps(tune_cfg),
+                    status,
+                    json.dumps(result),
+                    elapsed,
+                    time.time(),
+                ),
+            )
+
+    def trials(self):
+        r"""
+        Returns ``(tune_cfg, status, result, elapsed)`` of the trials of the program,
+        in the order they finished.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT cfg, status, result, elapsed FROM trials "
+                + "WHERE program_hash = ? ORDER BY created",
+                (self.program_hash,),
+            ).fetchall()
+        return [
+            (json.loads(cfg), status, json.loads(result), elapsed)
+            for cfg, status, result, elapsed in rows
+        ]
@@ -1,6 +1,8 @@
 import sys
 import subprocess
 import os
+import shutil
+import tempfile
 import intel_extension_for_pytorch.cpu.auto_ipex as auto_ipex
 from .launcher_base import Launcher
 from ...utils._logger import WarningType
@@ -77,6 +79,24 @@ class MultiInstancesLauncher(Launcher):
             + '"core_id,core_id,..." or list of core ranges "core_id-core_id,...". '
             + "By default all cores will be used.",
         )
+        group.add_argument(
+            "--share-tensor-weights",
+            "--share_tensor_weights",
+            action="store_true",
+            default=False,
+            help="Share the read-only weights held as tensors (TPP blocked, not prepacked) among the instances "
+            + "on the same NUMA node. The first instance on each node saves the weights passed to "
+            + "ipex.cpu.share_tensor_weights in a file under --share-tensor-weights-dir, which all the instances "
+            + "on the node map instead of keeping their own copies after the optimization.",
+        )
+        group.add_argument(
+            "--share-tensor-weights-dir",
+            "--share_tensor_weights_dir",
+            default="/dev/shm",
+            type=str,
+            help="The directory of the files of the shared weights, which should be on a memory file system "
+            + "(e.g. tmpfs) so that the weights are not read from disk. It is removed when the instances exit.",
+        )
         group.add_argument(
             "--benchmark",
             action="store_true",
@@ -122,6 +142,28 @@ class MultiInstancesLauncher(Launcher):
         )
         return tm_local
 
+    def get_share_tensor_weights_environ(
+        self, cpu_pools, instance_idx, share_tensor_weights_dir
+    ):
+        """
+        Returns the environment variables of each instance to share weights with the
+        other instances on the same NUMA node: the directory of the shared weights of
+        the node, and whether the instance is the leader saving the weights.
+        """
+        environ_instances = {}
+        leaders = {}
+        for i in instance_idx:
+            node = min([c.node for c in cpu_pools[i]])
+            if node not in leaders:
+                leaders[node] = i
+            environ_instances[i] = {
+                "IPEX_SHARED_TENSOR_WEIGHTS_DIR": os.path.join(
+                    share_tensor_weights_dir, f"node_{node}"
+                ),
+                "IPEX_SHARED_TENSOR_WEIGHTS_LEADER": "1" if leaders[node] == i else "0",
+            }
+        return environ_instances
+
     def execution_command_builder(
         self, args, omp_runtime, task_mgr, environ, cpu_pools, index
     ):
@@ -301,8 +343,19 @@ class MultiInstancesLauncher(Launcher):
         assert set(instance_idx).issubset(
             set(instances_available)
         ), "Designated nodes list contains invalid nodes."
+        share_tensor_weights_environ = {}
+        if args.share_tensor_weights:
+            share_tensor_weights_dir = tempfile.mkdtemp(
+                prefix="ipex_shared_tensor_weights_", dir=args.share_tensor_weights_dir
+            )
+            share_tensor_weights_environ = self.get_share_tensor_weights_environ(
+                self.cpuinfo.pools_ondemand, instance_idx, share_tensor_weights_dir
+            )
         processes = []
         for i in instance_idx:
+            for k, v in share_tensor_weights_environ.get(i, {}).items():
+                self.verbose("info", f"env: {k}={v}")
+                environ_local[k] = v
             process = self.execution_command_builder(
                 args=args,
                 omp_runtime=omp_runtime,
@@ -325,6 +378,8 @@ class MultiInstancesLauncher(Launcher):
                 # Clean the temp file
                 if os.path.exists(args.program) and args.program.endswith("_auto_ipex"):
                     os.remove(args.program)
+            if args.share_tensor_weights:
+                shutil.rmtree(share_tensor_weights_dir, ignore_errors=True)
 
 
 if __name__ == "__main__":
@@ -6,4 +6,5 @@ from .multi_stream import (
     MultiStreamModuleHint,
     _MultiStreamBenchmarkModule,
 )
+from .dynamic_batching import DynamicBatcher
 from .runtime_utils import get_core_list_of_node_id
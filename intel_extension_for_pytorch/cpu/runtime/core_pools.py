@@ -0,0 +1,65 @@
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from .cpupool import CPUPool, pin, is_runtime_ext_enabled
+from .runtime_utils import get_num_nodes
+
+
+class CorePools(object):
+    """Run independent functions concurrently, each worker thread on its own pool of cores.
+
+    With the runtime extension (IOMP), every worker thread is pinned to the cores of its pool. Otherwise the
+    worker threads are not pinned, and only their OpenMP thread count is limited to the size of their pool.
+    With 1 pool, the functions run sequentially on the calling thread with all the cores.
+
+    Args:
+        num_pools (int): number of pools to split the cores of the process into.
+            Default to the number of sockets.
+    """
+
+    def __init__(self, num_pools=None):
+        if num_pools is None:
+            num_pools = get_num_nodes()
+        core_ids = CPUPool().core_ids
+        self.num_pools = max(1, min(num_pools, len(core_ids)))
+        self.executor = None
+        # the thread count of the process, which is restored on shutdown
+        self.num_threads = torch.get_num_threads()
+        if self.num_pools == 1:
+            return
+        self.pools = Queue()
+        cores_per_pool = len(core_ids) // self.num_pools
+        for i in range(self.num_pools):
+            self.pools.put(
+                CPUPool(
+                    core_ids=core_ids[i * cores_per_pool : (i + 1) * cores_per_pool]
+                )
+            )
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.num_pools, initializer=self.init_worker
+        )
+
+    def init_worker(self):
+        cpu_pool = self.pools.get()
+        if is_runtime_ext_enabled():
+            # the worker thread keeps the cores for its lifetime
+            pin(cpu_pool).__enter__()
+        else:
+            torch.set_num_threads(len(cpu_pool.core_ids))
+
+    def imap(self, fn, items):
+        r"""
+        Returns an iterator over the results of ``fn`` in the order of ``items``.
+        """
+        if self.executor is None:
+            return (fn(item) for item in items)
+        return self.executor.map(fn, items)
+
+    def map(self, fn, items):
+        return list(self.imap(fn, items))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        torch.set_num_threads(self.num_threads)
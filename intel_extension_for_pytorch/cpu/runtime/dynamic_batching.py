@@ -0,0 +1,237 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import torch
+from .multi_stream import MultiStreamModule
+
+
+class _Request(object):
+    def __init__(self, args, kwargs, batch_size):
+        self.args = args
+        self.kwargs = kwargs
+        self.batch_size = batch_size
+        self.future = Future()
+        self.arrival_time = time.monotonic()
+
+
+def _get_batch_size(hint, obj):
+    # The size of the first input split by the hint, None if no input is split
+    if isinstance(hint, (list, tuple)):
+        for h, o in zip(hint, obj):
+            size = _get_batch_size(h, o)
+            if size is not None:
+                return size
+    elif isinstance(hint, dict):
+        for key in hint:
+            size = _get_batch_size(hint[key], obj[key])
+            if size is not None:
+                return size
+    elif hint is not None:
+        return obj.size(hint)
+    return None
+
+
+def _is_same_unsplit(hint, obj, other):
+    # Whether the inputs not split by the hint are shared by 2 requests
+    if isinstance(hint, (list, tuple)):
+        return all(_is_same_unsplit(h, o1, o2) for h, o1, o2 in zip(hint, obj, other))
+    elif isinstance(hint, dict):
+        return all(_is_same_unsplit(hint[key], obj[key], other[key]) for key in hint)
+    elif hint is None:
+        return obj is other
+    return True
+
+
+def _concat_by_hint(hint, objs):
+    if isinstance(hint, (list, tuple)):
+        return type(hint)(
+            _concat_by_hint(h, [o[i] for o in objs]) for i, h in enumerate(hint)
+        )
+    elif isinstance(hint, dict):
+        return {key: _concat_by_hint(hint[key], [o[key] for o in objs]) for key in hint}
+    elif hint is not None:
+        return torch.cat(objs, dim=hint)
+    return objs[0]
+
+
+def _split_by_hint(hint, obj, split_sizes):
+    if isinstance(hint, (list, tuple)):
+        splits = [_split_by_hint(h, o, split_sizes) for h, o in zip(hint, obj)]
+        return [type(obj)(s[i] for s in splits) for i in range(len(split_sizes))]
+    elif isinstance(hint, dict):
+        splits = {key: _split_by_hint(hint[key], obj[key], split_sizes) for key in hint}
+        return [{key: splits[key][i] for key in hint} for i in range(len(split_sizes))]
+    elif hint is not None:
+        return list(obj.split(split_sizes, dim=hint))
+    return [obj] * len(split_sizes)
+
+
+class DynamicBatcher(object):
+    r"""
+    DynamicBatcher is an asynchronous batching front-end of MultiStreamModule for
+    online inference, where the requests come one by one with small batch sizes.
+
+    The requests submitted by :meth:`submit` are queued. A background thread forms
+    a batch of the queued requests, once their total batch size reaches
+    ``max_batch_size`` or the oldest request has waited for ``max_latency_ms``,
+    runs it with ``multi_stream_module`` which splits it across the streams, and
+    sets the result of each request to its slice of the outputs.
+
+    The inputs and outputs of the requests are concatenated and split by the
+    ``input_split_hint`` and ``output_concat_hint`` of ``multi_stream_module``.
+    The inputs not split by the hint (e.g., a flag) are taken from the first
+    request of the batch, so the requests are only batched together if these
+    inputs are the same objects.
+
+    Args:
+        multi_stream_module (intel_extension_for_pytorch.cpu.runtime.MultiStreamModule):
+            The MultiStreamModule to run the batches, created with ``concat_output=True``.
+        max_batch_size (int): The max total batch size of the requests in a batch.
+            A request larger than it runs as a batch alone.
+        max_latency_ms (float): The max time in milliseconds that a request waits
+            in the queue for more requests to batch with.
+
+    Returns:
+        intel_extension_for_pytorch.cpu.runtime.DynamicBatcher: Generated
+        intel_extension_for_pytorch.cpu.runtime.DynamicBatcher object.
+
+    Examples:
+
+        >>> multi_stream_model = ipex.cpu.runtime.MultiStreamModule(traced_model, num_streams=2, cpu_pool=cpu_pool)
+        >>> with ipex.cpu.runtime.DynamicBatcher(multi_stream_model, max_batch_size=16, max_latency_ms=5) as batcher:
+        >>>     future = batcher.submit(x)  # x with batch size 1
+        >>>     y = future.result()
+        >>>     # or y = await asyncio.wrap_future(batcher.submit(x)) in a coroutine
+
+    :meta public:
+    """
+
+    def __init__(
+        self,
+        multi_stream_module: MultiStreamModule,
+        max_batch_size: int = 32,
+        max_latency_ms: float = 5.0,
+    ):
+        assert isinstance(
+            multi_stream_module, MultiStreamModule
+        ), "Input of multi_stream_module must be an ipex.cpu.runtime.MultiStreamModule"
+        assert (
+            multi_stream_module.concat_output
+        ), "DynamicBatcher requires the MultiStreamModule created with concat_output=True"
+        assert (
+            max_batch_size >= 1
+        ), "max_batch_size of DynamicBatcher should be positive"
+        assert (
+            max_latency_ms >= 0
+        ), "max_latency_ms of DynamicBatcher should not be negative"
+        self.multi_stream_module = multi_stream_module
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        split_hint = multi_stream_module.input_split_hint
+        self.input_hint = (split_hint.args, split_hint.kwargs)
+        # The same structure as the return of MultiStreamModule._concat_output_for_each_stream
+        concat_hint = multi_stream_module.output_concat_hint
+        if concat_hint.args and concat_hint.kwargs:
+            self.output_hint = (concat_hint.args[0], concat_hint.kwargs)
+        elif concat_hint.args:
+            self.output_hint = concat_hint.args[0]
+        else:
+            self.output_hint = concat_hint.kwargs
+
+        self._queue = deque()
+        self._queued_batch_size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, *args, **kwargs):
+        r"""
+        Queues a request with the inputs of ``multi_stream_module``.
+
+        Returns:
+            concurrent.futures.Future: The future of the outputs of the request.
+        """
+        batch_size = _get_batch_size(self.input_hint, (list(args), kwargs))
+        assert (
+            batch_size is not None
+        ), "DynamicBatcher requires at least one input split by the input_split_hint"
+        request = _Request(args, kwargs, batch_size)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("DynamicBatcher is closed")
+            self._queue.append(request)
+            self._queued_batch_size += batch_size
+            self._cond.notify()
+        return request.future
+
+    def __call__(self, *args, **kwargs):
+        return self.submit(*args, **kwargs).result()
+
+    def close(self):
+        r"""
+        Stops accepting requests and waits for the queued ones to finish.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            deadline = self._queue[0].arrival_time + self.max_latency
+            while self._queued_batch_size < self.max_batch_size and not self._closed:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+            batch = [self._queue.popleft()]
+            batch_size = batch[0].batch_size
+            while (
+                self._queue
+                and batch_size + self._queue[0].batch_size <= self.max_batch_size
+                and _is_same_unsplit(
+                    self.input_hint,
+                    (list(batch[0].args), batch[0].kwargs),
+                    (list(self._queue[0].args), self._queue[0].kwargs),
+                )
+            ):
+                batch.append(self._queue.popleft())
+                batch_size += batch[-1].batch_size
+            self._queued_batch_size -= batch_size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                args, kwargs = _concat_by_hint(
+                    self.input_hint, [(list(r.args), r.kwargs) for r in batch]
+                )
+                with torch.no_grad():
+                    outputs = self.multi_stream_module(*args, **kwargs)
+                outputs = _split_by_hint(
+                    self.output_hint, outputs, [r.batch_size for r in batch]
+                )
+            except BaseException as e:
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+            for r, output in zip(batch, outputs):
+                r.future.set_result(output)
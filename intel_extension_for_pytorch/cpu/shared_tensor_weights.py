@@ -0,0 +1,139 @@
+import os
+import time
+import torch
+
+# set by ipexrun --share-tensor-weights for every instance
+_SHARED_TENSOR_WEIGHTS_DIR = "IPEX_SHARED_TENSOR_WEIGHTS_DIR"
+_SHARED_TENSOR_WEIGHTS_LEADER = "IPEX_SHARED_TENSOR_WEIGHTS_LEADER"
+
+
+def _get_shareable_tensors(model):
+    # [(module, kind, attr name, tensor)] of the tensors used as plain tensors by the
+    # kernels. The oneDNN/MKL prepacked weights are owned by the op contexts of the
+    # modules, so they are not shareable.
+    from ..nn.utils._weight_prepack import _IPEXPrepackModule
+
+    tensors = []
+    for module in model.modules():
+        prepacked = isinstance(module, _IPEXPrepackModule) and not getattr(
+            module, "use_tpp", False
+        )
+        for kind, attrs in [
+            ("parameter", module._parameters),
+            ("buffer", module._buffers),
+        ]:
+            for name, t in attrs.items():
+                if prepacked and name in ["weight", "bias"]:
+                    continue
+                tensors.append((module, kind, name, t))
+        weight_for_large_batch = getattr(module, "weight_for_large_batch", None)
+        if isinstance(weight_for_large_batch, torch.Tensor):
+            tensors.append(
+                (module, "attribute", "weight_for_large_batch", weight_for_large_batch)
+            )
+    return [
+        (module, kind, name, t)
+        for module, kind, name, t in tensors
+        if t is not None and t.device.type == "cpu" and t.numel() > 0
+    ]
+
+
+def _wait_for_file(path, timeout):
+    start = time.time()
+    while not os.path.exists(path):
+        if time.time() - start > timeout:
+            raise RuntimeError(
+                f"Timed out after {timeout}s waiting for the shared weights {path} "
+                + "saved by the first instance on the NUMA node"
+            )
+        time.sleep(0.1)
+
+
+def share_tensor_weights(model, name="model", timeout=600):
+    r"""
+    Shares the read-only weights held as tensors by the modules of ``model`` among the
+    instances launched by ``ipexrun --share-tensor-weights`` on the same NUMA node. The
+    first instance on each node saves the tensors to a file on
+    ``--share-tensor-weights-dir`` (``/dev/shm`` by default), then every instance,
+    including the first one, replaces its tensors by the memory-mapped ones, so that
+    the node keeps only one copy of them however many instances run on it.
+
+    It should be called on the model after the weights are converted (e.g., by
+    ``ipex.optimize`` or ``ipex.llm.optimize``) and before it is traced, with the
+    same model in all the instances. The TPP blocked weights, the weights of
+    ``weights_prepack=False`` and all the other parameters and buffers are shared.
+    The weights prepacked by oneDNN or MKL are owned by their op contexts, so every
+    instance keeps its own copy of them. Only the steady-state memory is reduced:
+    every instance still loads and converts its full model before the call, so the
+    peak memory at startup is unchanged.
+    It does nothing if the program is not launched with ``--share-tensor-weights``.
+
+    Args:
+        model (torch.nn.Module): The model to share the weights of.
+        name (str): The name of the file of the shared weights, to share several
+            models. Default value is ``"model"``.
+        timeout (float): The time in seconds to wait for the first instance on the
+            node to save the weights. Default value is ``600``.
+
+    Returns:
+        The model with the shared weights.
+
+    Examples:
+
+        >>> # ipexrun --ninstances 8 --share-tensor-weights script.py
+        >>> model = ipex.llm.optimize(model, dtype=torch.bfloat16, deployment_mode=False)
+        >>> model = ipex.cpu.share_tensor_weights(model)
+    """
+    shared_dir = os.environ.get(_SHARED_TENSOR_WEIGHTS_DIR, None)
+    if shared_dir is None:
+        return model
+    is_leader = os.environ.get(_SHARED_TENSOR_WEIGHTS_LEADER, "0") == "1"
+    path = os.path.join(shared_dir, f"{name}.pt")
+
+    tensors = _get_shareable_tensors(model)
+    # the tied tensors are saved once
+    tensor_ids = {}
+    for i, (_, _, _, t) in enumerate(tensors):
+        tensor_ids.setdefault(id(t), i)
+    if is_leader:
+        os.makedirs(shared_dir, exist_ok=True)
+        # written in a temporary file and renamed, so the others never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(
+            {
+                i: t.detach()
+                for i, (_, _, _, t) in enumerate(tensors)
+                if tensor_ids[id(t)] == i
+            },
+            tmp_path,
+        )
+        os.rename(tmp_path, path)
+    else:
+        _wait_for_file(path, timeout)
+
+    shared = torch.load(path, mmap=True)
+    if set(shared.keys()) != set(tensor_ids.values()):
+        raise RuntimeError(
+            f"The shared weights {path} do not match the model, "
+            + "share_tensor_weights should be called on the same model in all the instances"
+        )
+    for module, kind, attr, t in tensors:
+        shared_t = shared.get(tensor_ids[id(t)], None)
+        if (
+            shared_t is None
+            or shared_t.shape != t.shape
+            or shared_t.dtype != t.dtype
+            or shared_t.stride() != t.stride()
+        ):
+            raise RuntimeError(
+                f"The shared weights {path} do not match the {kind} {attr} of {module.__class__.__name__}, "
+                + "share_tensor_weights should be called on the same model in all the instances"
+            )
+        if kind == "parameter":
+            # keep the Parameter (and its subclass, e.g., BlockedParameter)
+            module._parameters[attr].data = shared_t
+        elif kind == "buffer":
+            module._buffers[attr] = shared_t
+        else:
+            setattr(module, attr, shared_t)
+    return model
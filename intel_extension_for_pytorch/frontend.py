@@ -92,6 +92,50 @@ def _copy_model_and_optimizer(model, optimizer):
         return new_model, new_optimizer
 
 
+def _copy_model_sharing_weights(model):
+    r"""
+    Copies the module tree of ``model`` without copying the storage of its parameters
+    and buffers. Every parameter is wrapped by a new Parameter viewing the same data,
+    so that the optimizations replacing ``param.data`` (dtype conversion, weight
+    prepack) only change the copy, while the untouched parameters are shared.
+    """
+    memo = {}
+
+    def copy_tensor(t):
+        if t is None:
+            return None
+        if id(t) not in memo:
+            if isinstance(t, torch.nn.Parameter):
+                memo[id(t)] = torch.nn.Parameter(t.data, requires_grad=t.requires_grad)
+            else:
+                memo[id(t)] = t.detach()
+        return memo[id(t)]
+
+    def copy_module(m):
+        if isinstance(m, torch.jit.ScriptModule):
+            return m
+        if id(m) in memo:
+            return memo[id(m)]
+        new_m = m.__class__.__new__(m.__class__)
+        memo[id(m)] = new_m
+        new_dict = {}
+        for k, v in m.__dict__.items():
+            # the containers of the parameters, buffers, submodules and hooks
+            if isinstance(v, (dict, set)):
+                v = copy.copy(v)
+            new_dict[k] = v
+        new_m.__dict__ = new_dict
+        for k, p in m._parameters.items():
+            new_m._parameters[k] = copy_tensor(p)
+        for k, b in m._buffers.items():
+            new_m._buffers[k] = copy_tensor(b)
+        for k, sub_m in m._modules.items():
+            new_m._modules[k] = None if sub_m is None else copy_module(sub_m)
+        return new_m
+
+    return copy_module(model)
+
+
 class auto_channels_last_flag(IntFlag):
     AUTO = -1
     DISABLE = 0
@@ -183,6 +227,8 @@ def optimize(
     sample_input=None,
     graph_mode=None,
     concat_linear=None,
+    graph_capture_config=None,
+    share_weights=False,
 ):
     r"""
     Apply optimizations at Python frontend to the given model (nn.Module), as
@@ -274,6 +320,23 @@ def optimize(
         concat_linear (bool): Whether to perform ``concat_linear``. It only
             works for inference model. The default value is ``None``. Explicitly
             setting this knob overwrites the configuration set by ``level`` knob.
+        graph_capture_config (dict) [prototype]: The configuration of the graph cache of
+            ``graph_mode``, with the keys ``cache_size`` (the max number of graphs kept for
+            different input shapes, 1 by default), ``bucket_dims`` (the dims of the inputs
+            padded to the bucket sizes, e.g., ``[0]`` for the batch dim) and ``buckets``
+            (``"pow2"`` or a list of bucket sizes). The default value is ``None``, meaning
+            the graph captured at the first call runs all the inputs. The hits and misses of the cache
+            are returned by ``model.forward.cache_info()``. Each graph embeds its own frozen
+            weight constants, so the memory of the weights can grow up to ``cache_size``
+            times.
+        share_weights (bool): Whether the optimized model shares the storage of the
+            parameters and buffers with the original model, instead of working on a deep
+            copy of it. Only the parameters converted by the optimizations (e.g., dtype
+            conversion and weight prepack) get new storage, one module after another,
+            so the peak memory usage is the original model plus the converted weights.
+            The in-place updates on the other shared tensors are visible by both models.
+            It only works for inference model with ``inplace=False``. The default value
+            is ``False``.
 
     Returns:
         Model and optimizer (if given) modified according to the ``level`` knob
@@ -289,7 +352,8 @@ def optimize(
         Please invoke ``optimize`` function BEFORE invoking DDP in distributed
         training scenario.
 
-        The ``optimize`` function deepcopys the original model. If DDP is invoked
+        The ``optimize`` function deepcopys the original model (unless
+        ``inplace`` or ``share_weights`` is set). If DDP is invoked
         before ``optimize`` function, DDP is applied on the origin model, rather
         than the one returned from ``optimize`` function. In this case, some
         operators in DDP, like allreduce, will not be invoked and thus may cause
@@ -443,9 +507,17 @@ def optimize(
             opt_properties.optimize_lstm = False
             warn_if_user_explicitly_set(optimize_lstm, msg)
 
+    if share_weights and (inplace or optimizer is not None):
+        msg = "share_weights only works for inference model with inplace=False, so disable it"
+        share_weights = False
+        logger.warning(msg, _type=WarningType.NotSupported)
+
     if inplace:
         optimized_model = model
         optimized_optimizer = optimizer
+    elif share_weights:
+        optimized_model = _copy_model_sharing_weights(model)
+        optimized_optimizer = optimizer
     else:
         optimized_model, optimized_optimizer = _copy_model_and_optimizer(
             model, optimizer
@@ -586,6 +658,7 @@ def optimize(
             optimizer is not None,
             dtype,
             opt_properties.weights_prepack,
+            **(graph_capture_config if graph_capture_config is not None else {}),
         )
         optimized_model.forward = wrapper(_old_forward)
 
@@ -1,8 +1,10 @@
 import warnings
 from .frontend import optimize
+from ..transformers.profiler import GenerationProfiler
 from . import modules
 from . import functional
 from . import quantization
+from . import serving
 
 try:
     from . import generation
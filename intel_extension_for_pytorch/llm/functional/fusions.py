@@ -105,6 +105,10 @@ def indirect_access_kv_cache_attention(
     add_casual_mask: Optional[bool] = True,
     seq_info: Optional[torch.Tensor] = None,
     text_max_length: Optional[int] = 0,
+    kv_cache_chunk_size: Optional[int] = 256,
+    kv_cache_growth_factor: Optional[float] = 2.0,
+    kv_cache_max_length: Optional[int] = None,
+    kv_cache_dtype: Optional[str] = None,
 ):
     r"""
     kv_cache is used to reduce computation for **Decoder** layer but it also brings memory overheads,
@@ -139,8 +143,15 @@ def indirect_access_kv_cache_attention(
 
         head_mask (torch.Tensor): Head mask tensor which is not supported by kernel yet.
         attention_mask(torch.Tensor): Attention mask information.
-        text_max_length (int) : the max length of kv cache to be used for generation
-            (allocate the pre-cache buffer).
+        text_max_length (int) : the expected max length of kv cache to be used for generation,
+            the buffers do not grow beyond it unless the sequence is longer.
+        kv_cache_chunk_size (int) : the initial size and the minimal growth of the buffers, in tokens.
+        kv_cache_growth_factor (float) : the buffers grow to at least ``kv_cache_growth_factor``
+            times of their current size once they are full.
+        kv_cache_max_length (int) : the upper bound of the sequence length, a RuntimeError is
+            raised when the sequence is longer. None means no limit.
+        kv_cache_dtype (str) : ``"int8"`` or ``"fp8"`` to store the key/value buffers quantized,
+            with one fp32 scale per token and head. None keeps the dtype of the key/value states.
 
     Return:
         attn_output: weighted value which is the output of scale dot product.
@@ -182,6 +193,10 @@ def indirect_access_kv_cache_attention(
         add_casual_mask,
         seq_info,
         text_max_length,
+        kv_cache_chunk_size=kv_cache_chunk_size,
+        kv_cache_growth_factor=kv_cache_growth_factor,
+        kv_cache_max_length=kv_cache_max_length,
+        kv_cache_dtype=kv_cache_dtype,
     )
 
 
@@ -205,6 +220,9 @@ def varlen_attention(
     Applies PyTorch scaled_dot_product_attention on the inputs of query, key and value
     (see https://pytorch.org/docs/stable/generated/torch.nn.functional.scaled_dot_product_attention.html),
     and accept the variant (different) sequence length among the query, key and value.
+    The sequences are attended one by one on the packed inputs, without padding them to
+    ``max_seqlen_q``/``max_seqlen_k``, and the key/value heads are shared by the query heads
+    of their group (GQA/MQA) without being repeated.
 
     This module does not have args for `module init`.
 
@@ -213,10 +231,11 @@ def varlen_attention(
     Args:
         query (torch.Tensor): shape [query_tokens, num_head, head_size],
             where tokens is total sequence length among batch size.
-        key (torch.Tensor):  shape [key_tokens, num_head, head_size],
+        key (torch.Tensor):  shape [key_tokens, num_head_k, head_size],
             where tokens is total sequence length among batch size.
-        value (torch.Tensor): shape [value_tokens, num_head, head_size],
+        value (torch.Tensor): shape [value_tokens, num_head_k, head_size],
             where tokens is total sequence length among batch size.
+            ``num_head`` should be a multiple of ``num_head_k``.
         out (torch.Tensor): buffer to get the results, the shape is the same as query.
         seqlen_q (torch.Tensor): shape [batch_size + 1],
             points the current query_tokens among total sequence length.
@@ -226,6 +245,7 @@ def varlen_attention(
         max_seqlen_k (int): max/total sequence length of key.
         pdropout (float): dropout probability; if greater than 0.0, dropout is applied, default is 0.0.
         softmax_scale (float): scaling factor applied is prior to softmax.
+            None means ``1 / sqrt(head_size)``.
         is_causal (bool): whether to apply causal attention masking, default is True.
 
     """
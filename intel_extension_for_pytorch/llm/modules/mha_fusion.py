@@ -301,6 +301,9 @@ class VarlenAttention(nn.Module):
     [module init and forward] Applies PyTorch scaled_dot_product_attention on the inputs of query, key and value
     (see https://pytorch.org/docs/stable/generated/torch.nn.functional.scaled_dot_product_attention.html),
     and accept the variant (different) sequence length among the query, key and value.
+    The sequences are attended one by one on the packed inputs, without padding them to
+    ``max_seqlen_q``/``max_seqlen_k``, and the key/value heads are shared by the query heads
+    of their group (GQA/MQA) without being repeated.
 
     This module does not have args for `module init`.
 
@@ -309,10 +312,11 @@ class VarlenAttention(nn.Module):
     Args:
         query (torch.Tensor): shape [query_tokens, num_head, head_size],
             where tokens is total sequence length among batch size.
-        key (torch.Tensor):  shape [key_tokens, num_head, head_size],
+        key (torch.Tensor):  shape [key_tokens, num_head_k, head_size],
             where tokens is total sequence length among batch size.
-        value (torch.Tensor): shape [value_tokens, num_head, head_size],
+        value (torch.Tensor): shape [value_tokens, num_head_k, head_size],
             where tokens is total sequence length among batch size.
+            ``num_head`` should be a multiple of ``num_head_k``.
         out (torch.Tensor): buffer to get the results, the shape is the same as query.
         seqlen_q (torch.Tensor): shape [batch_size + 1], points the
             current query_tokens among total sequence length.
@@ -323,6 +327,7 @@ class VarlenAttention(nn.Module):
         pdropout (float): dropout probability; if greater than 0.0,
             dropout is applied, default is 0.0.
         softmax_scale (float): scaling factor applied is prior to softmax.
+            None means ``1 / sqrt(head_size)``.
         is_causal (bool): whether to apply causal attention masking, default is True.
 
     Examples:
@@ -439,8 +444,14 @@ class PagedAttention:
     The block is basic allocation unit of paged attention and the token intra-block are stored one-by-one.
     The block tables are used to map the logical block of sequence into the physical block.
 
+    The key/value cache buffers can also be allocated in ``torch.int8`` or ``torch.float8_e4m3fn``, the
+    key/value states are then quantized with one fp32 scale per token and head, stored in ``k_scale`` and
+    ``v_scale`` buffers of the shape ``key_cache.shape[:-1]``. The scale-dot-product dequantizes the
+    cached tokens per token and head.
+
     [class method]: reshape_and_cache
-    ipex.llm.modules.PagedAttention.reshape_and_cache(key, value, key_cache, value_cache, slot_mapping)
+    ipex.llm.modules.PagedAttention.reshape_and_cache(key, value, key_cache, value_cache, slot_mapping,
+    k_scale=None, v_scale=None)
     This operator is used to store the key/value token states into the pre-allcated kv_cache buffers of paged attention.
 
     Args:
@@ -453,6 +464,10 @@ class PagedAttention:
         slot_mapping (torch.Tensor):  It stores the position to store the key/value in the pre-allocated buffers.
             The shape should be the number of sequences. For sequence ``i``, the ``slot_mapping[i] // block_number``
             can get the block index, and the ``slot_mapping % block_size`` can get the offset of this block.
+        k_scale (torch.Tensor, optional): The pre-allocated fp32 buffer to store the scales of the int8/fp8
+            key cache. The shape should be ``key_cache.shape[:-1]``.
+        v_scale (torch.Tensor, optional): The pre-allocated fp32 buffer to store the scales of the int8/fp8
+            value cache. The shape should be ``value_cache.shape[:-1]``.
 
     [class method]: single_query_cached_kv_attention
 
@@ -470,7 +485,9 @@ class PagedAttention:
                                                             context_lens,
                                                             block_size,
                                                             max_context_len,
-                                                            alibi_slopes
+                                                            alibi_slopes,
+                                                            k_scale=None,
+                                                            v_scale=None,
                                                             )
 
     This operator is used to be calculated the scale-dot-product based on the paged attention.
@@ -494,6 +511,8 @@ class PagedAttention:
         block_size (int): The block size which means the number of token in every block.
         max_context_len (int): The max sequence length.
         alibi_slopes (torch.Tensor, optinal): which is the alibi slope with the shape of (num_heads).
+        k_scale (torch.Tensor, optional): The scales of the int8/fp8 key cache.
+        v_scale (torch.Tensor, optional): The scales of the int8/fp8 value cache.
 
     """
 
@@ -507,10 +526,14 @@ class PagedAttention:
         key_cache: torch.Tensor,
         value_cache: torch.Tensor,
         slot_mapping: torch.Tensor,
+        k_scale: Optional[torch.Tensor] = None,
+        v_scale: Optional[torch.Tensor] = None,
     ):
         return cls.runtime_ops.get_module_from_device(
             key.device.type, IPEXCustomOpType.PAGED_ATTENTION, False
-        ).reshape_and_cache(key, value, key_cache, value_cache, slot_mapping)
+        ).reshape_and_cache(
+            key, value, key_cache, value_cache, slot_mapping, k_scale, v_scale
+        )
 
     @classmethod
     def single_query_cached_kv_attention(
@@ -526,6 +549,8 @@ class PagedAttention:
         block_size: int,
         max_context_len: int,
         alibi_slopes: torch.Tensor,
+        k_scale: Optional[torch.Tensor] = None,
+        v_scale: Optional[torch.Tensor] = None,
     ):
         return cls.runtime_ops.get_module_from_device(
             output.device.type, IPEXCustomOpType.PAGED_ATTENTION, False
@@ -541,6 +566,8 @@ class PagedAttention:
             block_size,
             max_context_len,
             alibi_slopes,
+            k_scale,
+            v_scale,
         )
 
 
@@ -561,11 +588,30 @@ class IndirectAccessKVCacheAttention(nn.Module):
     the hidden state of key/value which is the shape of [beam*batch, head_num, head_size] is stored token by token.
     All beam idx information of every timestamp is also stored in a Tensor with the shape of [max_seq, beam*batch].
 
+    The buffers are grown on demand: the first token allocates ``kv_cache_chunk_size`` tokens (or the prompt
+    length plus ``kv_cache_chunk_size`` for longer prompts), and once they are full, the buffers are reallocated
+    to ``max(cur_size + kv_cache_chunk_size, cur_size * kv_cache_growth_factor)`` tokens, without exceeding
+    ``text_max_length`` as long as the sequence fits in it. The largest buffers used by the module are recorded
+    in ``peak_kv_cache_bytes``.
+
+    With ``kv_cache_dtype``, the key/value buffers are stored in int8 or fp8 (float8_e4m3fn) with one fp32 scale
+    per token and head, the scale follows the values of every head: [max_seq, beam*batch, head_num, head_size + 4].
+    The kernel quantizes the new tokens and dequantizes the past ones per head, the float buffers are never
+    materialized.
+
     `module init`
 
     Args:
-        text_max_length (int) : the max length of kv cache to be used
-            for generation (allocate the pre-cache buffer).
+        text_max_length (int) : the expected max length of kv cache to be used
+            for generation, the buffers do not grow beyond it unless the sequence is longer.
+        kv_cache_chunk_size (int) : the initial size and the minimal growth of the buffers, in tokens.
+            Default is 256.
+        kv_cache_growth_factor (float) : the buffers grow to at least ``kv_cache_growth_factor`` times of
+            their current size. Default is 2.0, 1.0 grows the buffers by ``kv_cache_chunk_size`` only.
+        kv_cache_max_length (int) : the upper bound of the sequence length, a RuntimeError is raised
+            when the sequence is longer. Default is None, meaning no limit.
+        kv_cache_dtype (str) : ``"int8"`` or ``"fp8"`` to quantize the key/value buffers. Default is None,
+            meaning the dtype of the key/value states.
 
     `forward()`
 
@@ -622,9 +668,23 @@ class IndirectAccessKVCacheAttention(nn.Module):
 
     runtime_ops: IPEXRuntimeCustomOps = IPEXRuntimeCustomOps()
 
-    def __init__(self, text_max_length=2048):
+    def __init__(
+        self,
+        text_max_length=2048,
+        kv_cache_chunk_size=256,
+        kv_cache_growth_factor=2.0,
+        kv_cache_max_length=None,
+        kv_cache_dtype=None,
+    ):
         super().__init__()
+        assert kv_cache_chunk_size > 0, "kv_cache_chunk_size should be positive"
+        assert kv_cache_growth_factor >= 1.0, "kv_cache_growth_factor should be >= 1.0"
         self.text_max_length = text_max_length
+        self.kv_cache_chunk_size = kv_cache_chunk_size
+        self.kv_cache_growth_factor = kv_cache_growth_factor
+        self.kv_cache_max_length = kv_cache_max_length
+        self.kv_cache_dtype = kv_cache_dtype
+        self.peak_kv_cache_bytes = 0
 
     @classmethod
     def apply_function(
@@ -640,6 +700,10 @@ class IndirectAccessKVCacheAttention(nn.Module):
         add_casual_mask: Optional[bool] = True,
         seq_info: Optional[torch.Tensor] = None,
         text_max_length: Optional[int] = 0,
+        kv_cache_chunk_size: Optional[int] = 256,
+        kv_cache_growth_factor: Optional[float] = 2.0,
+        kv_cache_max_length: Optional[int] = None,
+        kv_cache_dtype: Optional[str] = None,
     ):
         return cls.runtime_ops.get_module_from_device(
             query.device.type, IPEXCustomOpType.INDIRECTACCESS_KVCACHE_ATTENTION, False
@@ -655,8 +719,29 @@ class IndirectAccessKVCacheAttention(nn.Module):
             add_casual_mask,
             seq_info,
             text_max_length,
+            kv_cache_chunk_size=kv_cache_chunk_size,
+            kv_cache_growth_factor=kv_cache_growth_factor,
+            kv_cache_max_length=kv_cache_max_length,
+            kv_cache_dtype=kv_cache_dtype,
         )
 
+    @classmethod
+    def get_peak_kv_cache_bytes(cls, model: nn.Module):
+        r"""
+        Returns the peak indirect access kv cache bytes (key, value and beam idx buffers)
+        of every attention layer of ``model``, e.g., a model optimized by ``ipex.llm.optimize``
+        with ``deployment_mode=False``, in the order of ``model.modules()``.
+        """
+        from ...transformers.models.cpu.fusions.mha_fusion import (
+            _IPEXScaleDotProductCPU,
+        )
+
+        return [
+            m.peak_kv_cache_bytes
+            for m in model.modules()
+            if isinstance(m, (cls, _IPEXScaleDotProductCPU))
+        ]
+
     def forward(
         self,
         query: torch.Tensor,
@@ -686,13 +771,14 @@ class IndirectAccessKVCacheAttention(nn.Module):
         # value_cache: Value cache tensor [max_seq, batch, seq_len, num_head, head_dim]
         # beam-idx: History beam idx [max_seq, batch]
 
+        # the runtime module is shared by all the instances, pass the kv cache
+        # settings of this instance explicitly
         runtime_module = self.runtime_ops.get_module_from_device(
             query.device.type,
             IPEXCustomOpType.INDIRECTACCESS_KVCACHE_ATTENTION,
-            True,
-            self.text_max_length,
+            False,
         )
-        return runtime_module(
+        outputs = runtime_module.apply_function(
             query,
             key,
             value,
@@ -703,4 +789,15 @@ class IndirectAccessKVCacheAttention(nn.Module):
             alibi,
             add_casual_mask,
             seq_info,
+            self.text_max_length,
+            kv_cache_chunk_size=self.kv_cache_chunk_size,
+            kv_cache_growth_factor=self.kv_cache_growth_factor,
+            kv_cache_max_length=self.kv_cache_max_length,
+            kv_cache_dtype=self.kv_cache_dtype,
         )
+        if not torch.jit.is_tracing() and outputs[2] is not None:
+            self.peak_kv_cache_bytes = max(
+                self.peak_kv_cache_bytes,
+                sum(t.numel() * t.element_size() for t in outputs[2][1:4]),
+            )
+        return outputs
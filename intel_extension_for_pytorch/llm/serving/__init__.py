@@ -0,0 +1,4 @@
+from .engine import Engine, RequestOutput
+from .scheduler import SamplingParams, Scheduler
+from .block_manager import BlockAllocator, BlockSpaceManager
+from .cache import PagedKVCache
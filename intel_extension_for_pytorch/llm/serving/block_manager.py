@@ -0,0 +1,245 @@
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+
+class BlockAllocator:
+    r"""
+    Reference counted free list of the physical blocks of the paged KV cache. A
+    physical block holds ``block_size`` tokens of key/value states for every
+    layer, so one block index is valid for all the per-layer key/value caches.
+
+    With ``enable_prefix_caching``, full blocks can be registered with the hash
+    of their tokens (and of all the tokens before them). A registered block whose
+    reference count drops to zero is not returned to the free list right away:
+    it stays reusable by :meth:`get_cached_block` until it is evicted (least
+    recently used first) because the free list is empty.
+
+    Args:
+        num_blocks (int): number of physical blocks in the KV cache pool.
+        enable_prefix_caching (bool): keep the registered blocks reusable after
+            they are freed. Default is False.
+    """
+
+    def __init__(self, num_blocks: int, enable_prefix_caching: bool = False):
+        assert num_blocks > 0, "the KV cache pool needs at least one block"
+        self.num_blocks = num_blocks
+        self.enable_prefix_caching = enable_prefix_caching
+        self.free_blocks = deque(range(num_blocks))
+        self.ref_counts = [0] * num_blocks
+        self.cached_blocks: Dict[int, int] = {}
+        self.block_hashes: Dict[int, int] = {}
+        # blocks with zero reference which are still in cached_blocks, in LRU order
+        self.evictor: "OrderedDict[int, None]" = OrderedDict()
+
+    def allocate(self) -> int:
+        if self.free_blocks:
+            block = self.free_blocks.popleft()
+        elif self.evictor:
+            block, _ = self.evictor.popitem(last=False)
+            del self.cached_blocks[self.block_hashes.pop(block)]
+        else:
+            raise RuntimeError("Out of memory! No free KV cache blocks are available")
+        self.ref_counts[block] = 1
+        return block
+
+    def fork(self, block: int) -> int:
+        self.ref_counts[block] += 1
+        return block
+
+    def free(self, block: int):
+        assert self.ref_counts[block] > 0, f"double free of KV cache block {block}"
+        self.ref_counts[block] -= 1
+        if self.ref_counts[block] > 0:
+            return
+        if block in self.block_hashes:
+            self.evictor[block] = None
+        else:
+            self.free_blocks.append(block)
+
+    def get_ref_count(self, block: int) -> int:
+        return self.ref_counts[block]
+
+    def register(self, block: int, block_hash: int):
+        if not self.enable_prefix_caching or block_hash in self.cached_blocks:
+            return
+        self.cached_blocks[block_hash] = block
+        self.block_hashes[block] = block_hash
+
+    def contains(self, block_hash: int) -> bool:
+        return block_hash in self.cached_blocks
+
+    def is_evictable(self, block_hash: int) -> bool:
+        return self.cached_blocks.get(block_hash, -1) in self.evictor
+
+    def get_cached_block(self, block_hash: int) -> Optional[int]:
+        block = self.cached_blocks.get(block_hash, None)
+        if block is None:
+            return None
+        if block in self.evictor:
+            del self.evictor[block]
+        return self.fork(block)
+
+    def get_num_free_blocks(self) -> int:
+        return len(self.free_blocks) + len(self.evictor)
+
+
+class BlockSpaceManager:
+    r"""
+    Maps the logical blocks of every running sequence to physical blocks of the
+    :class:`BlockAllocator`, i.e., owns the ``block_tables`` consumed by
+    ``ipex.llm.modules.PagedAttention.single_query_cached_kv_attention``.
+
+    With ``enable_prefix_caching``, every full block of a sequence is hashed
+    together with its prefix when the sequence is admitted. Blocks already
+    holding the same prefix are shared (reference counted) instead of being
+    allocated, and their tokens are skipped by the prefill. A shared block is
+    copied to a private one before the sequence writes into it (copy on write);
+    the copies are reported by :meth:`get_pending_copies` and must be applied on
+    the KV cache before the next forward.
+
+    Args:
+        num_blocks (int): number of physical blocks in the KV cache pool.
+        block_size (int): number of tokens stored in every block.
+        watermark (float): fraction of the pool kept free when admitting new
+            prompts, so that running sequences can still grow for a few steps
+            without being preempted.
+        enable_prefix_caching (bool): share the KV cache blocks of common
+            prompt prefixes among sequences. Default is False.
+    """
+
+    def __init__(
+        self,
+        num_blocks: int,
+        block_size: int,
+        watermark: float = 0.01,
+        enable_prefix_caching: bool = False,
+    ):
+        self.block_size = block_size
+        self.enable_prefix_caching = enable_prefix_caching
+        self.allocator = BlockAllocator(num_blocks, enable_prefix_caching)
+        self.watermark_blocks = int(watermark * num_blocks)
+        self.block_tables: Dict[int, List[int]] = {}
+        self.pending_copies: List[Tuple[int, int]] = []
+        self.num_queried_tokens = 0
+        self.num_hit_tokens = 0
+
+    def _num_required_blocks(self, num_tokens: int) -> int:
+        return (num_tokens + self.block_size - 1) // self.block_size
+
+    def _get_block_hashes(self, seq) -> List[int]:
+        if not self.enable_prefix_caching:
+            return []
+        block_hashes = []
+        parent_hash = None
+        for start in range(0, seq.get_len() - self.block_size + 1, self.block_size):
+            parent_hash = hash(
+                (parent_hash, tuple(seq.token_ids[start : start + self.block_size]))
+            )
+            block_hashes.append(parent_hash)
+        return block_hashes
+
+    def _get_num_cached_blocks(self, block_hashes: List[int]) -> int:
+        # only a contiguous prefix of cached blocks can be skipped by the prefill
+        num_cached_blocks = 0
+        for block_hash in block_hashes:
+            if not self.allocator.contains(block_hash):
+                break
+            num_cached_blocks += 1
+        return num_cached_blocks
+
+    def can_allocate(self, seq) -> bool:
+        num_required_blocks = self._num_required_blocks(seq.get_len())
+        block_hashes = self._get_block_hashes(seq)
+        num_cached_blocks = self._get_num_cached_blocks(block_hashes)
+        # cached blocks with zero reference are counted as free ones, reusing them
+        # consumes the free space as well
+        num_evictable_hits = sum(
+            self.allocator.is_evictable(block_hash)
+            for block_hash in block_hashes[:num_cached_blocks]
+        )
+        num_new_blocks = num_required_blocks - num_cached_blocks
+        if num_cached_blocks * self.block_size >= seq.get_len():
+            # the last cached block is copied before recomputing the last token
+            num_new_blocks += 1
+        return (
+            self.allocator.get_num_free_blocks() - num_evictable_hits - num_new_blocks
+            >= self.watermark_blocks
+        )
+
+    def _copy_on_write(self, block_table: List[int], index: int):
+        block = block_table[index]
+        if self.allocator.get_ref_count(block) == 1:
+            return
+        new_block = self.allocator.allocate()
+        self.allocator.free(block)
+        self.pending_copies.append((block, new_block))
+        block_table[index] = new_block
+
+    def allocate(self, seq):
+        assert seq.seq_id not in self.block_tables, "sequence is already allocated"
+        block_hashes = self._get_block_hashes(seq)
+        num_cached_blocks = self._get_num_cached_blocks(block_hashes)
+        block_table = [
+            self.allocator.get_cached_block(block_hash)
+            for block_hash in block_hashes[:num_cached_blocks]
+        ]
+        for index in range(num_cached_blocks, self._num_required_blocks(seq.get_len())):
+            block = self.allocator.allocate()
+            if index < len(block_hashes):
+                # the prefill of this step computes the content of the block
+                self.allocator.register(block, block_hashes[index])
+            block_table.append(block)
+        self.block_tables[seq.seq_id] = block_table
+        # the last token is always computed to get the logits of the next token
+        seq.num_cached_tokens = min(
+            num_cached_blocks * self.block_size, seq.get_len() - 1
+        )
+        if seq.num_cached_tokens < num_cached_blocks * self.block_size:
+            self._copy_on_write(block_table, num_cached_blocks - 1)
+        self.num_queried_tokens += seq.get_len()
+        self.num_hit_tokens += seq.num_cached_tokens
+
+    def can_append_slot(self, seq) -> bool:
+        block_table = self.block_tables[seq.seq_id]
+        if len(block_table) * self.block_size >= seq.get_len():
+            if self.allocator.get_ref_count(block_table[-1]) == 1:
+                return True
+        return self.allocator.get_num_free_blocks() > 0
+
+    def append_slot(self, seq):
+        # the last token of the sequence has no key/value states yet, make sure
+        # the block holding its slot exists and is owned by this sequence only
+        block_table = self.block_tables[seq.seq_id]
+        if len(block_table) * self.block_size < seq.get_len():
+            block_table.append(self.allocator.allocate())
+        else:
+            self._copy_on_write(block_table, len(block_table) - 1)
+
+    def free(self, seq):
+        if seq.seq_id not in self.block_tables:
+            return
+        # free the tail first so the blocks of the shortest prefixes are evicted last
+        for block in reversed(self.block_tables.pop(seq.seq_id)):
+            self.allocator.free(block)
+
+    def get_block_table(self, seq) -> List[int]:
+        return self.block_tables[seq.seq_id]
+
+    def get_slot(self, seq, position: int) -> int:
+        block_table = self.block_tables[seq.seq_id]
+        return (
+            block_table[position // self.block_size] * self.block_size
+            + position % self.block_size
+        )
+
+    def get_pending_copies(self) -> List[Tuple[int, int]]:
+        pending_copies, self.pending_copies = self.pending_copies, []
+        return pending_copies
+
+    def get_num_free_blocks(self) -> int:
+        return self.allocator.get_num_free_blocks()
+
+    def get_prefix_cache_hit_rate(self) -> float:
+        if self.num_queried_tokens == 0:
+            return 0.0
+        return self.num_hit_tokens / self.num_queried_tokens
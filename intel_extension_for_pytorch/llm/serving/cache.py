@@ -0,0 +1,258 @@
+import torch
+from typing import Dict, List, Optional, Tuple
+from ..modules import PagedAttention
+
+
+class PagedInputMetadata:
+    r"""
+    Paged attention inputs of one engine step, shared by all the layers.
+
+    Args:
+        is_prefill (bool): whether this step prefills one prompt or decodes one token
+            for a batch of sequences.
+        slot_mapping (torch.Tensor): [num_tokens] the KV cache slot of every new token.
+        block_tables (torch.Tensor): [num_seqs, max_num_blocks_per_seq] the block table
+            of every sequence.
+        context_lens (torch.Tensor): [num_seqs] the number of tokens of every sequence
+            (including the new ones).
+        max_context_len (int): the max value of ``context_lens``.
+        num_prefix_tokens (int): for prefill steps, the number of prompt tokens whose
+            key/value states are reused from the prefix cache and thus not in the inputs.
+    """
+
+    def __init__(
+        self,
+        is_prefill: bool,
+        slot_mapping: torch.Tensor,
+        block_tables: Optional[torch.Tensor] = None,
+        context_lens: Optional[torch.Tensor] = None,
+        max_context_len: int = 0,
+        num_prefix_tokens: int = 0,
+    ):
+        self.is_prefill = is_prefill
+        self.slot_mapping = slot_mapping
+        self.block_tables = block_tables
+        self.context_lens = context_lens
+        self.max_context_len = max_context_len
+        self.num_prefix_tokens = num_prefix_tokens
+
+
+class PagedKVCache:
+    r"""
+    The per-layer key/value caches of the paged attention, with the layout
+    [num_blocks, num_kv_heads, block_size, head_size] expected by the
+    ``torch_ipex`` paged attention kernels. The buffers are allocated lazily on
+    the first step of every layer, so the number of kv heads (which may be
+    sharded by tensor parallel), the head size and the dtype are taken from the
+    key/value states produced by the model.
+
+    Args:
+        num_blocks (int): number of physical blocks.
+        block_size (int): number of tokens stored in every block.
+        kv_cache_dtype (str): store the key/value states in ``"int8"`` or ``"fp8"``
+            (float8_e4m3fn) with one fp32 scale per token and kv head, instead of
+            the dtype of the model. Default is None.
+    """
+
+    def __init__(
+        self, num_blocks: int, block_size: int, kv_cache_dtype: Optional[str] = None
+    ):
+        from ...transformers.models.cpu.fusions.mha_fusion import _get_kv_cache_dtype
+
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.kv_cache_dtype = kv_cache_dtype
+        quantized_kv = _get_kv_cache_dtype(kv_cache_dtype)
+        self.quantized_dtype = quantized_kv[0] if quantized_kv is not None else None
+        self.key_caches: Dict[int, torch.Tensor] = {}
+        self.value_caches: Dict[int, torch.Tensor] = {}
+        self.key_scales: Dict[int, torch.Tensor] = {}
+        self.value_scales: Dict[int, torch.Tensor] = {}
+        self.head_mappings: Dict[Tuple[int, int], torch.Tensor] = {}
+        self.input_metadata: Optional[PagedInputMetadata] = None
+
+    def get_kv_cache(self, layer_idx: int, key: torch.Tensor):
+        if layer_idx not in self.key_caches:
+            num_kv_heads, head_size = key.size(-2), key.size(-1)
+            shape = [self.num_blocks, num_kv_heads, self.block_size, head_size]
+            dtype = (
+                self.quantized_dtype if self.quantized_dtype is not None else key.dtype
+            )
+            self.key_caches[layer_idx] = torch.zeros(
+                shape, dtype=dtype, device=key.device
+            )
+            self.value_caches[layer_idx] = torch.zeros(
+                shape, dtype=dtype, device=key.device
+            )
+            if self.quantized_dtype is not None:
+                self.key_scales[layer_idx] = torch.zeros(
+                    shape[:-1], dtype=torch.float, device=key.device
+                )
+                self.value_scales[layer_idx] = torch.zeros(
+                    shape[:-1], dtype=torch.float, device=key.device
+                )
+        return self.key_caches[layer_idx], self.value_caches[layer_idx]
+
+    def get_kv_scales(self, layer_idx: int):
+        if self.quantized_dtype is None:
+            return None, None
+        return self.key_scales[layer_idx], self.value_scales[layer_idx]
+
+    def get_head_mapping(self, num_heads: int, num_kv_heads: int):
+        if (num_heads, num_kv_heads) not in self.head_mappings:
+            self.head_mappings[(num_heads, num_kv_heads)] = torch.repeat_interleave(
+                torch.arange(num_kv_heads, dtype=torch.int32),
+                num_heads // num_kv_heads,
+            )
+        return self.head_mappings[(num_heads, num_kv_heads)]
+
+    def copy_blocks(self, block_pairs: List[Tuple[int, int]]):
+        if not block_pairs:
+            return
+        src = torch.tensor([pair[0] for pair in block_pairs], dtype=torch.long)
+        dst = torch.tensor([pair[1] for pair in block_pairs], dtype=torch.long)
+        for caches in (
+            self.key_caches,
+            self.value_caches,
+            self.key_scales,
+            self.value_scales,
+        ):
+            for cache in caches.values():
+                # index_copy_ is not implemented for float8, copy the raw bytes
+                cache.view(torch.uint8).index_copy_(
+                    0, dst, cache.view(torch.uint8).index_select(0, src)
+                )
+
+    def gather_context(
+        self,
+        cache: torch.Tensor,
+        block_table: torch.Tensor,
+        context_len: int,
+        scales: Optional[torch.Tensor] = None,
+        dtype: Optional[torch.dtype] = None,
+    ):
+        # [num_blocks, num_kv_head, block_size, head_dim] -> [1, num_kv_head, context_len, head_dim]
+        context = cache.index_select(0, block_table.long())
+        if scales is not None:
+            context = (
+                context.float()
+                * scales.index_select(0, block_table.long()).unsqueeze(-1)
+            ).to(dtype)
+        context = context.transpose(0, 1).reshape(cache.size(1), -1, cache.size(-1))
+        return context[:, :context_len].unsqueeze(0)
+
+    def get_cache_bytes(self) -> int:
+        return sum(
+            cache.numel() * cache.element_size()
+            for caches in (
+                self.key_caches,
+                self.value_caches,
+                self.key_scales,
+                self.value_scales,
+            )
+            for cache in caches.values()
+        )
+
+    def attention(
+        self,
+        layer_idx: int,
+        query: torch.Tensor,
+        key: torch.Tensor,
+        value: torch.Tensor,
+        scale_attn: float,
+    ):
+        # query: [bs, seq_len, num_head, head_dim]
+        # key/value: [bs, seq_len, num_kv_head, head_dim]
+        # Return: attn_output [bs, num_head, seq_len, head_dim], as the
+        # indirect access kv cache attention does.
+        assert self.input_metadata is not None, "paged attention inputs are not set"
+        input_metadata = self.input_metadata
+        key_cache, value_cache = self.get_kv_cache(layer_idx, key)
+        k_scale, v_scale = self.get_kv_scales(layer_idx)
+        if k_scale is None:
+            key = key.to(key_cache.dtype)
+            value = value.to(value_cache.dtype)
+        PagedAttention.reshape_and_cache(
+            key.reshape(-1, key.size(-2), key.size(-1)),
+            value.reshape(-1, value.size(-2), value.size(-1)),
+            key_cache,
+            value_cache,
+            input_metadata.slot_mapping,
+            k_scale,
+            v_scale,
+        )
+        num_heads, num_kv_heads = query.size(-2), key.size(-2)
+        if input_metadata.is_prefill:
+            # only one prompt is prefilled per model forward
+            query = query.transpose(1, 2)
+            attn_mask = None
+            if input_metadata.num_prefix_tokens > 0:
+                # the cached prefix is read back from the blocks shared with other sequences
+                context_len = int(input_metadata.context_lens[0])
+                key = self.gather_context(
+                    key_cache,
+                    input_metadata.block_tables[0],
+                    context_len,
+                    k_scale,
+                    query.dtype,
+                )
+                value = self.gather_context(
+                    value_cache,
+                    input_metadata.block_tables[0],
+                    context_len,
+                    v_scale,
+                    query.dtype,
+                )
+                attn_mask = torch.ones(
+                    query.size(2), context_len, dtype=torch.bool
+                ).tril(diagonal=input_metadata.num_prefix_tokens)
+            else:
+                key = key.transpose(1, 2)
+                value = value.transpose(1, 2)
+            if num_heads != num_kv_heads:
+                key = torch.repeat_interleave(key, num_heads // num_kv_heads, dim=1)
+                value = torch.repeat_interleave(value, num_heads // num_kv_heads, dim=1)
+            return torch.nn.functional.scaled_dot_product_attention(
+                query,
+                key,
+                value,
+                attn_mask=attn_mask,
+                is_causal=attn_mask is None,
+                scale=1.0 / scale_attn,
+            )
+        assert query.size(1) == 1, "paged attention decodes one token per sequence"
+        query = query.squeeze(1).contiguous()
+        output = torch.empty_like(query)
+        PagedAttention.single_query_cached_kv_attention(
+            output,
+            query,
+            key_cache,
+            value_cache,
+            self.get_head_mapping(num_heads, num_kv_heads),
+            1.0 / scale_attn,
+            input_metadata.block_tables,
+            input_metadata.context_lens,
+            self.block_size,
+            input_metadata.max_context_len,
+            None,
+            k_scale,
+            v_scale,
+        )
+        return output.unsqueeze(2)
+
+
+def bind_paged_kv_cache(model: torch.nn.Module, kv_cache: Optional[PagedKVCache]):
+    r"""
+    Route (or, with ``kv_cache=None``, stop routing) the attention layers of a
+    model optimized by ``ipex.llm.optimize`` to the paged KV cache. Returns the
+    number of bound attention layers.
+    """
+    from ...transformers.models.cpu.fusions.mha_fusion import _IPEXScaleDotProductCPU
+
+    layers: List[_IPEXScaleDotProductCPU] = [
+        m for m in model.modules() if isinstance(m, _IPEXScaleDotProductCPU)
+    ]
+    for layer_idx, layer in enumerate(layers):
+        layer.paged_kv_cache = kv_cache
+        layer.layer_idx = layer_idx
+    return len(layers)
@@ -0,0 +1,281 @@
+import itertools
+import torch
+from typing import List, Optional, Union
+from .block_manager import BlockSpaceManager
+from .cache import PagedInputMetadata, PagedKVCache, bind_paged_kv_cache
+from .scheduler import SamplingParams, Scheduler, Sequence
+
+
+class RequestOutput:
+    r"""
+    The state of one request after an :meth:`Engine.step`.
+
+    Args:
+        request_id (str): the id returned by :meth:`Engine.add_request`.
+        prompt_token_ids (list of int): the prompt of the request.
+        output_token_ids (list of int): the tokens generated so far.
+        finished (bool): whether the request is completed.
+    """
+
+    def __init__(
+        self,
+        request_id: str,
+        prompt_token_ids: List[int],
+        output_token_ids: List[int],
+        finished: bool,
+    ):
+        self.request_id = request_id
+        self.prompt_token_ids = prompt_token_ids
+        self.output_token_ids = output_token_ids
+        self.finished = finished
+
+    @classmethod
+    def from_seq(cls, seq: Sequence):
+        return cls(
+            seq.request_id,
+            seq.token_ids[: seq.prompt_len],
+            seq.get_output_token_ids(),
+            seq.is_finished(),
+        )
+
+
+class Engine:
+    r"""
+    Continuous batching serving engine for the models optimized by ``ipex.llm.optimize``.
+    The engine owns a pool of paged KV cache blocks and, at every :meth:`step`, admits
+    waiting requests (one prefill forward per prompt) or decodes one token for all
+    the running requests in a single batched forward with
+    ``ipex.llm.modules.PagedAttention``. Requests finish and release their blocks
+    independently, so the batch never stalls on its longest sequence. When the block
+    pool runs out, the latest admitted requests are preempted and recomputed later.
+
+    The attention layers of the model are only routed to the paged KV cache inside
+    :meth:`step`, the model still works with ``model.generate()`` out of the engine.
+    The python forward of the model is used, thus ``deployment_mode`` of
+    ``ipex.llm.optimize`` does not matter.
+
+    With ``enable_prefix_caching``, the full blocks of prompts sharing a common prefix
+    (e.g., a system prompt) are stored once and shared by reference among the requests,
+    the prefill only computes the tokens after the cached prefix.
+
+    Supported model family: Llama, Mistral, Qwen2.
+
+    Args:
+        model (torch.nn.Module): the model optimized by ``ipex.llm.optimize``.
+        num_blocks (int): number of blocks of the KV cache pool. Every block costs
+            ``2 * num_layers * block_size * num_kv_heads * head_size`` elements.
+        block_size (int): number of tokens stored in every block. Default is 16.
+        max_num_seqs (int): the maximum number of running requests. Default is 256.
+        max_num_batched_tokens (int): the maximum number of prompt tokens prefilled in
+            one step. Default is None, meaning 2048.
+        enable_prefix_caching (bool): share the KV cache blocks of common prompt
+            prefixes among requests. Default is False.
+        kv_cache_dtype (str): store the KV cache blocks in ``"int8"`` or ``"fp8"``,
+            roughly halving (bf16 models) the memory of every block. Default is None,
+            meaning the ``kv_cache_dtype`` passed to ``ipex.llm.optimize``.
+
+    Examples:
+        >>> model = ipex.llm.optimize(model, dtype=torch.bfloat16)
+        >>> engine = ipex.llm.serving.Engine(model, num_blocks=1024)
+        >>> params = ipex.llm.serving.SamplingParams(max_new_tokens=32, eos_token_id=2)
+        >>> with torch.no_grad(), torch.cpu.amp.autocast(dtype=torch.bfloat16):
+        ...     outputs = engine.generate([prompt_ids_0, prompt_ids_1], params)
+
+    """
+
+    _supported_models = [
+        "LlamaForCausalLM",
+        "MistralForCausalLM",
+        "Qwen2ForCausalLM",
+    ]
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        num_blocks: int,
+        block_size: int = 16,
+        max_num_seqs: int = 256,
+        max_num_batched_tokens: Optional[int] = None,
+        enable_prefix_caching: bool = False,
+        kv_cache_dtype: Optional[str] = None,
+    ):
+        if isinstance(model, torch.jit.ScriptModule):
+            raise RuntimeError(
+                "ipex.llm.serving.Engine needs the python model returned by ipex.llm.optimize, "
+                + "not a TorchScript module"
+            )
+        if not (
+            hasattr(model, "config")
+            and hasattr(model.config, "architectures")
+            and model.config.architectures[0] in self._supported_models
+        ):
+            raise RuntimeError(
+                f"ipex.llm.serving.Engine only supports {self._supported_models}"
+            )
+        self.model = model
+        self.block_size = block_size
+        self.block_manager = BlockSpaceManager(
+            num_blocks, block_size, enable_prefix_caching=enable_prefix_caching
+        )
+        if kv_cache_dtype is None:
+            kv_cache_dtype = getattr(model.config, "kv_cache_dtype", None)
+        self.kv_cache = PagedKVCache(num_blocks, block_size, kv_cache_dtype)
+        self.scheduler = Scheduler(
+            self.block_manager,
+            max_num_seqs,
+            max_num_batched_tokens if max_num_batched_tokens is not None else 2048,
+        )
+        if bind_paged_kv_cache(self.model, None) == 0:
+            raise RuntimeError(
+                "ipex.llm.serving.Engine expects a model optimized by ipex.llm.optimize on cpu"
+            )
+        self.seq_counter = itertools.count()
+
+    def add_request(
+        self,
+        prompt_token_ids: Union[List[int], torch.Tensor],
+        sampling_params: Optional[SamplingParams] = None,
+        request_id: Optional[str] = None,
+    ) -> str:
+        if isinstance(prompt_token_ids, torch.Tensor):
+            prompt_token_ids = prompt_token_ids.flatten().tolist()
+        assert len(prompt_token_ids) > 0, "the prompt should not be empty"
+        seq_id = next(self.seq_counter)
+        if request_id is None:
+            request_id = str(seq_id)
+        if sampling_params is None:
+            sampling_params = SamplingParams()
+        self.scheduler.add_seq(
+            Sequence(seq_id, request_id, prompt_token_ids, sampling_params)
+        )
+        return request_id
+
+    def abort_request(self, request_id: str):
+        self.scheduler.abort_seq(request_id)
+
+    def has_unfinished_requests(self) -> bool:
+        return self.scheduler.has_unfinished_seqs()
+
+    def get_num_free_blocks(self) -> int:
+        return self.block_manager.get_num_free_blocks()
+
+    def get_prefix_cache_hit_rate(self) -> float:
+        return self.block_manager.get_prefix_cache_hit_rate()
+
+    def _run_model(self, input_ids, position_ids, input_metadata):
+        self.kv_cache.copy_blocks(self.block_manager.get_pending_copies())
+        self.kv_cache.input_metadata = input_metadata
+        bind_paged_kv_cache(self.model, self.kv_cache)
+        try:
+            outputs = self.model(
+                input_ids=input_ids,
+                position_ids=position_ids,
+                use_cache=True,
+                return_dict=False,
+            )
+        finally:
+            bind_paged_kv_cache(self.model, None)
+            self.kv_cache.input_metadata = None
+        return outputs[0][:, -1, :]
+
+    def _prefill(self, seq: Sequence) -> torch.Tensor:
+        num_tokens = seq.get_len()
+        num_cached_tokens = seq.num_cached_tokens
+        positions = torch.arange(num_cached_tokens, num_tokens)
+        block_table = torch.tensor(
+            self.block_manager.get_block_table(seq), dtype=torch.int32
+        )
+        slot_mapping = (
+            block_table[positions // self.block_size] * self.block_size
+            + positions % self.block_size
+        ).to(torch.int32)
+        return self._run_model(
+            torch.tensor([seq.token_ids[num_cached_tokens:]], dtype=torch.long),
+            positions.unsqueeze(0),
+            PagedInputMetadata(
+                True,
+                slot_mapping,
+                block_table.unsqueeze(0),
+                torch.tensor([num_tokens], dtype=torch.int32),
+                num_tokens,
+                num_cached_tokens,
+            ),
+        )
+
+    def _decode(self, seqs: List[Sequence]) -> torch.Tensor:
+        block_tables = [self.block_manager.get_block_table(seq) for seq in seqs]
+        max_num_blocks = max(len(block_table) for block_table in block_tables)
+        context_lens = [seq.get_len() for seq in seqs]
+        input_metadata = PagedInputMetadata(
+            False,
+            torch.tensor(
+                [self.block_manager.get_slot(seq, seq.get_len() - 1) for seq in seqs],
+                dtype=torch.int32,
+            ),
+            torch.tensor(
+                [
+                    block_table + [0] * (max_num_blocks - len(block_table))
+                    for block_table in block_tables
+                ],
+                dtype=torch.int32,
+            ),
+            torch.tensor(context_lens, dtype=torch.int32),
+            max(context_lens),
+        )
+        return self._run_model(
+            torch.tensor([[seq.token_ids[-1]] for seq in seqs], dtype=torch.long),
+            torch.tensor([[seq.get_len() - 1] for seq in seqs], dtype=torch.long),
+            input_metadata,
+        )
+
+    def _sample(self, logits: torch.Tensor, seqs: List[Sequence]) -> List[int]:
+        next_tokens = torch.argmax(logits, dim=-1).tolist()
+        for i, seq in enumerate(seqs):
+            params = seq.sampling_params
+            if not params.do_sample:
+                continue
+            scores = logits[i].float() / params.temperature
+            if params.top_k > 0:
+                top_k = min(params.top_k, scores.size(-1))
+                kth_score = torch.topk(scores, top_k)[0][-1]
+                scores = scores.masked_fill(scores < kth_score, -float("inf"))
+            probs = torch.softmax(scores, dim=-1)
+            next_tokens[i] = int(torch.multinomial(probs, num_samples=1))
+        return next_tokens
+
+    @torch.no_grad()
+    def step(self) -> List[RequestOutput]:
+        r"""
+        Runs one scheduling iteration and returns the outputs of the requests
+        processed by it.
+        """
+        scheduler_output = self.scheduler.schedule()
+        if scheduler_output.is_empty():
+            return []
+        if scheduler_output.prefill_seqs:
+            seqs = scheduler_output.prefill_seqs
+            logits = torch.cat([self._prefill(seq) for seq in seqs], dim=0)
+        else:
+            seqs = scheduler_output.decode_seqs
+            logits = self._decode(seqs)
+        for seq, token_id in zip(seqs, self._sample(logits, seqs)):
+            seq.append_token_id(token_id)
+        self.scheduler.free_finished_seqs()
+        return [RequestOutput.from_seq(seq) for seq in seqs]
+
+    def generate(
+        self,
+        prompts: List[Union[List[int], torch.Tensor]],
+        sampling_params: Optional[SamplingParams] = None,
+    ) -> List[RequestOutput]:
+        r"""
+        Adds all the prompts and steps the engine until they are completed.
+        The outputs are returned in the order of the prompts.
+        """
+        request_ids = [self.add_request(prompt, sampling_params) for prompt in prompts]
+        outputs = {}
+        while self.has_unfinished_requests():
+            for output in self.step():
+                if output.finished:
+                    outputs[output.request_id] = output
+        return [outputs[request_id] for request_id in request_ids]
@@ -0,0 +1,208 @@
+from collections import deque
+from enum import Enum
+from typing import List, Optional, Tuple
+from .block_manager import BlockSpaceManager
+
+
+class SamplingParams:
+    r"""
+    Per-request generation parameters of :class:`Engine`.
+
+    Args:
+        max_new_tokens (int): the maximum number of tokens to generate. Default is 128.
+        eos_token_id (int or list of int): the token(s) that finish the request. Default is None.
+        do_sample (bool): sample the next token from the (temperature/top_k scaled) distribution
+            instead of greedy search. Default is False.
+        temperature (float): the value used to module the next token probabilities. Default is 1.0.
+        top_k (int): the number of highest probability tokens to keep when sampling,
+            0 means no top-k filtering. Default is 0.
+    """
+
+    def __init__(
+        self,
+        max_new_tokens: int = 128,
+        eos_token_id=None,
+        do_sample: bool = False,
+        temperature: float = 1.0,
+        top_k: int = 0,
+    ):
+        assert max_new_tokens > 0, "max_new_tokens should be a positive integer"
+        assert temperature > 0, "temperature should be strictly positive"
+        self.max_new_tokens = max_new_tokens
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+        self.eos_token_id = eos_token_id
+        self.do_sample = do_sample
+        self.temperature = temperature
+        self.top_k = top_k
+
+
+class SequenceStatus(Enum):
+    WAITING = 0
+    RUNNING = 1
+    FINISHED = 2
+
+
+class Sequence:
+    def __init__(
+        self,
+        seq_id: int,
+        request_id: str,
+        prompt_token_ids: List[int],
+        sampling_params: SamplingParams,
+    ):
+        self.seq_id = seq_id
+        self.request_id = request_id
+        self.prompt_len = len(prompt_token_ids)
+        self.token_ids = list(prompt_token_ids)
+        self.sampling_params = sampling_params
+        self.status = SequenceStatus.WAITING
+        self.num_preemptions = 0
+        # prompt tokens whose key/value states are reused from the prefix cache
+        self.num_cached_tokens = 0
+
+    def get_len(self) -> int:
+        return len(self.token_ids)
+
+    def get_output_token_ids(self) -> List[int]:
+        return self.token_ids[self.prompt_len :]
+
+    def append_token_id(self, token_id: int):
+        self.token_ids.append(token_id)
+        num_new_tokens = len(self.token_ids) - self.prompt_len
+        eos_token_id = self.sampling_params.eos_token_id
+        if num_new_tokens >= self.sampling_params.max_new_tokens or (
+            eos_token_id is not None and token_id in eos_token_id
+        ):
+            self.status = SequenceStatus.FINISHED
+
+    def is_finished(self) -> bool:
+        return self.status == SequenceStatus.FINISHED
+
+
+class SchedulerOutput:
+    def __init__(
+        self,
+        prefill_seqs: List[Sequence],
+        decode_seqs: List[Sequence],
+        preempted_seqs: List[Sequence],
+    ):
+        self.prefill_seqs = prefill_seqs
+        self.decode_seqs = decode_seqs
+        self.preempted_seqs = preempted_seqs
+
+    def is_empty(self) -> bool:
+        return not self.prefill_seqs and not self.decode_seqs
+
+
+class Scheduler:
+    r"""
+    Iteration level (continuous batching) scheduler. Every call of
+    :meth:`schedule` either admits waiting requests for their prefill, or runs
+    one decode step for all the running sequences. When the KV cache pool is
+    exhausted during decoding, the most recently admitted sequences are
+    preempted: their blocks are released and they are put back in front of the
+    waiting queue to be recomputed later.
+
+    Args:
+        block_manager (BlockSpaceManager): owner of the block tables.
+        max_num_seqs (int): the maximum number of running sequences.
+        max_num_batched_tokens (int): the maximum number of prompt tokens
+            prefilled in one step.
+    """
+
+    def __init__(
+        self,
+        block_manager: BlockSpaceManager,
+        max_num_seqs: int,
+        max_num_batched_tokens: int,
+    ):
+        self.block_manager = block_manager
+        self.max_num_seqs = max_num_seqs
+        self.max_num_batched_tokens = max_num_batched_tokens
+        self.waiting = deque()
+        self.running: List[Sequence] = []
+
+    def add_seq(self, seq: Sequence):
+        self.waiting.append(seq)
+
+    def has_unfinished_seqs(self) -> bool:
+        return len(self.waiting) > 0 or len(self.running) > 0
+
+    def _preempt(self, seq: Sequence):
+        self.block_manager.free(seq)
+        seq.status = SequenceStatus.WAITING
+        seq.num_preemptions += 1
+        self.waiting.appendleft(seq)
+
+    def _schedule_prefill(self) -> List[Sequence]:
+        prefill_seqs = []
+        num_batched_tokens = 0
+        while self.waiting:
+            seq = self.waiting[0]
+            if len(self.running) + len(prefill_seqs) >= self.max_num_seqs:
+                break
+            if (
+                prefill_seqs
+                and num_batched_tokens + seq.get_len() > self.max_num_batched_tokens
+            ):
+                break
+            if not self.block_manager.can_allocate(seq):
+                if not self.running and not prefill_seqs:
+                    raise RuntimeError(
+                        f"The KV cache pool is too small to hold a sequence of {seq.get_len()} tokens, "
+                        + "please increase num_blocks"
+                    )
+                break
+            self.waiting.popleft()
+            self.block_manager.allocate(seq)
+            seq.status = SequenceStatus.RUNNING
+            num_batched_tokens += seq.get_len() - seq.num_cached_tokens
+            prefill_seqs.append(seq)
+        return prefill_seqs
+
+    def _schedule_decode(self) -> Tuple[List[Sequence], List[Sequence]]:
+        preempted_seqs = []
+        decode_seqs = []
+        running = list(self.running)
+        while running:
+            seq = running.pop(0)
+            while not self.block_manager.can_append_slot(seq):
+                if running:
+                    victim = running.pop(-1)
+                    self._preempt(victim)
+                    preempted_seqs.append(victim)
+                else:
+                    self._preempt(seq)
+                    preempted_seqs.append(seq)
+                    break
+            else:
+                self.block_manager.append_slot(seq)
+                decode_seqs.append(seq)
+        return decode_seqs, preempted_seqs
+
+    def schedule(self) -> SchedulerOutput:
+        prefill_seqs = self._schedule_prefill()
+        if prefill_seqs:
+            self.running.extend(prefill_seqs)
+            return SchedulerOutput(prefill_seqs, [], [])
+        decode_seqs, preempted_seqs = self._schedule_decode()
+        self.running = decode_seqs
+        return SchedulerOutput([], decode_seqs, preempted_seqs)
+
+    def free_finished_seqs(self) -> List[Sequence]:
+        finished = [seq for seq in self.running if seq.is_finished()]
+        for seq in finished:
+            self.block_manager.free(seq)
+        self.running = [seq for seq in self.running if not seq.is_finished()]
+        return finished
+
+    def abort_seq(self, request_id: str) -> Optional[Sequence]:
+        for queue in (self.waiting, self.running):
+            for seq in list(queue):
+                if seq.request_id == request_id:
+                    queue.remove(seq)
+                    self.block_manager.free(seq)
+                    seq.status = SequenceStatus.FINISHED
+                    return seq
+        return None
@@ -656,36 +656,171 @@ class MergedEmbeddingBagWithCat(MergedEmbeddingBag):
 import torch.distributed as dist
 
 
+def _align(nbytes: int, alignment: int = 8):
+    return (nbytes + alignment - 1) // alignment * alignment
+
+
+class SparseAll2AllBuffer(object):
+    r"""
+    The byte buffer of the packed payloads of sparse_all2all. It is kept across the
+    iterations and only grows when a payload is larger than the running maximum, so
+    that the buffers are not allocated (and zero-filled) in every step.
+    """
+
+    def __init__(self):
+        self.buffer = torch.empty(0, dtype=torch.uint8)
+
+    def get(self, nbytes: int):
+        if self.buffer.numel() < nbytes:
+            self.buffer = torch.empty(nbytes, dtype=torch.uint8)
+        return self.buffer[:nbytes]
+
+
+class SparseAll2All(object):
+    r"""
+    Exchanges the sparse rows (index, value and offset of each rank) among the ranks
+    with one packed all to all. The indices, values and offsets for each rank are
+    packed into one byte buffer, with each part aligned to 8 bytes:
+
+        [offsets (int64) | indices (index type) | values (value type)] * world_size
+
+    The exchange is asynchronous: the row counts are sent when the exchange is
+    created, the payload by ``start`` and ``wait`` returns the received rows, so that
+    the communication runs behind the computation issued in between. The received
+    rows are views of ``recv_buffer``, they are valid until it is used again.
+    """
+
+    def __init__(
+        self,
+        world_size: int,
+        send_idx: List[torch.Tensor],
+        send_buf: List[torch.Tensor],
+        send_ofs: List[torch.Tensor],
+        send_buffer: SparseAll2AllBuffer,
+        recv_buffer: SparseAll2AllBuffer,
+    ):
+        self.world_size = world_size
+        self.send_idx = send_idx
+        self.send_buf = send_buf
+        self.send_ofs = send_ofs
+        self.send_buffer = send_buffer
+        self.recv_buffer = recv_buffer
+        self.index_type = send_idx[0].dtype
+        self.val_type = send_buf[0].dtype
+        self.emb_dim = send_buf[0].shape[1]
+        self.ofs_size = send_ofs[0].shape[0]
+        # the first thing to know is the recv sizes, this requires an all to all
+        self.send_rows = torch.tensor([idx.shape[0] for idx in send_idx])
+        self.recv_rows = torch.empty(world_size, dtype=torch.int64)
+        self.work = dist.all_to_all_single(
+            self.recv_rows, self.send_rows, async_op=True
+        )
+
+    def _part_sizes(self, num_rows: int):
+        # bytes of the offsets, indices and values for one rank in the packed buffer
+        index_size = torch.empty(0, dtype=self.index_type).element_size()
+        val_size = torch.empty(0, dtype=self.val_type).element_size()
+        return (
+            _align(self.ofs_size * 8),
+            _align(num_rows * index_size),
+            _align(num_rows * self.emb_dim * val_size),
+        )
+
+    def _pack(self):
+        send_sizes = [sum(self._part_sizes(n)) for n in self.send_rows.tolist()]
+        packed = self.send_buffer.get(sum(send_sizes))
+        pos = 0
+        for i in range(self.world_size):
+            for nbytes, part in zip(
+                self._part_sizes(self.send_idx[i].shape[0]),
+                [
+                    self.send_ofs[i].to(torch.int64),
+                    self.send_idx[i],
+                    self.send_buf[i],
+                ],
+            ):
+                part = part.contiguous().view(torch.uint8).view(-1)
+                packed[pos : pos + part.numel()].copy_(part)
+                pos += nbytes
+        return packed, send_sizes
+
+    def start(self):
+        self.work.wait()
+        self.recv_sizes = [sum(self._part_sizes(n)) for n in self.recv_rows.tolist()]
+        packed, send_sizes = self._pack()
+        self.recv_packed = self.recv_buffer.get(sum(self.recv_sizes))
+        self.work = dist.all_to_all_single(
+            self.recv_packed,
+            packed,
+            output_split_sizes=self.recv_sizes,
+            input_split_sizes=send_sizes,
+            async_op=True,
+        )
+        return self
+
+    def wait(self):
+        self.work.wait()
+        recv_idx, recv_buf, recv_ofs = [], [], []
+        pos = 0
+        for i, num_rows in enumerate(self.recv_rows.tolist()):
+            ofs_bytes, idx_bytes, val_bytes = self._part_sizes(num_rows)
+            recv = self.recv_packed[pos : pos + self.recv_sizes[i]]
+            recv_ofs.append(recv[:ofs_bytes].view(torch.int64)[: self.ofs_size])
+            recv = recv[ofs_bytes:]
+            recv_idx.append(recv[:idx_bytes].view(self.index_type)[:num_rows])
+            recv = recv[idx_bytes:]
+            recv_buf.append(
+                recv[:val_bytes]
+                .view(self.val_type)[: num_rows * self.emb_dim]
+                .view(num_rows, self.emb_dim)
+            )
+            pos += self.recv_sizes[i]
+        return recv_idx, recv_buf, recv_ofs
+
+
 def sparse_all2all(
     world_size: int,
     send_idx: List[torch.Tensor],
     send_buf: List[torch.Tensor],
     send_ofs: List[torch.Tensor],
+    send_buffer: Optional[SparseAll2AllBuffer] = None,
+    recv_buffer: Optional[SparseAll2AllBuffer] = None,
 ):
-    # the first thing to know is the recv tensor sizes
-    # this requires an all to all
-    is_buffers = [torch.empty(1, dtype=torch.int64) for _ in range(world_size)]
-    for i in range(world_size):
-        is_buffers[i][0] = send_idx[i].shape[0]
-    os_buffers = [torch.empty(1, dtype=torch.int64) for _ in range(world_size)]
-    dist.all_to_all(os_buffers, is_buffers)
-    dist.barrier()
-
-    # init received buffers sizes
-    index_type = send_idx[0].dtype
-    val_type = send_buf[0].dtype
-    emb_dim = send_buf[0].shape[1]
-    ofs_size = send_ofs[0].shape[0]
-    recv_idx = [torch.zeros(os_buffers[i], dtype=index_type) for i in range(world_size)]
-    recv_buf = [
-        torch.zeros((os_buffers[i], emb_dim), dtype=val_type) for i in range(world_size)
-    ]
-    recv_ofs = [torch.zeros((ofs_size,), dtype=torch.int64) for i in range(world_size)]
-    dist.all_to_all(recv_idx, send_idx)
-    dist.all_to_all(recv_buf, send_buf)
-    dist.all_to_all(recv_ofs, send_ofs)
-    dist.barrier()
-    return recv_idx, recv_buf, recv_ofs
+    return (
+        SparseAll2All(
+            world_size,
+            send_idx,
+            send_buf,
+            send_ofs,
+            SparseAll2AllBuffer() if send_buffer is None else send_buffer,
+            SparseAll2AllBuffer() if recv_buffer is None else recv_buffer,
+        )
+        .start()
+        .wait()
+    )
+
+
+def _pipelined_all2all(world_size, table_chunks, run_local, run_merge, buffers):
+    # run_local(i) returns the rows to send for the i-th chunk of tables and
+    # run_merge(i, recv_idx, recv_buf, recv_ofs) consumes the received ones. The
+    # exchange of each chunk runs while the next chunk is computed locally, so each
+    # chunk has its own (send, recv) buffers.
+    exchanges = []
+    for i in range(len(table_chunks)):
+        send_idx, send_buf, send_ofs = run_local(i)
+        exchange = SparseAll2All(world_size, send_idx, send_buf, send_ofs, *buffers[i])
+        if exchanges:
+            exchanges[-1].start()
+        exchanges.append(exchange)
+    exchanges[-1].start()
+    for i, exchange in enumerate(exchanges):
+        run_merge(i, *exchange.wait())
+
+
+def _get_table_chunks(num_tables: int, num_chunks: int):
+    num_chunks = max(1, min(num_chunks, num_tables))
+    bounds = [num_tables * i // num_chunks for i in range(num_chunks + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
 
 
 class DistMergeEmbeddingBagFunc(Function):
@@ -700,6 +835,8 @@ class DistMergeEmbeddingBagFunc(Function):
         world_size: int,
         include_last_offsets: bool,
         adagrad_args: AdaGradArgs,
+        num_comm_chunks: int = 1,
+        comm_buffers: Optional[List[tuple]] = None,
     ):
         global_bs = offsets[0].size(0)
         if include_last_offsets:
@@ -715,20 +852,42 @@ class DistMergeEmbeddingBagFunc(Function):
         ctx.world_size = world_size
         num_emb = len(indices)
         emb_dim = weight.shape[1]
-        (
-            send_idx,
-            send_buf,
-            send_ofs,
-        ) = torch.ops.torch_ipex.mergedemb_distribute_forward_local(
-            weight, row_offset, indices, offsets, rank, world_size, include_last_offsets
-        )
-        recv_idx, recv_buf, recv_ofs = sparse_all2all(
-            world_size, send_idx, send_buf, send_ofs
-        )
+        table_chunks = _get_table_chunks(num_emb, num_comm_chunks)
+        if comm_buffers is None:
+            comm_buffers = [
+                (SparseAll2AllBuffer(), SparseAll2AllBuffer()) for _ in table_chunks
+            ]
+        ctx.table_chunks = table_chunks
+        ctx.comm_buffers = comm_buffers
         output = torch.empty((local_bs, num_emb, emb_dim), dtype=weight.dtype)
-        torch.ops.torch_ipex.mergedemb_distribute_forward_merge(
-            output, recv_idx, recv_buf, recv_ofs, num_emb
-        )
+
+        def run_local(i):
+            start, end = table_chunks[i]
+            return torch.ops.torch_ipex.mergedemb_distribute_forward_local(
+                weight,
+                row_offset[start : end + 1],
+                indices[start:end],
+                offsets[start:end],
+                rank,
+                world_size,
+                include_last_offsets,
+            )
+
+        def run_merge(i, recv_idx, recv_buf, recv_ofs):
+            start, end = table_chunks[i]
+            if len(table_chunks) == 1:
+                chunk_output = output
+            else:
+                chunk_output = torch.empty(
+                    (local_bs, end - start, emb_dim), dtype=weight.dtype
+                )
+            torch.ops.torch_ipex.mergedemb_distribute_forward_merge(
+                chunk_output, recv_idx, recv_buf, recv_ofs, end - start
+            )
+            if chunk_output is not output:
+                output[:, start:end].copy_(chunk_output)
+
+        _pipelined_all2all(world_size, table_chunks, run_local, run_merge, comm_buffers)
         return output
 
     @staticmethod
@@ -739,26 +898,55 @@ class DistMergeEmbeddingBagFunc(Function):
         rank = ctx.rank
         world_size = ctx.world_size
         include_last_offsets = ctx.include_last_offsets
-        (
-            send_idx,
-            send_buf,
-            send_ofs,
-        ) = torch.ops.torch_ipex.mergedemb_distribute_backward_local(
-            grad, row_offset, indices, offsets, rank, world_size, include_last_offsets
-        )
-        recv_idx, recv_buf, recv_ofs = sparse_all2all(
-            world_size, send_idx, send_buf, send_ofs
-        )
+        table_chunks = ctx.table_chunks
         weight = ctx.weight
         adagrad_args = ctx.adagrad_args
         trail = adagrad_args.bf16_trail
         hessian = adagrad_args.hessian
         lr = adagrad_args.lr
         eps = adagrad_args.eps
-        torch.ops.torch_ipex.mergedemb_distribute_backward_merge_adagrad_update(
-            recv_idx, recv_buf, recv_ofs, weight, trail[0], hessian[0], lr, eps
+
+        def run_local(i):
+            start, end = table_chunks[i]
+            chunk_grad = grad if len(table_chunks) == 1 else grad[:, start:end]
+            return torch.ops.torch_ipex.mergedemb_distribute_backward_local(
+                chunk_grad.contiguous(),
+                row_offset[start : end + 1],
+                indices[start:end],
+                offsets[start:end],
+                rank,
+                world_size,
+                include_last_offsets,
+            )
+
+        def run_merge(i, recv_idx, recv_buf, recv_ofs):
+            # the tables of the chunks have disjoint rows, they are updated one by one
+            torch.ops.torch_ipex.mergedemb_distribute_backward_merge_adagrad_update(
+                recv_idx, recv_buf, recv_ofs, weight, trail[0], hessian[0], lr, eps
+            )
+
+        _pipelined_all2all(
+            world_size, table_chunks, run_local, run_merge, ctx.comm_buffers
         )
-        return None, None, None, None, None, None, None, None
+        return None, None, None, None, None, None, None, None, None, None
+
+
+def _copy_rows_to_shard(
+    shard: torch.Tensor,
+    weight: torch.Tensor,
+    row_offset: int,
+    rank: int,
+    world_size: int,
+):
+    # shard keeps the rows [rank::world_size] of the concatenated tables, weight is
+    # the table whose first row is the row_offset-th row of the concatenated tables
+    first_row = row_offset + (rank - row_offset) % world_size
+    if first_row >= row_offset + weight.size(0):
+        return
+    src = weight[first_row - row_offset :: world_size]
+    start = (first_row - rank) // world_size
+    with torch.no_grad():
+        shard[start : start + src.size(0)].copy_(src)
 
 
 class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
@@ -775,6 +963,20 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
         >>> dist.init_process_group("ccl", world_size=world_size, rank=rank)
         >>> distributed_emb = DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(EmbLists)
         >>> out = distributed_emb(indices, offsets)
+
+    Each rank only allocates its shard (1 / world_size of the tables). To build large tables
+    without holding them in memory, create the EmbeddingBags on the "meta" device and load the
+    tables one by one, e.g., from memory-mapped checkpoints:
+
+        >>> EmbLists = torch.nn.ModuleList([torch.nn.EmbeddingBag(..., device="meta") for ...])
+        >>> distributed_emb = DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(EmbLists)
+        >>> for i, path in enumerate(table_paths):
+        >>>     distributed_emb.load_table(i, torch.load(path, mmap=True))
+
+    The tables are exchanged in ``num_comm_chunks`` chunks (4 by default, it can be set
+    on the module), and the all to all of each chunk runs asynchronously while the next
+    chunk is looked up (forward) or reduced (backward). Set it to 1 to exchange all the
+    tables at once.
     """
 
     def __init__(
@@ -782,8 +984,22 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
         embedding_specs: List[EmbeddingSpec],
         lr: float = 0.01,
         eps: float = 1e-10,
+        num_comm_chunks: int = 4,
     ):
-        super(MergedEmbeddingBagWithAdaGrad, self).__init__(embedding_specs)
+        # Keep the full tables out of memory: the tables without weight are created on
+        # the "meta" device, and the given weights (e.g., memory-mapped from a checkpoint)
+        # are only read for the rows of the local shard.
+        meta_specs = [
+            spec._replace(
+                weight=torch.empty(
+                    (spec.num_embeddings, spec.embedding_dim),
+                    dtype=spec.dtype,
+                    device="meta",
+                )
+            )
+            for spec in embedding_specs
+        ]
+        super(MergedEmbeddingBagWithAdaGrad, self).__init__(meta_specs)
         assert (
             self.pooling_mode == PoolingMode.SUM
         ), "only support SUM for DistMergeEmbeddingBagWithAdaGrad"
@@ -793,16 +1009,18 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
         self._row_offset = [0 for i in range(self.n_tables + 1)]
         for i in range(self.n_tables):
             self._row_offset[i + 1] = self.weights[i].shape[0] + self._row_offset[i]
-        # create allin1 weight
-        # TODO: The initialization for weight here requiures 2 * total weight size PEAK memory
-        # We may able to optimize here to:
-        #     1. Require (1 + 1 / world_size) PEAK memory if always load all table first
-        #     2. Require (1 / world_size) memory with loading optimizations like using "meta" device
-        weight_allin1 = torch.cat([w.data for w in self.weights])[
-            self._rank :: self._size, :
-        ].clone()
+        # create allin1 weight, which keeps the rows [rank::world_size] of the concatenated tables
+        # and is filled table by table, so that the PEAK memory is (1 / world_size) of the tables
+        n_rows = len(range(self._rank, self._row_offset[-1], self._size))
+        weight_allin1 = torch.empty((n_rows, self.embedding_dim), dtype=self.dtype)
         # drop the oringal weighs
         self.weights = nn.ParameterList([nn.parameter.Parameter(weight_allin1)])
+        # the tables on "meta" device should be loaded by load_table before forward, the
+        # tables without weight are left uninitialized as in MergedEmbeddingBag
+        self._loaded_tables = [spec.weight is None for spec in embedding_specs]
+        for i, spec in enumerate(embedding_specs):
+            if spec.weight is not None and spec.weight.device.type != "meta":
+                self.load_table(i, spec.weight)
         self.n_tables = 1
         self.adagrad_args = self.init_adagrad_args(lr, eps)
         if weight_allin1.dtype == torch.bfloat16:
@@ -815,8 +1033,60 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
         else:
             self.adagrad_args.bf16_trail.append(torch.empty(0, dtype=torch.bfloat16))
             self.adagrad_args.hessian.append(torch.zeros_like(weight_allin1))
+        # the tables are exchanged in num_comm_chunks chunks, so that the all to all
+        # of a chunk overlaps with the local lookup/gradient of the next one
+        self.num_comm_chunks = num_comm_chunks
+        self._comm_buffers = []
+
+    def load_table(self, table_id: int, weight: torch.Tensor):
+        r"""
+        Copy the rows kept by this rank from the full weight of the ``table_id``-th table.
+        Only these rows of ``weight`` are read, so it can be memory-mapped from a checkpoint,
+        e.g., ``torch.load(path, mmap=True)``, to load the tables without holding them in memory.
+        """
+        assert 0 <= table_id < len(self._row_offset) - 1, "invalid table_id"
+        assert weight.shape == (
+            self._row_offset[table_id + 1] - self._row_offset[table_id],
+            self.embedding_dim,
+        ), "weight shape does not match the table"
+        _copy_rows_to_shard(
+            self.weights[0].data,
+            weight,
+            self._row_offset[table_id],
+            self._rank,
+            self._size,
+        )
+        self._loaded_tables[table_id] = True
+
+    def _load_from_state_dict(
+        self,
+        state_dict,
+        prefix,
+        local_metadata,
+        strict,
+        missing_keys,
+        unexpected_keys,
+        error_msgs,
+    ):
+        super(DistMergeEmbeddingBagWithAdaGrad, self)._load_from_state_dict(
+            state_dict,
+            prefix,
+            local_metadata,
+            strict,
+            missing_keys,
+            unexpected_keys,
+            error_msgs,
+        )
+        # the shard of all the tables is loaded at once
+        if prefix + "weights.0" in state_dict:
+            self._loaded_tables = [True] * len(self._loaded_tables)
 
     def forward(self, indices: List[torch.Tensor], offset: List[torch.Tensor]):
+        assert all(
+            self._loaded_tables
+        ), "tables {} are not loaded, call load_table before forward".format(
+            [i for i, loaded in enumerate(self._loaded_tables) if not loaded]
+        )
         out = DistMergeEmbeddingBagFunc.apply(
             self.weights[0],
             self._row_offset,
@@ -826,9 +1096,22 @@ class DistMergeEmbeddingBagWithAdaGrad(MergedEmbeddingBagWithAdaGrad):
             self._size,
             self.include_last_offset,
             self.adagrad_args,
+            self.num_comm_chunks,
+            self._get_comm_buffers(),
         )
         return out
 
+    def _get_comm_buffers(self):
+        # one send buffer and one receive buffer per chunk, kept across the steps
+        table_chunks = _get_table_chunks(
+            len(self._row_offset) - 1, self.num_comm_chunks
+        )
+        if len(self._comm_buffers) != len(table_chunks):
+            self._comm_buffers = [
+                (SparseAll2AllBuffer(), SparseAll2AllBuffer()) for _ in table_chunks
+            ]
+        return self._comm_buffers
+
     def extra_repr(self) -> str:
         s = ""
         s += f"world_size: {self._size}, rank_id: {self._rank}\n"
@@ -117,7 +117,16 @@ class WeightOnlyQuantizedLinear(nn.Module):
         # otherwise, it may overflow when we subtract zero points from int8 weight.
         sym_quant = dtype == WoqWeightDtype.INT8 and lowp_mode == 3
 
-        if group_size == -1:
+        # quantized in advance with the other linears of the model by convert
+        quantized = mod.__dict__.pop("_woq_quantized_weight", None)
+        if (
+            quantized is not None
+            and scales is None
+            and zero_points is None
+            and quantized[0] == qconfig
+        ):
+            qweight, scales, zero_points = quantized[1:]
+        elif group_size == -1:
             qweight, scales, zero_points = quantize_per_channel(
                 mod.weight, dtype, scales, zero_points, sym_quant
             )
@@ -8,6 +8,10 @@ from intel_extension_for_pytorch.cpu._auto_kernel_selection import (
     _using_dnnl,
     _using_tpp,
 )
+from intel_extension_for_pytorch.cpu._linear_autotune import (
+    _get_linear_autotuner,
+    _autotune_dnnl_or_mkl,
+)
 from intel_extension_for_pytorch import frontend
 import intel_extension_for_pytorch._C as core
 from intel_extension_for_pytorch.nn.utils._weight_prepack import (
@@ -565,6 +569,14 @@ class ParameterWrapper(object):
                 module.batch_size_collapsed = 1
                 for i in range(len(module.input_shape) - 1):
                     module.batch_size_collapsed *= module.input_shape[i]
+            # MKL only runs the fp32 inference in FP32 math mode, so only this case is
+            # autotuned. The others (bf16, fp16, training, the other math modes or the
+            # oneDNN forced by ipex._enable_dnnl()) only have the oneDNN kernel.
+            if not use_dnnl and _get_linear_autotuner() is not None:
+                # choose oneDNN or MKL by benchmarking them instead of the global knob
+                module.use_dnnl = use_dnnl = _autotune_dnnl_or_mkl(
+                    module.weight, module.bias, module.batch_size_collapsed
+                )
             # create linear op context
             if module.use_dnnl:
                 self.op_ctx = torch.ops.ipex_prepack.linear_prepack(
@@ -26,6 +26,7 @@ def TPPLinear_weight_prepack(m, bk=None, bc=None, layer_dtype=torch.float32):
         )
     )
     m.weight_for_large_batch = None
+    m.large_batch_min_m = 256
     layer_use_low_prec = layer_dtype != torch.float32
     if layer_use_low_prec is True and USE_LOW_PREC_PARAMS:
         low_prec_vnni_blocking = get_vnni_blocking(layer_dtype)
@@ -233,18 +234,18 @@ class _IPEXConv3d(_IPEXConvNd):
 
 
 @torch.library.impl("torch_ipex::choose_tpp_linear_weight", "cpu")
-def choose_tpp_linear_weight(x, weight, weight_for_large_batch):
+def choose_tpp_linear_weight(x, weight, weight_for_large_batch, large_batch_min_m=256):
     M = x.numel() // x.size(-1)
     return (
         weight_for_large_batch
-        if weight_for_large_batch is not None and M >= 256
+        if weight_for_large_batch is not None and M >= large_batch_min_m
         else weight
     )
 
 
 torch.library.define(
     "torch_ipex::choose_tpp_linear_weight",
-    "(Tensor x, Tensor weight, Tensor? weight_for_large_batch) -> Tensor",
+    "(Tensor x, Tensor weight, Tensor? weight_for_large_batch, int large_batch_min_m=256) -> Tensor",
 )
 
 
@@ -285,8 +286,13 @@ class _IPEXLinear(_IPEXPrepackModule):
                     if hasattr(self, "weight_for_large_batch")
                     else None
                 )
+                large_batch_min_m = (
+                    self.large_batch_min_m
+                    if hasattr(self, "large_batch_min_m")
+                    else 256
+                )
                 w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                    x, self.weight, weight_for_large_batch
+                    x, self.weight, weight_for_large_batch, large_batch_min_m
                 )
                 if self.bias is not None:
                     output = torch.ops.torch_ipex.tpp_linear_bias(
@@ -19,6 +19,10 @@ def gptq_quantize(
     device=torch.device("cpu"),
     layer_wise=False,
     model_path=None,
+    checkpoint_dir=None,
+    export_fn=None,
+    replay_batch_size=8,
+    num_pools=None,
 ):
     """Run weight-only quantization with weight configs.
 
@@ -43,13 +47,21 @@ def gptq_quantize(
         pad_max_length (int): whether to align calibration data to a fixed length.
         device: set to torch.device("cpu").
         layer_wise (bool): whether to do LWQ.
-        model_path (str): path to register LWQ weight hooks.
+        model_path (str): path of the checkpoint to load the weights from in LWQ.
+        checkpoint_dir (str): path to save the quantized transformer blocks in LWQ.
+        export_fn (callable): function to export the quantized transformer blocks in LWQ,
+            called as export_fn(model, weight_config, gptq_config).
+        replay_batch_size (int): number of calibration samples replayed in one batch.
+        num_pools (int): number of core pools to process independent layers concurrently.
     """
     assert isinstance(model, torch.nn.Module), "only support torch module"
     if layer_wise:
         assert (
             model_path is not None
         ), "model_path should not be None when use layer_wise mode"
+        assert (
+            checkpoint_dir is not None and export_fn is not None
+        ), "checkpoint_dir and export_fn should not be None when use layer_wise mode"
 
     from .gptq import GPTQuantizer
 
@@ -65,9 +77,11 @@ def gptq_quantize(
         pad_max_length,
         device,
         layer_wise=layer_wise,
+        replay_batch_size=replay_batch_size,
+        num_pools=num_pools,
     )
     fp32_modified_model, gptq_config = gptq_quantizer.execute_quantization(
-        model_path=model_path
+        model_path=model_path, checkpoint_dir=checkpoint_dir, export_fn=export_fn
     )
     logger.info("GPTQ quantizing done.")
     return fp32_modified_model, gptq_config
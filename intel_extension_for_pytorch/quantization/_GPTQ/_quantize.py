@@ -1,5 +1,6 @@
 import logging
 import torch
+from functools import partial
 from pathlib import Path
 
 format_str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -21,6 +22,9 @@ def gptq(
     use_max_length=False,
     pad_max_length=2048,
     layer_wise=False,
+    model_path=None,
+    replay_batch_size=8,
+    num_pools=None,
     # export arguments
     compression_dtype=torch.int32,
     compression_dim=1,
@@ -42,11 +46,24 @@ def gptq(
         use_max_length (bool): whether to align calibration data to a fixed length.
         pad_max_length (int): whether to align calibration data to a fixed length.
         device: set to torch.device("cpu").
-        layer_wise (bool): whether to do LWQ.
+        layer_wise (bool): whether to do LWQ. The parameters of the model should be on meta device
+                        (e.g., with accelerate.init_empty_weights), they are loaded from model_path
+                        one transformer block at a time. Each quantized block is saved to
+                        save_dir/gptq_checkpoint_g{group_size} and released, and an
+                        interrupted run resumes from the last saved block.
+        model_path (str): path of the Hugging Face checkpoint (.safetensors or .bin, sharded or
+                        not) to load the weights from in LWQ.
+        replay_batch_size (int): number of calibration samples concatenated to replay a transformer
+                        block. The samples are replayed one by one if their shapes mismatch.
+        num_pools (int): number of core pools to accumulate the Hessians and quantize the independent
+                        layers concurrently, default to the number of sockets.
         compression_dtype: data type for compressed dtype, select from [torch.int8|16|32|64].
         compression_dim (int): 0 means output channel while 1 means input channel.
         scale_dtype: data type for scale and bias.
         save_dir (str): path to save checkpoint.
+
+    Returns:
+        The compressed model, or the directory of the checkpoint files in LWQ.
     """
     logger.info("quantizing with GPTQ algorithm")
     from ._gptq_utils import gptq_quantize, gptq_export
@@ -64,7 +81,6 @@ def gptq(
                 ):
                     getattr(cur_mod, submodel_name)._use_sdpa = False
 
-    model_path = None
     weight_config = {}
     for name, module in model.named_modules():
         if "lm_head" in name or "output_layer" in name or "embed_out" in name:
@@ -83,6 +99,17 @@ def gptq(
             + "but you have not set length value. Default sequence length"
             + "is 2048 and this might cause inference error!"
         )
+    checkpoint_dir = None
+    export_fn = None
+    if layer_wise:
+        # the blocks are exported as soon as they are quantized
+        checkpoint_dir = save_dir + "/" + f"gptq_checkpoint_g{group_size}"
+        export_fn = partial(
+            gptq_export,
+            compression_dtype=compression_dtype,
+            compression_dim=compression_dim,
+            scale_dtype=scale_dtype,
+        )
     model, gptq_config = gptq_quantize(
         model,
         weight_config,
@@ -90,9 +117,18 @@ def gptq(
         nsamples,
         use_max_length,
         pad_max_length,
-        layer_wise,
-        model_path,
+        layer_wise=layer_wise,
+        model_path=model_path,
+        checkpoint_dir=checkpoint_dir,
+        export_fn=export_fn,
+        replay_batch_size=replay_batch_size,
+        num_pools=num_pools,
     )
+    if layer_wise:
+        logger.info(
+            "Low-precision checkpoint generated and saved to {}.".format(checkpoint_dir)
+        )
+        return checkpoint_dir
     logger.info("Exporting compressed model...")
     compressed_model = gptq_export(
         model,
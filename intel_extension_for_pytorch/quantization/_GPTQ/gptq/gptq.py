@@ -1,5 +1,6 @@
 import logging
 import math
+import os
 import random
 import re
 import time
@@ -15,6 +16,8 @@ from .model_utils import (
     move_input_to_device,
     quantize,
 )
+from .layer_wise import LayerWiseLoader, save_atomically
+from ....cpu.runtime.core_pools import CorePools
 
 DEBUG = False
 format_str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -34,6 +37,8 @@ class GPTQuantizer(object):
         pad_max_length=2048,
         device=None,
         layer_wise=False,
+        replay_batch_size=8,
+        num_pools=None,
     ):
         """
         Args:
@@ -51,6 +56,9 @@ class GPTQuantizer(object):
                 ...
             }
             dataloader: an iterable containing calibration datasets, contains (inputs, targets)
+            replay_batch_size (int): number of calibration samples concatenated to replay a transformer block.
+            num_pools (int): number of core pools to run independent layers concurrently.
+                Default to the number of sockets.
         """
         self.model = model
         self.gptq_related_blocks = trace_gptq_target_blocks(
@@ -77,6 +85,8 @@ class GPTQuantizer(object):
         self.device = "cpu"
         self.is_ready = False
         self.layer_wise = layer_wise
+        self.replay_batch_size = replay_batch_size
+        self.num_pools = num_pools
 
         # dataloader
         self.use_max_length = use_max_length
@@ -103,6 +113,7 @@ class GPTQuantizer(object):
             self.cache_positional_arguments = (
                 []
             )  # a list of list, positional arguments ("rotary_pos_emb" in chatglm)
+            self.cache_batch_sizes = []  # batch size of each calibration sample
             self.is_ready = True
         except Exception:
             logger.warning("GPTQ Quantizer initialization failed!")
@@ -368,9 +379,11 @@ class GPTQuantizer(object):
             embedding_layer = embedding_layer.to(self.device)
 
         # Step2: modify the first transformer block's forward function to obtain inputs for calibration
-        self.gptq_related_blocks["transformers"][0] = self.gptq_related_blocks[
-            "transformers"
-        ][0].to(self.device)
+        # the block stays on meta device in layer-wise mode since its forward is not run
+        if not self.layer_wise:
+            self.gptq_related_blocks["transformers"][0] = self.gptq_related_blocks[
+                "transformers"
+            ][0].to(self.device)
         forward_cache = self.gptq_related_blocks["transformers"][0].forward
         self.gptq_related_blocks["transformers"][0].forward = partial(
             forward, self.gptq_related_blocks["transformers"][0]
@@ -382,10 +395,13 @@ class GPTQuantizer(object):
             batch = move_input_to_device(batch, self.device)
             try:
                 if isinstance(batch, tuple) or isinstance(batch, list):
+                    self.cache_batch_sizes.append(batch[0].shape[0])
                     self.model(batch[0])
                 elif isinstance(batch, dict):
+                    self.cache_batch_sizes.append(batch["input_ids"].shape[0])
                     self.model(**batch)
                 else:
+                    self.cache_batch_sizes.append(batch.shape[0])
                     self.model(batch)
             except ValueError:
                 pass
@@ -401,9 +417,10 @@ class GPTQuantizer(object):
 
         # Step 4: restore original forward function, relocate layers back to cpu.
         self.gptq_related_blocks["transformers"][0].forward = forward_cache
-        self.gptq_related_blocks["transformers"][0] = self.gptq_related_blocks[
-            "transformers"
-        ][0].cpu()
+        if not self.layer_wise:
+            self.gptq_related_blocks["transformers"][0] = self.gptq_related_blocks[
+                "transformers"
+            ][0].cpu()
         for embedding_name, embedding_layer in self.gptq_related_blocks[
             "embeddings"
         ].items():
@@ -426,6 +443,79 @@ class GPTQuantizer(object):
             single_batch.append(data_item[idx])
         return single_batch
 
+    def can_concat(self, data_key, items, batch_sizes):
+        # the tensors are concatenated along the batch dimension, the others should be shared
+        if not all(isinstance(item, torch.Tensor) for item in items):
+            return all(item is items[0] for item in items)
+        if all(item is items[0] for item in items):
+            return True
+        if any(
+            item.dtype != items[0].dtype or item.shape[1:] != items[0].shape[1:]
+            for item in items
+        ):
+            return False
+        for item, batch_size in zip(items, batch_sizes):
+            if item.dim() == 0 or item.shape[0] % batch_size != 0:
+                return False
+            # alibi is (batch_size * num_heads, ...)
+            if item.shape[0] != batch_size and data_key != "alibi":
+                return False
+        return True
+
+    def get_replay_batches(self):
+        """Group the consecutive calibration samples which can be replayed in one batch."""
+        data = [(k, v) for k, v in self.cache_key_arguments.items() if k != "i"] + list(
+            enumerate(self.cache_positional_arguments)
+        )
+        replay_batches = []
+        for j in range(len(self.dataloader)):
+            if (
+                len(replay_batches) > 0
+                and len(replay_batches[-1]) < self.replay_batch_size
+            ):
+                indices = replay_batches[-1] + [j]
+                batch_sizes = [self.cache_batch_sizes[i] for i in indices]
+                if all(
+                    self.can_concat(k, [v[i] for i in indices], batch_sizes)
+                    for k, v in data
+                ):
+                    replay_batches[-1].append(j)
+                    continue
+            replay_batches.append([j])
+        return replay_batches
+
+    def gather_replay_batch(self, indices):
+        """Concatenate the inputs of the calibration samples along the batch dimension."""
+
+        def concat(items):
+            if all(item is items[0] for item in items):
+                return items[0]
+            return torch.cat(items, dim=0)
+
+        cache_keyword_batch = {
+            k: concat([v[j] for j in indices])
+            for k, v in self.cache_key_arguments.items()
+            if k != "i"
+        }
+        cache_positional_batch = [
+            concat([v[j] for j in indices]) for v in self.cache_positional_arguments
+        ]
+        return cache_positional_batch, cache_keyword_batch
+
+    def replay_block(self, transformer_block, replay_batches, on_batch=None):
+        """Run the transformer block on the calibration samples, return the outputs of each sample."""
+        outs = []
+        for indices in replay_batches:
+            cache_positional_batch, cache_keyword_batch = self.gather_replay_batch(
+                indices
+            )
+            out = transformer_block(*cache_positional_batch, **cache_keyword_batch)
+            if on_batch is not None:
+                on_batch()
+            out = self.track_hidden_states(out)
+            outs.extend(out.split([self.cache_batch_sizes[j] for j in indices]))
+        return outs
+
     def update_blockwise_hidden_states(self, outs):
         if "hidden_states" in self.cache_key_arguments:
             self.cache_key_arguments["hidden_states"] = outs[:]
@@ -464,13 +554,143 @@ class GPTQuantizer(object):
             layers.append([layer])
         return layers
 
+    def get_resume_path(self, checkpoint_dir):
+        return checkpoint_dir + ".resume"
+
+    def get_resume_args_path(self, checkpoint_dir):
+        return checkpoint_dir + ".resume_args"
+
+    def get_blockwise_hidden_states(self):
+        if "hidden_states" in self.cache_key_arguments:
+            return self.cache_key_arguments["hidden_states"]
+        return self.cache_positional_arguments[0]
+
+    def get_block_prefixes(self):
+        return tuple(
+            self.get_full_layer_name("", block_idx)
+            for block_idx in range(len(self.gptq_related_blocks["transformers"]))
+        )
+
+    def prepare_layer_wise(self, model_path, checkpoint_dir):
+        """Load the layers out of the transformer blocks and find the block to resume from."""
+        assert (
+            checkpoint_dir is not None
+        ), "checkpoint_dir should not be None when use layer_wise mode"
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.loader = LayerWiseLoader(model_path)
+        self.loader.load(self.model, skip_prefixes=self.get_block_prefixes())
+
+        resume_path = self.get_resume_path(checkpoint_dir)
+        resume_args_path = self.get_resume_args_path(checkpoint_dir)
+        if not os.path.exists(resume_path) or not os.path.exists(resume_args_path):
+            return 0
+        resume_state = torch.load(resume_path, weights_only=False)
+        if resume_state["nsamples"] != len(self.dataloader):
+            logger.warning(
+                f"Calibration samples mismatched with {resume_path}, quantize from the first block."
+            )
+            return 0
+        resume_args = torch.load(resume_args_path, weights_only=False)
+        self.cache_key_arguments = resume_args["cache_key_arguments"]
+        self.cache_positional_arguments = resume_args["cache_positional_arguments"]
+        self.cache_batch_sizes = resume_args["cache_batch_sizes"]
+        self.update_blockwise_hidden_states(resume_state["hidden_states"])
+        logger.info(f"Resume from layer {resume_state['block_idx'] + 1}")
+        return resume_state["block_idx"]
+
+    def save_layer_wise_args(self, checkpoint_dir):
+        """Save the calibration arguments shared by all the transformer blocks."""
+        # attention masks, position ids, etc. are the same for all the blocks, only the
+        # hidden states are saved after each block
+        cache_key_arguments = dict(self.cache_key_arguments)
+        cache_positional_arguments = list(self.cache_positional_arguments)
+        if "hidden_states" in cache_key_arguments:
+            cache_key_arguments["hidden_states"] = None
+        else:
+            cache_positional_arguments[0] = None
+        save_atomically(
+            {
+                "cache_key_arguments": cache_key_arguments,
+                "cache_positional_arguments": cache_positional_arguments,
+                "cache_batch_sizes": self.cache_batch_sizes,
+            },
+            self.get_resume_args_path(checkpoint_dir),
+        )
+
+    def save_layer_wise_block(self, block_idx, gptq_config, checkpoint_dir, export_fn):
+        """Export a quantized transformer block to the checkpoint and release it."""
+        prefix = self.get_full_layer_name("", block_idx)
+        block_gptq_config = {}
+        for layer_name in [k for k in gptq_config if k.startswith(prefix)]:
+            block_gptq_config[layer_name] = {
+                m: n.tolist() for m, n in gptq_config.pop(layer_name).items()
+            }
+        block_weight_config = {
+            k: self.weight_config[k] for k in block_gptq_config.keys()
+        }
+        export_fn(self.model, block_weight_config, block_gptq_config)
+        transformer_block = self.gptq_related_blocks["transformers"][block_idx]
+        save_atomically(
+            {prefix + k: v for k, v in transformer_block.state_dict().items()},
+            os.path.join(checkpoint_dir, f"block_{block_idx:05d}.pt"),
+        )
+        transformer_block.to("meta")
+        # the input of the next block, which is saved after the block so that it can be resumed
+        save_atomically(
+            {
+                "block_idx": block_idx + 1,
+                "nsamples": len(self.dataloader),
+                "hidden_states": self.get_blockwise_hidden_states(),
+            },
+            self.get_resume_path(checkpoint_dir),
+        )
+
+    def save_layer_wise_others(self, checkpoint_dir):
+        """Save the layers out of the transformer blocks to the checkpoint."""
+        block_prefixes = self.get_block_prefixes()
+        save_atomically(
+            {
+                k: v
+                for k, v in self.model.state_dict().items()
+                if not k.startswith(block_prefixes)
+            },
+            os.path.join(checkpoint_dir, "others.pt"),
+        )
+        for path in [
+            self.get_resume_path(checkpoint_dir),
+            self.get_resume_args_path(checkpoint_dir),
+        ]:
+            if os.path.exists(path):
+                os.remove(path)
+
     @torch.no_grad()
-    def execute_quantization(self, means=None, stds=None, model_path=None):
-        """Run quantization."""
+    def execute_quantization(
+        self,
+        means=None,
+        stds=None,
+        model_path=None,
+        checkpoint_dir=None,
+        export_fn=None,
+    ):
+        """Run quantization.
+
+        In layer-wise mode, the model is created on meta device and its weights are
+        loaded from `model_path` one transformer block at a time. Each block is
+        exported by `export_fn(model, weight_config, gptq_config)` and saved to
+        `checkpoint_dir` once quantized, then released. The hidden states input to the
+        next block are saved along, and the other calibration arguments once before
+        the first block, so that an interrupted run resumes from it.
+        """
         # Step1: prepare quantization (calibration datasets)
 
         logger.info("Begin ====>")
-        self.pre_quantization()
+        start_block_idx = 0
+        if self.layer_wise:
+            start_block_idx = self.prepare_layer_wise(model_path, checkpoint_dir)
+        if start_block_idx == 0:
+            self.pre_quantization()
+            if self.layer_wise:
+                self.save_layer_wise_args(checkpoint_dir)
 
         # Step2: run gptq quantization in a transformer block-wise manner.
         gptq_config = {}
@@ -481,12 +701,23 @@ class GPTQuantizer(object):
             self.gptq_related_blocks["transformers"][0]
         )
         logger.info(f"Sequential Name: {true_sequential_map}")
+        replay_batches = self.get_replay_batches()
+        logger.info(
+            f"Replay {len(self.dataloader)} calibration samples in {len(replay_batches)} batches"
+        )
+        self.core_pools = CorePools(self.num_pools)
         tblock_length = len(self.gptq_related_blocks["transformers"])
-        for block_idx in range(tblock_length):
+        for block_idx in range(start_block_idx, tblock_length):
             logger.info(f"Quantizing layer {block_idx + 1} / {tblock_length}..")
-            transformer_block = self.gptq_related_blocks["transformers"][block_idx].to(
-                self.device
-            )
+            if self.layer_wise:
+                transformer_block = self.loader.load(
+                    self.gptq_related_blocks["transformers"][block_idx],
+                    prefix=self.get_full_layer_name("", block_idx),
+                )
+            else:
+                transformer_block = self.gptq_related_blocks["transformers"][
+                    block_idx
+                ].to(self.device)
             # Step2.1: obtain all layers (Linear, Conv2d, etc) in the block which can be quantized.
             sub_layers = find_layers(transformer_block)
             sub_layers_to_quant = {}
@@ -532,14 +763,36 @@ class GPTQuantizer(object):
                     )
 
                 # Step 2.3: modify forward functions to hook inputs data (used in gptq execution)
+                # the inputs of the layers are collected during the replay of a batch, then the
+                # hessians are accumulated concurrently, once for the layers with the same input (e.g., q, k, v)
+                batch_inputs = {}
+                hessian_owners = {}
+
                 def add_batch(_name):
                     def tmp(_, inp, out):
-                        gptq_for_this_block[_name].add_batch(
-                            inp[0].data, out.data
-                        )  # noqa: F821
+                        batch_inputs[_name] = (inp[0], out)
 
                     return tmp
 
+                def accumulate_hessians():
+                    if len(hessian_owners) == 0:
+                        for layer_name, (inp, _) in batch_inputs.items():
+                            hessian_owners[layer_name] = next(
+                                (
+                                    owner
+                                    for owner in set(hessian_owners.values())
+                                    if batch_inputs[owner][0] is inp
+                                ),
+                                layer_name,
+                            )
+                    self.core_pools.map(
+                        lambda _name: gptq_for_this_block[_name].add_batch(
+                            batch_inputs[_name][0].data, batch_inputs[_name][1].data
+                        ),
+                        [n for n, owner in hessian_owners.items() if n == owner],
+                    )
+                    batch_inputs.clear()
+
                 handles = (
                     []
                 )  # register handles which add inputs and outputs to gptq object
@@ -549,29 +802,29 @@ class GPTQuantizer(object):
                             add_batch(layer_name)
                         )
                     )
-                idx = self.cache_key_arguments.pop("i")
-                for j in range(len(self.dataloader)):
-                    cache_keyword_batch = self.gather_single_batch_from_dict(
-                        self.cache_key_arguments, j
-                    )
-                    cache_positional_batch = self.gather_single_batch_from_list(
-                        self.cache_positional_arguments, j
-                    )
-                    out = transformer_block(
-                        *cache_positional_batch, **cache_keyword_batch
-                    )
-                    out = self.track_hidden_states(out)
-                self.cache_key_arguments["i"] = idx
+                self.replay_block(
+                    transformer_block, replay_batches, accumulate_hessians
+                )
                 for h in handles:
                     h.remove()
+                for layer_name, owner in hessian_owners.items():
+                    if layer_name != owner:
+                        gptq_for_this_block[layer_name].H = gptq_for_this_block[
+                            owner
+                        ].H.clone()
+                        gptq_for_this_block[layer_name].nsamples = gptq_for_this_block[
+                            owner
+                        ].nsamples
+
                 # Step 2.4: everything is prepared, so start quantization!
-                for layer_name in sequential_layers:
+                # the layers of a sequential are independent, they are quantized concurrently
+                def quantize_layer(layer_name):
                     weight_config_this_layer = self.get_layer_config(
                         self.get_full_layer_name(layer_name, block_idx)
                     )
                     logger.info(f"Quantizing layer {layer_name}")
                     W = sequential_layers[layer_name].weight.data.clone()
-                    scale, zp, Q = gptq_for_this_block[layer_name].fasterquant(
+                    return gptq_for_this_block[layer_name].fasterquant(
                         W,
                         blocksize=weight_config_this_layer["block_size"],
                         percdamp=weight_config_this_layer["percdamp"],
@@ -580,6 +833,11 @@ class GPTQuantizer(object):
                         static_groups=weight_config_this_layer["static_groups"],
                     )
 
+                results = self.core_pools.map(quantize_layer, list(sequential_layers))
+                for layer_name, (scale, zp, Q) in zip(sequential_layers, results):
+                    weight_config_this_layer = self.get_layer_config(
+                        self.get_full_layer_name(layer_name, block_idx)
+                    )
                     sequential_layers[layer_name].weight.data = Q
                     gptq_config[self.get_full_layer_name(layer_name, block_idx)] = {
                         "scale": scale
@@ -599,19 +857,7 @@ class GPTQuantizer(object):
                     gptq_for_this_block[layer_name].free()
 
             # Step 2.5: replace output data with quantized weights
-            outs = []
-            idx = self.cache_key_arguments.pop("i")
-            for j in range(len(self.dataloader)):
-                cache_keyword_batch = self.gather_single_batch_from_dict(
-                    self.cache_key_arguments, j
-                )
-                cache_positional_batch = self.gather_single_batch_from_list(
-                    self.cache_positional_arguments, j
-                )
-                out = transformer_block(*cache_positional_batch, **cache_keyword_batch)
-                out = self.track_hidden_states(out)
-                outs.append(out)
-            self.cache_key_arguments["i"] = idx
+            outs = self.replay_block(transformer_block, replay_batches)
             self.gptq_related_blocks["transformers"][
                 block_idx
             ] = transformer_block.cpu()
@@ -619,6 +865,10 @@ class GPTQuantizer(object):
             torch.cuda.empty_cache()
             # iteratively replace the input with output, thus layerwise quantization can continue.
             self.update_blockwise_hidden_states(outs)
+            if self.layer_wise:
+                self.save_layer_wise_block(
+                    block_idx, gptq_config, checkpoint_dir, export_fn
+                )
             logger.info("------------------------------")
 
         # do the post transformer blocks quantization
@@ -709,6 +959,9 @@ class GPTQuantizer(object):
                     ].perm
                 gptq_post_block[layer_name].free()
 
+        if self.layer_wise:
+            self.save_layer_wise_others(checkpoint_dir)
+        self.core_pools.shutdown()
         logger.info("Quantization done")
 
         # obtain model (all weight only quantization API function should return)
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import torch
+import torch.nn as nn
+
+format_str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+logging.basicConfig(level=logging.INFO, format=format_str)
+logger = logging.getLogger("GPTQ")
+logger.setLevel(logging.INFO)
+
+
+class LayerWiseLoader(object):
+    """Load the tensors of a (sharded) Hugging Face checkpoint on demand.
+
+    Only the tensors of the requested modules are read, so that a model created on
+    the meta device is materialized one transformer block at a time.
+
+    Args:
+        model_path (str): directory of the checkpoint, which contains
+            `model.safetensors`, `pytorch_model.bin` or their sharded version with
+            the `*.index.json` file.
+    """
+
+    index_files = ["model.safetensors.index.json", "pytorch_model.bin.index.json"]
+    single_files = ["model.safetensors", "pytorch_model.bin"]
+
+    def __init__(self, model_path):
+        assert os.path.isdir(
+            model_path
+        ), f"Checkpoint directory not found: {model_path}"
+        self.model_path = model_path
+        self.weight_map = self.get_weight_map()
+
+    def get_weight_map(self):
+        """Obtain the map from tensor names to the checkpoint files."""
+        for index_file in self.index_files:
+            index_path = os.path.join(self.model_path, index_file)
+            if os.path.exists(index_path):
+                with open(index_path) as f:
+                    return json.load(f)["weight_map"]
+        for single_file in self.single_files:
+            if os.path.exists(os.path.join(self.model_path, single_file)):
+                return {
+                    name: single_file for name in self.load_file(single_file).keys()
+                }
+        raise RuntimeError(
+            f"Cannot find checkpoint files ({', '.join(self.index_files + self.single_files)}) "
+            + f"in {self.model_path}"
+        )
+
+    def load_file(self, file_name, names=None):
+        """Load tensors with given names (all tensors by default) from a checkpoint file."""
+        path = os.path.join(self.model_path, file_name)
+        if file_name.endswith(".safetensors"):
+            from safetensors import safe_open
+
+            with safe_open(path, framework="pt", device="cpu") as f:
+                names = f.keys() if names is None else names
+                return {name: f.get_tensor(name) for name in names}
+        # the storage is mapped, only the requested tensors are read from the file
+        state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        names = state_dict.keys() if names is None else names
+        return {name: state_dict[name] for name in names}
+
+    def load(self, module, prefix="", skip_prefixes=()):
+        """Materialize the meta parameters and buffers of a module from the checkpoint.
+
+        Args:
+            module (torch.nn.Module): the module to load.
+            prefix (str): prefix of the names of the module tensors in the checkpoint.
+            skip_prefixes (tuple of str): names of the tensors to keep on meta device.
+        """
+        # tied tensors are loaded once and assigned to all their names
+        tensor_names = {}
+        tensors = {}
+        for name, t in list(module.named_parameters(remove_duplicate=False)) + list(
+            module.named_buffers(remove_duplicate=False)
+        ):
+            if t is None or not t.is_meta or name.startswith(skip_prefixes):
+                continue
+            tensor_names.setdefault(id(t), []).append(name)
+            tensors[id(t)] = t
+
+        files = {}
+        for tensor_id, names in tensor_names.items():
+            ckpt_names = [
+                prefix + name for name in names if prefix + name in self.weight_map
+            ]
+            if len(ckpt_names) == 0:
+                raise RuntimeError(
+                    f"Cannot find {prefix + names[0]} in the checkpoint {self.model_path}, "
+                    + "only the parameters should be on meta device "
+                    + "(e.g., create the model with accelerate.init_empty_weights())"
+                )
+            files.setdefault(self.weight_map[ckpt_names[0]], []).append(
+                (tensor_id, ckpt_names[0])
+            )
+
+        for file_name, items in files.items():
+            loaded = self.load_file(file_name, [ckpt_name for _, ckpt_name in items])
+            for tensor_id, ckpt_name in items:
+                meta_t = tensors[tensor_id]
+                t = loaded[ckpt_name]
+                assert (
+                    t.shape == meta_t.shape
+                ), f"Shape of {ckpt_name} mismatched: {t.shape} vs {meta_t.shape}"
+                t = t.to(meta_t.dtype)
+                if isinstance(meta_t, nn.Parameter):
+                    t = nn.Parameter(t, requires_grad=False)
+                for name in tensor_names[tensor_id]:
+                    module_name, _, attr = name.rpartition(".")
+                    sub_module = module.get_submodule(module_name)
+                    if attr in sub_module._parameters:
+                        sub_module._parameters[attr] = t
+                    else:
+                        sub_module._buffers[attr] = t
+        return module
+
+
+def save_atomically(obj, path):
+    """Save an object with torch.save, the file is complete once it exists."""
+    tmp_path = f"{path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
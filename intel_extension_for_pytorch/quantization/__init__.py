@@ -17,5 +17,6 @@ from ._quantize_utils import (
     dequantize_per_channel,
     quantize_per_block,
     dequantize_per_block,
+    quantize_woq_weights,
 )
 from ._GPTQ import gptq
@@ -4,6 +4,7 @@ from ..utils._logger import logger, WarningType
 
 import torch
 from torch.ao.quantization import PlaceholderObserver, QConfig, QConfigMapping
+from torch.ao.quantization.quantize import swap_module
 from torch.ao.quantization.quantization_mappings import (
     get_default_dynamic_quant_module_mappings,
 )
@@ -16,7 +17,14 @@ from intel_extension_for_pytorch.nn.utils._weight_prepack import (
     _all_reduce_and_bias_add,
     _pre_ipex_gemm,
 )
-from ._quantize_utils import auto_prepare, auto_convert, copy_prepared_model
+from ._quantize_utils import (
+    auto_prepare,
+    auto_convert,
+    copy_prepared_model,
+    quantize_woq_weights,
+    WOQ_QUANT_GROUP_NUMEL,
+)
+from ._qconfig import QConfigWoq
 from .. import nn
 from typing import Dict
 
@@ -380,6 +388,59 @@ def may_quantize_deepspeed_modules(
     return module_mappings, qconfig_spec
 
 
+def _swap_woq_modules_in_groups(model, qconfig, module_mappings):
+    # Quantize the weights of the linears to be swapped to weight-only quantized
+    # modules together, which is much faster than one by one in their from_float.
+    # The linears are quantized and swapped in groups of WOQ_QUANT_GROUP_NUMEL weight
+    # elements, so that only the quantized weights of one group are alive with the
+    # float weights. The modules keep their qconfig, which has priority over the
+    # global one.
+    from ..cpu.runtime.core_pools import CorePools
+
+    modules = [
+        (name, m)
+        for name, m in model.named_modules()
+        if name != ""
+        and type(m) in module_mappings
+        and issubclass(
+            module_mappings[type(m)],
+            nn.modules.weight_only_quantization.WeightOnlyQuantizedLinear,
+        )
+        and isinstance(getattr(m, "qconfig", qconfig), QConfigWoq)
+        and isinstance(getattr(m, "weight", None), torch.Tensor)
+        and m.weight.dim() == 2
+        and not m.weight.is_meta
+    ]
+    groups = []
+    group_numel = 0
+    for name, m in modules:
+        if len(groups) == 0 or group_numel + m.weight.numel() > WOQ_QUANT_GROUP_NUMEL:
+            groups.append([])
+            group_numel = 0
+        groups[-1].append((name, m))
+        group_numel += m.weight.numel()
+    if len(groups) == 0:
+        return
+    core_pools = CorePools()
+    try:
+        for group in groups:
+            qconfigs = [getattr(m, "qconfig", qconfig) for _, m in group]
+            quantized = quantize_woq_weights(
+                [m.weight for _, m in group], qconfigs, core_pools=core_pools
+            )
+            for (name, m), m_qconfig, (qweight, scales, zero_points) in zip(
+                group, qconfigs, quantized
+            ):
+                m.qconfig = m_qconfig
+                m._woq_quantized_weight = (m_qconfig, qweight, scales, zero_points)
+                parent_name, _, attr = name.rpartition(".")
+                parent = model.get_submodule(parent_name)
+                setattr(parent, attr, swap_module(m, module_mappings, {}))
+            del quantized
+    finally:
+        core_pools.shutdown()
+
+
 def convert(model, inplace=False):
     r"""
     Convert an FP32 prepared model to a model which will automatically insert fake quant
@@ -433,12 +494,16 @@ def convert(model, inplace=False):
             module_mappings,
             qconfig_spec,
         )
+        _swap_woq_modules_in_groups(
+            convert_model, convert_model.q_config, module_mappings
+        )
+        # convert_model is already a copy of the model when not inplace
         converted_model = torch.quantization.quantize_dynamic(
             convert_model,
             qconfig_spec=qconfig_spec,
             dtype=torch.qint8,
             mapping=module_mappings,
-            inplace=inplace,
+            inplace=True,
         )
         return converted_model
 
@@ -829,18 +829,16 @@ NF4_DEQUANT_TABLE = [
 def map_float_tensor_to_nf4(t, dtype=torch.uint8):
     # Map [-1, 1] to nf4
     # Assume t in [-1, 1]
-    out_uint8 = torch.empty(t.shape, dtype=dtype)
-    for i in range(len(NF4_QUANT_TABLE)):
-        out_uint8[t > NF4_QUANT_TABLE[i]] = i
-    return out_uint8
+    # nf4 value i is the last one with t > NF4_QUANT_TABLE[i], i.e., the number of
+    # the other thresholds less than t, found in one pass by bucketize
+    boundaries = torch.tensor(NF4_QUANT_TABLE[1:], dtype=t.dtype, device=t.device)
+    return torch.bucketize(t, boundaries, out_int32=True).to(dtype)
 
 
 def map_nf4_tensor_to_float(t, dtype=torch.float32):
     # Map nf4 to [-1, 1]
-    out_dq = torch.empty(t.shape).to(dtype)
-    for i in range(len(NF4_DEQUANT_TABLE)):
-        out_dq[t == i] = NF4_DEQUANT_TABLE[i]
-    return out_dq
+    table = torch.tensor(NF4_DEQUANT_TABLE, dtype=dtype, device=t.device)
+    return table[t.to(torch.int64)]
 
 
 def is_4bit(dtype):
@@ -904,15 +902,23 @@ def quantize_per_channel(
         qmax = 127
         if sym_quant:
             zps = torch.zeros_like(scales)
-        qt = torch.clamp(
-            torch.round(t * inv_scales) + zps.unsqueeze(1), min=qmin, max=qmax
-        ).to(torch.int8)
+        qt = (
+            (t * inv_scales)
+            .round_()
+            .add_(zps.unsqueeze(1))
+            .clamp_(min=qmin, max=qmax)
+            .to(torch.int8)
+        )
     elif dtype == WoqWeightDtype.INT4:
         qmin = 0
         qmax = 15
-        qt = torch.clamp(
-            torch.round(t * inv_scales) + zps.unsqueeze(1), min=qmin, max=qmax
-        ).to(torch.uint8)
+        qt = (
+            (t * inv_scales)
+            .round_()
+            .add_(zps.unsqueeze(1))
+            .clamp_(min=qmin, max=qmax)
+            .to(torch.uint8)
+        )
     else:  # NF4
         qt = map_float_tensor_to_nf4(t * inv_scales)
     if is_4bit(dtype):
@@ -1073,18 +1079,20 @@ def quantize_per_block(
     if dtype == WoqWeightDtype.INT8:
         qmin = -128
         qmax = 127
-        qt = torch.clamp(
-            torch.round(t_com * inv_scales_com) + zps_com.unsqueeze(-1),
-            min=qmin,
-            max=qmax,
+        qt = (
+            (t_com * inv_scales_com)
+            .round_()
+            .add_(zps_com.unsqueeze(-1))
+            .clamp_(min=qmin, max=qmax)
         )
     elif dtype == WoqWeightDtype.INT4:
         qmin = 0
         qmax = 15
-        qt = torch.clamp(
-            torch.round(t_com * inv_scales_com) + zps_com.unsqueeze(-1),
-            min=qmin,
-            max=qmax,
+        qt = (
+            (t_com * inv_scales_com)
+            .round_()
+            .add_(zps_com.unsqueeze(-1))
+            .clamp_(min=qmin, max=qmax)
         )
     else:  # NF4
         qt = map_float_tensor_to_nf4(t_com * inv_scales_com)
@@ -1097,17 +1105,19 @@ def quantize_per_block(
             zps_rem = zps[:, Kc - has_rem :]
         if dtype == WoqWeightDtype.INT8:
             assert zps_rem is not None
-            qt_rem = torch.clamp(
-                torch.round(t_rem * inv_scales_rem) + zps_rem.unsqueeze(-1),
-                min=qmin,
-                max=qmax,
+            qt_rem = (
+                (t_rem * inv_scales_rem)
+                .round_()
+                .add_(zps_rem.unsqueeze(-1))
+                .clamp_(min=qmin, max=qmax)
             )
         elif dtype == WoqWeightDtype.INT4:
             assert zps_rem is not None
-            qt_rem = torch.clamp(
-                torch.round(t_rem * inv_scales_rem) + zps_rem.unsqueeze(-1),
-                min=qmin,
-                max=qmax,
+            qt_rem = (
+                (t_rem * inv_scales_rem)
+                .round_()
+                .add_(zps_rem.unsqueeze(-1))
+                .clamp_(min=qmin, max=qmax)
             )
         else:  # NF4
             qt_rem = map_float_tensor_to_nf4(t_rem * inv_scales_rem)
@@ -1202,3 +1212,81 @@ def dequantize_per_block(
     if weight_shape is not None:
         t = t[: weight_shape[0], : weight_shape[1]].contiguous()
     return t
+
+
+# max number of weight elements quantized at once by quantize_woq_weights, so that
+# the float temporaries of a chunk stay small
+WOQ_QUANT_CHUNK_NUMEL = 1 << 22
+# max number of weight elements of the linears quantized and swapped together by
+# convert, so that the quantized weights of one group only are alive with the float
+# weights of the model
+WOQ_QUANT_GROUP_NUMEL = 1 << 28
+
+
+def _quantize_woq_chunk(weight, qconfig):
+    # the same quantization as WeightOnlyQuantizedLinear.from_float
+    dtype = qconfig.weight_dtype
+    # if dtype = int8, lowp-mode = int8, we want zero points to be 0
+    sym_quant = dtype == WoqWeightDtype.INT8 and qconfig.lowp_mode == 3
+    with torch.no_grad():
+        if qconfig.group_size == -1:
+            return quantize_per_channel(weight, dtype, None, None, sym_quant)
+        return quantize_per_block(
+            weight, dtype, qconfig.group_size, None, None, sym_quant
+        )
+
+
+def quantize_woq_weights(weights, qconfigs, num_pools=None, core_pools=None):
+    r"""
+    Quantize the weights of Linear modules for weight-only quantization, with the
+    ``weight_dtype``, ``lowp_mode`` and ``group_size`` of their QConfigWoq, as
+    ``WeightOnlyQuantizedLinear.from_float`` does. The quantization parameters are per
+    output channel or per block of an output channel, so every weight is split into
+    chunks of rows, and the chunks of all the weights are quantized concurrently on
+    ``num_pools`` pools of cores. The chunks are written into the quantized weights
+    as they are done.
+
+    Args:
+        weights: The list of weight tensors in shape [output channel, input channel]
+        qconfigs: The list of QConfigWoq of the weights
+        num_pools: Number of pools to split the cores into. Default to the number of sockets.
+        core_pools: The CorePools to run on, instead of creating ``num_pools`` pools.
+
+    Returns:
+        A list of (quantized weight, scales, zero points) for every weight
+    """
+    from ..cpu.runtime.core_pools import CorePools
+
+    chunks = []
+    for i, weight in enumerate(weights):
+        N = weight.size(0)
+        chunk_rows = max(1, WOQ_QUANT_CHUNK_NUMEL // max(1, weight.size(1)))
+        for start in range(0, N, chunk_rows):
+            chunks.append((i, start, min(start + chunk_rows, N)))
+
+    def quantize_chunk(chunk):
+        i, start, end = chunk
+        return _quantize_woq_chunk(weights[i].detach()[start:end], qconfigs[i])
+
+    quantized = [None] * len(weights)
+    own_core_pools = core_pools is None
+    if own_core_pools:
+        core_pools = CorePools(num_pools)
+    try:
+        for (i, start, end), result in zip(
+            chunks, core_pools.imap(quantize_chunk, chunks)
+        ):
+            # the rows of the chunk are the same rows of the quantized weight and qparams
+            if quantized[i] is None:
+                N = weights[i].size(0)
+                quantized[i] = tuple(
+                    None if t is None else t.new_empty((N,) + tuple(t.shape[1:]))
+                    for t in result
+                )
+            for out, t in zip(quantized[i], result):
+                if t is not None:
+                    out[start:end].copy_(t)
+    finally:
+        if own_core_pools:
+            core_pools.shutdown()
+    return quantized
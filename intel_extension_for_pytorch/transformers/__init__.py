@@ -1,5 +1,6 @@
 from .optimize import optimize_transformers
 from .optimize import _set_optimized_model_for_generation
+from .profiler import GenerationProfiler
 from .models.cpu.modules.attentions import _IPEXAttentionCPU
 from .models.cpu.modules.decoder import _IPEXDecoderLayerCPU
 
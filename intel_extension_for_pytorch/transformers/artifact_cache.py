@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections.abc import Mapping
+import torch
+import intel_extension_for_pytorch as ipex
+import intel_extension_for_pytorch._C as core
+from ..utils._logger import logger, WarningType
+
+# The artifact cache of ipex.llm.optimize stores the frozen TorchScript graphs of the
+# deployment mode (with the prepacked/quantized weights as their constants) in
+# <cache_dir>/<key>/, one entry per model, optimization options and environment.
+_META_FILE = "meta.json"
+_GRAPH_FILE = "model.pt"
+_FIRST_TOKEN_GRAPH_FILE = "model_first.pt"
+
+
+def _get_environment():
+    import transformers
+
+    environment = {
+        "ipex_version": ipex.__version__,
+        "torch_version": torch.__version__,
+        "transformers_version": transformers.__version__,
+        "isa": core._get_current_isa_level(),
+    }
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        environment["rank"] = torch.distributed.get_rank()
+        environment["world_size"] = torch.distributed.get_world_size()
+    return environment
+
+
+def _get_graph_settings():
+    r"""
+    Returns the process-wide settings changing the optimized graphs besides the
+    arguments of ``ipex.llm.optimize``.
+    """
+    from ..cpu._auto_kernel_selection import _using_dnnl, _using_tpp
+    from ..cpu._linear_autotune import _get_linear_autotuner
+    from .profiler import _PROFILE_LAYERS_ENV
+
+    linear_autotuner = _get_linear_autotuner()
+    return {
+        "LM_HEAD_TOPK": os.getenv("LM_HEAD_TOPK", "0"),
+        "LM_HEAD_SHARD_POLICY": os.getenv("LM_HEAD_SHARD_POLICY", "row"),
+        _PROFILE_LAYERS_ENV: os.environ.get(_PROFILE_LAYERS_ENV, "0"),
+        "using_tpp": _using_tpp(),
+        "using_dnnl": _using_dnnl(),
+        "linear_autotune_m_buckets": (
+            None if linear_autotuner is None else linear_autotuner.m_buckets
+        ),
+    }
+
+
+def _update_tensor_fingerprint(sha, name, tensor):
+    sha.update(f"{name}:{list(tensor.shape)}:{tensor.dtype}".encode())
+    if tensor.device.type == "meta" or tensor.numel() == 0:
+        return
+    # all the bytes, a sample misses the fine-tuned weights changing a few elements
+    flat = tensor.detach().contiguous().reshape(-1)
+    sha.update(flat.view(torch.uint8).numpy())
+
+
+def _update_object_fingerprint(sha, obj):
+    if isinstance(obj, torch.Tensor):
+        _update_tensor_fingerprint(sha, "", obj)
+    elif isinstance(obj, Mapping):
+        for key in sorted(obj.keys(), key=str):
+            sha.update(str(key).encode())
+            _update_object_fingerprint(sha, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _update_object_fingerprint(sha, item)
+    else:
+        # object addresses differ in every process
+        sha.update(re.sub(r"0x[0-9a-fA-F]+", "", repr(obj)).encode())
+
+
+def _get_artifact_cache_key(
+    model,
+    dtype,
+    quantization_config=None,
+    low_precision_checkpoint=None,
+    sample_inputs=None,
+    cache_weight_for_large_batch=False,
+):
+    r"""
+    Returns the key of the artifacts of ``model`` optimized with the given options in
+    the current environment (IPEX/PyTorch/transformers versions, ISA level and rank)
+    and with the current graph settings (see ``_get_graph_settings``).
+    """
+    sha = hashlib.sha256()
+    sha.update(model.config.to_json_string(use_diff=False).encode())
+    for name, tensor in model.state_dict().items():
+        _update_tensor_fingerprint(sha, name, tensor)
+    for obj in [
+        dtype,
+        quantization_config,
+        low_precision_checkpoint,
+        sample_inputs,
+        cache_weight_for_large_batch,
+        _get_environment(),
+        _get_graph_settings(),
+    ]:
+        _update_object_fingerprint(sha, obj)
+    return sha.hexdigest()
+
+
+def _is_stale(meta):
+    environment = _get_environment()
+    return any(
+        meta.get(name, None) != environment[name]
+        for name in ["ipex_version", "torch_version", "transformers_version"]
+    )
+
+
+def _remove_entry(entry_dir):
+    shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+def _evict_stale_artifacts(cache_dir):
+    r"""
+    Removes the entries created by other IPEX/PyTorch/transformers versions, which
+    can not be loaded anymore, and the unreadable ones.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        if not os.path.isdir(entry_dir) or name.startswith("."):
+            continue
+        try:
+            with open(os.path.join(entry_dir, _META_FILE)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if meta is None or _is_stale(meta):
+            logger.info(f"ipex.llm.optimize evicts the stale artifacts {entry_dir}")
+            _remove_entry(entry_dir)
+
+
+def _load_artifacts(cache_dir, key):
+    r"""
+    Returns the cached ``(optimized_model, first_token_optimized_model)`` of ``key``,
+    or None if they are missing or invalid (the invalid entry is removed).
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry_dir):
+        return None
+    try:
+        with open(os.path.join(entry_dir, _META_FILE)) as f:
+            meta = json.load(f)
+        if meta["key"] != key or _is_stale(meta):
+            raise RuntimeError("the metadata does not match")
+        graphs = []
+        for file_name in [_GRAPH_FILE, _FIRST_TOKEN_GRAPH_FILE]:
+            if file_name not in meta["files"]:
+                graphs.append(None)
+                continue
+            path = os.path.join(entry_dir, file_name)
+            if os.path.getsize(path) != meta["files"][file_name]:
+                raise RuntimeError(f"{file_name} is truncated")
+            graphs.append(torch.jit.freeze(torch.jit.load(path).eval()))
+    except Exception as e:
+        logger.warning(
+            f"ipex.llm.optimize fails to load the cached artifacts {entry_dir} due to: {e}, "
+            + "they are removed and rebuilt",
+            _type=WarningType.NotSupported,
+        )
+        _remove_entry(entry_dir)
+        return None
+    # the access time orders the entries for manual cleanup
+    os.utime(os.path.join(entry_dir, _META_FILE))
+    return graphs[0], graphs[1]
+
+
+def _save_artifacts(cache_dir, key, model):
+    r"""
+    Saves the optimized graphs set on ``model`` by ``ipex.llm.optimize``. The entry is
+    written in a temporary directory and renamed, so that the processes sharing the
+    cache never read a partial entry.
+    """
+    if not hasattr(model, "trace_graph"):
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_dir = os.path.join(cache_dir, key)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir)
+    try:
+        files = {}
+        graphs = [(_GRAPH_FILE, model.trace_graph)]
+        if hasattr(model, "trace_graph_first"):
+            graphs.append((_FIRST_TOKEN_GRAPH_FILE, model.trace_graph_first))
+        for file_name, graph in graphs:
+            path = os.path.join(tmp_dir, file_name)
+            graph.save(path)
+            files[file_name] = os.path.getsize(path)
+        meta = {"key": key, "files": files, "created": time.time()}
+        meta.update(_get_environment())
+        with open(os.path.join(tmp_dir, _META_FILE), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # another process has saved the same entry
+            pass
+    except Exception as e:
+        logger.warning(
+            f"ipex.llm.optimize fails to save the artifacts to {cache_dir} due to: {e}",
+            _type=WarningType.NotSupported,
+        )
+    finally:
+        _remove_entry(tmp_dir)
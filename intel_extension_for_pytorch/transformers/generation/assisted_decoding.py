@@ -0,0 +1,475 @@
+import torch
+import torch.distributed as dist
+from typing import Optional, Tuple, Union, List
+from transformers.generation.stopping_criteria import StoppingCriteriaList
+from transformers.generation.logits_process import LogitsProcessorList
+from transformers.generation.streamers import BaseStreamer
+from transformers.generation.candidate_generator import (
+    AssistedCandidateGenerator,
+    CandidateGenerator,
+)
+from transformers.generation.utils import _speculative_sampling
+from transformers.utils import ModelOutput
+from ...utils._logger import logger, WarningType
+import time
+from .utils import _get_beam_idx_tmp_length, _with_lm_head_topk
+
+
+class AssistedDecodingDecoderOnlyOutput(ModelOutput):
+    sequences: torch.LongTensor = None
+    scores: Optional[Tuple[torch.FloatTensor]] = None
+    logits: Optional[Tuple[torch.FloatTensor]] = None
+
+
+# models whose prepare_inputs_for_generation keeps the tokens after the cached ones
+_assisted_decoding_supported_models = [
+    "LlamaForCausalLM",
+    "MistralForCausalLM",
+    "Qwen2ForCausalLM",
+]
+
+
+def _is_ipex_optimized(model) -> bool:
+    from ..models.cpu.fusions.mha_fusion import _IPEXScaleDotProductCPU
+
+    return hasattr(model, "trace_graph") or any(
+        isinstance(m, _IPEXScaleDotProductCPU) for m in model.modules()
+    )
+
+
+def _crop_indirect_kv_cache(past_key_values, length: int):
+    # The length of the indirect access kv cache is only recorded by the shape of
+    # the seq_info dummy, the rows of the rejected tokens are overwritten later.
+    seq_info = torch.empty(1, length, length, 1, dtype=torch.long).contiguous()
+    return tuple((seq_info,) + tuple(layer_past[1:]) for layer_past in past_key_values)
+
+
+def _get_num_hidden_layers(config) -> int:
+    for name in ["n_layer", "num_hidden_layers", "num_layers", "n_layers"]:
+        if hasattr(config, name):
+            return getattr(config, name)
+    raise RuntimeError("Cannot detect the number of layers from the model config")
+
+
+def _assisted_forward(
+    model,
+    input_ids: torch.LongTensor,
+    past_key_values,
+    attention_mask: torch.LongTensor,
+    max_length: int,
+):
+    # Runs the tokens of input_ids which are not in past_key_values yet and
+    # returns their logits and the updated indirect access kv cache.
+    first_token = past_key_values is None
+    if first_token:
+        beam_idx_tmp = torch.zeros(
+            (max_length, int(input_ids.size(0))), dtype=torch.long
+        ).contiguous()
+        past_key_values = tuple(
+            [
+                (
+                    torch.zeros(1, 0, 0, 1, dtype=torch.long).contiguous(),
+                    torch.zeros([1, 1, 1, 1]).contiguous(),
+                    torch.zeros([1, 1, 1, 1]).contiguous(),
+                    beam_idx_tmp,
+                )
+                for i in range(_get_num_hidden_layers(model.config))
+            ]
+        )
+    model_inputs = model.prepare_inputs_for_generation(
+        input_ids,
+        past_key_values=past_key_values,
+        attention_mask=attention_mask,
+        use_cache=True,
+    )
+    if hasattr(model, "trace_graph"):
+        model_inputs.pop("use_cache", None)
+        if first_token and hasattr(model, "trace_graph_first"):
+            outputs = model.trace_graph_first(**model_inputs)
+        else:
+            outputs = model.trace_graph(**model_inputs)
+    else:
+        outputs = model(**model_inputs, return_dict=True)
+    if isinstance(outputs, dict):
+        return outputs.logits, outputs.past_key_values
+    return outputs[0], outputs[1]
+
+
+class _IPEXAssistedCandidateGenerator(CandidateGenerator):
+    r"""
+    Proposes the candidate tokens with a draft model optimized by ``ipex.llm.optimize``,
+    which keeps its own indirect access kv cache across the iterations and rolls it back
+    to the accepted tokens.
+    """
+
+    def __init__(
+        self,
+        assistant_model,
+        max_length: int,
+        logits_processor: LogitsProcessorList,
+        logits_warper: Optional[LogitsProcessorList] = None,
+    ):
+        self.assistant_model = assistant_model
+        self.max_length = max_length
+        self.logits_processor = logits_processor
+        self.logits_warper = logits_warper
+        self.num_assistant_tokens = (
+            assistant_model.generation_config.num_assistant_tokens
+        )
+        self.num_assistant_tokens_schedule = (
+            assistant_model.generation_config.num_assistant_tokens_schedule
+        )
+        self.past_key_values = None
+
+    def get_candidates(
+        self, input_ids: torch.LongTensor
+    ) -> Tuple[torch.LongTensor, Optional[torch.FloatTensor]]:
+        num_candidates = min(
+            int(self.num_assistant_tokens), self.max_length - input_ids.size(1) - 1
+        )
+        if num_candidates <= 0:
+            return input_ids, None
+        candidate_logits = []
+        for _ in range(num_candidates):
+            logits, self.past_key_values = _assisted_forward(
+                self.assistant_model,
+                input_ids,
+                self.past_key_values,
+                torch.ones_like(input_ids),
+                self.max_length,
+            )
+            next_token_logits = self.logits_processor(input_ids, logits[:, -1, :])
+            if self.logits_warper is not None:
+                next_token_logits = self.logits_warper(input_ids, next_token_logits)
+                probs = next_token_logits.softmax(dim=-1)
+                next_tokens = torch.multinomial(probs, num_samples=1)
+            else:
+                next_tokens = next_token_logits.argmax(dim=-1, keepdim=True)
+            candidate_logits.append(next_token_logits)
+            input_ids = torch.cat([input_ids, next_tokens], dim=-1)
+        return input_ids, torch.stack(candidate_logits, dim=1)
+
+    def update_candidate_strategy(
+        self, input_ids: torch.LongTensor, scores: torch.FloatTensor, num_matches: int
+    ):
+        if self.past_key_values is None:
+            return
+        # the cached tokens of the draft model are valid up to the first rejected one
+        cache_length = self.past_key_values[0][0].size(-2)
+        self.past_key_values = _crop_indirect_kv_cache(
+            self.past_key_values, min(cache_length, input_ids.size(1) - 1)
+        )
+        if self.num_assistant_tokens_schedule in ["heuristic", "heuristic_transient"]:
+            if num_matches == int(self.num_assistant_tokens):
+                self.num_assistant_tokens += 2.0
+            else:
+                self.num_assistant_tokens = max(1.0, self.num_assistant_tokens - 1.0)
+
+
+@_with_lm_head_topk()
+def _assisted_decoding(
+    self,
+    input_ids: torch.LongTensor,
+    assistant_model: Optional["torch.nn.Module"] = None,
+    candidate_generator: Optional[CandidateGenerator] = None,
+    do_sample: bool = False,
+    logits_processor: Optional[LogitsProcessorList] = None,
+    logits_warper: Optional[LogitsProcessorList] = None,
+    stopping_criteria: Optional[StoppingCriteriaList] = None,
+    pad_token_id: Optional[int] = None,
+    eos_token_id: Optional[Union[int, List[int]]] = None,
+    output_attentions: Optional[bool] = None,
+    output_hidden_states: Optional[bool] = None,
+    output_scores: Optional[bool] = None,
+    output_logits: Optional[bool] = None,
+    return_dict_in_generate: Optional[bool] = None,
+    synced_gpus: bool = False,
+    streamer: Optional["BaseStreamer"] = None,
+    **model_kwargs,
+) -> Union[AssistedDecodingDecoderOnlyOutput, torch.LongTensor]:
+    r"""
+    Speculative decoding for the models optimized by ``ipex.llm.optimize``, used by
+    ``model.generate(..., assistant_model=draft_model)`` (draft model) and
+    ``model.generate(..., prompt_lookup_num_tokens=k)`` (n-gram lookup in the prompt).
+    Every iteration verifies all the candidate tokens with one forward of the model, keeps
+    the accepted ones plus the token predicted after them, and rolls the indirect access
+    kv cache back to the accepted tokens.
+    """
+    token_latency = (
+        self.config.token_latency if hasattr(self.config, "token_latency") else False
+    )
+    self.model_backbone = self.config.architectures[0]
+    if self.model_backbone not in _assisted_decoding_supported_models:
+        raise RuntimeError(
+            f"assisted decoding of ipex.llm.optimize only supports {_assisted_decoding_supported_models}"
+        )
+    if input_ids.size(0) != 1:
+        raise RuntimeError("assisted decoding only supports batch size 1")
+    if output_attentions or output_hidden_states:
+        logger.warning(
+            "output_attentions and output_hidden_states are not supported by assisted decoding"
+            + " of ipex.llm.optimize, they are ignored",
+            _type=WarningType.NotSupported,
+        )
+
+    latency_list = []
+    logits_processor = (
+        logits_processor if logits_processor is not None else LogitsProcessorList()
+    )
+    logits_warper = (
+        logits_warper if logits_warper is not None else LogitsProcessorList()
+    )
+    stopping_criteria = (
+        stopping_criteria if stopping_criteria is not None else StoppingCriteriaList()
+    )
+    max_length = stopping_criteria.max_length
+    assert max_length is not None, "assisted decoding needs the max length"
+    pad_token_id = (
+        pad_token_id
+        if pad_token_id is not None
+        else self.generation_config.pad_token_id
+    )
+    eos_token_id = (
+        eos_token_id
+        if eos_token_id is not None
+        else self.generation_config.eos_token_id
+    )
+    if isinstance(eos_token_id, int):
+        eos_token_id = [eos_token_id]
+    eos_token_id_tensor = (
+        torch.tensor(eos_token_id).to(input_ids.device)
+        if eos_token_id is not None
+        else None
+    )
+    output_scores = (
+        output_scores
+        if output_scores is not None
+        else self.generation_config.output_scores
+    )
+    output_logits = (
+        output_logits
+        if output_logits is not None
+        else getattr(self.generation_config, "output_logits", False)
+    )
+    return_dict_in_generate = (
+        return_dict_in_generate
+        if return_dict_in_generate is not None
+        else self.generation_config.return_dict_in_generate
+    )
+
+    if isinstance(candidate_generator, AssistedCandidateGenerator):
+        assistant_model = candidate_generator.assistant_model
+    # the draft models optimized by ipex.llm.optimize keep the indirect access kv cache,
+    # which is not handled by the candidate generator of transformers
+    if assistant_model is not None and _is_ipex_optimized(assistant_model):
+        if (
+            assistant_model.config.architectures[0]
+            not in _assisted_decoding_supported_models
+        ):
+            raise RuntimeError(
+                "assisted decoding of ipex.llm.optimize only supports draft models of "
+                + f"{_assisted_decoding_supported_models}"
+            )
+        candidate_generator = _IPEXAssistedCandidateGenerator(
+            assistant_model,
+            max_length,
+            logits_processor,
+            logits_warper if do_sample else None,
+        )
+    elif candidate_generator is None:
+        raise RuntimeError(
+            "assisted decoding needs a candidate_generator or a draft model optimized by ipex.llm.optimize"
+        )
+
+    # init scores tuples
+    scores = () if (return_dict_in_generate and output_scores) else None
+    raw_logits = () if (return_dict_in_generate and output_logits) else None
+
+    # keep track of which sequences are already finished
+    unfinished_sequences = torch.ones(
+        input_ids.shape[0], dtype=torch.long, device=input_ids.device
+    )
+    past_key_values = None
+    attention_mask = model_kwargs.get("attention_mask", None)
+    beam_idx_tmp_length = _get_beam_idx_tmp_length(stopping_criteria)
+
+    this_peer_finished = False  # used by synced_gpus only
+    while True:
+        tic = time.time()
+        if synced_gpus:
+            # Under synced_gpus the `forward` call must continue until all gpus complete their sequence.
+            # The following logic allows an early break if all peers finished generating their sequence
+            this_peer_finished_flag = torch.tensor(
+                0.0 if this_peer_finished else 1.0
+            ).to(input_ids.device)
+            # send 0.0 if we finished, 1.0 otherwise
+            dist.all_reduce(this_peer_finished_flag, op=dist.ReduceOp.SUM)
+            # did all peers finish? the reduced sum will be 0.0 then
+            if this_peer_finished_flag.item() == 0.0:
+                break
+
+        cur_len = input_ids.shape[-1]
+
+        # 1. fetch the candidate tokens, they are verified up to the max length
+        candidate_input_ids, candidate_logits = candidate_generator.get_candidates(
+            input_ids
+        )
+        candidate_input_ids = candidate_input_ids[:, : max_length - 1].to(
+            input_ids.device
+        )
+        candidate_length = candidate_input_ids.shape[1] - cur_len
+        if candidate_logits is not None:
+            candidate_logits = (
+                candidate_logits[:, :candidate_length].to(input_ids.device)
+                if candidate_length > 0
+                else None
+            )
+        last_assistant_token_is_eos = (
+            eos_token_id_tensor is not None
+            and candidate_length > 0
+            and bool(torch.isin(candidate_input_ids[0, -1], eos_token_id_tensor))
+        )
+
+        # 2. verify all the candidates with one forward, which gives
+        # candidate_length + 1 logits: the bonus token is predicted after the last candidate
+        if attention_mask is not None:
+            attention_mask = torch.cat(
+                [
+                    attention_mask,
+                    attention_mask.new_ones(
+                        (
+                            attention_mask.size(0),
+                            candidate_input_ids.size(1) - attention_mask.size(1),
+                        )
+                    ),
+                ],
+                dim=-1,
+            )
+        else:
+            attention_mask = torch.ones_like(candidate_input_ids)
+        logits, past_key_values = _assisted_forward(
+            self,
+            candidate_input_ids,
+            past_key_values,
+            attention_mask,
+            beam_idx_tmp_length,
+        )
+        if logits.size(1) < candidate_length + 1:
+            raise RuntimeError(
+                "assisted decoding needs the logits of all the input tokens, "
+                + "please disable lm_head_generation"
+            )
+        new_logits = logits[:, -candidate_length - 1 :].float()
+        next_token_logits = new_logits.clone()
+        for i in range(candidate_length + 1):
+            new_logits[:, i, :] = logits_processor(
+                candidate_input_ids[:, : cur_len + i], new_logits[:, i, :]
+            )
+        if do_sample:
+            for i in range(candidate_length + 1):
+                new_logits[:, i, :] = logits_warper(
+                    candidate_input_ids[:, : cur_len + i], new_logits[:, i, :]
+                )
+
+        # 3. select the accepted tokens
+        max_matches = max_length - cur_len - 1
+        if do_sample and candidate_logits is not None:
+            valid_tokens, n_matches = _speculative_sampling(
+                candidate_input_ids,
+                candidate_logits,
+                candidate_length,
+                new_logits,
+                last_assistant_token_is_eos,
+                max_matches,
+            )
+            n_matches = int(n_matches)
+        else:
+            if do_sample:
+                probs = new_logits.softmax(dim=-1)
+                selected_tokens = torch.multinomial(probs[0], num_samples=1).squeeze(1)[
+                    None, :
+                ]
+            else:
+                selected_tokens = new_logits.argmax(dim=-1)
+            candidate_new_tokens = candidate_input_ids[:, cur_len:]
+            n_matches = int(
+                (
+                    (~(candidate_new_tokens == selected_tokens[:, :-1])).cumsum(dim=-1)
+                    < 1
+                ).sum()
+            )
+            # do not generate beyond the max length or an eos token of the draft
+            if last_assistant_token_is_eos and n_matches == candidate_length:
+                n_matches -= 1
+            n_matches = min(n_matches, max_matches)
+            valid_tokens = selected_tokens[:, : n_matches + 1]
+
+        # the tokens after an accepted eos are dropped, as greedy search would stop there
+        if eos_token_id_tensor is not None:
+            is_eos = torch.isin(valid_tokens[0], eos_token_id_tensor)
+            if bool(is_eos.any()):
+                n_matches = int(is_eos.int().argmax())
+                valid_tokens = valid_tokens[:, : n_matches + 1]
+
+        # 4. keep the accepted tokens and roll back the kv cache of the rejected ones
+        input_ids = torch.cat([input_ids, valid_tokens], dim=-1)
+        if streamer is not None:
+            streamer.put(valid_tokens.cpu())
+        new_cur_len = input_ids.shape[-1]
+        past_key_values = _crop_indirect_kv_cache(past_key_values, new_cur_len - 1)
+        attention_mask = attention_mask[:, :new_cur_len]
+        candidate_generator.update_candidate_strategy(input_ids, new_logits, n_matches)
+
+        latency_list.append(time.time() - tic)
+        if synced_gpus and this_peer_finished:
+            continue  # don't waste resources running the code we don't need
+
+        if return_dict_in_generate:
+            if output_scores:
+                scores += tuple(new_logits[:, i, :] for i in range(n_matches + 1))
+            if output_logits:
+                raw_logits += tuple(
+                    next_token_logits[:, i, :] for i in range(n_matches + 1)
+                )
+
+        # if eos_token was found in one sentence, set sentence to finished
+        if eos_token_id_tensor is not None:
+            unfinished_sequences = unfinished_sequences.mul(
+                input_ids[:, -1]
+                .tile(eos_token_id_tensor.shape[0], 1)
+                .ne(eos_token_id_tensor.unsqueeze(1))
+                .prod(dim=0)
+            )
+
+        # stop when each sentence is finished, or if we exceed the maximum length
+        if unfinished_sequences.max() == 0 or stopping_criteria(input_ids, scores):
+            if not synced_gpus:
+                break
+            else:
+                this_peer_finished = True
+
+    if streamer is not None:
+        streamer.end()
+
+    if hasattr(candidate_generator, "assistant_model"):
+        if (
+            candidate_generator.assistant_model.generation_config.num_assistant_tokens_schedule
+            == "heuristic"
+        ):
+            candidate_generator.assistant_model.generation_config.num_assistant_tokens = (
+                candidate_generator.num_assistant_tokens
+            )
+
+    if return_dict_in_generate:
+        output_result = AssistedDecodingDecoderOnlyOutput(
+            sequences=input_ids,
+            scores=scores,
+            logits=raw_logits,
+        )
+    else:
+        output_result = input_ids
+
+    if token_latency:
+        return (output_result, latency_list)
+    else:
+        return output_result
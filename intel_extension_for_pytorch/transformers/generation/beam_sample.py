@@ -11,6 +11,7 @@ from transformers.generation.logits_process import LogitsProcessorList
 from transformers.generation.beam_search import BeamScorer
 from transformers.utils import ModelOutput
 import time
+from .utils import _get_beam_idx_tmp_length, _with_lm_head_topk
 
 
 class GenerateBeamDecoderOnlyOutput(ModelOutput):
@@ -43,6 +44,7 @@ GenerateBeamOutput = Union[
 ]
 
 
+@_with_lm_head_topk()
 def _beam_sample(
     self,
     input_ids: torch.LongTensor,
@@ -200,7 +202,11 @@ def _beam_sample(
                 if self.model_backbone == "T5ForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(batch_size * num_beams),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -250,7 +256,11 @@ def _beam_sample(
                 elif self.model_backbone == "GitForCausalLM":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(batch_size * num_beams),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     num_head = self.git.encoder.layer[
                         0
@@ -276,7 +286,11 @@ def _beam_sample(
                 elif self.model_backbone == "WhisperForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(batch_size * num_beams),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -323,7 +337,11 @@ def _beam_sample(
                 elif hasattr(self.config, "n_layers"):
                     num_hidden_layers = self.config.n_layers
                 beam_idx_tmp = torch.zeros(
-                    (2048, int(batch_size * num_beams)), dtype=torch.long
+                    (
+                        _get_beam_idx_tmp_length(stopping_criteria),
+                        int(batch_size * num_beams),
+                    ),
+                    dtype=torch.long,
                 ).contiguous()
                 model_inputs["past_key_values"] = tuple(
                     [
@@ -11,6 +11,7 @@ from transformers.generation.logits_process import LogitsProcessorList
 from transformers.generation.beam_search import BeamScorer
 from transformers.utils import ModelOutput
 import time
+from .utils import _get_beam_idx_tmp_length, _TokenBuffer, _with_lm_head_topk
 
 
 class BeamSearchEncoderDecoderOutput(ModelOutput):
@@ -37,6 +38,7 @@ class BeamSearchDecoderOnlyOutput(ModelOutput):
 BeamSearchOutput = Union[BeamSearchEncoderDecoderOutput, BeamSearchDecoderOnlyOutput]
 
 
+@_with_lm_head_topk()
 def _beam_search(
     self,
     input_ids: torch.LongTensor,
@@ -152,6 +154,8 @@ def _beam_search(
     )
     beam_scores[:, 1:] = -1e9
     beam_scores = beam_scores.view((batch_size * num_beams,))
+    # the beams are reordered between two preallocated buffers instead of torch.cat
+    token_buffer = _TokenBuffer(input_ids, stopping_criteria.max_length, num_buffers=2)
     this_peer_finished = False  # used by synced_gpus only
     while True:
         tic = time.time()
@@ -203,7 +207,11 @@ def _beam_search(
                 if self.model_backbone == "T5ForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(batch_size * num_beams),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -253,7 +261,11 @@ def _beam_search(
                 elif self.model_backbone == "GitForCausalLM":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(batch_size * num_beams),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     num_head = self.git.encoder.layer[
                         0
@@ -279,7 +291,11 @@ def _beam_search(
                 elif self.model_backbone == "WhisperForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(batch_size * num_beams)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(batch_size * num_beams),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -326,7 +342,11 @@ def _beam_search(
                 elif hasattr(self.config, "n_layers"):
                     num_hidden_layers = self.config.n_layers
                 beam_idx_tmp = torch.zeros(
-                    (2048, int(batch_size * num_beams)), dtype=torch.long
+                    (
+                        _get_beam_idx_tmp_length(stopping_criteria),
+                        int(batch_size * num_beams),
+                    ),
+                    dtype=torch.long,
                 ).contiguous()
                 model_inputs["past_key_values"] = tuple(
                     [
@@ -425,9 +445,15 @@ def _beam_search(
         )  # (batch_size * num_beams, vocab_size)
 
         next_token_scores_processed = logits_processor(input_ids, next_token_scores)
-        next_token_scores = next_token_scores_processed + beam_scores[
-            :, None
-        ].expand_as(next_token_scores)
+        if (
+            return_dict_in_generate and output_scores
+        ) or next_token_scores_processed.dtype != beam_scores.dtype:
+            next_token_scores = next_token_scores_processed + beam_scores[
+                :, None
+            ].expand_as(next_token_scores)
+        else:
+            # the processed scores are not kept, add the beam scores in place
+            next_token_scores = next_token_scores_processed.add_(beam_scores[:, None])
 
         # Store scores, attentions and hidden_states when required
         if return_dict_in_generate:
@@ -476,9 +502,7 @@ def _beam_search(
         beam_next_tokens = beam_outputs["next_beam_tokens"]
         beam_idx = beam_outputs["next_beam_indices"]
 
-        input_ids = torch.cat(
-            [input_ids[beam_idx, :], beam_next_tokens.unsqueeze(-1)], dim=-1
-        )
+        input_ids = token_buffer.append(beam_next_tokens, beam_idx)
 
         model_kwargs = self._update_model_kwargs_for_generation(
             outputs, model_kwargs, is_encoder_decoder=self.config.is_encoder_decoder
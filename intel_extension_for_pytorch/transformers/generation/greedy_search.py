@@ -10,6 +10,8 @@ from transformers.generation.logits_process import LogitsProcessorList
 from transformers.generation.streamers import BaseStreamer
 from transformers.utils import ModelOutput
 import time
+from .utils import _get_beam_idx_tmp_length, _TokenBuffer, _with_lm_head_topk
+from ..tensor_parallel import _unpack_vocab_topk
 
 
 class GreedySearchDecoderOnlyOutput(ModelOutput):
@@ -34,6 +36,7 @@ GreedySearchOutput = Union[
 ]
 
 
+@_with_lm_head_topk(do_sample=False)
 def _greedy_search(
     self,
     input_ids: torch.LongTensor,
@@ -48,6 +51,7 @@ def _greedy_search(
     return_dict_in_generate: Optional[bool] = None,
     synced_gpus: Optional[bool] = False,
     streamer: Optional["BaseStreamer"] = None,
+    lm_head_topk: bool = False,
     **model_kwargs,
 ) -> Union[GreedySearchOutput, torch.LongTensor]:
     token_latency = (
@@ -131,6 +135,8 @@ def _greedy_search(
     unfinished_sequences = torch.ones(
         input_ids.shape[0], dtype=torch.long, device=input_ids.device
     )
+    # the generated tokens are written to a preallocated buffer instead of torch.cat
+    token_buffer = _TokenBuffer(input_ids, stopping_criteria.max_length)
 
     this_peer_finished = False  # used by synced_gpus only
     while True:
@@ -184,7 +190,11 @@ def _greedy_search(
                 if self.model_backbone == "T5ForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(input_bs)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(input_bs),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -234,7 +244,11 @@ def _greedy_search(
                 if self.model_backbone == "WhisperForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(input_bs)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(input_bs),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -282,7 +296,11 @@ def _greedy_search(
                 elif hasattr(self.config, "n_layers"):
                     num_hidden_layers = self.config.n_layers
                 beam_idx_tmp = torch.zeros(
-                    (2048, int(input_bs)), dtype=torch.long
+                    (
+                        _get_beam_idx_tmp_length(stopping_criteria),
+                        int(input_bs),
+                    ),
+                    dtype=torch.long,
                 ).contiguous()
                 if self.model_backbone == "GitForCausalLM":
                     num_head = self.git.encoder.layer[
@@ -395,7 +413,14 @@ def _greedy_search(
                 )
 
         # argmax
-        next_tokens = torch.argmax(next_tokens_scores, dim=-1)
+        if lm_head_topk:
+            # the packed top-k logits of the vocabulary-sharded LM head
+            values, indices = _unpack_vocab_topk(next_tokens_scores)
+            next_tokens = indices.gather(
+                -1, torch.argmax(values, dim=-1, keepdim=True)
+            ).squeeze(-1)
+        else:
+            next_tokens = torch.argmax(next_tokens_scores, dim=-1)
 
         # finished sentences should have their next token be a padding token
         if eos_token_id is not None:
@@ -408,7 +433,7 @@ def _greedy_search(
             )
 
         # update generated ids, model inputs, and length for next step
-        input_ids = torch.cat([input_ids, next_tokens[:, None]], dim=-1)
+        input_ids = token_buffer.append(next_tokens)
         if streamer is not None:
             streamer.put(next_tokens.cpu())
         model_kwargs = self._update_model_kwargs_for_generation(
@@ -433,6 +458,7 @@ def _greedy_search(
 
     if streamer is not None:
         streamer.end()
+    input_ids = input_ids.contiguous()
 
     if return_dict_in_generate:
         if self.config.is_encoder_decoder:
@@ -11,6 +11,14 @@ from transformers.generation.logits_process import LogitsProcessorList
 from transformers.generation.streamers import BaseStreamer
 from transformers.utils import ModelOutput
 import time
+from .utils import (
+    _get_beam_idx_tmp_length,
+    _TokenBuffer,
+    _get_fused_logits_warper,
+    _fused_sample,
+    _with_lm_head_topk,
+)
+from ..tensor_parallel import _unpack_vocab_topk
 
 
 class SampleEncoderDecoderOutput(ModelOutput):
@@ -33,6 +41,7 @@ class SampleDecoderOnlyOutput(ModelOutput):
 SampleOutput = Union[SampleEncoderDecoderOutput, SampleDecoderOnlyOutput]
 
 
+@_with_lm_head_topk(do_sample=True)
 def _sample(
     self,
     input_ids: torch.LongTensor,
@@ -48,6 +57,7 @@ def _sample(
     return_dict_in_generate: Optional[bool] = None,
     synced_gpus: bool = False,
     streamer: Optional["BaseStreamer"] = None,
+    lm_head_topk: bool = False,
     **model_kwargs,
 ) -> Union[SampleOutput, torch.LongTensor]:
     token_latency = (
@@ -135,6 +145,15 @@ def _sample(
     unfinished_sequences = torch.ones(
         input_ids.shape[0], dtype=torch.long, device=input_ids.device
     )
+    # the generated tokens are written to a preallocated buffer instead of torch.cat
+    token_buffer = _TokenBuffer(input_ids, stopping_criteria.max_length)
+    # temperature, top-k and top-p are applied in one pass with the sampling, unless
+    # the warped scores are returned
+    fused_logits_warper = (
+        None
+        if return_dict_in_generate and output_scores
+        else _get_fused_logits_warper(logits_warper)
+    )
 
     this_peer_finished = False  # used by synced_gpus only
     # auto-regressive generation
@@ -190,7 +209,11 @@ def _sample(
                 if self.model_backbone == "T5ForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(input_bs)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(input_bs),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -240,7 +263,11 @@ def _sample(
                 if self.model_backbone == "WhisperForConditionalGeneration":
                     first_token = False
                     beam_idx_tmp = torch.zeros(
-                        (2048, int(input_bs)), dtype=torch.long
+                        (
+                            _get_beam_idx_tmp_length(stopping_criteria),
+                            int(input_bs),
+                        ),
+                        dtype=torch.long,
                     ).contiguous()
                     model_inputs["past_key_values"] = tuple(
                         [
@@ -288,7 +315,11 @@ def _sample(
                 elif hasattr(self.config, "n_layers"):
                     num_hidden_layers = self.config.n_layers
                 beam_idx_tmp = torch.zeros(
-                    (2048, int(input_bs)), dtype=torch.long
+                    (
+                        _get_beam_idx_tmp_length(stopping_criteria),
+                        int(input_bs),
+                    ),
+                    dtype=torch.long,
                 ).contiguous()
                 if self.model_backbone == "GitForCausalLM":
                     num_head = self.git.encoder.layer[
@@ -379,7 +410,8 @@ def _sample(
 
         # pre-process distribution
         next_token_scores = logits_processor(input_ids, next_token_logits)
-        next_token_scores = logits_warper(input_ids, next_token_scores)
+        if fused_logits_warper is None:
+            next_token_scores = logits_warper(input_ids, next_token_scores)
 
         # Store scores, attentions and hidden_states when required
         if return_dict_in_generate:
@@ -402,8 +434,18 @@ def _sample(
                 )
 
         # sample
-        probs = nn.functional.softmax(next_token_scores, dim=-1)
-        next_tokens = torch.multinomial(probs, num_samples=1).squeeze(1)
+        if lm_head_topk:
+            # the packed top-k logits of the vocabulary-sharded LM head, which keep all
+            # the tokens of top_k
+            values, indices = _unpack_vocab_topk(next_token_scores)
+            next_tokens = indices.gather(
+                -1, _fused_sample(values, fused_logits_warper).unsqueeze(-1)
+            ).squeeze(-1)
+        elif fused_logits_warper is not None:
+            next_tokens = _fused_sample(next_token_scores, fused_logits_warper)
+        else:
+            probs = nn.functional.softmax(next_token_scores, dim=-1)
+            next_tokens = torch.multinomial(probs, num_samples=1).squeeze(1)
 
         # finished sentences should have their next token be a padding token
         if eos_token_id is not None:
@@ -416,7 +458,7 @@ def _sample(
             )
 
         # update generated ids, model inputs, and length for next step
-        input_ids = torch.cat([input_ids, next_tokens[:, None]], dim=-1)
+        input_ids = token_buffer.append(next_tokens)
         if streamer is not None:
             streamer.put(next_tokens.cpu())
         model_kwargs = self._update_model_kwargs_for_generation(
@@ -444,6 +486,7 @@ def _sample(
 
     if streamer is not None:
         streamer.end()
+    input_ids = input_ids.contiguous()
 
     if return_dict_in_generate:
         if self.config.is_encoder_decoder:
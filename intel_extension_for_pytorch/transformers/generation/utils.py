@@ -1,3 +1,7 @@
+import contextlib
+import functools
+import inspect
+import torch
 from transformers.utils import ModelOutput
 
 
@@ -22,3 +26,213 @@ def _extract_past_from_model_output(
             past_key_values, batch_size=batch_size
         )
     return past_key_values
+
+
+def _get_beam_idx_tmp_length(stopping_criteria) -> int:
+    # The beam idx passed with the first token is replaced by the kv cache kernel,
+    # it is only kept by the paths which do not write the kv cache (e.g., the
+    # cutoff of git vision tokens), so it never needs more than the max length.
+    max_length = stopping_criteria.max_length
+    return max_length if max_length is not None else 2048
+
+
+class _TokenBuffer(object):
+    r"""
+    Preallocated buffer of the generated sequences, which replaces concatenating every
+    new token to ``input_ids``. The tokens are kept in ``[max_length, batch]`` layout,
+    so that appending a token writes a contiguous row, and the last tokens fed to the
+    model (``input_ids[:, -1:]``) are contiguous. ``input_ids`` is the prompt before
+    the first token is appended, and a ``[batch, length]`` view of the buffer after.
+    The beam search keeps two buffers and reorders the beams from one to the other.
+    """
+
+    def __init__(self, input_ids, max_length=None, num_buffers=1):
+        batch_size, length = input_ids.shape
+        capacity = max(max_length or 0, length + 1)
+        self.buffers = [
+            input_ids.new_empty((capacity, batch_size)) for _ in range(num_buffers)
+        ]
+        self.buffers[0][:length].copy_(input_ids.t())
+        self.length = length
+        self.input_ids = input_ids
+
+    def _grow(self):
+        # stopping criteria without max_length, e.g., max_time
+        for i, buffer in enumerate(self.buffers):
+            new_buffer = buffer.new_empty((buffer.size(0) * 2, buffer.size(1)))
+            new_buffer[: self.length].copy_(buffer[: self.length])
+            self.buffers[i] = new_buffer
+
+    def append(self, next_tokens, beam_idx=None):
+        r"""
+        Appends ``next_tokens`` (``[batch]``) to the sequences, which are reordered by
+        ``beam_idx`` first if given. Returns the new ``input_ids``.
+        """
+        if self.length == self.buffers[0].size(0):
+            self._grow()
+        if beam_idx is not None:
+            src, dst = self.buffers[0][: self.length], self.buffers[1][: self.length]
+            torch.index_select(src, 1, beam_idx, out=dst)
+            self.buffers.reverse()
+        self.buffers[0][self.length].copy_(next_tokens)
+        self.length += 1
+        self.input_ids = self.buffers[0][: self.length].t()
+        return self.input_ids
+
+
+def _get_fused_logits_warper(logits_warper):
+    # (temperature, top_k, top_p, min_tokens_to_keep) if the warpers are the ones of
+    # temperature, top-k and top-p which _fused_sample applies in one pass, else None
+    from transformers.generation.logits_process import (
+        TemperatureLogitsWarper,
+        TopKLogitsWarper,
+        TopPLogitsWarper,
+    )
+
+    temperature, top_k, top_p, min_tokens_to_keep = 1.0, None, 1.0, 1
+    for warper in logits_warper:
+        # temperature commutes with top-k, not with top-p
+        if isinstance(warper, TemperatureLogitsWarper) and top_p == 1.0:
+            temperature *= warper.temperature
+        elif (
+            isinstance(warper, TopKLogitsWarper)
+            and warper.filter_value == -float("inf")
+            and top_p == 1.0
+        ):
+            top_k = warper.top_k if top_k is None else min(top_k, warper.top_k)
+        elif (
+            isinstance(warper, TopPLogitsWarper)
+            and warper.filter_value == -float("inf")
+            and top_p == 1.0
+        ):
+            top_p = float(warper.top_p)
+            min_tokens_to_keep = warper.min_tokens_to_keep
+        else:
+            return None
+    return temperature, top_k, top_p, min_tokens_to_keep
+
+
+def _fused_sample(scores, fused_logits_warper):
+    r"""
+    Samples the next tokens from the logits ``scores`` (``[batch, vocab]``) with the
+    temperature, top-k and top-p of ``fused_logits_warper``, which is the same
+    distribution as the warpers followed by softmax and multinomial. The full
+    vocabulary is only read by one topk (or sort) pass, the softmax and the
+    top-p filter run on the k kept tokens.
+    """
+    temperature, top_k, top_p, min_tokens_to_keep = fused_logits_warper
+    vocab_size = scores.size(-1)
+    if top_k is not None or top_p < 1.0:
+        if top_k is not None and top_k < vocab_size:
+            values, indices = torch.topk(scores, top_k, dim=-1)
+        else:
+            values, indices = torch.sort(scores, dim=-1, descending=True)
+        probs = torch.softmax(values.float() / temperature, dim=-1)
+        if top_p < 1.0:
+            # the tokens whose more probable tokens already cover top_p are removed
+            to_remove = (probs.cumsum(dim=-1) - probs) >= top_p
+            to_remove[:, :min_tokens_to_keep] = False
+            probs = probs.masked_fill(to_remove, 0.0)
+        next_tokens = torch.multinomial(probs, num_samples=1)
+        return indices.gather(-1, next_tokens).squeeze(1)
+    # the temperature only: the exponential race (Gumbel-max), one pass over the
+    # logits without the softmax normalization
+    values = scores.float() / temperature
+    noise = torch.empty_like(values).exponential_().log_()
+    return torch.argmax(values - noise, dim=-1)
+
+
+def _get_topk_lm_head(model):
+    # the vocabulary-sharded LM head gathering the top-k logits (LM_HEAD_TOPK), if any
+    from ..tensor_parallel import TensorParallelLMhead
+
+    for m in model.modules():
+        if isinstance(m, TensorParallelLMhead) and m.topk > 0:
+            return m
+    return None
+
+
+def _can_use_lm_head_topk(self, topk, arguments, do_sample):
+    # the top-k logits are enough if no processor reads the other tokens, the scores
+    # are not returned and the sampling only keeps the top_k <= topk tokens
+    output_scores = arguments.get("output_scores", None)
+    if output_scores is None:
+        output_scores = self.generation_config.output_scores
+    logits_processor = arguments.get("logits_processor", None)
+    if output_scores or (logits_processor is not None and len(logits_processor) > 0):
+        return False
+    if not do_sample:
+        return True
+    logits_warper = arguments.get("logits_warper", None)
+    fused_logits_warper = _get_fused_logits_warper(
+        logits_warper if logits_warper is not None else []
+    )
+    return (
+        fused_logits_warper is not None
+        and fused_logits_warper[1] is not None
+        and fused_logits_warper[1] <= topk
+    )
+
+
+@contextlib.contextmanager
+def _lm_head_topk_logits(model, enabled):
+    r"""
+    Makes the vocabulary-sharded LM head of ``model`` return the packed top-k logits
+    in the context if ``enabled``, otherwise the full vocabulary logits. Yields
+    whether the model returns the top-k logits. The traced graphs keep the logits
+    they are traced with, i.e., the full logits unless ``return_topk`` is set before
+    tracing, in which case they cannot return the full logits.
+    """
+    lm_head = _get_topk_lm_head(model)
+    if lm_head is None:
+        yield False
+        return
+    if hasattr(model, "trace_graph"):
+        if lm_head.return_topk and not enabled:
+            raise ValueError(
+                "The model is traced with the top-k logits of LM_HEAD_TOPK, which are not enough "
+                + "for the generation config (beam search, logits processors, output_scores or "
+                + "sampling without top_k <= LM_HEAD_TOPK), unset LM_HEAD_TOPK to trace the full logits."
+            )
+        yield lm_head.return_topk
+        return
+    return_topk = lm_head.return_topk
+    lm_head.return_topk = enabled
+    try:
+        yield enabled
+    finally:
+        lm_head.return_topk = return_topk
+
+
+def _with_lm_head_topk(do_sample=None):
+    r"""
+    Decorates a generation function, so that the vocabulary-sharded LM head returns
+    the top-k logits for it if they are enough, i.e., with ``do_sample`` set (False
+    for the greedy search), and the full logits otherwise. The generation function
+    gets ``lm_head_topk`` (whether the logits are the packed top-k ones) as keyword.
+    """
+
+    def decorator(generate_fn):
+        signature = inspect.signature(generate_fn)
+
+        @functools.wraps(generate_fn)
+        def wrapper(self, *args, **kwargs):
+            lm_head = _get_topk_lm_head(self)
+            enabled = (
+                lm_head is not None
+                and do_sample is not None
+                and _can_use_lm_head_topk(
+                    self,
+                    lm_head.topk,
+                    signature.bind_partial(self, *args, **kwargs).arguments,
+                    do_sample,
+                )
+            )
+            with _lm_head_topk_logits(self, enabled) as lm_head_topk:
+                if do_sample is None:
+                    return generate_fn(self, *args, **kwargs)
+                return generate_fn(self, *args, lm_head_topk=lm_head_topk, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -32,7 +32,10 @@ class _IPEXlinearSiluCPU(_IPEXlinearFusionCPU):
         if self.tpp and not self.linear.tpp_fallback:
             x = x.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_linear_silu(
                 x,
@@ -66,7 +69,10 @@ class _IPEXlinearReluCPU(_IPEXlinearFusionCPU):
         if self.tpp and not self.linear.tpp_fallback:
             x = x.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_linear_relu(
                 x,
@@ -101,7 +107,10 @@ class _IPEXlinearMulCPU(_IPEXlinearFusionCPU):
             x = x.to(self.dtype).contiguous()
             y = y.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_linear_mul(
                 x,
@@ -138,7 +147,10 @@ class _IPEXlinearAddCPU(_IPEXlinearFusionCPU):
             x = x.to(self.dtype).contiguous()
             y = y.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_linear_add(
                 x,
@@ -177,7 +189,10 @@ class _IPEXlinearAddAddCPU(_IPEXlinearFusionCPU):
             y = y.to(self.dtype).contiguous()
             z = z.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_linear_add_add(
                 x,
@@ -215,7 +230,10 @@ class _IPEXlinearNewGeluCPU(_IPEXlinearFusionCPU):
         if self.tpp and not self.linear.tpp_fallback:
             x = x.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_linear_gelu(
                 x,
@@ -260,7 +278,10 @@ class _IPEXlinearGeluCPU(_IPEXlinearFusionCPU):
         if self.tpp and not self.linear.tpp_fallback:
             x = x.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_linear_gelu(
                 x,
@@ -454,10 +475,16 @@ class _IPEXlinearSiluMulCPU(nn.Module):
         ):
             x = x.to(self.dtype).contiguous()
             w_s = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear_s.weight, self.linear_s.weight_for_large_batch
+                x,
+                self.linear_s.weight,
+                self.linear_s.weight_for_large_batch,
+                getattr(self.linear_s, "large_batch_min_m", 256),
             )
             w_m = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear_m.weight, self.linear_m.weight_for_large_batch
+                x,
+                self.linear_m.weight,
+                self.linear_m.weight_for_large_batch,
+                getattr(self.linear_m, "large_batch_min_m", 256),
             )
             return torch.ops.torch_ipex.tpp_fused_gate_up_proj(
                 x,
@@ -506,7 +533,10 @@ class _IPEXlinearSiluAndMulCPU(nn.Module):
         if self.tpp and not self.linear.tpp_fallback:
             x = x.to(self.dtype).contiguous()
             w = torch.ops.torch_ipex.choose_tpp_linear_weight(
-                x, self.linear.weight, self.linear.weight_for_large_batch
+                x,
+                self.linear.weight,
+                self.linear.weight_for_large_batch,
+                getattr(self.linear, "large_batch_min_m", 256),
             )
             x1 = torch.ops.torch_ipex.tpp_linear_silu(
                 x,
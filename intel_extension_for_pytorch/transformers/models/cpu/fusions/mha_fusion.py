@@ -1,3 +1,4 @@
+import functools
 import torch
 from torch import nn
 from typing import Optional, Tuple
@@ -142,10 +143,118 @@ class _IPEXRopeCPU(nn.Module):
         return query, key
 
 
+def _grow_indirect_kv_cache(
+    query: torch.Tensor,
+    key_cache: torch.Tensor,
+    value_cache: torch.Tensor,
+    beam_idx: torch.Tensor,
+    seq_info: torch.Tensor,
+    text_max_length: int,
+    chunk_size: int,
+    growth_factor: float,
+    max_length: int,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    # key/value cache: [cache_size, beam*batch, num_kv_head, head_dim]
+    # beam_idx: [cache_size + 2, beam*batch], the last two rows record the
+    # prompt length and the prompt batch size
+    offset = int(seq_info.reshape(-1)[0].item())
+    required = offset + query.size(1)
+    if max_length > 0 and required > max_length:
+        raise RuntimeError(
+            "The indirect access kv cache is limited to kv_cache_max_length tokens"
+        )
+    cache_size = key_cache.size(0)
+    # the first token allocates the buffers inside the kernel
+    if offset == 0 or required <= cache_size:
+        return key_cache, value_cache, beam_idx
+    new_cache_size = max(
+        max(required, cache_size + chunk_size), int(cache_size * growth_factor)
+    )
+    # do not grow beyond the expected text length unless it is exceeded
+    if text_max_length >= required:
+        new_cache_size = min(new_cache_size, text_max_length)
+    if max_length > 0:
+        new_cache_size = min(new_cache_size, max_length)
+    new_key_cache = key_cache.new_empty([new_cache_size] + list(key_cache.size()[1:]))
+    new_key_cache[:cache_size].copy_(key_cache)
+    new_value_cache = value_cache.new_empty(
+        [new_cache_size] + list(value_cache.size()[1:])
+    )
+    new_value_cache[:cache_size].copy_(value_cache)
+    new_beam_idx = beam_idx.new_empty([new_cache_size + 2, beam_idx.size(1)])
+    new_beam_idx[:cache_size].copy_(beam_idx[:cache_size])
+    new_beam_idx[cache_size:new_cache_size].copy_(
+        beam_idx[0:1].expand([new_cache_size - cache_size, beam_idx.size(1)])
+    )
+    new_beam_idx[new_cache_size:].copy_(beam_idx[cache_size:])
+    return new_key_cache, new_value_cache, new_beam_idx
+
+
+@functools.lru_cache(maxsize=None)
+def _scripted_grow_indirect_kv_cache():
+    # Keep the growth as control flow in the graphs of torch.jit.trace,
+    # otherwise the branch taken by the example inputs is recorded.
+    return torch.jit.script(_grow_indirect_kv_cache)
+
+
+def _get_kv_cache_bytes(layer_past: Optional[Tuple[torch.Tensor]]) -> int:
+    if layer_past is None or len(layer_past) < 4:
+        return 0
+    return sum(t.numel() * t.element_size() for t in layer_past[1:4])
+
+
+def _get_kv_cache_dtype(kv_cache_dtype) -> Optional[Tuple[torch.dtype, float]]:
+    # returns the storage dtype of the quantized kv cache and its max magnitude
+    if kv_cache_dtype is None:
+        return None
+    if kv_cache_dtype in ["int8", torch.int8]:
+        return torch.int8, 127.0
+    fp8_dtype = getattr(torch, "float8_e4m3fn", None)
+    if kv_cache_dtype in ["fp8", "fp8_e4m3"] or (
+        fp8_dtype is not None and kv_cache_dtype == fp8_dtype
+    ):
+        if fp8_dtype is None:
+            raise RuntimeError(
+                "kv_cache_dtype fp8 needs a PyTorch version with torch.float8_e4m3fn"
+            )
+        return fp8_dtype, 448.0
+    raise RuntimeError(
+        f"Unsupported kv_cache_dtype {kv_cache_dtype}, only int8 and fp8_e4m3 are supported"
+    )
+
+
+def _quantize_kv_per_token_head(
+    x: torch.Tensor, kv_dtype: torch.dtype, qmax: float
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    # symmetric quantization with one fp32 scale per token and head
+    x = x.float()
+    scale = x.abs().amax(-1, keepdim=True).clamp_min(1e-12) / qmax
+    q = x / scale
+    if kv_dtype == torch.int8:
+        q = q.round().clamp(-qmax, qmax)
+    return q.to(kv_dtype), scale
+
+
 class _IPEXScaleDotProductCPU(nn.Module):
-    def __init__(self, text_max_length):
+    def __init__(
+        self,
+        text_max_length,
+        kv_cache_chunk_size=256,
+        kv_cache_growth_factor=2.0,
+        kv_cache_max_length=None,
+        kv_cache_dtype=None,
+    ):
         super().__init__()
         self.text_max_length = text_max_length
+        self.kv_cache_chunk_size = kv_cache_chunk_size
+        self.kv_cache_growth_factor = kv_cache_growth_factor
+        self.kv_cache_max_length = kv_cache_max_length
+        self.kv_cache_dtype = kv_cache_dtype
+        # the largest key/value/beam_idx buffers seen by this layer, in bytes
+        self.peak_kv_cache_bytes = 0
+        # set by ipex.llm.serving.Engine to route the attention to its paged KV cache
+        self.paged_kv_cache = None
+        self.layer_idx = None
 
     @classmethod
     def apply_function(
@@ -163,6 +272,10 @@ class _IPEXScaleDotProductCPU(nn.Module):
         text_max_length: Optional[int] = 0,
         cutoff: Optional[torch.Tensor] = None,
         vision: Optional[torch.Tensor] = False,
+        kv_cache_chunk_size: Optional[int] = 256,
+        kv_cache_growth_factor: Optional[float] = 2.0,
+        kv_cache_max_length: Optional[int] = None,
+        kv_cache_dtype: Optional[str] = None,
     ):
         if cutoff is not None:
             if layer_past is None:
@@ -234,6 +347,35 @@ class _IPEXScaleDotProductCPU(nn.Module):
             seq_info = torch.tensor(
                 layer_past[0].size(-2), dtype=torch.long
             ).contiguous()
+        # The int8/fp8 caches are allocated by the kernel, it quantizes the new
+        # tokens and dequantizes the past ones per head in the attention loops.
+        quantized_kv = _get_kv_cache_dtype(kv_cache_dtype)
+        cache_dtype = quantized_kv[0] if quantized_kv is not None else None
+        # The buffers start with kv_cache_chunk_size tokens (or the prompt length plus
+        # kv_cache_chunk_size for longer prompts) and are grown before the kernel
+        # writes beyond them.
+        grow_fn = (
+            _scripted_grow_indirect_kv_cache()
+            if torch.jit.is_tracing()
+            else _grow_indirect_kv_cache
+        )
+        max_length = kv_cache_max_length if kv_cache_max_length is not None else 0
+        key_cache, value_cache, beam_idx = grow_fn(
+            query,
+            key_cache,
+            value_cache,
+            beam_idx,
+            seq_info,
+            text_max_length,
+            kv_cache_chunk_size,
+            kv_cache_growth_factor,
+            max_length,
+        )
+        initial_length = kv_cache_chunk_size
+        if text_max_length > 0:
+            initial_length = min(initial_length, text_max_length)
+        if max_length > 0:
+            initial_length = min(initial_length, max_length)
         (
             attn_output,
             attn_weights,
@@ -249,10 +391,11 @@ class _IPEXScaleDotProductCPU(nn.Module):
             beam_idx,
             seq_info,
             scale_attn,
-            text_max_length,
+            initial_length,
             head_mask,
             attention_mask,
             add_casual_mask,
+            cache_dtype,
         )
 
         present = (
@@ -284,7 +427,12 @@ class _IPEXScaleDotProductCPU(nn.Module):
         cutoff: Optional[torch.Tensor] = None,
         vision: Optional[torch.Tensor] = False,
     ):
-        return self.apply_function(
+        if self.paged_kv_cache is not None:
+            attn_output = self.paged_kv_cache.attention(
+                self.layer_idx, query, key, value, scale_attn
+            )
+            return attn_output, None, None
+        outputs = self.apply_function(
             query,
             key,
             value,
@@ -298,7 +446,16 @@ class _IPEXScaleDotProductCPU(nn.Module):
             self.text_max_length,
             cutoff,
             vision,
+            self.kv_cache_chunk_size,
+            self.kv_cache_growth_factor,
+            self.kv_cache_max_length,
+            self.kv_cache_dtype,
         )
+        if not torch.jit.is_tracing():
+            self.peak_kv_cache_bytes = max(
+                self.peak_kv_cache_bytes, _get_kv_cache_bytes(outputs[2])
+            )
+        return outputs
 
 
 class _IPEXRMSNormCPU(nn.Module):
@@ -339,9 +496,42 @@ class _IPEXFastLayerNormCPU(nn.Module):
         )
 
 
+def _is_quantized_kv_cache(cache: torch.Tensor) -> bool:
+    return cache.dtype in [torch.int8, getattr(torch, "float8_e4m3fn", torch.int8)]
+
+
 class _IPEXPagedAttentionCPU:
     @classmethod
-    def reshape_and_cache(cls, key, value, key_cache, value_cache, slot_mapping):
+    def reshape_and_cache(
+        cls,
+        key,
+        value,
+        key_cache,
+        value_cache,
+        slot_mapping,
+        k_scale=None,
+        v_scale=None,
+    ):
+        if _is_quantized_kv_cache(key_cache):
+            assert (
+                k_scale is not None and v_scale is not None
+            ), "k_scale and v_scale are needed by the quantized key/value cache"
+            # key/value cache: [num_blocks, num_kv_heads, block_size, head_size]
+            # k_scale/v_scale: [num_blocks, num_kv_heads, block_size]
+            block_size = key_cache.size(2)
+            slot_mapping = slot_mapping.long()
+            blocks = slot_mapping // block_size
+            offsets = slot_mapping % block_size
+            kv_dtype, qmax = _get_kv_cache_dtype(key_cache.dtype)
+            for states, cache, scales in [
+                (key, key_cache, k_scale),
+                (value, value_cache, v_scale),
+            ]:
+                q, scale = _quantize_kv_per_token_head(states, kv_dtype, qmax)
+                # index_put on uint8 to support the float8 cache as well
+                cache.view(torch.uint8)[blocks, :, offsets] = q.view(torch.uint8)
+                scales[blocks, :, offsets] = scale.squeeze(-1)
+            return
         torch.ops.torch_ipex.reshape_and_cache(
             key,
             value,
@@ -364,7 +554,10 @@ class _IPEXPagedAttentionCPU:
         block_size,
         max_context_len,
         alibi_slopes,
+        k_scale=None,
+        v_scale=None,
     ):
+        # the int8/fp8 caches are dequantized per token and head by the kernel
         torch.ops.torch_ipex.single_query_cached_kv_attention(
             output,
             query,
@@ -377,6 +570,8 @@ class _IPEXPagedAttentionCPU:
             block_size,
             max_context_len,
             alibi_slopes,
+            k_scale,
+            v_scale,
         )
 
 
@@ -385,10 +580,48 @@ class _IPEXVarlenScaledDotProductCPU(nn.Module):
         super().__init__()
 
     @classmethod
-    def repeat_kv(cls, x: torch.Tensor, n_rep: int) -> torch.Tensor:
-        if n_rep == 1:
-            return x
-        return torch.repeat_interleave(x, dim=1, repeats=n_rep)
+    def attention_tile(
+        cls,
+        query,  # [seqlen_q, num_head, head_size]
+        key,  # [seqlen_k, num_head_k, head_size]
+        value,  # [seqlen_k, num_head_k, head_size]
+        softmax_scale,
+        is_causal,
+    ):
+        seqlen_q, num_head, head_size = query.size()
+        seqlen_k, num_head_k, _ = key.size()
+        n_rep = num_head // num_head_k
+        # The query heads sharing one kv head are folded into the sequence dim:
+        # [seqlen_q, num_head_k * n_rep, head_size] -> [1, num_head_k, n_rep * seqlen_q, head_size],
+        # so that the kv heads are mapped without repeating them.
+        query = (
+            query.view(seqlen_q, num_head_k, n_rep, head_size)
+            .permute(1, 2, 0, 3)
+            .reshape(1, num_head_k, n_rep * seqlen_q, head_size)
+        )
+        key = key.transpose(0, 1).unsqueeze(0)
+        value = value.transpose(0, 1).unsqueeze(0)
+        attn_mask = None
+        if is_causal and n_rep > 1:
+            attn_mask = (
+                torch.ones(seqlen_q, seqlen_k, dtype=torch.bool, device=query.device)
+                .tril()
+                .repeat(n_rep, 1)
+            )
+        out = torch.nn.functional.scaled_dot_product_attention(
+            query,
+            key,
+            value,
+            attn_mask=attn_mask,
+            is_causal=is_causal and n_rep == 1,
+            scale=softmax_scale,
+        )
+        # [1, num_head_k, n_rep * seqlen_q, head_size] -> [seqlen_q, num_head, head_size]
+        return (
+            out.view(num_head_k, n_rep, seqlen_q, head_size)
+            .permute(2, 0, 1, 3)
+            .reshape(seqlen_q, num_head, head_size)
+        )
 
     @classmethod
     def apply_function(
@@ -411,68 +644,29 @@ class _IPEXVarlenScaledDotProductCPU(nn.Module):
         assert return_softmax is False, "ipex do not support return_softmax option"
         assert gen_ is None, "ipex do not support custom random generator"
         assert zero_tensors is False, "ipex varlen_fwd do not support zero tensors"
-
-        # Repeat kv if it is GQA.
-        key = cls.repeat_kv(key, int(query.shape[1] / key.shape[1]))
-        value = cls.repeat_kv(value, int(query.shape[1] / value.shape[1]))
-
-        total_q, num_head, head_size = query.size()
-        total_k, num_head_k, _ = key.size()
-        batch_size = seqlen_q.size(0) - 1
-        seqlen_q_ = seqlen_q.clone()
-        seqlen_q_[:batch_size] = seqlen_q[1:]
-        seqlen_q = (seqlen_q_ - seqlen_q)[:batch_size]
-        seqlen_k_ = seqlen_k.clone()
-        seqlen_k_[:batch_size] = seqlen_k[1:]
-        seqlen_k = (seqlen_k_ - seqlen_k)[:batch_size]
-
-        pad_q = torch.zeros(
-            [batch_size, max_seqlen_q, num_head, head_size],
-            dtype=query.dtype,
-            device=query.device,
-        )
-        pad_k = torch.zeros(
-            [batch_size, max_seqlen_k, num_head_k, head_size],
-            dtype=key.dtype,
-            device=key.device,
-        )
-        pad_v = torch.zeros(
-            [batch_size, max_seqlen_k, num_head_k, head_size],
-            dtype=value.dtype,
-            device=value.device,
-        )
-        q_mask = torch.arange(0, max_seqlen_q, device=query.device)[None, :].repeat(
-            batch_size, 1
-        )
-        q_mask = q_mask < seqlen_q[:, None].repeat(1, q_mask.size(-1))
-        k_mask = torch.arange(0, max_seqlen_k, device=key.device)[None, :].repeat(
-            batch_size, 1
-        )
-        k_mask = k_mask < seqlen_k[:, None].repeat(1, k_mask.size(-1))
-        align_mask_seqlen = max_seqlen_k
-        attn_mask = torch.empty(
-            [batch_size, 1, 1, align_mask_seqlen],
-            dtype=query.dtype,
-            device=query.device,
-        ).fill_(float("-inf"))
-        attn_mask[:, :, :, :max_seqlen_k].masked_fill_(k_mask[:, None, None, :], 0)
-
-        pad_q[q_mask] = query
-        pad_k[k_mask] = key
-        pad_v[k_mask] = value
-
-        pad_q = pad_q.permute(0, 2, 1, 3)
-        pad_k = pad_k.permute(0, 2, 1, 3)
-        pad_v = pad_v.permute(0, 2, 1, 3)
-        out_ = torch.nn.functional.scaled_dot_product_attention(
-            pad_q,
-            pad_k,
-            pad_v,
-            attn_mask=attn_mask if not is_causal else None,
-            is_causal=is_causal,
-        )
-        out_ = out_.permute(0, 2, 1, 3)
-        out.copy_(out_[q_mask])
+        assert (
+            query.size(1) % key.size(1) == 0
+        ), "the number of query heads should be a multiple of the number of kv heads"
+
+        # The packed tensors are attended sequence by sequence following the
+        # cumulative sequence lengths, without padding them to max_seqlen_q/k.
+        cu_seqlens_q = seqlen_q.tolist()
+        cu_seqlens_k = seqlen_k.tolist()
+        for i in range(len(cu_seqlens_q) - 1):
+            q_start, q_end = cu_seqlens_q[i], cu_seqlens_q[i + 1]
+            k_start, k_end = cu_seqlens_k[i], cu_seqlens_k[i + 1]
+            if q_end == q_start:
+                continue
+            if k_end == k_start:
+                out[q_start:q_end].zero_()
+                continue
+            out[q_start:q_end] = cls.attention_tile(
+                query[q_start:q_end],
+                key[k_start:k_end],
+                value[k_start:k_end],
+                softmax_scale,
+                is_causal,
+            )
         return out
 
     def forward(
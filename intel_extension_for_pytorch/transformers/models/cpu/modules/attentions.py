@@ -79,5 +79,9 @@ class _IPEXAttentionCPU(nn.Module):
             config.text_max_length if hasattr(config, "text_max_length") else 2048
         )
         self._IPEXScaleDotProduct = _IPEXScaleDotProductCPU(
-            text_max_length=self.text_max_length
+            text_max_length=self.text_max_length,
+            kv_cache_chunk_size=getattr(config, "kv_cache_chunk_size", 256),
+            kv_cache_growth_factor=getattr(config, "kv_cache_growth_factor", 2.0),
+            kv_cache_max_length=getattr(config, "kv_cache_max_length", None),
+            kv_cache_dtype=getattr(config, "kv_cache_dtype", None),
         )
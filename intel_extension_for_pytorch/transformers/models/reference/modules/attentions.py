@@ -2877,7 +2877,10 @@ def _reorder_cache(
     elif len(past_key_values[0]) == 8:
         for layer_past in past_key_values:
             layer_past[3][layer_past[0].size(-2) - 1] = beam_idx
-            layer_past[7][layer_past[0].size(-2) - 1] = beam_idx
+            # the cross attention buffers only hold the encoder states, they are
+            # not grown with the self attention ones
+            if layer_past[0].size(-2) - 1 < layer_past[7].size(0) - 2:
+                layer_past[7][layer_past[0].size(-2) - 1] = beam_idx
         return past_key_values
     elif len(past_key_values[0]) == 5:
         for layer_past in past_key_values:
@@ -1,5 +1,7 @@
 import torch
 import copy
+import os
+from collections.abc import Mapping
 from ..utils._logger import logger, WarningType
 import pkg_resources
 from intel_extension_for_pytorch.cpu._auto_kernel_selection import (
@@ -13,8 +15,10 @@ from ..utils.weight_only_quantization import (
     _is_woq_qconfig,
     _woq_enable_weight_cache_for_large_batch,
     _convert_woq_with_low_precision_checkpoint,
+    _LowPrecisionCheckpoint,
 )
 
+from .profiler import _record_layer_ranges_in_graph
 from .tensor_parallel import (
     shard_lm_head_weights,
     shard_mha_weights,
@@ -130,6 +134,7 @@ def model_convert_reference(_model):
         _greedy_search,
         _sample,
         _beam_sample,
+        _assisted_decoding,
     )
 
     # model wise optimization for MHA module
@@ -211,6 +216,7 @@ def model_convert_reference(_model):
     convert_function(_model, "greedy_search", _greedy_search)
     convert_function(_model, "sample", _sample)
     convert_function(_model, "beam_sample", _beam_sample)
+    convert_function(_model, "assisted_decoding", _assisted_decoding)
     convert_function(
         _model,
         "_extract_past_from_model_output",
@@ -1126,6 +1132,10 @@ def attach_extra_weight_for_large_batch_inference(model):
     from intel_extension_for_pytorch.nn.utils._weight_prepack import (
         _IPEXLinear,
     )
+    from intel_extension_for_pytorch.cpu._linear_autotune import (
+        _get_linear_autotuner,
+        _autotune_tpp_large_batch_min_m,
+    )
 
     def _pack_weight_for_large_batch(weight):
         assert weight.dim() == 2, "Expected 2D weight to pack, but got {}D".format(
@@ -1162,6 +1172,13 @@ def attach_extra_weight_for_large_batch_inference(model):
             unblocked_weight = _unpack_blocked_weight(weight)
             extra_weight = _pack_weight_for_large_batch(unblocked_weight)
             mod.weight_for_large_batch = extra_weight
+            if extra_weight is not None and _get_linear_autotuner() is not None:
+                mod.large_batch_min_m = _autotune_tpp_large_batch_min_m(
+                    mod.weight,
+                    extra_weight,
+                    unblocked_weight.size(1),
+                    mod.out_features,
+                )
             return mod
 
         mod_new = mod
@@ -1306,7 +1323,7 @@ def model_convert_lowering(
             with torch.no_grad(), torch.cpu.amp.autocast(
                 enabled=True if dtype in [torch.bfloat16, torch.half] else False,
                 dtype=dtype,
-            ):
+            ), _record_layer_ranges_in_graph(_model):
                 trace_model = torch.jit.trace(
                     _model,
                     example_kwarg_inputs=sample_inputs,
@@ -1381,6 +1398,8 @@ def optimize(
     sample_inputs=None,
     deployment_mode=True,
     cache_weight_for_large_batch=False,
+    kv_cache_dtype=None,
+    artifact_cache_dir=None,
 ):
     r"""
     Apply optimizations at Python frontend to the given transformers model (nn.Module).
@@ -1408,10 +1427,14 @@ def optimize(
         qconfig_summary_file (str): Path to the IPEX static quantization config json file.
             Default value is ``None``. Work with quantization_config under static quantization use case.
             Need to do IPEX static quantization calibration and generate this file.
-        low_precision_checkpoint (dict or tuple of dict): For weight only quantization with INT4 weights.
+        low_precision_checkpoint (dict, str or tuple): For weight only quantization with INT4 weights.
             If it's a dict, it should be the state_dict of checkpoint (`.pt`) generated by GPTQ, etc.
+            If it's a str, it should be the path to the checkpoint file (`.safetensors`, `.pt` or `.bin`) or to
+            the directory of the (sharded) checkpoint files. The files are memory-mapped and the tensors of each
+            linear layer are read on demand, so the checkpoint is never fully loaded in memory, and the
+            ``torch.nn.Linear`` layers of the model can be created on the meta device to skip their float weights.
             If a tuple is provided, it should be `(checkpoint, checkpoint config)`,
-            where `checkpoint` is the state_dict and `checkpoint config` is dict specifying
+            where `checkpoint` is the state_dict or the path and `checkpoint config` is dict specifying
             keys of weight/scale/zero point/bias in the state_dict.
             The default config is {'weight_key': 'packed_weight', 'scale_key': 'scale',
             'zero_point_key': 'packed_zp', bias_key: 'bias'}. Change the values of the dict to make a custom config.
@@ -1427,6 +1450,17 @@ def optimize(
             its inference (e.g., prefill phase) with extra memory usage. It is only valid for non-quantization cases
             where dtype = bfloat16 and weight-only quantization cases where lowp-mode=BF16/INT8. In other cases, an
             error will be raised. Default value is ``False``.
+        kv_cache_dtype (str): Store the KV cache of the attention layers in ``"int8"`` or ``"fp8"``
+            (float8_e4m3fn) with one fp32 scale per token and head, which roughly halves its memory for
+            bfloat16 models. It is only valid on cpu and not supported by T5, Git and Whisper.
+            Default value is ``None``, meaning the KV cache is stored in ``dtype``.
+        artifact_cache_dir (str): Directory to cache the optimized graphs of the deployment mode on disk.
+            They are keyed by the model config and the digest of all the weights, ``dtype``, the quantization options,
+            the kernel selection (TPP/oneDNN, linear autotune), the ``LM_HEAD_TOPK``, ``LM_HEAD_SHARD_POLICY`` and
+            ``IPEX_LLM_PROFILE_LAYERS`` environment variables, the ISA level and the IPEX/PyTorch/transformers
+            versions, so that optimizing the same model again (e.g., when restarting a service) loads them instead
+            of converting, quantizing and tracing the model. Entries of other versions are evicted. It is only valid on cpu with ``deployment_mode=True`` for non-quantization and
+            weight-only quantization cases. Default value is ``None``, meaning no cache.
 
     Returns:
         Optimized model object for model.generate(), also workable with model.forward
@@ -1456,6 +1490,11 @@ def optimize(
 
     validate_device_avaliable(device)
 
+    if kv_cache_dtype is not None:
+        from .models.cpu.fusions.mha_fusion import _get_kv_cache_dtype
+
+        _get_kv_cache_dtype(kv_cache_dtype)
+
     try:
         well_supported_model = False
         if hasattr(model, "config") and hasattr(model.config, "architectures"):
@@ -1517,6 +1556,21 @@ def optimize(
         else:
             _model = model
 
+        if kv_cache_dtype is not None:
+            # the cross attention caches of these models are read back as key/value states
+            if device != "cpu" or model.config.architectures[0] in [
+                "T5ForConditionalGeneration",
+                "GitForCausalLM",
+                "WhisperForConditionalGeneration",
+            ]:
+                logger.warning(
+                    f"kv_cache_dtype is not supported by {model.config.architectures[0]} on {device}, "
+                    + "fallback to the KV cache in the model dtype",
+                    _type=WarningType.NotSupported,
+                )
+            else:
+                _model.config.kv_cache_dtype = kv_cache_dtype
+
         # profiling mode is disabled in ChatGLM (https://huggingface.co/THUDM/chatglm3-6b/blob/main/modeling_chatglm.py#L33-L34)
         # Enable profiling mode to apply jit optimizations
         if model.config.architectures[0] == "ChatGLMModel":
@@ -1541,19 +1595,78 @@ def optimize(
                     quantization_config
                 )
 
+        # map the checkpoint files before fingerprinting them for the artifact cache
+        if device == "cpu" and is_woq and low_precision_checkpoint is not None:
+            if isinstance(low_precision_checkpoint, tuple):
+                assert (
+                    len(low_precision_checkpoint) == 2
+                ), "Invalid low_precision_checkpoint"
+                if isinstance(low_precision_checkpoint[0], (str, os.PathLike)):
+                    low_precision_checkpoint = (
+                        _LowPrecisionCheckpoint(low_precision_checkpoint[0]),
+                        low_precision_checkpoint[1],
+                    )
+            elif isinstance(low_precision_checkpoint, (str, os.PathLike)):
+                low_precision_checkpoint = _LowPrecisionCheckpoint(
+                    low_precision_checkpoint
+                )
+
+        artifact_cache_key = None
+        if artifact_cache_dir is not None:
+            if (
+                device != "cpu"
+                or not deployment_mode
+                or (is_quantization and not is_woq)
+            ):
+                logger.warning(
+                    "artifact_cache_dir is only supported on cpu with deployment_mode for non-quantization "
+                    + "and weight-only quantization cases, fallback to optimizing without cache",
+                    _type=WarningType.NotSupported,
+                )
+            else:
+                from .artifact_cache import (
+                    _get_artifact_cache_key,
+                    _evict_stale_artifacts,
+                    _load_artifacts,
+                )
+
+                _evict_stale_artifacts(artifact_cache_dir)
+                artifact_cache_key = _get_artifact_cache_key(
+                    _model,
+                    dtype,
+                    quantization_config,
+                    low_precision_checkpoint,
+                    sample_inputs,
+                    cache_weight_for_large_batch,
+                )
+                artifacts = _load_artifacts(artifact_cache_dir, artifact_cache_key)
+                if artifacts is not None:
+                    # the graphs hold the optimized weights, the python modules are only
+                    # converted to reference for the generation functions
+                    _model = model_convert_reference(_model)
+                    _model = _set_optimized_model_for_generation(
+                        _model,
+                        optimized_model=artifacts[0],
+                        first_token_optimized_model=artifacts[1],
+                    )
+                    from .models.reference.models import output_hook
+
+                    _model.register_forward_hook(output_hook, with_kwargs=True)
+                    return _model
+
         # Load low precision checkpoint (generated by GPTQ, etc.) for WOQ before any conversion
         if device == "cpu" and is_woq and low_precision_checkpoint is not None:
             state_dict, config = None, None
             if isinstance(low_precision_checkpoint, tuple):
                 assert (
                     len(low_precision_checkpoint) == 2
-                    and isinstance(low_precision_checkpoint[0], dict)
+                    and isinstance(low_precision_checkpoint[0], Mapping)
                     and isinstance(low_precision_checkpoint[1], dict)
                 ), "Invalid low_precision_checkpoint"
                 state_dict, config = low_precision_checkpoint
             else:
                 assert isinstance(
-                    low_precision_checkpoint, dict
+                    low_precision_checkpoint, Mapping
                 ), "Invalid low_precision_checkpoint argument"
                 state_dict = low_precision_checkpoint
             _model = _convert_woq_with_low_precision_checkpoint(
@@ -1596,7 +1709,7 @@ def optimize(
                             True if dtype in [torch.bfloat16, torch.half] else False
                         ),
                         dtype=dtype,
-                    ):
+                    ), _record_layer_ranges_in_graph(_model):
                         trace_model = torch.jit.trace(
                             _model,
                             example_kwarg_inputs=sample_inputs,
@@ -1666,6 +1779,10 @@ def optimize(
             is_woq,
             cache_weight_for_large_batch,
         )
+        if artifact_cache_key is not None:
+            from .artifact_cache import _save_artifacts
+
+            _save_artifacts(artifact_cache_dir, artifact_cache_key, _model)
         # do not register output hook when doing calibration in static int8
         if not (is_quantization and not is_woq and qconfig_summary_file is None):
             from .models.reference.models import output_hook
@@ -0,0 +1,365 @@
+import bisect
+import contextlib
+import json
+import os
+import time
+import torch
+
+# set to record the ranges of the decoder layers in the graphs traced by
+# ipex.llm.optimize(deployment_mode=True), so that GenerationProfiler times them
+_PROFILE_LAYERS_ENV = "IPEX_LLM_PROFILE_LAYERS"
+_STEP_KINDS = ["prefill", "decode"]
+# seconds, 0.1 ms to ~13 s
+_LATENCY_BUCKETS = [1e-4 * 2**i for i in range(18)]
+# bytes/s, 1 GB/s to ~1 TB/s
+_BANDWIDTH_BUCKETS = [1e9 * 2**i for i in range(11)]
+
+
+class _Histogram(object):
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.values = []
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.values.append(value)
+
+    def summary(self):
+        values = sorted(self.values)
+        count = len(values)
+        cumulative = 0
+        buckets = []
+        for bound, bucket_count in zip(self.bounds + [float("inf")], self.counts):
+            cumulative += bucket_count
+            buckets.append((bound, cumulative))
+        return {
+            "count": count,
+            "sum": sum(values),
+            "mean": sum(values) / count if count > 0 else 0.0,
+            "p50": values[int(count * 0.5)] if count > 0 else 0.0,
+            "p90": values[int(count * 0.9)] if count > 0 else 0.0,
+            "p99": values[int(count * 0.99)] if count > 0 else 0.0,
+            "max": values[-1] if count > 0 else 0.0,
+            # (upper bound, cumulative count), as the Prometheus histograms
+            "buckets": buckets,
+        }
+
+
+def _get_decoder_layers(model):
+    # [(index, decoder layer, [attention modules])] of the IPEX modules
+    from .models.reference.modules.decoder import _IPEXDecoderLayerRef
+    from .models.reference.modules.attentions import _IPEXAttentionRef
+    from .models.cpu.modules.decoder import _IPEXDecoderLayerCPU
+    from .models.cpu.modules.attentions import _IPEXAttentionCPU
+
+    layers = [
+        m
+        for m in model.modules()
+        if isinstance(m, (_IPEXDecoderLayerRef, _IPEXDecoderLayerCPU))
+    ]
+    return [
+        (
+            i,
+            layer,
+            [
+                m
+                for m in layer.modules()
+                if isinstance(m, (_IPEXAttentionRef, _IPEXAttentionCPU))
+            ],
+        )
+        for i, layer in enumerate(layers)
+    ]
+
+
+def _add_range_hooks(module, name):
+    # the profiler ranges are ops, so that they are also recorded by torch.jit.trace
+    handles = []
+
+    def pre_hook(module, args):
+        handles.append(torch.ops.profiler._record_function_enter_new(name, None))
+
+    def hook(module, args, output):
+        torch.ops.profiler._record_function_exit._RecordFunction(handles.pop())
+
+    return [
+        module.register_forward_pre_hook(pre_hook),
+        module.register_forward_hook(hook),
+    ]
+
+
+def _add_layer_range_hooks(model):
+    hooks = []
+    for i, layer, attentions in _get_decoder_layers(model):
+        hooks += _add_range_hooks(layer, f"ipex::decoder_layer.{i}")
+        for attention in attentions:
+            hooks += _add_range_hooks(attention, f"ipex::attention.{i}")
+    return hooks
+
+
+@contextlib.contextmanager
+def _record_layer_ranges_in_graph(model):
+    r"""
+    Records the ranges of the decoder layers and attentions in the graph traced in
+    the context if ``IPEX_LLM_PROFILE_LAYERS=1``. The ranges cost nothing but a check
+    of the profiler state when no profiler is running.
+    """
+    hooks = (
+        _add_layer_range_hooks(model)
+        if os.environ.get(_PROFILE_LAYERS_ENV, "0") == "1"
+        else []
+    )
+    try:
+        yield
+    finally:
+        for hook in hooks:
+            hook.remove()
+
+
+def _get_nbytes(obj):
+    if isinstance(obj, torch.Tensor):
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, (tuple, list)):
+        return sum(_get_nbytes(x) for x in obj)
+    return 0
+
+
+def _get_kv_cache_bytes(past_key_values):
+    # the bytes of the keys and values of the sequence, which the attention reads. The
+    # buffers of the indirect access kv cache, (seq info, key, value, beam idx), are
+    # preallocated, only their first seq len tokens are read. The cross attention
+    # cache of the encoder-decoder models (layer_past[4:8]) is not counted, since the
+    # length of the encoder states is not recorded in it.
+    if not isinstance(past_key_values, (tuple, list)):
+        return 0
+    nbytes = 0
+    for layer_past in past_key_values:
+        if not isinstance(layer_past, (tuple, list)) or len(layer_past) < 2:
+            continue
+        if len(layer_past) >= 4 and layer_past[0].dtype == torch.long:
+            seq_len = layer_past[0].size(-2)
+            for cache in layer_past[1:3]:
+                # [cache size, beam * batch, num_kv_heads, head_dim]
+                nbytes += seq_len * cache[0].numel() * cache.element_size()
+        else:
+            nbytes += _get_nbytes(layer_past[0]) + _get_nbytes(layer_past[1])
+    return nbytes
+
+
+def _get_past_key_values(outputs):
+    if isinstance(outputs, dict):
+        return outputs.get("past_key_values", None)
+    # the traced graphs return tuples, past_key_values is the second output
+    if isinstance(outputs, (tuple, list)) and len(outputs) > 1:
+        return outputs[1]
+    return None
+
+
+class GenerationProfiler(object):
+    r"""
+    Collects the latencies of the ``generate`` calls of a model optimized by
+    ``ipex.llm.optimize``:
+
+    * ``prefill_latency`` and ``decode_latency``: the time of the first forward of
+      each ``generate`` call and of the next ones.
+    * ``{prefill,decode}_layer_latency.<i>``: the time of the ``i``-th decoder layer,
+      split into ``{prefill,decode}_attention_latency.<i>`` and
+      ``{prefill,decode}_mlp_latency.<i>``, the latter being the rest of the layer
+      (MLP, norms and residuals).
+    * ``decode_bandwidth``: the achieved memory bandwidth of the decode steps
+      (bytes/s), estimated as the bytes of the weights and the KV cache read by
+      each step.
+
+    and the counters ``prefill_steps``, ``decode_steps``, ``weight_bytes`` and
+    ``kv_cache_bytes`` (the keys and values of the sequence after the last step,
+    not the preallocated capacity of the KV cache). The latencies of the steps are
+    measured by the hooks of the model, which are only registered in the context,
+    so the model runs as usual out of it. The latencies of the layers are
+    collected by ``torch.profiler`` when ``record_layers`` is set, which adds the
+    overhead of the profiler to every op of the steps. The traced
+    graphs of ``deployment_mode=True`` only contain the ranges of the layers if
+    the environment variable ``IPEX_LLM_PROFILE_LAYERS=1`` is set when
+    ``ipex.llm.optimize`` traces the model.
+
+    Args:
+        model (torch.nn.Module): The model optimized by ``ipex.llm.optimize``.
+        record_layers (bool): Whether to time the decoder layers with
+            ``torch.profiler``. Default value is ``False``.
+
+    Examples:
+
+        >>> model = ipex.llm.optimize(model, dtype=torch.bfloat16)
+        >>> with ipex.llm.GenerationProfiler(model, record_layers=True) as prof:
+        ...     model.generate(input_ids, max_new_tokens=32)
+        >>> prof.summary()["histograms"]["decode_latency"]["p90"]
+        >>> prof.export_chrome_trace("trace.json")
+    """
+
+    def __init__(self, model, record_layers=False):
+        self.model = model
+        self.record_layers = record_layers
+        self.histograms = {}
+        self.counters = {}
+        # [(kind, start, end)] in seconds
+        self.steps = []
+        self._prof = None
+        self._hooks = []
+        self._prefill = True
+        self._step = None
+
+    def _histogram(self, name, bounds=_LATENCY_BUCKETS):
+        if name not in self.histograms:
+            self.histograms[name] = _Histogram(bounds)
+        return self.histograms[name]
+
+    def _step_pre_hook(self, module, args):
+        # the traced graphs are called by the wrappers of the model
+        if self._step is not None:
+            return
+        kind = _STEP_KINDS[0] if self._prefill else _STEP_KINDS[1]
+        handle = None
+        if self._prof is not None:
+            handle = torch.autograd.profiler.record_function(f"ipex::{kind}")
+            handle.__enter__()
+        self._step = (module, kind, handle, time.perf_counter())
+
+    def _step_hook(self, module, args, output):
+        if self._step is None or self._step[0] is not module:
+            return
+        _, kind, handle, start = self._step
+        end = time.perf_counter()
+        if handle is not None:
+            handle.__exit__(None, None, None)
+        self._step = None
+        self._prefill = False
+        self.steps.append((kind, start, end))
+        self._histogram(f"{kind}_latency").add(end - start)
+        self.counters[f"{kind}_steps"] = self.counters.get(f"{kind}_steps", 0) + 1
+        kv_cache_bytes = _get_kv_cache_bytes(_get_past_key_values(output))
+        self.counters["kv_cache_bytes"] = kv_cache_bytes
+        if kind == "decode" and end > start:
+            self._histogram("decode_bandwidth", _BANDWIDTH_BUCKETS).add(
+                (self.counters["weight_bytes"] + kv_cache_bytes) / (end - start)
+            )
+
+    def _wrap_generate(self):
+        generate = self.model.generate
+
+        def wrapper(*args, **kwargs):
+            self._prefill = True
+            return generate(*args, **kwargs)
+
+        self.model.generate = wrapper
+
+    def __enter__(self):
+        tensors = {}
+        for t in list(self.model.parameters()) + list(self.model.buffers()):
+            tensors[t.data_ptr()] = _get_nbytes(t)
+        self.counters["weight_bytes"] = sum(tensors.values())
+        self._saved_generate = self.model.__dict__.get("generate", None)
+        self._wrap_generate()
+        for name in ["trace_graph_first", "trace_graph"]:
+            if hasattr(self.model, name):
+                self._hooks.append(
+                    getattr(self.model, name).register_forward_pre_hook(
+                        self._step_pre_hook
+                    )
+                )
+                self._hooks.append(
+                    getattr(self.model, name).register_forward_hook(self._step_hook)
+                )
+        self._hooks.append(self.model.register_forward_pre_hook(self._step_pre_hook))
+        self._hooks.append(self.model.register_forward_hook(self._step_hook))
+        if self.record_layers:
+            # the eager layers, the traced ones have recorded the ranges in the graph
+            if not hasattr(self.model, "trace_graph"):
+                self._hooks += _add_layer_range_hooks(self.model)
+            self._prof = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU]
+            )
+            self._prof.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._prof is not None:
+            self._prof.__exit__(exc_type, exc_value, traceback)
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        if self._saved_generate is None:
+            del self.model.generate
+        else:
+            self.model.generate = self._saved_generate
+        if self._prof is not None:
+            self._collect_layer_latencies()
+        return False
+
+    def _collect_layer_latencies(self):
+        # {(step index, metric name): seconds}, the layer events are assigned to the
+        # steps they run in
+        steps = []
+        layers = []
+        for event in self._prof.events():
+            if event.name in [f"ipex::{kind}" for kind in _STEP_KINDS]:
+                steps.append((event.time_range.start, event.time_range.end, event.name))
+            elif event.name.startswith(("ipex::decoder_layer.", "ipex::attention.")):
+                layers.append(event)
+        steps.sort()
+        starts = [start for start, _, _ in steps]
+        latencies = {}
+        for event in layers:
+            i = bisect.bisect_right(starts, event.time_range.start) - 1
+            if i < 0 or event.time_range.end > steps[i][1]:
+                continue
+            kind = steps[i][2][len("ipex::") :]
+            layer_kind, _, layer_idx = event.name[len("ipex::") :].partition(".")
+            name = "layer" if layer_kind == "decoder_layer" else "attention"
+            key = (i, kind, name, layer_idx)
+            latencies[key] = (
+                latencies.get(key, 0.0)
+                + (event.time_range.end - event.time_range.start) / 1e6
+            )
+        for (i, kind, name, layer_idx), latency in sorted(latencies.items()):
+            self._histogram(f"{kind}_{name}_latency.{layer_idx}").add(latency)
+            if name == "layer":
+                attention = latencies.get((i, kind, "attention", layer_idx), 0.0)
+                self._histogram(f"{kind}_mlp_latency.{layer_idx}").add(
+                    latency - attention
+                )
+
+    def summary(self):
+        r"""
+        Returns the collected metrics as
+        ``{"histograms": {name: {"count", "sum", "mean", "p50", "p90", "p99", "max",
+        "buckets"}}, "counters": {name: value}}``. The latencies are in seconds.
+        """
+        return {
+            "histograms": {
+                name: histogram.summary()
+                for name, histogram in sorted(self.histograms.items())
+            },
+            "counters": dict(self.counters),
+        }
+
+    def export_chrome_trace(self, path):
+        r"""
+        Exports the steps, and the layers and ops if ``record_layers`` is set, as a
+        Chrome trace (``chrome://tracing`` or Perfetto).
+        """
+        if self._prof is not None:
+            self._prof.export_chrome_trace(path)
+            return
+        origin = self.steps[0][1] if len(self.steps) > 0 else 0.0
+        events = [
+            {
+                "name": f"ipex::{kind}",
+                "ph": "X",
+                "ts": (start - origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+            }
+            for kind, start, end in self.steps
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
@@ -445,7 +445,45 @@ class TensorParallelRowLinear(TensorParallellLinear):
         return out
 
 
+def _pack_vocab_topk(logits, k, vocab_offset):
+    # [..., 2 * k]: the top-k logits of the vocabulary shard and their indices in the
+    # full vocabulary, in float to keep the indices exact
+    values, indices = torch.topk(logits.float(), k, dim=-1)
+    return torch.cat([values, (indices + vocab_offset).float()], dim=-1)
+
+
+def _merge_vocab_topk(gathered, k, world_size):
+    # the packed top-k logits of the full vocabulary from the packed top-k of all the
+    # ranks, sorted in descending order
+    gathered = gathered.view(gathered.shape[:-1] + (world_size, 2 * k))
+    values = gathered[..., :k].flatten(-2)
+    indices = gathered[..., k:].flatten(-2)
+    values, topk_indices = torch.topk(values, k, dim=-1)
+    return torch.cat([values, indices.gather(-1, topk_indices)], dim=-1)
+
+
+def _unpack_vocab_topk(packed):
+    r"""
+    Returns the top-k logits ``[..., k]`` and their token ids ``[..., k]`` from the
+    packed top-k logits returned by the vocabulary-sharded LM head.
+    """
+    k = packed.size(-1) // 2
+    return packed[..., :k], packed[..., k:].long()
+
+
 class TensorParallelLMhead(TensorParallellLinear):
+    r"""
+    The LM head sharded by rows, whose outputs are all-reduced, or by columns (the
+    vocabulary), whose outputs are all-gathered. With the vocabulary sharded and
+    ``topk`` > 0, each rank only sends its ``topk`` largest logits and their token ids
+    instead of all its logits, and the LM head returns the ``topk`` largest logits of
+    the full vocabulary packed with their token ids (``[..., 2 * topk]`` in float,
+    see ``_unpack_vocab_topk``) when ``return_topk`` is set. ``return_topk`` is unset
+    by default, so the forward returns the full logits as any LM head. The generation
+    of ``ipex.llm.optimize`` only sets it for the greedy search and the sampling with
+    ``top_k <= topk`` without logits processors or returned scores.
+    """
+
     def __init__(
         self,
         linear,
@@ -455,6 +493,7 @@ class TensorParallelLMhead(TensorParallellLinear):
         rank,
         world_size,
         shard_by_col,
+        topk=0,
     ):
         super().__init__(
             linear,
@@ -467,9 +506,29 @@ class TensorParallelLMhead(TensorParallellLinear):
             shard_by_col=shard_by_col,
         )
         self.gather_result = shard_by_col
+        self.topk = 0
+        self.return_topk = False
+        if self.gather_result and self.world_size > 1 and topk > 0:
+            # the same k on every rank, bounded by the smallest shard
+            self.topk = min(
+                [topk]
+                + [
+                    self.cols_per_rank[i + 1] - self.cols_per_rank[i]
+                    for i in range(self.world_size)
+                ]
+            )
 
     def forward(self, input: torch.Tensor) -> torch.Tensor:
-        if self.gather_result:
+        if self.gather_result and self.return_topk:
+            out = self.linear(input)
+            packed = _pack_vocab_topk(out, self.topk, self.cols_per_rank[self.rank])
+            packed = ipex_comm.allgather(
+                packed,
+                [2 * self.topk * i for i in range(self.world_size + 1)],
+                self.world_size,
+            )
+            out = _merge_vocab_topk(packed, self.topk, self.world_size)
+        elif self.gather_result:
             out = self.linear(input)
             out = ipex_comm.allgather(out, self.cols_per_rank, self.world_size)
         else:
@@ -623,6 +682,9 @@ def shard_lm_head_weights(
     for name, sub_m in model.named_children():
         lm_head_shard_policy = os.getenv("LM_HEAD_SHARD_POLICY", "row")
         shard_by_col = lm_head_shard_policy == "col"
+        # with LM_HEAD_SHARD_POLICY=col, gather the top-k logits of every rank
+        # instead of the full vocabulary
+        lm_head_topk = int(os.getenv("LM_HEAD_TOPK", "0"))
         if name in ["lm_head"]:
             TPLinear = TensorParallelLMhead(
                 sub_m,
@@ -632,6 +694,7 @@ def shard_lm_head_weights(
                 rank,
                 world_size,
                 shard_by_col=shard_by_col,
+                topk=lm_head_topk,
             )
             setattr(model, name, TPLinear)
             return
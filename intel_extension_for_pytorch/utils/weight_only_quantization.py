@@ -1,4 +1,8 @@
 import copy
+import glob
+import json
+import os
+from collections.abc import Mapping
 import torch
 from intel_extension_for_pytorch.nn.modules import WeightOnlyQuantizedLinear
 from intel_extension_for_pytorch.quantization import QConfigWoq, WoqLowpMode
@@ -31,6 +35,75 @@ LEGACY_LOWP_CHECKPOINT_CONFIG = {
 }
 
 
+class _LowPrecisionCheckpoint(Mapping):
+    r"""
+    Read-only state_dict of a low precision checkpoint on disk, whose tensors are
+    memory-mapped on access instead of loaded at once. ``path`` is a checkpoint file
+    (``.safetensors``, ``.pt`` or ``.bin``) or a directory of (sharded) checkpoint
+    files, with an optional ``*.index.json`` file mapping the tensor names to the
+    files as Hugging Face does. The returned tensors are views of the mapped files,
+    so only the pages read by the conversion are loaded in memory.
+    """
+
+    def __init__(self, path):
+        path = os.fspath(path)
+        assert os.path.exists(path), f"low_precision_checkpoint not found: {path}"
+        self.path = path
+        # the opened files, their tensors are mapped lazily
+        self._files = {}
+        self._weight_map = {}
+        if os.path.isdir(path):
+            index_files = sorted(glob.glob(os.path.join(path, "*.index.json")))
+            if len(index_files) > 0:
+                with open(index_files[0]) as f:
+                    weight_map = json.load(f)["weight_map"]
+                self._weight_map = {
+                    name: os.path.join(path, file_name)
+                    for name, file_name in weight_map.items()
+                }
+                return
+            files = sorted(glob.glob(os.path.join(path, "*.safetensors")))
+            if len(files) == 0:
+                files = sorted(
+                    glob.glob(os.path.join(path, "*.pt"))
+                    + glob.glob(os.path.join(path, "*.bin"))
+                )
+            assert len(files) > 0, f"No checkpoint files found in {path}"
+        else:
+            files = [path]
+        for file_path in files:
+            for name in self._open(file_path).keys():
+                self._weight_map[name] = file_path
+
+    def _open(self, file_path):
+        if file_path not in self._files:
+            if file_path.endswith(".safetensors"):
+                from safetensors import safe_open
+
+                self._files[file_path] = safe_open(
+                    file_path, framework="pt", device="cpu"
+                )
+            else:
+                self._files[file_path] = torch.load(
+                    file_path, map_location="cpu", mmap=True, weights_only=True
+                )
+        return self._files[file_path]
+
+    def __getitem__(self, name):
+        f = self._open(self._weight_map[name])
+        if isinstance(f, dict):
+            # a new tensor sharing the mapped storage, so that the in-place ops of
+            # the format conversion do not modify the loaded state_dict
+            return f[name].detach()
+        return f.get_tensor(name)
+
+    def __iter__(self):
+        return iter(self._weight_map)
+
+    def __len__(self):
+        return len(self._weight_map)
+
+
 def _is_woq_qconfig(qconfig_mapping):
     qconfig = (
         qconfig_mapping.global_qconfig
@@ -124,7 +197,10 @@ def _convert_woq_with_low_precision_checkpoint(
     Args:
         model: original model
         qconfig_mapping: QConfigMapping object containing observer info, lowp mode, etc.
-        low_precision_checkpoint (dict): checkpoint generated by GPTQ, etc.
+        low_precision_checkpoint (dict or str): checkpoint generated by GPTQ, etc.
+            It is either the state_dict or the path to the checkpoint file or to the
+            directory of the (sharded) checkpoint files, which are memory-mapped and
+            read on demand for each linear layer.
         checkpoint_config (dict): custom config to load the checkpoint. Use default if None
         inplace: do conversion in-place or make a copy of original model
     Return:
@@ -138,9 +214,11 @@ def _convert_woq_with_low_precision_checkpoint(
     - Keys are 'packed_weight', 'scale', 'packed_zp'
     """
 
+    if isinstance(low_precision_checkpoint, (str, os.PathLike)):
+        low_precision_checkpoint = _LowPrecisionCheckpoint(low_precision_checkpoint)
     assert isinstance(
-        low_precision_checkpoint, dict
-    ), "low_precision_checkpoint should be a state_dict"
+        low_precision_checkpoint, Mapping
+    ), "low_precision_checkpoint should be a state_dict or a path"
     assert checkpoint_config is None or isinstance(
         checkpoint_config, dict
     ), "checkpoint_config should be a dict"
@@ -151,7 +229,7 @@ def _convert_woq_with_low_precision_checkpoint(
     # Check that keys can be found in the state dict. Bias and g_idx are optional.
     weight_key, scales_key, zeros_key, _, _ = _get_keys_from_config(checkpoint_config)
     keys_found = [False] * 3
-    for k, _ in state_dict.items():
+    for k in state_dict.keys():
         if k.endswith("." + weight_key):
             keys_found[0] = True
         if k.endswith("." + scales_key):
@@ -170,6 +248,13 @@ def _convert_woq_with_low_precision_checkpoint(
             )
             if any(i is None for i in [qweight, scales, qzeros]):
                 return mod
+            if mod.bias is not None and mod.bias.is_meta:
+                # the linear layers of the model can be on meta device, as their float
+                # weights are not used
+                assert (
+                    bias is not None
+                ), f"Bias of {attr_name} is on meta device and not found in the checkpoint"
+                mod.bias = None
             mod_new = WeightOnlyQuantizedLinear.from_float_and_int4_weight(
                 mod, qweight, scales, qzeros, bias, group_size=group_size, g_idx=g_idx
             )
@@ -148,6 +148,129 @@ class DistMergedEmbeddingTester(TestCase):
                         )
         dist.destroy_process_group()
 
+    def test_shard_streaming(self):
+        from intel_extension_for_pytorch.nn.modules.merged_embeddingbag import (
+            _copy_rows_to_shard,
+        )
+
+        tables = [torch.randn(n, 16) for n in [7, 1, 12, 5]]
+        row_offset = [0]
+        for t in tables:
+            row_offset.append(row_offset[-1] + t.size(0))
+        for world_size in [1, 2, 3, 4, 8]:
+            for rank in range(world_size):
+                ref_shard = torch.cat(tables)[rank::world_size]
+                shard = torch.empty_like(ref_shard)
+                for t, ofs in zip(tables, row_offset):
+                    _copy_rows_to_shard(shard, t, ofs, rank, world_size)
+                self.assertEqual(shard, ref_shard)
+
+    def test_build_from_meta_and_mmap(self):
+        import tempfile
+        import torch.distributed as dist
+
+        emb_list = EmbeddingBagList(4, 16, torch.float32, mode="sum")
+        with tempfile.TemporaryDirectory() as tmp:
+            dist.init_process_group(
+                "gloo", init_method=f"file://{tmp}/store", world_size=1, rank=0
+            )
+            paths = []
+            for i, emb in enumerate(emb_list.list):
+                paths.append(os.path.join(tmp, f"table_{i}.pt"))
+                torch.save(emb.weight.detach(), paths[i])
+            ref_emb = (
+                ipex.nn.modules.DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(
+                    copy.deepcopy(emb_list.list)
+                )
+            )
+            meta_emb = (
+                ipex.nn.modules.DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(
+                    copy.deepcopy(emb_list.list).to("meta")
+                )
+            )
+            self.assertEqual(meta_emb.weights[0].device.type, "cpu")
+            indices = [torch.zeros(1, dtype=torch.int64) for _ in paths]
+            offsets = [torch.zeros(1, dtype=torch.int64) for _ in paths]
+            for i, path in enumerate(paths):
+                # the rows of the tables not loaded yet are not initialized
+                with self.assertRaisesRegex(AssertionError, "not loaded"):
+                    meta_emb(indices, offsets)
+                meta_emb.load_table(i, torch.load(path, mmap=True))
+            self.assertEqual(meta_emb.weights[0], ref_emb.weights[0])
+            dist.destroy_process_group()
+
+    def test_sparse_all2all_packing(self):
+        import tempfile
+        import torch.distributed as dist
+        from intel_extension_for_pytorch.nn.modules.merged_embeddingbag import (
+            SparseAll2AllBuffer,
+            sparse_all2all,
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            dist.init_process_group(
+                "gloo", init_method=f"file://{tmp}/store", world_size=1, rank=0
+            )
+            send_buffer = SparseAll2AllBuffer()
+            recv_buffer = SparseAll2AllBuffer()
+            # odd sizes check the alignment of the packed parts
+            for index_type in [torch.int32, torch.int64]:
+                for dtype in [torch.bfloat16, torch.float32, torch.float64]:
+                    for num_rows in [7, 0, 3]:
+                        send_idx = [torch.randint(100, (num_rows,)).to(index_type)]
+                        send_buf = [torch.randn(num_rows, 65).to(dtype)]
+                        send_ofs = [torch.tensor([0, num_rows // 2, num_rows])]
+                        recv_idx, recv_buf, recv_ofs = sparse_all2all(
+                            1, send_idx, send_buf, send_ofs, send_buffer, recv_buffer
+                        )
+                        self.assertEqual(recv_idx, send_idx)
+                        self.assertEqual(recv_buf, send_buf)
+                        self.assertEqual(recv_ofs, send_ofs)
+            # the receive buffer is kept at the running max size
+            buffer = recv_buffer.buffer
+            sparse_all2all(1, send_idx, send_buf, send_ofs, send_buffer, recv_buffer)
+            self.assertTrue(recv_buffer.buffer is buffer)
+            dist.destroy_process_group()
+
+    def test_chunked_exchange(self):
+        import tempfile
+        import torch.distributed as dist
+
+        B = 64
+        emb_list = EmbeddingBagList(
+            5, 16, torch.float32, include_last_offset=True, mode="sum"
+        )
+        indices = [torch.randint(1000, (B * self.multi_hot[i],)) for i in range(5)]
+        offsets = [
+            torch.arange(0, (B + 1) * self.multi_hot[i], self.multi_hot[i])
+            for i in range(5)
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            dist.init_process_group(
+                "gloo", init_method=f"file://{tmp}/store", world_size=1, rank=0
+            )
+            ref_emb = (
+                ipex.nn.modules.DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(
+                    copy.deepcopy(emb_list.list)
+                )
+            )
+            ref_emb.num_comm_chunks = 1
+            ref_out = ref_emb(indices, offsets)
+            ref_out.backward(torch.ones_like(ref_out))
+            for num_comm_chunks in [2, 3, 8]:
+                emb = ipex.nn.modules.DistMergeEmbeddingBagWithAdaGrad.from_embeddingbag_list(
+                    copy.deepcopy(emb_list.list)
+                )
+                emb.num_comm_chunks = num_comm_chunks
+                out = emb(indices, offsets)
+                self.assertEqual(out, ref_out)
+                out.backward(torch.ones_like(out))
+                self.assertEqual(emb.weights[0], ref_emb.weights[0])
+                self.assertEqual(
+                    emb.adagrad_args.hessian[0], ref_emb.adagrad_args.hessian[0]
+                )
+            dist.destroy_process_group()
+
 
 if __name__ == "__main__":
     test = unittest.main()
@@ -1,9 +1,11 @@
+import contextlib
 import tempfile
 import torch
 
 import copy
 import os
 import unittest
+import unittest.mock
 import transformers
 from transformers import AutoConfig
 
@@ -124,6 +126,181 @@ class GPTQLLMTester(TestCase):
                     # the optimized model is ipex_m.trace_graph
                     model(*example_inputs)
 
+    def test_gptq_quantize_layer_wise(self):
+        class GPTQLLMDataLoader:
+            def __init__(self):
+                self.batch_size = 1
+
+            def __iter__(self):
+                for i in range(10):
+                    yield torch.ones([1, 512], dtype=torch.long)
+
+        from intel_extension_for_pytorch.quantization._GPTQ.gptq.gptq import (
+            GPTQuantizer,
+        )
+
+        dataloader = GPTQLLMDataLoader()
+        curpath = os.path.abspath(os.path.dirname(__file__))
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/gptj", return_dict=False
+        )
+        config.n_layer = 2
+        gptj = transformers.models.gptj.modeling_gptj.GPTJForCausalLM(config).eval()
+        gptq_args = {
+            "dataloader": dataloader,
+            "wbits": 4,
+            "group_size": 128,
+            "use_max_length": True,
+            "pad_max_length": 512,
+            "scale_dtype": torch.float16,
+        }
+        with tempfile.TemporaryDirectory() as work_dir:
+            model_path = os.path.join(work_dir, "model")
+            gptj.save_pretrained(model_path)
+            ipex.quantization.gptq(
+                copy.deepcopy(gptj), save_dir=work_dir + "/ref", **gptq_args
+            )
+            ref_checkpoint = torch.load(work_dir + "/ref/gptq_checkpoint_g128.pt")
+
+            def get_meta_model():
+                # only the parameters are on meta device, like accelerate.init_empty_weights
+                model = copy.deepcopy(gptj)
+                for module in model.modules():
+                    for name, param in module.named_parameters(recurse=False):
+                        module._parameters[name] = torch.nn.Parameter(
+                            param.to("meta"), requires_grad=False
+                        )
+                return model
+
+            # interrupted after the first block, then resumed from the second one
+            save_layer_wise_block = GPTQuantizer.save_layer_wise_block
+
+            def interrupt(quantizer, block_idx, *args):
+                save_layer_wise_block(quantizer, block_idx, *args)
+                raise KeyboardInterrupt
+
+            with unittest.mock.patch.object(
+                GPTQuantizer, "save_layer_wise_block", interrupt
+            ):
+                with self.assertRaises(KeyboardInterrupt):
+                    ipex.quantization.gptq(
+                        get_meta_model(),
+                        layer_wise=True,
+                        model_path=model_path,
+                        save_dir=work_dir + "/lwq",
+                        **gptq_args,
+                    )
+            self.assertTrue(
+                os.path.exists(work_dir + "/lwq/gptq_checkpoint_g128.resume")
+            )
+            # the attention masks etc. are saved once, each block only saves the hidden states
+            resume_args = torch.load(work_dir + "/lwq/gptq_checkpoint_g128.resume_args")
+            self.assertIsNone(
+                resume_args["cache_key_arguments"]["hidden_states"]
+                if "hidden_states" in resume_args["cache_key_arguments"]
+                else resume_args["cache_positional_arguments"][0]
+            )
+            self.assertEqual(
+                sorted(
+                    torch.load(work_dir + "/lwq/gptq_checkpoint_g128.resume").keys()
+                ),
+                ["block_idx", "hidden_states", "nsamples"],
+            )
+            with unittest.mock.patch.object(
+                GPTQuantizer, "pre_quantization"
+            ) as pre_quantization:
+                checkpoint_dir = ipex.quantization.gptq(
+                    get_meta_model(),
+                    layer_wise=True,
+                    model_path=model_path,
+                    save_dir=work_dir + "/lwq",
+                    **gptq_args,
+                )
+                pre_quantization.assert_not_called()
+            self.assertEqual(checkpoint_dir, work_dir + "/lwq/gptq_checkpoint_g128")
+            self.assertEqual(
+                sorted(os.listdir(checkpoint_dir)),
+                ["block_00000.pt", "block_00001.pt", "others.pt"],
+            )
+            self.assertFalse(
+                os.path.exists(work_dir + "/lwq/gptq_checkpoint_g128.resume")
+            )
+            self.assertFalse(
+                os.path.exists(work_dir + "/lwq/gptq_checkpoint_g128.resume_args")
+            )
+            checkpoint = {}
+            for f in os.listdir(checkpoint_dir):
+                checkpoint.update(torch.load(os.path.join(checkpoint_dir, f)))
+            self.assertEqual(checkpoint.keys(), ref_checkpoint.keys())
+            for k, v in ref_checkpoint.items():
+                self.assertEqual(checkpoint[k], v)
+
+    def test_gptq_quantize_parallel(self):
+        class GPTQLLMDataLoader:
+            def __init__(self):
+                self.batch_size = 1
+
+            def __iter__(self):
+                for i in range(10):
+                    yield torch.randint(1, 512, [1, 512], dtype=torch.long)
+
+        torch.manual_seed(0)
+        dataloader = list(GPTQLLMDataLoader())
+        curpath = os.path.abspath(os.path.dirname(__file__))
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/gptj", return_dict=False
+        )
+        gptj = transformers.models.gptj.modeling_gptj.GPTJForCausalLM(config).eval()
+        with tempfile.TemporaryDirectory() as work_dir:
+            checkpoints = []
+            # replayed one by one and sequentially, in batches and sequentially,
+            # in batches and concurrently with the worker threads pinned by the
+            # runtime extension if enabled, and only thread-limited without it
+            for replay_batch_size, num_pools, runtime_ext_off in [
+                (1, 1, False),
+                (4, 1, False),
+                (4, 2, False),
+                (4, 2, True),
+            ]:
+                save_dir = (
+                    f"{work_dir}/{replay_batch_size}_{num_pools}_{runtime_ext_off}"
+                )
+                runtime_ext = (
+                    unittest.mock.patch(
+                        "intel_extension_for_pytorch.cpu.runtime.core_pools.is_runtime_ext_enabled",
+                        return_value=False,
+                    )
+                    if runtime_ext_off
+                    else contextlib.nullcontext()
+                )
+                with runtime_ext:
+                    ipex.quantization.gptq(
+                        copy.deepcopy(gptj),
+                        dataloader=dataloader,
+                        wbits=4,
+                        group_size=128,
+                        use_max_length=True,
+                        pad_max_length=512,
+                        replay_batch_size=replay_batch_size,
+                        num_pools=num_pools,
+                        save_dir=save_dir,
+                    )
+                checkpoints.append(torch.load(save_dir + "/gptq_checkpoint_g128.pt"))
+            for checkpoint in checkpoints[1:]:
+                self.assertEqual(checkpoints[0].keys(), checkpoint.keys())
+            for k in checkpoints[0].keys():
+                if k.endswith("scales"):
+                    self.assertEqual(
+                        checkpoints[0][k], checkpoints[1][k], rtol=1e-3, atol=1e-3
+                    )
+                # the independent layers quantized concurrently get the same
+                # quantized weights and zero points as quantized sequentially
+                for checkpoint in checkpoints[2:]:
+                    if k.endswith(("qweight", "qzeros")):
+                        self.assertTrue(torch.equal(checkpoints[1][k], checkpoint[k]))
+                    else:
+                        self.assertEqual(checkpoints[1][k], checkpoint[k])
+
     def test_gptq_falcon_7b(self):
         class GPTQLLMDataLoader:
             def __init__(self):
@@ -90,6 +90,81 @@ class TestGraphCapture(TestCase):
                 y2 = model(x)
         self.assertEqual(y1, y2)
 
+    def test_inference_graph_mode_jit_graph_cache(self):
+        model = Conv_Bn_Relu().to(memory_format=torch.channels_last).eval()
+        ipex_model = ipex.optimize(
+            copy.deepcopy(model),
+            graph_mode=True,
+            graph_capture_config={"cache_size": 2},
+        )
+        with torch.no_grad():
+            for batch_size in [3, 3, 5, 3, 7, 5]:
+                x = torch.randn(batch_size, 6, 10, 10).to(
+                    memory_format=torch.channels_last
+                )
+                self.assertEqual(model(x), ipex_model(x))
+        # 5 is evicted by 7 as the least recently used graph
+        info = ipex_model.forward.cache_info()
+        self.assertEqual(info.hits, 2)
+        self.assertEqual(info.misses, 4)
+        self.assertEqual(info.evictions, 2)
+        self.assertEqual(info.currsize, 2)
+        self.assertEqual(info.maxsize, 2)
+
+    def test_inference_graph_mode_jit_single_graph(self):
+        model = Conv_Bn_Relu().to(memory_format=torch.channels_last).eval()
+        ipex_model = ipex.optimize(copy.deepcopy(model), graph_mode=True)
+        with torch.no_grad():
+            for batch_size in [3, 5, 3, 7]:
+                x = torch.randn(batch_size, 6, 10, 10).to(
+                    memory_format=torch.channels_last
+                )
+                self.assertEqual(model(x), ipex_model(x))
+        # by default, the graph of the first call runs all the input shapes
+        info = ipex_model.forward.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 3)
+        self.assertEqual(info.currsize, 1)
+        self.assertEqual(info.maxsize, 1)
+
+    def test_inference_graph_mode_jit_bucket(self):
+        model = Conv_Bn_Relu().to(memory_format=torch.channels_last).eval()
+        for buckets, expected_misses in [("pow2", 4), ([4, 8], 2)]:
+            ipex_model = ipex.optimize(
+                copy.deepcopy(model),
+                graph_mode=True,
+                graph_capture_config={"bucket_dims": [0], "buckets": buckets},
+            )
+            with torch.no_grad():
+                for batch_size in [1, 3, 4, 2, 7, 8]:
+                    x = torch.randn(batch_size, 6, 10, 10).to(
+                        memory_format=torch.channels_last
+                    )
+                    y = ipex_model(x)
+                    self.assertEqual(y.size(0), batch_size)
+                    self.assertEqual(model(x), y)
+            info = ipex_model.forward.cache_info()
+            self.assertEqual(info.misses, expected_misses)
+            self.assertEqual(info.hits, 6 - expected_misses)
+
+    def test_inference_graph_mode_share_weights(self):
+        from intel_extension_for_pytorch.cpu.graph_capture import GraphCapture
+
+        model = Conv_Bn_Relu().eval()
+        wrapper = GraphCapture(model, False, torch.float32, False)
+        # the captured model does not copy the weights of the optimized model
+        self.assertIsNot(wrapper.model, model)
+        self.assertEqual(
+            wrapper.model.conv.weight.data_ptr(), model.conv.weight.data_ptr()
+        )
+        ipex_model = ipex.optimize(
+            copy.deepcopy(model), graph_mode=True, share_weights=True
+        )
+        x = torch.randn(3, 6, 10, 10)
+        with torch.no_grad():
+            for _ in range(3):
+                self.assertEqual(model(x), ipex_model(x))
+
     def test_inference_graph_mode_torchdynamo(self):
         model = Conv_IF_Relu().to(memory_format=torch.channels_last).eval()
         x = torch.randn(3, 6, 10, 10).to(memory_format=torch.channels_last)
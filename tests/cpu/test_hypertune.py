@@ -0,0 +1,362 @@
+import csv
+import math
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+import numpy as np
+from intel_extension_for_pytorch.cpu.hypertune.conf.dotdict import DotDict
+from intel_extension_for_pytorch.cpu.hypertune.strategy import STRATEGIES
+from intel_extension_for_pytorch.cpu.hypertune.trial_db import TrialDatabase
+
+from common_utils import TestCase
+
+LATENCY = {"name": "latency", "higher_is_better": False, "target_val": -float("inf")}
+THROUGHPUT = {
+    "name": "throughput",
+    "higher_is_better": True,
+    "target_val": float("inf"),
+}
+
+
+def _get_strategy(work_dir, strategy, usr_objectives, hyperparams, **tuning):
+    program = os.path.join(work_dir, "program.py")
+    if not os.path.exists(program):
+        with open(program, "w") as f:
+            f.write("print('latency: 1')\n")
+    tuning_conf = {
+        "strategy": strategy,
+        "max_trials": 100,
+        "n_startup_trials": 4,
+        "early_stop_ratio": 0,
+        "resume": True,
+        "parallel_trials": 1,
+    }
+    tuning_conf.update(tuning)
+    # as built by hypertune.conf.config.Conf
+    conf = SimpleNamespace(
+        execution_conf=DotDict(
+            {
+                "tuning": tuning_conf,
+                "hyperparams": {"tune": dict(hp=list(hyperparams), **hyperparams)},
+                "output_dir": work_dir,
+            }
+        ),
+        program=program,
+        program_args=[],
+        usr_objectives=usr_objectives,
+    )
+    return STRATEGIES[strategy](conf)
+
+
+def _close(strategy):
+    strategy.csvfile.close()
+    strategy.trial_db.conn.close()
+
+
+def _objective(tune_cfg):
+    # deterministic, the lowest latency is at x = 3 and y = "b"
+    return [float((tune_cfg["x"] - 3) ** 2 + (0 if tune_cfg["y"] == "b" else 10))]
+
+
+def _stub_objective(strategy, objective=_objective, evaluated=None):
+    def evaluate(tune_cfg, timeout=None, nodes_list=None):
+        if evaluated is not None:
+            evaluated.append(dict(tune_cfg))
+        return "finished", objective(tune_cfg)
+
+    strategy.multiobjective.evaluate = evaluate
+
+
+class HypertuneStrategyTester(TestCase):
+    hyperparams = {"x": [1, 2, 3, 4, 5, 6], "y": ["a", "b"]}
+
+    def test_dominates(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            strategy = _get_strategy(
+                work_dir, "grid", [LATENCY, THROUGHPUT], self.hyperparams
+            )
+            # lower latency and higher throughput
+            self.assertTrue(strategy._dominates([1.0, 10.0], [2.0, 5.0]))
+            self.assertFalse(strategy._dominates([2.0, 5.0], [1.0, 10.0]))
+            # better for one objective only
+            self.assertFalse(strategy._dominates([1.0, 5.0], [2.0, 10.0]))
+            self.assertFalse(strategy._dominates([2.0, 10.0], [1.0, 5.0]))
+            # not worse for all and better for one
+            self.assertTrue(strategy._dominates([1.0, 10.0], [1.0, 5.0]))
+            # equal results do not dominate each other
+            self.assertFalse(strategy._dominates([1.0, 10.0], [1.0, 10.0]))
+            _close(strategy)
+
+    def test_pareto_front(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            strategy = _get_strategy(
+                work_dir, "grid", [LATENCY, THROUGHPUT], self.hyperparams
+            )
+            results = [
+                ({"x": 1, "y": "a"}, [3.0, 30.0]),
+                ({"x": 2, "y": "a"}, [2.0, 10.0]),
+                # dominated by x=1
+                ({"x": 3, "y": "a"}, [4.0, 20.0]),
+                # dominates x=2
+                ({"x": 4, "y": "a"}, [2.0, 20.0]),
+                ({"x": 5, "y": "a"}, [1.0, 5.0]),
+            ]
+            for tune_cfg, tune_result in results:
+                strategy._update_best_tune_result(tune_result, tune_cfg)
+            front = sorted(
+                (tune_cfg["x"], tune_result)
+                for tune_cfg, tune_result in strategy.pareto_front
+            )
+            self.assertEqual(
+                front, [(1, [3.0, 30.0]), (4, [2.0, 20.0]), (5, [1.0, 5.0])]
+            )
+            # no target is met, the best latency of the front
+            self.assertEqual(strategy.best_tune_cfg, {"x": 5, "y": "a"})
+            with open(strategy.pareto_front_name) as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(rows[0], ["x", "y", "latency", "throughput"])
+            self.assertEqual(sorted(int(row[0]) for row in rows[1:]), [1, 4, 5])
+            _close(strategy)
+
+    def test_pareto_front_target(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            throughput = dict(THROUGHPUT, target_val=15.0)
+            latency = dict(LATENCY, target_val=3.5)
+            strategy = _get_strategy(
+                work_dir, "grid", [latency, throughput], self.hyperparams
+            )
+            for tune_cfg, tune_result in [
+                ({"x": 1, "y": "a"}, [1.0, 5.0]),
+                ({"x": 2, "y": "a"}, [3.0, 30.0]),
+            ]:
+                strategy._update_best_tune_result(tune_result, tune_cfg)
+            # the configuration of the front meeting the targets, though its
+            # latency is higher
+            self.assertEqual(strategy.best_tune_cfg, {"x": 2, "y": "a"})
+            self.assertTrue(strategy._stop(2))
+            _close(strategy)
+
+    def test_tpe_nondominated_ranks(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            strategy = _get_strategy(
+                work_dir, "tpe", [LATENCY, THROUGHPUT], self.hyperparams
+            )
+            ranks = strategy._nondominated_ranks(
+                [[1.0, 5.0], [2.0, 20.0], [3.0, 10.0], [4.0, 5.0], [1.0, 20.0]]
+            )
+            self.assertEqual(ranks, [1, 1, 2, 3, 0])
+            _close(strategy)
+
+    def test_tpe_split_trials(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            strategy = _get_strategy(work_dir, "tpe", [LATENCY], self.hyperparams)
+            strategy.tune_history = [
+                ({"x": x, "y": "a"}, _objective({"x": x, "y": "a"}))
+                for x in range(1, 7)
+            ] + [({"x": 1, "y": "b"}, None), ({"x": 3, "y": "b"}, [0.0])]
+            good, bad = strategy._split_trials()
+            # gamma of the 8 trials, the lowest latencies
+            self.assertEqual(len(good), math.ceil(strategy.gamma * 8))
+            self.assertEqual(good, [(2, 1), (2, 0)])
+            # the early stopped trial is bad
+            self.assertEqual(len(bad), 6)
+            self.assertIn((0, 1), bad)
+            _close(strategy)
+
+    def test_tpe_parzen(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            strategy = _get_strategy(work_dir, "tpe", [LATENCY], self.hyperparams)
+            # the numeric values are smoothed around the observations
+            density = strategy._parzen(0, [2, 2])
+            self.assertAlmostEqual(density.sum(), 1.0)
+            self.assertEqual(int(np.argmax(density)), 2)
+            self.assertGreater(density[1], density[0])
+            self.assertGreater(density[3], density[5])
+            # the categorical ones are counted
+            density = strategy._parzen(1, [1, 1, 1])
+            self.assertAlmostEqual(density[1] / density[0], 7.0)
+            # the uniform prior without observation
+            self.assertEqual(strategy._parzen(0, []).tolist(), [1.0 / 6] * 6)
+            _close(strategy)
+
+    def test_tpe_suggest(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            strategy = _get_strategy(work_dir, "tpe", [LATENCY], self.hyperparams)
+            strategy.tune_history = [
+                ({"x": x, "y": y}, _objective({"x": x, "y": y}))
+                for x, y in [(2, "b"), (3, "a"), (6, "a"), (5, "a"), (1, "a")]
+            ]
+            for tune_cfg, _ in strategy.tune_history:
+                strategy.visited.add(strategy._cfg_to_idx(tune_cfg))
+            # the candidate maximizing l(x) / g(x) out of all the unvisited ones
+            strategy.n_candidates = 1000
+            np.random.seed(0)
+            self.assertEqual(strategy._suggest(), (2, 1))
+            # the visited configurations are not suggested again
+            strategy.visited.add((2, 1))
+            self.assertNotIn(strategy._suggest(), strategy.visited)
+            _close(strategy)
+
+    def test_tpe_traverse(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            np.random.seed(0)
+            strategy = _get_strategy(work_dir, "tpe", [LATENCY], self.hyperparams)
+            evaluated = []
+            _stub_objective(strategy, evaluated=evaluated)
+            strategy.traverse()
+            # the search space is exhausted without repeating a configuration
+            self.assertEqual(len(evaluated), 12)
+            self.assertEqual(
+                len(set(tuple(cfg.values()) for cfg in evaluated)), len(evaluated)
+            )
+            self.assertEqual(strategy.best_tune_cfg, {"x": 3, "y": "b"})
+            self.assertEqual(strategy.best_tune_result, [0.0])
+            _close(strategy)
+
+
+class TrialDatabaseTester(TestCase):
+    hyperparams = {"x": [1, 2, 3, 4, 5, 6], "y": ["a", "b"]}
+
+    def test_trial_database(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            program = os.path.join(work_dir, "program.py")
+            with open(program, "w") as f:
+                f.write("print('latency: 1')\n")
+            trials = [
+                ({"x": 1, "y": "a"}, "finished", [1.5], 0.5),
+                ({"x": 2, "y": "a"}, "stopped", None, 2.0),
+                ({"x": 3, "y": "b"}, "failed", None, 0.1),
+            ]
+            trial_db = TrialDatabase(work_dir, program, ["--arg"], [LATENCY])
+            for tune_cfg, status, result, elapsed in trials:
+                trial_db.put(tune_cfg, status, result, elapsed)
+            trial_db.conn.close()
+            self.assertTrue(os.path.exists(os.path.join(work_dir, "trials.db")))
+
+            # reopened, the trials are read back in order
+            trial_db = TrialDatabase(work_dir, program, ["--arg"], [LATENCY])
+            self.assertEqual(trial_db.trials(), trials)
+            self.assertEqual(trial_db.get({"y": "a", "x": 1}), ("finished", [1.5], 0.5))
+            self.assertIsNone(trial_db.get({"x": 4, "y": "a"}))
+            # a trial run again replaces the previous one
+            trial_db.put({"x": 3, "y": "b"}, "finished", [0.5], 0.2)
+            self.assertEqual(trial_db.get({"x": 3, "y": "b"}), ("finished", [0.5], 0.2))
+            self.assertEqual(len(trial_db.trials()), 3)
+            trial_db.conn.close()
+
+            # the trials of other program arguments, objectives or program
+            # content are not reused
+            for program_args, usr_objectives in [
+                (["--other"], [LATENCY]),
+                (["--arg"], [LATENCY, THROUGHPUT]),
+            ]:
+                trial_db = TrialDatabase(
+                    work_dir, program, program_args, usr_objectives
+                )
+                self.assertEqual(trial_db.trials(), [])
+                trial_db.conn.close()
+            with open(program, "a") as f:
+                f.write("print('throughput: 1')\n")
+            trial_db = TrialDatabase(work_dir, program, ["--arg"], [LATENCY])
+            self.assertEqual(trial_db.trials(), [])
+            self.assertIsNone(trial_db.get({"x": 1, "y": "a"}))
+            trial_db.conn.close()
+
+    def test_resume(self):
+        for strategy_name in ["grid", "tpe"]:
+            with tempfile.TemporaryDirectory() as work_dir:
+                np.random.seed(0)
+                # interrupted after 5 trials
+                strategy = _get_strategy(
+                    work_dir, strategy_name, [LATENCY], self.hyperparams, max_trials=5
+                )
+                evaluated = []
+                _stub_objective(strategy, evaluated=evaluated)
+                strategy.traverse()
+                self.assertEqual(len(evaluated), 5)
+                best = (strategy.best_tune_cfg, strategy.best_tune_result)
+                _close(strategy)
+
+                strategy = _get_strategy(
+                    work_dir, strategy_name, [LATENCY], self.hyperparams
+                )
+                resumed = []
+                _stub_objective(strategy, evaluated=resumed)
+                # the best result is rebuilt from the database
+                self.assertEqual(strategy._resume(), 5)
+                self.assertEqual(
+                    (strategy.best_tune_cfg, strategy.best_tune_result), best
+                )
+                self.assertEqual(resumed, [])
+                strategy.tune_history = []
+                strategy.pareto_front = []
+                strategy.done = set()
+                if strategy_name == "tpe":
+                    strategy.visited = set()
+                strategy.traverse()
+                # the finished trials are not run again
+                self.assertEqual(len(resumed), 7)
+                self.assertEqual(
+                    sorted(tuple(cfg.values()) for cfg in evaluated + resumed),
+                    sorted(
+                        (x, y)
+                        for x in self.hyperparams["x"]
+                        for y in self.hyperparams["y"]
+                    ),
+                )
+                self.assertEqual(strategy.best_tune_cfg, {"x": 3, "y": "b"})
+                _close(strategy)
+
+    def test_resume_pareto_front(self):
+        def objective(tune_cfg):
+            # latency and throughput trade off with x, y = "b" is always better
+            penalty = 0 if tune_cfg["y"] == "b" else 1
+            return [float(tune_cfg["x"] + penalty), float(tune_cfg["x"] ** 2 - penalty)]
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            strategy = _get_strategy(
+                work_dir, "grid", [LATENCY, THROUGHPUT], self.hyperparams
+            )
+            _stub_objective(strategy, objective)
+            strategy.traverse()
+            pareto_front = sorted(
+                tuple(tune_cfg.values()) for tune_cfg, _ in strategy.pareto_front
+            )
+            self.assertEqual(pareto_front, [(x, "b") for x in self.hyperparams["x"]])
+            best = (strategy.best_tune_cfg, strategy.best_tune_result)
+            _close(strategy)
+
+            # a stopped trial is resumed as done, without result
+            trial_db = TrialDatabase(
+                work_dir,
+                os.path.join(work_dir, "program.py"),
+                [],
+                [LATENCY, THROUGHPUT],
+            )
+            trial_db.put({"x": 6, "y": "b"}, "stopped", None, 10.0)
+            trial_db.conn.close()
+
+            strategy = _get_strategy(
+                work_dir, "grid", [LATENCY, THROUGHPUT], self.hyperparams
+            )
+            _stub_objective(
+                strategy,
+                lambda tune_cfg: self.fail(f"{tune_cfg} is run again"),
+            )
+            strategy.traverse()
+            self.assertEqual(len(strategy.tune_history), 12)
+            self.assertIn(({"x": 6, "y": "b"}, None), strategy.tune_history)
+            # the front is rebuilt from the finished trials
+            self.assertEqual(
+                sorted(
+                    tuple(tune_cfg.values()) for tune_cfg, _ in strategy.pareto_front
+                ),
+                [(x, "b") for x in range(1, 6)] + [(6, "a")],
+            )
+            self.assertEqual((strategy.best_tune_cfg, strategy.best_tune_result), best)
+            _close(strategy)
+
+
+if __name__ == "__main__":
+    test = unittest.main()
@@ -1,6 +1,9 @@
+import math
+import os
 import torch
 import intel_extension_for_pytorch as ipex
 import unittest
+from unittest import mock
 from torch.utils._pytree import tree_flatten, tree_unflatten
 from torch.testing._internal.common_utils import TestCase
 
@@ -277,6 +280,206 @@ class TestIpexInductor(TestCase):
         y = torch.randn(128, 256).as_strided([128, 256], [1, 128])
         self.common(fn, (x, y))
 
+    def _check_fusion(self, fn, inputs, ops, atol=None, rtol=None):
+        from torch._inductor.utils import run_and_get_code
+
+        torch._dynamo.reset()
+        with torch.no_grad():
+            expected = fn(*inputs)
+            actual, (code,) = run_and_get_code(
+                torch.compile(fn, backend="ipex"), *inputs
+            )
+        for op in ops:
+            self.assertIn(f"torch.ops.torch_ipex.{op}.default", code)
+        self.assertEqual(actual, expected, atol=atol, rtol=rtol)
+        torch._dynamo.reset()
+
+    def test_rmsnorm_fusion(self):
+        def rmsnorm(hidden_states, weight):
+            input_dtype = hidden_states.dtype
+            hidden_states = hidden_states.to(torch.float32)
+            variance = hidden_states.pow(2).mean(-1, keepdim=True)
+            hidden_states = hidden_states * torch.rsqrt(variance + 1e-5)
+            return weight * hidden_states.to(input_dtype)
+
+        def add_rmsnorm(hidden_states, residual, weight):
+            return rmsnorm(hidden_states + residual, weight)
+
+        for dtype in [torch.float32, torch.bfloat16]:
+            x = torch.randn(2, 7, 64, dtype=dtype)
+            residual = torch.randn(2, 7, 64, dtype=dtype)
+            weight = torch.randn(64, dtype=dtype)
+            tol = 1e-2 if dtype == torch.bfloat16 else None
+            self._check_fusion(rmsnorm, (x, weight), ["rmsnorm"], atol=tol, rtol=tol)
+            self._check_fusion(
+                add_rmsnorm,
+                (x, residual, weight),
+                ["add_rmsnorm"],
+                atol=tol,
+                rtol=tol,
+            )
+
+    def test_rotary_embedding_fusion(self):
+        def rotate_half(x):
+            x1 = x[..., : x.shape[-1] // 2]
+            x2 = x[..., x.shape[-1] // 2 :]
+            return torch.cat((-x2, x1), dim=-1)
+
+        def apply_rotary_pos_emb(q, k, cos, sin):
+            cos = cos.unsqueeze(1)
+            sin = sin.unsqueeze(1)
+            q_embed = (q * cos) + (rotate_half(q) * sin)
+            k_embed = (k * cos) + (rotate_half(k) * sin)
+            return q_embed, k_embed
+
+        def rotary_emb(q, k, freqs):
+            # cos/sin of the HF rotary embeddings, repeating the two halves
+            emb = torch.cat((freqs, freqs), dim=-1)
+            return apply_rotary_pos_emb(q, k, emb.cos(), emb.sin())
+
+        batch, seq_len, num_head, head_dim = 2, 5, 4, 32
+        inv_freq = 1.0 / (10000 ** (torch.arange(0, head_dim, 2) / head_dim))
+        for position_batch in [1, batch]:
+            position_ids = torch.arange(seq_len).expand(position_batch, -1) + 3
+            freqs = position_ids[..., None].float() * inv_freq
+            q = torch.randn(batch, seq_len, num_head, head_dim).transpose(1, 2)
+            k = torch.randn(batch, seq_len, num_head, head_dim).transpose(1, 2)
+            self._check_fusion(
+                rotary_emb,
+                (q, k, freqs),
+                ["rotary_position_embedding"],
+            )
+
+        # the halves of cos/sin given as inputs may differ, they are not fused
+        from torch._inductor.utils import run_and_get_code
+
+        cos = torch.randn(batch, seq_len, head_dim)
+        sin = torch.randn(batch, seq_len, head_dim)
+        torch._dynamo.reset()
+        with torch.no_grad():
+            expected = apply_rotary_pos_emb(q, k, cos, sin)
+            actual, (code,) = run_and_get_code(
+                torch.compile(apply_rotary_pos_emb, backend="ipex"), q, k, cos, sin
+            )
+        self.assertNotIn("torch.ops.torch_ipex.rotary_position_embedding", code)
+        self.assertEqual(actual, expected)
+        torch._dynamo.reset()
+
+    def test_sdpa_fusion(self):
+        def attention(query, key, value, attn_mask):
+            attn_weights = torch.matmul(query, key.transpose(2, 3)) / math.sqrt(
+                query.size(-1)
+            )
+            attn_weights = attn_weights + attn_mask
+            attn_weights = torch.softmax(attn_weights, dim=-1, dtype=torch.float32)
+            return torch.matmul(attn_weights.to(query.dtype), value)
+
+        for dtype in [torch.float32, torch.bfloat16]:
+            query = torch.randn(2, 4, 9, 32, dtype=dtype)
+            key = torch.randn(2, 4, 9, 32, dtype=dtype)
+            value = torch.randn(2, 4, 9, 32, dtype=dtype)
+            attn_mask = torch.zeros(2, 1, 9, 9, dtype=dtype)
+            attn_mask[..., -2:] = torch.finfo(dtype).min
+            tol = 2e-2 if dtype == torch.bfloat16 else None
+            self._check_fusion(
+                attention,
+                (query, key, value, attn_mask),
+                ["flash_attention"],
+                atol=tol,
+                rtol=tol,
+            )
+
+    def test_tpp_linear_eltwise_fusion(self):
+        from intel_extension_for_pytorch.cpu._auto_kernel_selection import (
+            _enable_tpp,
+            _disable_tpp,
+        )
+
+        class MLP(torch.nn.Module):
+            def __init__(self, activation):
+                super().__init__()
+                self.gate_proj = torch.nn.Linear(64, 128, bias=False)
+                self.up_proj = torch.nn.Linear(64, 128)
+                self.down_proj = torch.nn.Linear(128, 64)
+                self.activation = activation
+
+            def forward(self, x):
+                y = self.activation(self.gate_proj(x)) * self.up_proj(x)
+                return x + self.down_proj(y)
+
+        for activation, op in [
+            (torch.nn.functional.silu, "tpp_linear_silu"),
+            (torch.nn.functional.gelu, "tpp_linear_gelu"),
+            (torch.nn.functional.relu, "tpp_linear_relu"),
+        ]:
+            _enable_tpp()
+            model = ipex.optimize(
+                MLP(activation).eval(), dtype=torch.bfloat16, inplace=True
+            )
+            _disable_tpp()
+            x = torch.randn(2, 3, 64).to(torch.bfloat16)
+            self._check_fusion(
+                model,
+                (x,),
+                [op, "tpp_linear_mul", "tpp_linear_add"],
+                atol=2e-2,
+                rtol=2e-2,
+            )
+
+    def test_compile_cache(self):
+        import tempfile
+        from torch._dynamo.utils import counters
+
+        def fn(x, y):
+            return torch.softmax(x * 2 + y, -1)
+
+        x = torch.randn(8, 32)
+        y = torch.randn(8, 32)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ipex.enable_compile_cache(cache_dir)
+            try:
+                # the second compilation, as in another process, hits the cache
+                for hits in [0, 1]:
+                    torch._dynamo.reset()
+                    counters.clear()
+                    out = torch.compile(fn, backend="ipex")(x, y)
+                    self.assertEqual(out, fn(x, y))
+                    self.assertEqual(counters["inductor"]["fxgraph_cache_hit"], hits)
+                self.assertTrue(
+                    any("inductor" in dirs for _, dirs, _ in os.walk(cache_dir))
+                )
+
+                # the torchscript graphs are saved and loaded instead of traced
+                ipex._set_compiler_backend("torchscript")
+                torch._dynamo.reset()
+                out = torch.compile(fn, backend="ipex")(x, y)
+                self.assertEqual(out, fn(x, y))
+                torch._dynamo.reset()
+                with mock.patch("torch.jit.trace") as trace:
+                    out = torch.compile(fn, backend="ipex")(x, y)
+                    trace.assert_not_called()
+                self.assertEqual(out, fn(x, y))
+
+                # evict all the files beyond the size
+                ipex.enable_compile_cache(cache_dir, max_size=0)
+                from intel_extension_for_pytorch._dynamo.compile_cache import (
+                    _get_compile_cache,
+                )
+
+                _get_compile_cache().evict()
+                self.assertEqual(
+                    [
+                        name
+                        for _, _, names in os.walk(cache_dir)
+                        for name in names
+                        if not name.endswith(".lock")
+                    ],
+                    [],
+                )
+            finally:
+                ipex.disable_compile_cache()
+                torch._dynamo.reset()
+
 
 if __name__ == "__main__":
     test = unittest.main()
@@ -461,6 +461,207 @@ class TestLLMModules(TestCase):
             ipex_out = ipex.llm.functional.silu_mul(x_, x_)
             self.assertEqual(ref_out, ipex_out)
 
+    def test_indirect_access_kv_cache_growth(self):
+        bs, num_head, head_dim, prompt_len = 2, 4, 32, 3
+        preallocated = ipex.llm.modules.IndirectAccessKVCacheAttention(
+            text_max_length=64, kv_cache_chunk_size=64
+        )
+        growing = ipex.llm.modules.IndirectAccessKVCacheAttention(
+            text_max_length=64, kv_cache_chunk_size=4, kv_cache_growth_factor=2.0
+        )
+        ref_past, past = None, None
+        cache_sizes = []
+        for step in range(12):
+            seq_len = prompt_len if step == 0 else 1
+            offset = 0 if step == 0 else prompt_len + step - 1
+            query = torch.rand(bs, seq_len, num_head, head_dim)
+            key = torch.rand(bs, seq_len, num_head, head_dim)
+            value = torch.rand(bs, seq_len, num_head, head_dim)
+            mask = torch.zeros(bs, 1, seq_len, offset + seq_len)
+            ref_out, _, ref_past = preallocated(
+                query, key, value, math.sqrt(head_dim), ref_past, None, mask
+            )
+            out, _, past = growing(
+                query, key, value, math.sqrt(head_dim), past, None, mask
+            )
+            self.assertEqual(out, ref_out)
+            self.assertEqual(past[3].size(0), past[1].size(0) + 2)
+            self.assertEqual(past[3][-2][0], prompt_len)
+            cache_sizes.append(past[1].size(0))
+        # 4 tokens first, then the cache doubles every time it is full
+        self.assertEqual(sorted(set(cache_sizes)), [4, 8, 16])
+        self.assertEqual(ref_past[1].size(0), 64)
+        self.assertEqual(
+            growing.peak_kv_cache_bytes,
+            sum(t.numel() * t.element_size() for t in past[1:4]),
+        )
+        self.assertTrue(growing.peak_kv_cache_bytes < preallocated.peak_kv_cache_bytes)
+        self.assertEqual(
+            ipex.llm.modules.IndirectAccessKVCacheAttention.get_peak_kv_cache_bytes(
+                torch.nn.Sequential(preallocated, growing)
+            ),
+            [preallocated.peak_kv_cache_bytes, growing.peak_kv_cache_bytes],
+        )
+        # the sequence can not be longer than kv_cache_max_length
+        bounded = ipex.llm.modules.IndirectAccessKVCacheAttention(
+            kv_cache_chunk_size=4, kv_cache_max_length=4
+        )
+        query = torch.rand(bs, 5, num_head, head_dim)
+        with self.assertRaises(RuntimeError):
+            bounded(
+                query,
+                query,
+                query,
+                math.sqrt(head_dim),
+                None,
+                None,
+                torch.zeros(bs, 1, 5, 5),
+            )
+
+    def test_indirect_access_kv_cache_quantized(self):
+        bs, num_head, head_dim, prompt_len = 2, 4, 32, 5
+        kv_cache_dtypes = ["int8"]
+        if hasattr(torch, "float8_e4m3fn"):
+            kv_cache_dtypes.append("fp8")
+        for kv_cache_dtype in kv_cache_dtypes:
+            ref_m = ipex.llm.modules.IndirectAccessKVCacheAttention(
+                text_max_length=64, kv_cache_chunk_size=8
+            )
+            m = ipex.llm.modules.IndirectAccessKVCacheAttention(
+                text_max_length=64, kv_cache_chunk_size=8, kv_cache_dtype=kv_cache_dtype
+            )
+            ref_past, past = None, None
+            for step in range(8):
+                seq_len = prompt_len if step == 0 else 1
+                offset = 0 if step == 0 else prompt_len + step - 1
+                query = torch.rand(bs, seq_len, num_head, head_dim)
+                key = torch.rand(bs, seq_len, num_head, head_dim)
+                value = torch.rand(bs, seq_len, num_head, head_dim)
+                mask = torch.zeros(bs, 1, seq_len, offset + seq_len)
+                ref_out, _, ref_past = ref_m(
+                    query, key, value, math.sqrt(head_dim), ref_past, None, mask
+                )
+                out, _, past = m(
+                    query, key, value, math.sqrt(head_dim), past, None, mask
+                )
+                self.assertEqual(out, ref_out, atol=5e-2, rtol=5e-2)
+                # the cache holds the quantized states followed by their fp32 scales
+                self.assertEqual(
+                    past[1].dtype,
+                    torch.int8 if kv_cache_dtype == "int8" else torch.float8_e4m3fn,
+                )
+                self.assertEqual(past[1].size(0), ref_past[1].size(0))
+                self.assertEqual(past[1].size(-1), head_dim + 4)
+            self.assertTrue(m.peak_kv_cache_bytes < ref_m.peak_kv_cache_bytes)
+
+    def test_paged_attention_quantized(self):
+        num_blocks, block_size, num_head, head_dim = 8, 4, 4, 32
+        num_seqs, context_len = 2, 10
+        shape = [num_blocks, num_head, block_size, head_dim]
+        key = torch.rand(num_seqs * context_len, num_head, head_dim)
+        value = torch.rand(num_seqs * context_len, num_head, head_dim)
+        query = torch.rand(num_seqs, num_head, head_dim)
+        slot_mapping = torch.cat(
+            [torch.arange(context_len), torch.arange(context_len) + 4 * block_size]
+        ).to(torch.int32)
+        block_tables = torch.tensor([[0, 1, 2], [4, 5, 6]], dtype=torch.int32)
+        context_lens = torch.tensor([context_len] * num_seqs, dtype=torch.int32)
+        head_mapping = torch.arange(num_head, dtype=torch.int32)
+        key_cache, value_cache = torch.zeros(shape), torch.zeros(shape)
+        ipex.llm.modules.PagedAttention.reshape_and_cache(
+            key, value, key_cache, value_cache, slot_mapping
+        )
+        ref_out = torch.empty_like(query)
+        ipex.llm.modules.PagedAttention.single_query_cached_kv_attention(
+            ref_out,
+            query,
+            key_cache,
+            value_cache,
+            head_mapping,
+            1.0 / math.sqrt(head_dim),
+            block_tables,
+            context_lens,
+            block_size,
+            context_len,
+            None,
+        )
+        kv_dtypes = [torch.int8]
+        if hasattr(torch, "float8_e4m3fn"):
+            kv_dtypes.append(torch.float8_e4m3fn)
+        for kv_dtype in kv_dtypes:
+            key_cache = torch.zeros(shape, dtype=kv_dtype)
+            value_cache = torch.zeros(shape, dtype=kv_dtype)
+            k_scale, v_scale = torch.zeros(shape[:-1]), torch.zeros(shape[:-1])
+            ipex.llm.modules.PagedAttention.reshape_and_cache(
+                key, value, key_cache, value_cache, slot_mapping, k_scale, v_scale
+            )
+            out = torch.empty_like(query)
+            ipex.llm.modules.PagedAttention.single_query_cached_kv_attention(
+                out,
+                query,
+                key_cache,
+                value_cache,
+                head_mapping,
+                1.0 / math.sqrt(head_dim),
+                block_tables,
+                context_lens,
+                block_size,
+                context_len,
+                None,
+                k_scale,
+                v_scale,
+            )
+            self.assertEqual(out, ref_out, atol=5e-2, rtol=5e-2)
+
+    def test_varlen_attention(self):
+        head_size = 64
+        # skewed lengths, including an empty sequence
+        seqlens = [1, 37, 0, 5, 128]
+        cu_seqlens = torch.tensor([0] + seqlens).cumsum(0).to(torch.int32)
+        total = int(cu_seqlens[-1])
+        for num_head, num_head_k in [(8, 8), (8, 2), (8, 1)]:
+            for is_causal in [True, False]:
+                for softmax_scale in [None, 0.2]:
+                    query = torch.randn(total, num_head, head_size)
+                    key = torch.randn(total, num_head_k, head_size)
+                    value = torch.randn(total, num_head_k, head_size)
+                    out = torch.empty_like(query)
+                    ipex.llm.functional.varlen_attention(
+                        query,
+                        key,
+                        value,
+                        out,
+                        cu_seqlens,
+                        cu_seqlens,
+                        max(seqlens),
+                        max(seqlens),
+                        0.0,
+                        softmax_scale,
+                        False,
+                        is_causal,
+                        False,
+                        None,
+                    )
+                    scale = (
+                        softmax_scale
+                        if softmax_scale is not None
+                        else 1.0 / math.sqrt(head_size)
+                    )
+                    n_rep = num_head // num_head_k
+                    for i in range(len(seqlens)):
+                        start, end = int(cu_seqlens[i]), int(cu_seqlens[i + 1])
+                        if start == end:
+                            continue
+                        q = query[start:end].transpose(0, 1)
+                        k = key[start:end].repeat_interleave(n_rep, 1).transpose(0, 1)
+                        v = value[start:end].repeat_interleave(n_rep, 1).transpose(0, 1)
+                        scores = q @ k.transpose(-1, -2) * scale
+                        if is_causal:
+                            mask = torch.ones(end - start, end - start).tril() == 0
+                            scores = scores.masked_fill(mask, float("-inf"))
+                        ref_out = (scores.softmax(-1) @ v).transpose(0, 1)
+                        self.assertEqual(out[start:end], ref_out, atol=1e-5, rtol=1e-5)
+
 
 if __name__ == "__main__":
     test = unittest.main()
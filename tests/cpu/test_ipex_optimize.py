@@ -392,6 +392,65 @@ class TestOptimizeCases(TestCase):
                 M.embeddingbag.weight.data_ptr() == opt_M.embeddingbag.weight.data_ptr()
             )
 
+    def test_optimize_share_weights_behavior_eval_mode(self):
+        M_ori = TestModule().eval()
+        options = itertools.product([torch.float32, torch.bfloat16], ["O0", "O1"])
+        for dtype, level in options:
+            M = copy.deepcopy(M_ori)
+            ref_state = {k: v.clone() for k, v in M.state_dict().items()}
+            with torch.no_grad():
+                ref_out = M(*M.input)
+            opt_M = ipex.optimize(M, dtype=dtype, level=level, share_weights=True)
+            # the original model is untouched
+            self.assertFalse(isinstance(M.linear, _IPEXLinear))
+            for k, v in M.state_dict().items():
+                self.assertEqual(v, ref_state[k])
+                self.assertEqual(v.dtype, ref_state[k].dtype)
+            if level == "O1":
+                self.assertTrue(isinstance(opt_M.linear, _IPEXLinear))
+                self.assertTrue(
+                    M.linear.weight.data_ptr() != opt_M.linear.weight.data_ptr()
+                )
+            if dtype == torch.float32:
+                # the unconverted weights are shared
+                self.assertTrue(
+                    M.embeddingbag.weight.data_ptr()
+                    == opt_M.embeddingbag.weight.data_ptr()
+                )
+            if dtype == torch.float32 and level == "O0":
+                self.assertTrue(opt_M.linear.weight is not M.linear.weight)
+                self.assertTrue(
+                    M.linear.weight.data_ptr() == opt_M.linear.weight.data_ptr()
+                )
+            with torch.no_grad(), torch.cpu.amp.autocast(
+                enabled=(dtype == torch.bfloat16)
+            ):
+                out = opt_M(*M.input)
+            if dtype == torch.bfloat16:
+                self.assertEqual(out.float(), ref_out, atol=1e-1, rtol=1e-2)
+            else:
+                self.assertEqual(out, ref_out)
+            with torch.no_grad():
+                self.assertEqual(M(*M.input), ref_out)
+
+    def test_optimize_share_weights_tied(self):
+        class TiedModel(torch.nn.Module):
+            def __init__(self):
+                super(TiedModel, self).__init__()
+                self.embedding = torch.nn.Embedding(10, 16)
+                self.linear = torch.nn.Linear(16, 10, bias=False)
+                self.linear.weight = self.embedding.weight
+
+            def forward(self, x):
+                return self.linear(self.embedding(x))
+
+        M = TiedModel().eval()
+        opt_M = ipex.optimize(M, share_weights=True)
+        self.assertTrue(opt_M.linear.weight is opt_M.embedding.weight)
+        self.assertTrue(opt_M.linear.weight is not M.linear.weight)
+        x = torch.arange(10)
+        self.assertEqual(opt_M(x), M(x))
+
     def test_optimize_inplace_behavior_training_mode_with_optimizer(self):
         M_ori = TestModule()
         options = itertools.product([torch.float32, torch.bfloat16], ["O0", "O1"])
@@ -506,6 +565,43 @@ class TestOptimizeCases(TestCase):
             if isinstance(M, TwoLayerMLP):
                 self.assertEqual(opt_M.l2.batch_size_collapsed, 3)
 
+    def test_linear_autotune(self):
+        import json
+        import tempfile
+        import unittest.mock
+        from intel_extension_for_pytorch.cpu._linear_autotune import _get_m_bucket
+
+        M = OneLayerMLP().eval()
+        ref = M(M.input1)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_file = os.path.join(tmp, "linear_autotune.json")
+            try:
+                ipex.cpu.enable_linear_autotune(cache_file, m_buckets=[1, 2, 64])
+                opt_M = ipex.optimize(copy.deepcopy(M), sample_input=M.input1)
+                with open(cache_file) as f:
+                    table = json.load(f)
+                self.assertEqual(len(table), 1)
+                decisions = list(table.values())[0]
+                self.assertEqual(sorted(decisions.keys()), ["1", "2", "64"])
+                # the layer runs the kernel chosen for its M bucket
+                self.assertEqual(
+                    opt_M.l1.use_dnnl,
+                    decisions[str(_get_m_bucket(2, [1, 2, 64]))] == "dnnl",
+                )
+                with torch.no_grad():
+                    self.assertEqual(opt_M(M.input1), ref)
+                # the persisted decisions are reused without benchmarking
+                ipex.cpu.enable_linear_autotune(cache_file, m_buckets=[1, 2, 64])
+                with unittest.mock.patch(
+                    "intel_extension_for_pytorch.cpu._linear_autotune._benchmark",
+                    side_effect=AssertionError("the decisions are not reused"),
+                ):
+                    opt_M = ipex.optimize(copy.deepcopy(M), sample_input=M.input1)
+                with torch.no_grad():
+                    self.assertEqual(opt_M(M.input1), ref)
+            finally:
+                ipex.cpu.disable_linear_autotune()
+
     def test_traced_model_serialization(self):
         for module in [ConvBatchNorm, OneLayerMLP, ConvTranspose2d]:
             for dtype in [torch.float, torch.bfloat16]:
@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 import torch
 import intel_extension_for_pytorch as ipex
 import intel_extension_for_pytorch._C as core
@@ -6,6 +7,7 @@ import sys
 import subprocess
 import os
 import copy
+import json
 import re
 import tempfile
 from intel_extension_for_pytorch.quantization import prepare, convert
@@ -21,7 +23,10 @@ except ImportError:
     )
     import transformers
     from transformers import AutoConfig
-from intel_extension_for_pytorch.cpu._auto_kernel_selection import _disable_tpp
+from intel_extension_for_pytorch.cpu._auto_kernel_selection import (
+    _enable_tpp,
+    _disable_tpp,
+)
 
 from common_utils import TestCase
 
@@ -464,6 +469,77 @@ class OptimizeTransformersTester(TestCase):
                 # the optimized model is ipex_m.trace_graph
                 ipex_m.trace_graph(*example_inputs)
 
+    def test_weight_only_quant_gptq_lazy_checkpoint(self):
+        # Test loading the sharded checkpoint files by path
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/gptj", return_dict=False
+        )
+        m = transformers.models.gptj.modeling_gptj.GPTJForCausalLM(config).eval()
+        with tempfile.TemporaryDirectory() as work_dir:
+            # Generate dummy checkpoint
+            state_dict = m.state_dict()
+            linear_keys = []
+            for k, v in state_dict.items():
+                if any(
+                    k.endswith(suffix)
+                    for suffix in ["proj.weight", "fc_in.weight", "fc_out.weight"]
+                ):
+                    linear_keys.append(k[:-7])
+            for k in linear_keys:
+                N = state_dict[k + ".weight"].shape[0]
+                K = state_dict[k + ".weight"].shape[1]
+                del state_dict[k + ".weight"]
+                state_dict[k + ".packed_weight"] = torch.randint(
+                    -(2**31), 2**31 - 1, (N, K // 8), dtype=torch.int32
+                )
+                state_dict[k + ".scale"] = torch.ones((N, 1), dtype=torch.half) * 0.5
+                state_dict[k + ".packed_zp"] = torch.ones((N, 1), dtype=torch.int32) * 4
+            # two shards and the index file
+            keys = list(state_dict.keys())
+            weight_map = {}
+            for i, shard_keys in enumerate([keys[::2], keys[1::2]]):
+                file_name = f"checkpoint-{i}.pt"
+                torch.save(
+                    {k: state_dict[k] for k in shard_keys}, work_dir + "/" + file_name
+                )
+                weight_map.update({k: file_name for k in shard_keys})
+            with open(work_dir + "/checkpoint.index.json", "w") as f:
+                json.dump({"weight_map": weight_map}, f)
+
+            config_dict = (
+                ipex.utils.weight_only_quantization._legacy_lowp_checkpoint_config()
+            )
+            qconfig = ipex.quantization.get_weight_only_quant_qconfig_mapping(
+                lowp_mode=ipex.quantization.WoqLowpMode.INT8
+            )
+            ref_m = ipex.llm.optimize(
+                copy.deepcopy(m),
+                dtype=torch.float,
+                quantization_config=qconfig,
+                low_precision_checkpoint=(state_dict, config_dict),
+                deployment_mode=True,
+                inplace=True,
+            )
+            # the float weights of the linear layers are not needed
+            lazy_m = copy.deepcopy(m)
+            for k in linear_keys:
+                linear = lazy_m.get_submodule(k)
+                linear.weight = torch.nn.Parameter(linear.weight.to("meta"))
+            lazy_m = ipex.llm.optimize(
+                lazy_m,
+                dtype=torch.float,
+                quantization_config=qconfig,
+                low_precision_checkpoint=(work_dir, config_dict),
+                deployment_mode=True,
+                inplace=True,
+            )
+            with torch.no_grad():
+                example_inputs = _get_gptj_example_inputs()
+                self.assertEqual(
+                    lazy_m.trace_graph(*example_inputs),
+                    ref_m.trace_graph(*example_inputs),
+                )
+
     def test_generate_functions(self):
         config = AutoConfig.from_pretrained(
             f"{curpath}/hf_configs/gptj", return_dict=False
@@ -515,6 +591,155 @@ class OptimizeTransformersTester(TestCase):
                     ref_res = ref_m.generate(input_ids, **generate_kwargs)
                     self.assertEqual(ipex_res, ref_res)
 
+    def test_beam_search_encoder_decoder(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/t5", return_dict=False
+        )
+        # small kv cache chunks, so that the self attention buffers are grown
+        # beyond the cross attention ones during the generation
+        config.kv_cache_chunk_size = 4
+        m = transformers.models.t5.modeling_t5.T5ForConditionalGeneration(config).eval()
+        ref_m = copy.deepcopy(m)
+        input_ids = torch.randint(0, 1000, (2, 8))
+        generate_kwargs = dict(
+            do_sample=False, num_beams=4, max_new_tokens=16, min_new_tokens=16
+        )
+        for deployment_mode in [False, True]:
+            ipex_m = ipex.llm.optimize(
+                copy.deepcopy(m),
+                dtype=torch.float,
+                deployment_mode=deployment_mode,
+            )
+            with torch.no_grad():
+                ipex_res = ipex_m.generate(input_ids, **generate_kwargs)
+                ref_res = ref_m.generate(input_ids, **generate_kwargs)
+            self.assertEqual(ipex_res, ref_res)
+
+    def test_generate_token_buffer_and_fused_sample(self):
+        from intel_extension_for_pytorch.transformers.generation.utils import (
+            _TokenBuffer,
+            _get_fused_logits_warper,
+            _fused_sample,
+        )
+        from transformers.generation.logits_process import (
+            LogitsProcessorList,
+            TemperatureLogitsWarper,
+            TopKLogitsWarper,
+            TopPLogitsWarper,
+            TypicalLogitsWarper,
+        )
+
+        # appending and growing
+        prompt = torch.arange(6).view(2, 3)
+        token_buffer = _TokenBuffer(prompt, max_length=4)
+        ref = prompt
+        for i in range(3):
+            next_tokens = torch.tensor([10 + i, 20 + i])
+            ref = torch.cat([ref, next_tokens[:, None]], dim=-1)
+            self.assertEqual(token_buffer.append(next_tokens), ref)
+            self.assertTrue(token_buffer.input_ids[:, -1:].is_contiguous())
+        # reordering the beams
+        token_buffer = _TokenBuffer(prompt, max_length=5, num_buffers=2)
+        ref = prompt
+        for beam_idx in [torch.tensor([1, 1]), torch.tensor([1, 0])]:
+            next_tokens = torch.tensor([7, 8])
+            ref = torch.cat([ref[beam_idx, :], next_tokens[:, None]], dim=-1)
+            self.assertEqual(token_buffer.append(next_tokens, beam_idx), ref)
+
+        # only temperature, top-k and top-p are fused
+        self.assertEqual(
+            _get_fused_logits_warper(
+                LogitsProcessorList(
+                    [
+                        TemperatureLogitsWarper(0.5),
+                        TopKLogitsWarper(10),
+                        TopPLogitsWarper(0.9),
+                    ]
+                )
+            ),
+            (0.5, 10, 0.9, 1),
+        )
+        self.assertIsNone(
+            _get_fused_logits_warper(LogitsProcessorList([TypicalLogitsWarper(0.9)]))
+        )
+        scores = torch.randn(4, 1000)
+        for warpers in [
+            [TemperatureLogitsWarper(1e-5)],
+            [TopKLogitsWarper(1)],
+            [TemperatureLogitsWarper(0.7), TopPLogitsWarper(1e-6)],
+        ]:
+            fused_logits_warper = _get_fused_logits_warper(LogitsProcessorList(warpers))
+            self.assertEqual(
+                _fused_sample(scores, fused_logits_warper), scores.argmax(dim=-1)
+            )
+        # the tokens are sampled from the top-k/top-p ones only
+        fused_logits_warper = _get_fused_logits_warper(
+            LogitsProcessorList([TopKLogitsWarper(50), TopPLogitsWarper(0.5)])
+        )
+        warped = LogitsProcessorList([TopKLogitsWarper(50), TopPLogitsWarper(0.5)])(
+            None, scores.clone()
+        )
+        for _ in range(10):
+            next_tokens = _fused_sample(scores, fused_logits_warper)
+            self.assertTrue(
+                torch.isfinite(warped.gather(-1, next_tokens[:, None])).all()
+            )
+
+    def test_generation_profiler(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/gptj", return_dict=False
+        )
+        input_ids = torch.ones(8).unsqueeze(0).to(torch.long)
+        generate_kwargs = dict(do_sample=False, max_new_tokens=3, min_new_tokens=3)
+        for deployment_mode in [False, True]:
+            m = transformers.models.gptj.modeling_gptj.GPTJForCausalLM(config).eval()
+            with unittest.mock.patch.dict(os.environ, {"IPEX_LLM_PROFILE_LAYERS": "1"}):
+                ipex_m = ipex.llm.optimize(
+                    m, dtype=torch.float, deployment_mode=deployment_mode
+                )
+            with torch.inference_mode(), torch.no_grad():
+                ref_res = ipex_m.generate(input_ids, **generate_kwargs)
+                # the steps only, without the overhead of torch.profiler
+                with ipex.llm.GenerationProfiler(ipex_m) as prof:
+                    res = ipex_m.generate(input_ids, **generate_kwargs)
+                self.assertEqual(res, ref_res)
+                histograms = prof.summary()["histograms"]
+                self.assertEqual(histograms["decode_latency"]["count"], 2)
+                self.assertFalse("decode_layer_latency.0" in histograms)
+                with ipex.llm.GenerationProfiler(ipex_m, record_layers=True) as prof:
+                    res = ipex_m.generate(input_ids, **generate_kwargs)
+            self.assertEqual(res, ref_res)
+            # the hooks are removed out of the context
+            self.assertFalse("generate" in ipex_m.__dict__)
+            summary = prof.summary()
+            self.assertEqual(summary["counters"]["prefill_steps"], 1)
+            self.assertEqual(summary["counters"]["decode_steps"], 2)
+            self.assertGreater(summary["counters"]["weight_bytes"], 0)
+            # the keys and values of the 10 tokens in fp32
+            self.assertEqual(
+                summary["counters"]["kv_cache_bytes"],
+                config.n_layer * 10 * config.n_embd * 4 * 2,
+            )
+            histograms = summary["histograms"]
+            self.assertEqual(histograms["decode_latency"]["count"], 2)
+            self.assertEqual(histograms["decode_latency"]["buckets"][-1][1], 2)
+            self.assertEqual(histograms["decode_bandwidth"]["count"], 2)
+            for kind in ["prefill", "decode"]:
+                for i in range(config.n_layer):
+                    for name in ["layer", "attention", "mlp"]:
+                        self.assertTrue(f"{kind}_{name}_latency.{i}" in histograms)
+                self.assertLessEqual(
+                    histograms[f"{kind}_layer_latency.0"]["sum"],
+                    histograms[f"{kind}_latency"]["sum"],
+                )
+            with tempfile.TemporaryDirectory() as work_dir:
+                path = os.path.join(work_dir, "trace.json")
+                prof.export_chrome_trace(path)
+                with open(path) as f:
+                    names = [e.get("name", "") for e in json.load(f)["traceEvents"]]
+                self.assertTrue("ipex::decode" in names)
+                self.assertTrue("ipex::decoder_layer.0" in names)
+
     def test_cache_weight_for_large_batch(self):
         config = AutoConfig.from_pretrained(
             f"{curpath}/hf_configs/gptj", return_dict=False
@@ -547,6 +772,163 @@ class OptimizeTransformersTester(TestCase):
             assert all(l.weight_for_large_batch is not None for l in linear_list)
             self.assertEqual(y[0], y_ref[0])
 
+    def test_cache_weight_for_large_batch_autotune(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/gptj", return_dict=False
+        )
+        model = transformers.models.gptj.modeling_gptj.GPTJForCausalLM(config).eval()
+        model_ref = ipex.llm.optimize(
+            copy.deepcopy(model),
+            dtype=torch.bfloat16,
+            deployment_mode=True,
+            cache_weight_for_large_batch=True,
+        )
+        try:
+            ipex.cpu.enable_linear_autotune(m_buckets=[1, 64, 512])
+            model = ipex.llm.optimize(
+                model,
+                dtype=torch.bfloat16,
+                deployment_mode=True,
+                cache_weight_for_large_batch=True,
+            )
+        finally:
+            ipex.cpu.disable_linear_autotune()
+        linear = model.transformer.h[0].attn.out_proj
+        self.assertTrue(
+            linear.large_batch_min_m in [1, 64, 512, torch.iinfo(torch.int64).max]
+        )
+        with torch.no_grad(), torch.cpu.amp.autocast(enabled=True):
+            for batch_size in [1, 512]:
+                example_inputs = _get_gptj_example_inputs(batch_size=batch_size)
+                y = model(*example_inputs)
+                y_ref = model_ref(*example_inputs)
+                self.assertEqual(y[0], y_ref[0])
+
+    def test_assisted_decoding(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/llama", return_dict=False
+        )
+        config.num_hidden_layers = 2
+        m = transformers.models.llama.modeling_llama.LlamaForCausalLM(config).eval()
+        draft_config = copy.deepcopy(config)
+        draft_config.num_hidden_layers = 1
+        draft_m = transformers.models.llama.modeling_llama.LlamaForCausalLM(
+            draft_config
+        ).eval()
+        # a repeated prompt gives the prompt lookup some matches
+        input_ids = torch.randint(0, 1000, (12,)).repeat(2).unsqueeze(0)
+        generate_kwargs = dict(do_sample=False, max_new_tokens=16, min_new_tokens=16)
+        for deployment_mode in [False, True]:
+            ipex_m = ipex.llm.optimize(
+                copy.deepcopy(m), dtype=torch.float, deployment_mode=deployment_mode
+            )
+            ipex_draft_m = ipex.llm.optimize(
+                copy.deepcopy(draft_m),
+                dtype=torch.float,
+                deployment_mode=deployment_mode,
+            )
+            with torch.no_grad():
+                ref_res = ipex_m.generate(input_ids, **generate_kwargs)
+                # the verified tokens are the greedy ones whatever the candidates are
+                prompt_lookup_res = ipex_m.generate(
+                    input_ids, prompt_lookup_num_tokens=4, **generate_kwargs
+                )
+                assisted_res = ipex_m.generate(
+                    input_ids, assistant_model=ipex_draft_m, **generate_kwargs
+                )
+                hf_draft_res = ipex_m.generate(
+                    input_ids, assistant_model=draft_m, **generate_kwargs
+                )
+            self.assertEqual(prompt_lookup_res, ref_res)
+            self.assertEqual(assisted_res, ref_res)
+            self.assertEqual(hf_draft_res, ref_res)
+
+    def test_artifact_cache(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/llama", return_dict=False
+        )
+        config.num_hidden_layers = 2
+        m = transformers.models.llama.modeling_llama.LlamaForCausalLM(config).eval()
+        input_ids = torch.randint(0, 1000, (1, 12))
+        generate_kwargs = dict(do_sample=False, max_new_tokens=8, min_new_tokens=8)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # an entry of another IPEX version is evicted
+            stale_dir = os.path.join(cache_dir, "stale")
+            os.makedirs(stale_dir)
+            with open(os.path.join(stale_dir, "meta.json"), "w") as f:
+                f.write('{"ipex_version": "0.0"}')
+            ref_m = ipex.llm.optimize(
+                copy.deepcopy(m), dtype=torch.float, artifact_cache_dir=cache_dir
+            )
+            self.assertFalse(os.path.exists(stale_dir))
+            entries = os.listdir(cache_dir)
+            self.assertEqual(len(entries), 1)
+            with torch.no_grad():
+                ref_res = ref_m.generate(input_ids, **generate_kwargs)
+            # the cached graphs are loaded without lowering the model
+            with unittest.mock.patch(
+                "intel_extension_for_pytorch.transformers.optimize.model_convert_lowering",
+                side_effect=AssertionError("the artifact cache is missed"),
+            ):
+                cached_m = ipex.llm.optimize(
+                    copy.deepcopy(m), dtype=torch.float, artifact_cache_dir=cache_dir
+                )
+            with torch.no_grad():
+                cached_res = cached_m.generate(input_ids, **generate_kwargs)
+            self.assertEqual(cached_res, ref_res)
+            # a corrupted entry is removed and rebuilt
+            with open(os.path.join(cache_dir, entries[0], "model.pt"), "r+b") as f:
+                f.truncate(16)
+            rebuilt_m = ipex.llm.optimize(
+                copy.deepcopy(m), dtype=torch.float, artifact_cache_dir=cache_dir
+            )
+            with torch.no_grad():
+                rebuilt_res = rebuilt_m.generate(input_ids, **generate_kwargs)
+            self.assertEqual(rebuilt_res, ref_res)
+            self.assertGreater(
+                os.path.getsize(os.path.join(cache_dir, entries[0], "model.pt")), 16
+            )
+            # another dtype is another entry
+            ipex.llm.optimize(
+                copy.deepcopy(m), dtype=torch.bfloat16, artifact_cache_dir=cache_dir
+            )
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_artifact_cache_key(self):
+        from intel_extension_for_pytorch.transformers.artifact_cache import (
+            _get_artifact_cache_key,
+        )
+
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/llama", return_dict=False
+        )
+        config.num_hidden_layers = 2
+        m = transformers.models.llama.modeling_llama.LlamaForCausalLM(config).eval()
+        ref_key = _get_artifact_cache_key(m, torch.float)
+        self.assertEqual(
+            _get_artifact_cache_key(copy.deepcopy(m), torch.float), ref_key
+        )
+        # any element of the weights changes the key
+        m2 = copy.deepcopy(m)
+        with torch.no_grad():
+            m2.model.layers[1].mlp.down_proj.weight[-1, -1] += 1
+        self.assertNotEqual(_get_artifact_cache_key(m2, torch.float), ref_key)
+        # so do the settings changing the graphs
+        with unittest.mock.patch.dict(os.environ, {"LM_HEAD_TOPK": "50"}):
+            self.assertNotEqual(_get_artifact_cache_key(m, torch.float), ref_key)
+        with unittest.mock.patch.dict(os.environ, {"IPEX_LLM_PROFILE_LAYERS": "1"}):
+            self.assertNotEqual(_get_artifact_cache_key(m, torch.float), ref_key)
+        _enable_tpp()
+        try:
+            self.assertNotEqual(_get_artifact_cache_key(m, torch.float), ref_key)
+        finally:
+            _disable_tpp()
+        ipex.cpu.enable_linear_autotune()
+        try:
+            self.assertNotEqual(_get_artifact_cache_key(m, torch.float), ref_key)
+        finally:
+            ipex.cpu.disable_linear_autotune()
+
 
 if __name__ == "__main__":
     test = unittest.main()
@@ -208,5 +208,104 @@ class TensorParallelTester(TestCase):
         self.tensor_parallel_with_optimize_transformers(model)
 
 
+class VocabParallelTopkTester(TestCase):
+    def test_merge_vocab_topk(self):
+        from intel_extension_for_pytorch.transformers.tensor_parallel import (
+            _pack_vocab_topk,
+            _merge_vocab_topk,
+            _unpack_vocab_topk,
+        )
+
+        world_size, vocab_size, k = 2, 1000, 8
+        logits = torch.randn(3, 5, vocab_size)
+        cols_per_rank = [0, 500, vocab_size]
+        # the concatenation along the last dim, as ipex_comm.allgather
+        gathered = torch.cat(
+            [
+                _pack_vocab_topk(
+                    logits[..., cols_per_rank[i] : cols_per_rank[i + 1]],
+                    k,
+                    cols_per_rank[i],
+                )
+                for i in range(world_size)
+            ],
+            dim=-1,
+        )
+        out = _merge_vocab_topk(gathered, k, world_size)
+        # only the top-k logits and their token ids are returned
+        self.assertEqual(out.shape, (3, 5, 2 * k))
+        values, indices = _unpack_vocab_topk(out)
+        ref_values, ref_indices = torch.topk(logits, k, dim=-1)
+        self.assertEqual(values, ref_values)
+        self.assertEqual(indices, ref_indices)
+
+    def test_lm_head_topk_generation_config(self):
+        from transformers.generation.logits_process import (
+            LogitsProcessorList,
+            RepetitionPenaltyLogitsProcessor,
+            TopKLogitsWarper,
+        )
+        from intel_extension_for_pytorch.transformers.generation.utils import (
+            _with_lm_head_topk,
+        )
+
+        class Model(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.lm_head = TensorParallelLMhead(
+                    torch.nn.Linear(16, 100, bias=False),
+                    1,
+                    1,
+                    16,
+                    0,
+                    2,
+                    shard_by_col=True,
+                    topk=8,
+                )
+                self.generation_config = transformers.GenerationConfig()
+
+        def generate(
+            self,
+            input_ids,
+            logits_processor=None,
+            logits_warper=None,
+            output_scores=None,
+            lm_head_topk=False,
+            **model_kwargs,
+        ):
+            return lm_head_topk, self.lm_head.return_topk
+
+        model = Model()
+        # the LM head returns the full logits outside of the generation
+        self.assertFalse(model.lm_head.return_topk)
+        greedy = _with_lm_head_topk(do_sample=False)(generate)
+        sample = _with_lm_head_topk(do_sample=True)(generate)
+        beam = _with_lm_head_topk()(lambda self, input_ids: self.lm_head.return_topk)
+        input_ids = torch.zeros(1, 1, dtype=torch.long)
+        no_processor = LogitsProcessorList()
+        penalty = LogitsProcessorList([RepetitionPenaltyLogitsProcessor(1.2)])
+        for fn, kwargs, expected in [
+            (greedy, {"logits_processor": no_processor}, True),
+            (greedy, {"logits_processor": penalty}, False),
+            (greedy, {"logits_processor": no_processor, "output_scores": True}, False),
+            (
+                sample,
+                {"logits_warper": LogitsProcessorList([TopKLogitsWarper(4)])},
+                True,
+            ),
+            (
+                sample,
+                {"logits_warper": LogitsProcessorList([TopKLogitsWarper(16)])},
+                False,
+            ),
+            (sample, {"logits_warper": LogitsProcessorList()}, False),
+        ]:
+            self.assertEqual(fn(model, input_ids, **kwargs), (expected, expected))
+            # the LM head returns the full logits again after the generation
+            self.assertFalse(model.lm_head.return_topk)
+        self.assertFalse(beam(model, input_ids))
+        self.assertFalse(model.lm_head.return_topk)
+
+
 if __name__ == "__main__":
     test = unittest.main()
@@ -5,8 +5,13 @@ from intel_extension_for_pytorch.cpu.launch import (
     CPUPoolList,
     Launcher,
     DistributedTrainingLauncher,
+    MultiInstancesLauncher,
 )
+import intel_extension_for_pytorch as ipex
+import torch
 import os
+import copy
+import tempfile
 from os.path import expanduser
 import glob
 import subprocess
@@ -714,6 +719,75 @@ class TestLauncher(TestCase):
         }
         self.verify_affinity(cpuinfo.pools_ondemand, ground_truth)
 
+    def test_share_tensor_weights_environ(self):
+        num_nodes = 2
+        n_phycores_per_node = 28
+        lscpu_txt = construct_numa_config(
+            num_nodes, n_phycores_per_node, enable_ht=True, numa_mode=1
+        )
+        launcher = MultiInstancesLauncher(lscpu_txt=lscpu_txt)
+        launcher.cpuinfo.gen_pools_ondemand(ninstances=4)
+        environ = launcher.get_share_tensor_weights_environ(
+            launcher.cpuinfo.pools_ondemand, [0, 1, 2, 3], "/dev/shm/ipex"
+        )
+        self.assertEqual(
+            [environ[i]["IPEX_SHARED_TENSOR_WEIGHTS_DIR"] for i in range(4)],
+            ["/dev/shm/ipex/node_0"] * 2 + ["/dev/shm/ipex/node_1"] * 2,
+        )
+        self.assertEqual(
+            [environ[i]["IPEX_SHARED_TENSOR_WEIGHTS_LEADER"] for i in range(4)],
+            ["1", "0", "1", "0"],
+        )
+        # the first launched instance on the node is the leader
+        environ = launcher.get_share_tensor_weights_environ(
+            launcher.cpuinfo.pools_ondemand, [1, 3], "/dev/shm/ipex"
+        )
+        self.assertEqual(environ[1]["IPEX_SHARED_TENSOR_WEIGHTS_LEADER"], "1")
+        self.assertEqual(environ[3]["IPEX_SHARED_TENSOR_WEIGHTS_LEADER"], "1")
+
+    def test_share_tensor_weights(self):
+        class M(torch.nn.Module):
+            def __init__(self):
+                super(M, self).__init__()
+                self.linear = torch.nn.Linear(64, 64)
+                self.embedding = torch.nn.Embedding(64, 64)
+                self.linear.weight = self.embedding.weight
+                self.norm = torch.nn.BatchNorm1d(64)
+
+            def forward(self, x):
+                return self.norm(self.linear(self.embedding(x)))
+
+        m = M().eval()
+        x = torch.arange(64)
+        # not launched with --share-tensor-weights
+        self.assertTrue(ipex.cpu.share_tensor_weights(m) is m)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["IPEX_SHARED_TENSOR_WEIGHTS_DIR"] = tmp
+            try:
+                models = []
+                for leader in ["1", "0"]:
+                    os.environ["IPEX_SHARED_TENSOR_WEIGHTS_LEADER"] = leader
+                    model = copy.deepcopy(m)
+                    models.append(ipex.cpu.share_tensor_weights(model))
+                self.assertTrue(os.path.exists(os.path.join(tmp, "model.pt")))
+                for model in models:
+                    self.assertTrue(model.linear.weight is model.embedding.weight)
+                    self.assertNotEqual(
+                        model.linear.weight.data_ptr(), m.linear.weight.data_ptr()
+                    )
+                    self.assertEqual(model(x), m(x))
+
+                # a different model
+                os.environ["IPEX_SHARED_TENSOR_WEIGHTS_LEADER"] = "0"
+                with self.assertRaises(RuntimeError):
+                    ipex.cpu.share_tensor_weights(torch.nn.Linear(3, 3))
+                with self.assertRaises(RuntimeError):
+                    ipex.cpu.share_tensor_weights(m, name="missing", timeout=0.5)
+            finally:
+                del os.environ["IPEX_SHARED_TENSOR_WEIGHTS_DIR"]
+                del os.environ["IPEX_SHARED_TENSOR_WEIGHTS_LEADER"]
+
 
 if __name__ == "__main__":
     test = unittest.main()
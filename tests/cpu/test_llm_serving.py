@@ -0,0 +1,229 @@
+import unittest
+import torch
+import intel_extension_for_pytorch as ipex
+import sys
+import subprocess
+import os
+import copy
+
+try:
+    import transformers
+    from transformers import AutoConfig
+except ImportError:
+    subprocess.check_call(
+        [sys.executable, "-m", "pip", "install", "transformers==4.38.1"]
+    )
+    import transformers
+    from transformers import AutoConfig
+
+from common_utils import TestCase
+from intel_extension_for_pytorch.llm.serving import (
+    BlockSpaceManager,
+    SamplingParams,
+    Scheduler,
+)
+from intel_extension_for_pytorch.llm.serving.scheduler import Sequence
+
+torch.manual_seed(128)
+
+curpath = os.path.abspath(os.path.dirname(__file__))
+
+
+class LLMServingTester(TestCase):
+    def _tiny_llama(self):
+        config = AutoConfig.from_pretrained(
+            f"{curpath}/hf_configs/llama", return_dict=False
+        )
+        config.hidden_size = 256
+        config.intermediate_size = 512
+        config.num_attention_heads = 8
+        config.num_key_value_heads = 4
+        config.num_hidden_layers = 2
+        return transformers.models.llama.modeling_llama.LlamaForCausalLM(config).eval()
+
+    def test_block_space_manager(self):
+        block_manager = BlockSpaceManager(num_blocks=4, block_size=4, watermark=0)
+        seq = Sequence(0, "0", list(range(5)), SamplingParams())
+        self.assertTrue(block_manager.can_allocate(seq))
+        block_manager.allocate(seq)
+        self.assertEqual(len(block_manager.get_block_table(seq)), 2)
+        self.assertEqual(block_manager.get_num_free_blocks(), 2)
+        block_table = block_manager.get_block_table(seq)
+        self.assertEqual(block_manager.get_slot(seq, 4), block_table[1] * 4)
+        for token in range(3):
+            seq.append_token_id(token)
+            self.assertTrue(block_manager.can_append_slot(seq))
+            block_manager.append_slot(seq)
+        self.assertEqual(len(block_manager.get_block_table(seq)), 2)
+        seq.append_token_id(0)
+        block_manager.append_slot(seq)
+        self.assertEqual(len(block_manager.get_block_table(seq)), 3)
+        block_manager.free(seq)
+        self.assertEqual(block_manager.get_num_free_blocks(), 4)
+
+    def test_prefix_caching_block_sharing(self):
+        block_manager = BlockSpaceManager(
+            num_blocks=8, block_size=4, watermark=0, enable_prefix_caching=True
+        )
+        prefix = list(range(8))
+        seq0 = Sequence(0, "0", prefix + [100, 101], SamplingParams())
+        seq1 = Sequence(1, "1", prefix + [200], SamplingParams())
+        block_manager.allocate(seq0)
+        self.assertEqual(seq0.num_cached_tokens, 0)
+        block_manager.allocate(seq1)
+        self.assertEqual(seq1.num_cached_tokens, 8)
+        table0 = block_manager.get_block_table(seq0)
+        table1 = block_manager.get_block_table(seq1)
+        self.assertEqual(table0[:2], table1[:2])
+        self.assertNotEqual(table0[2], table1[2])
+        self.assertEqual(block_manager.get_num_free_blocks(), 4)
+        # the cached blocks survive their sequences until they are evicted
+        block_manager.free(seq0)
+        block_manager.free(seq1)
+        self.assertEqual(block_manager.get_num_free_blocks(), 8)
+        seq2 = Sequence(2, "2", prefix, SamplingParams())
+        block_manager.allocate(seq2)
+        # the whole prompt is cached, the last token is recomputed in a private copy
+        self.assertEqual(seq2.num_cached_tokens, 7)
+        self.assertEqual(block_manager.get_pending_copies(), [])
+        seq3 = Sequence(3, "3", prefix, SamplingParams())
+        block_manager.allocate(seq3)
+        table2 = block_manager.get_block_table(seq2)
+        table3 = block_manager.get_block_table(seq3)
+        self.assertEqual(table2[0], table3[0])
+        self.assertEqual(block_manager.get_pending_copies(), [(table2[1], table3[1])])
+        self.assertEqual(block_manager.get_prefix_cache_hit_rate(), 22 / 35)
+
+    def test_scheduler_preemption(self):
+        block_manager = BlockSpaceManager(num_blocks=3, block_size=2, watermark=0)
+        scheduler = Scheduler(block_manager, max_num_seqs=8, max_num_batched_tokens=64)
+        seqs = [
+            Sequence(i, str(i), [1, 2], SamplingParams(max_new_tokens=8))
+            for i in range(3)
+        ]
+        for seq in seqs:
+            scheduler.add_seq(seq)
+        output = scheduler.schedule()
+        self.assertEqual(output.prefill_seqs, seqs)
+        for seq in seqs:
+            seq.append_token_id(3)
+        # every sequence needs a new block, the pool is empty
+        output = scheduler.schedule()
+        self.assertEqual(output.preempted_seqs, [seqs[2], seqs[1]])
+        self.assertEqual(output.decode_seqs, [seqs[0]])
+        self.assertEqual(list(scheduler.waiting), [seqs[1], seqs[2]])
+        self.assertEqual(block_manager.get_num_free_blocks(), 1)
+
+    def test_scheduler_limits(self):
+        block_manager = BlockSpaceManager(num_blocks=64, block_size=4, watermark=0)
+        scheduler = Scheduler(block_manager, max_num_seqs=2, max_num_batched_tokens=8)
+        for i in range(3):
+            scheduler.add_seq(Sequence(i, str(i), [1] * 6, SamplingParams()))
+        # the token budget only admits one prompt per step
+        self.assertEqual(len(scheduler.schedule().prefill_seqs), 1)
+        self.assertEqual(len(scheduler.schedule().prefill_seqs), 1)
+        # max_num_seqs is reached, decode the running ones
+        output = scheduler.schedule()
+        self.assertEqual(len(output.prefill_seqs), 0)
+        self.assertEqual(len(output.decode_seqs), 2)
+
+    def test_engine_greedy(self):
+        model = self._tiny_llama()
+        ref_m = copy.deepcopy(model)
+        ipex_m = ipex.llm.optimize(model, dtype=torch.float, deployment_mode=False)
+        engine = ipex.llm.serving.Engine(ipex_m, num_blocks=16, block_size=16)
+        prompts = [torch.randint(0, 1000, (prompt_len,)) for prompt_len in [5, 17, 33]]
+        max_new_tokens = [4, 12, 8]
+        request_ids = [
+            engine.add_request(prompt, SamplingParams(max_new_tokens=max_new_tokens[i]))
+            for i, prompt in enumerate(prompts)
+        ]
+        outputs = {}
+        while engine.has_unfinished_requests():
+            for output in engine.step():
+                if output.finished:
+                    outputs[output.request_id] = output
+        self.assertEqual(engine.get_num_free_blocks(), 16)
+        with torch.no_grad():
+            for i, prompt in enumerate(prompts):
+                ref_res = ref_m.generate(
+                    prompt.unsqueeze(0),
+                    do_sample=False,
+                    max_new_tokens=max_new_tokens[i],
+                    min_new_tokens=max_new_tokens[i],
+                )
+                self.assertEqual(
+                    outputs[request_ids[i]].output_token_ids,
+                    ref_res[0, len(prompt) :].tolist(),
+                )
+        # the model is still usable out of the engine
+        with torch.no_grad():
+            ipex_res = ipex_m.generate(
+                prompts[0].unsqueeze(0), do_sample=False, max_new_tokens=4
+            )
+        self.assertEqual(
+            ipex_res[0, len(prompts[0]) :].tolist(),
+            outputs[request_ids[0]].output_token_ids,
+        )
+
+    def test_engine_preemption(self):
+        model = self._tiny_llama()
+        ipex_m = ipex.llm.optimize(model, dtype=torch.float, deployment_mode=False)
+        prompts = [torch.randint(0, 1000, (15,)) for _ in range(4)]
+        params = SamplingParams(max_new_tokens=8)
+        ref_engine = ipex.llm.serving.Engine(ipex_m, num_blocks=64, block_size=4)
+        ref_outputs = ref_engine.generate(prompts, params)
+        # 12 blocks are not enough to keep all the 4 sequences running
+        engine = ipex.llm.serving.Engine(ipex_m, num_blocks=12, block_size=4)
+        outputs = engine.generate(prompts, params)
+        for output, ref_output in zip(outputs, ref_outputs):
+            self.assertEqual(output.output_token_ids, ref_output.output_token_ids)
+        self.assertEqual(engine.get_num_free_blocks(), 12)
+
+    def test_engine_prefix_caching(self):
+        model = self._tiny_llama()
+        ipex_m = ipex.llm.optimize(model, dtype=torch.float, deployment_mode=False)
+        system_prompt = torch.randint(0, 1000, (40,))
+        prompts = [
+            torch.cat([system_prompt, torch.randint(0, 1000, (prompt_len,))])
+            for prompt_len in [0, 3, 9]
+        ]
+        params = SamplingParams(max_new_tokens=6)
+        ref_engine = ipex.llm.serving.Engine(ipex_m, num_blocks=64, block_size=8)
+        ref_outputs = [ref_engine.generate([prompt], params)[0] for prompt in prompts]
+        engine = ipex.llm.serving.Engine(
+            ipex_m, num_blocks=64, block_size=8, enable_prefix_caching=True
+        )
+        outputs = [engine.generate([prompt], params)[0] for prompt in prompts * 2]
+        for output, ref_output in zip(outputs, ref_outputs * 2):
+            self.assertEqual(output.output_token_ids, ref_output.output_token_ids)
+        self.assertTrue(engine.get_prefix_cache_hit_rate() > 0.5)
+        self.assertEqual(engine.get_num_free_blocks(), 64)
+
+    def test_engine_quantized_kv_cache(self):
+        model = self._tiny_llama()
+        ref_m = ipex.llm.optimize(model, dtype=torch.float, deployment_mode=False)
+        ipex_m = ipex.llm.optimize(
+            model, dtype=torch.float, deployment_mode=False, kv_cache_dtype="int8"
+        )
+        self.assertEqual(ipex_m.config.kv_cache_dtype, "int8")
+        self.assertFalse(hasattr(model.config, "kv_cache_dtype"))
+        prompts = [torch.randint(0, 1000, (prompt_len,)) for prompt_len in [5, 17]]
+        params = SamplingParams(max_new_tokens=4)
+        ref_engine = ipex.llm.serving.Engine(ref_m, num_blocks=16, block_size=8)
+        ref_outputs = ref_engine.generate(prompts, params)
+        engine = ipex.llm.serving.Engine(ipex_m, num_blocks=16, block_size=8)
+        outputs = engine.generate(prompts, params)
+        self.assertEqual(engine.kv_cache.key_caches[0].dtype, torch.int8)
+        self.assertTrue(
+            engine.kv_cache.get_cache_bytes() < ref_engine.kv_cache.get_cache_bytes()
+        )
+        for output, ref_output in zip(outputs, ref_outputs):
+            self.assertEqual(len(output.output_token_ids), 4)
+            # the first token only depends on the prompt computed in the model dtype
+            self.assertEqual(output.output_token_ids[0], ref_output.output_token_ids[0])
+        self.assertEqual(engine.get_num_free_blocks(), 16)
+
+
+if __name__ == "__main__":
+    test = unittest.main()
@@ -1033,6 +1033,104 @@ class WeightOnlyQuantizationTester(TestCase):
         for shape, use_bias in cases:
             test(shape, use_bias)
 
+    def test_weight_only_quantization_bulk_quantize(self):
+        from unittest import mock
+        from intel_extension_for_pytorch.quantization import (
+            _quantize_utils,
+            quantize_woq_weights,
+        )
+
+        # the NF4 mapping of one bucketize pass is the same as the thresholds one by one
+        t = torch.rand(64, 257) * 2 - 1
+        ref = torch.empty(t.shape, dtype=torch.uint8)
+        for i, threshold in enumerate(_quantize_utils.NF4_QUANT_TABLE):
+            ref[t > threshold] = i
+        self.assertEqual(_quantize_utils.map_float_tensor_to_nf4(t), ref)
+        q = torch.randint(0, 16, (64, 257), dtype=torch.uint8)
+        ref = torch.empty(q.shape)
+        for i, value in enumerate(_quantize_utils.NF4_DEQUANT_TABLE):
+            ref[q == i] = value
+        self.assertEqual(_quantize_utils.map_nf4_tensor_to_float(q), ref)
+
+        weights = [torch.randn(n, k) for n, k in [(31, 64), (128, 255), (7, 512)]]
+        qconfigs = [
+            ipex.quantization.get_weight_only_quant_qconfig_mapping(
+                weight_dtype=w_dtype, lowp_mode=lowp_mode, group_size=group_size
+            ).global_qconfig
+            for w_dtype, lowp_mode, group_size in [
+                (WoqWeightDtype.INT8, WoqLowpMode.INT8, -1),
+                (WoqWeightDtype.INT4, WoqLowpMode.BF16, 32),
+                (WoqWeightDtype.NF4, WoqLowpMode.NONE, -1),
+            ]
+        ]
+        for qconfig in qconfigs:
+            # the weights are split into chunks of a few rows
+            with mock.patch.object(_quantize_utils, "WOQ_QUANT_CHUNK_NUMEL", 1024):
+                for num_pools in [1, 2]:
+                    quantized = quantize_woq_weights(
+                        weights, [qconfig] * len(weights), num_pools
+                    )
+                    for weight, (qweight, scales, zero_points) in zip(
+                        weights, quantized
+                    ):
+                        ref = _quantize_utils._quantize_woq_chunk(weight, qconfig)
+                        self.assertEqual(qweight, ref[0])
+                        self.assertEqual(scales, ref[1])
+                        self.assertEqual(zero_points, ref[2])
+
+        # convert quantizes the weights in advance and from_float uses them
+        class M(nn.Module):
+            def __init__(self):
+                super(M, self).__init__()
+                self.linear1 = torch.nn.Linear(64, 128)
+                self.linear2 = torch.nn.Linear(128, 64)
+
+            def forward(self, x):
+                return self.linear2(self.linear1(x))
+
+        model = M().eval()
+        woq_ref_state = copy.deepcopy(model.state_dict())
+        data = torch.rand(4, 64)
+        qconfig = ipex.quantization.get_weight_only_quant_qconfig_mapping(
+            weight_dtype=WoqWeightDtype.INT4
+        )
+        ref_model = copy.deepcopy(model)
+        with torch.no_grad():
+            for name in ["linear1", "linear2"]:
+                linear = getattr(ref_model, name)
+                linear.qconfig = qconfig.global_qconfig
+                setattr(
+                    ref_model,
+                    name,
+                    ipex.nn.modules.weight_only_quantization.WeightOnlyQuantizedLinear.from_float(
+                        linear
+                    ),
+                )
+            prepared_model = prepare(model, qconfig, example_inputs=data, inplace=True)
+            with mock.patch.object(
+                ipex.quantization._quantize,
+                "quantize_woq_weights",
+                wraps=quantize_woq_weights,
+            ) as bulk_quantize:
+                woq_model = convert(prepared_model, inplace=True)
+            self.assertEqual(bulk_quantize.call_count, 1)
+            self.assertEqual(len(bulk_quantize.call_args[0][0]), 2)
+            self.assertEqual(woq_model(data), ref_model(data))
+            # the linears are quantized and swapped in groups of bounded size
+            model = M().eval()
+            model.load_state_dict(woq_ref_state)
+            prepared_model = prepare(model, qconfig, example_inputs=data, inplace=True)
+            with mock.patch.object(
+                ipex.quantization._quantize, "WOQ_QUANT_GROUP_NUMEL", 64 * 128
+            ), mock.patch.object(
+                ipex.quantization._quantize,
+                "quantize_woq_weights",
+                wraps=quantize_woq_weights,
+            ) as bulk_quantize:
+                woq_model = convert(prepared_model, inplace=True)
+            self.assertEqual(bulk_quantize.call_count, 2)
+            self.assertEqual(woq_model(data), ref_model(data))
+
     def _test_weight_only_quantization_unary_fused_op_helper(
         self,
         post_op_module,
@@ -471,6 +471,69 @@ class TestMultiStreamModule(TestCase):
         self.assertEqual(y_runtime2[1].size(0), 1)
         self.assertEqual(y_runtime2[2].size(0), 1)
 
+    @unittest.skipIf(
+        not ipex.cpu.runtime.is_runtime_ext_enabled(),
+        "Skip when IPEX Runtime extension is not enabled",
+    )
+    @runtime_thread_affinity_test_env
+    def test_dynamic_batcher(self):
+        model = SimpleNet()
+        model.eval()
+        # Requests of batch size 1 and 3, the last one is larger than max_batch_size
+        xs = [torch.rand(1 if i % 2 else 3, 64, 3, 3) for i in range(9)]
+        xs.append(torch.rand(6, 64, 3, 3))
+        # Calculate the reference result
+        ys = [model(x) for x in xs]
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(
+            model, num_streams=2, cpu_pool=cpu_pool
+        )
+        with ipex.cpu.runtime.DynamicBatcher(
+            multi_stream_model, max_batch_size=4, max_latency_ms=20
+        ) as batcher:
+            futures = [batcher.submit(x) for x in xs]
+            for y, future in zip(ys, futures):
+                self.assertEqual(y, future.result())
+            self.assertEqual(ys[0], batcher(xs[0]))
+        with self.assertRaises(RuntimeError):
+            batcher.submit(xs[0])
+
+    @unittest.skipIf(
+        not ipex.cpu.runtime.is_runtime_ext_enabled(),
+        "Skip when IPEX Runtime extension is not enabled",
+    )
+    @runtime_thread_affinity_test_env
+    def test_dynamic_batcher_with_tensor_and_dict_return_type(self):
+        model = SimpleNet_tensor_dict()
+        model.eval()
+        x_dicts = [
+            {"x1": torch.rand(1, 64, 3, 3), "x2": torch.rand(1, 64, 3, 3)}
+            for _ in range(8)
+        ]
+        # Calculate the reference result
+        y_refs = [model(**x_dict) for x_dict in x_dicts]
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(
+            model,
+            num_streams=2,
+            cpu_pool=cpu_pool,
+            input_split_hint=ipex.cpu.runtime.MultiStreamModuleHint(x1=0, x2=0),
+            output_concat_hint=ipex.cpu.runtime.MultiStreamModuleHint(
+                (0, {"y1": 0, "y2": 0})
+            ),
+        )
+        with ipex.cpu.runtime.DynamicBatcher(
+            multi_stream_model, max_batch_size=8, max_latency_ms=20
+        ) as batcher:
+            futures = [batcher.submit(**x_dict) for x_dict in x_dicts]
+            for (y, y_dict), future in zip(y_refs, futures):
+                y_runtime, y_runtime_dict = future.result()
+                self.assertEqual(y, y_runtime)
+                self.assertEqual(y_dict["y1"], y_runtime_dict["y1"])
+                self.assertEqual(y_dict["y2"], y_runtime_dict["y2"])
+
 
 class TestModuleMultiStreamModuleHint(TestCase):
     # For the inputs format which can't be jit.trace